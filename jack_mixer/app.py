@@ -26,7 +26,7 @@ from gi.repository import GLib
 
 from . import gui
 from . import scale
-from ._jack_mixer import Mixer
+from ._jack_mixer import Mixer, Parameter, ProcessStage
 from .channel import InputChannel, NewInputChannelDialog, NewOutputChannelDialog, OutputChannel
 from .nsmclient import NSMClient
 from .preferences import PreferencesDialog
@@ -131,7 +131,13 @@ class JackMixer(SerializedObject):
         self.meter_refresh_period = \
             self.gui_factory.get_meter_refresh_period_milliseconds()
         self.meter_refresh_timer_id = GLib.timeout_add(self.meter_refresh_period, self.read_meters)
-        GLib.timeout_add(50, self.midi_events_check)
+        self.status_bar_timer_id = GLib.timeout_add_seconds(1, self.update_status_bar)
+        self.midi_change_watch_id = GLib.unix_fd_add_full(
+            GLib.PRIORITY_DEFAULT,
+            self.mixer.midi_change_fd,
+            GLib.IOCondition.IN,
+            self.on_midi_change,
+        )
 
         if with_nsm:
             GLib.timeout_add(200, self.nsm_react)
@@ -144,6 +150,8 @@ class JackMixer(SerializedObject):
         for channel in self.channels:
             channel.unrealize()
 
+        GLib.source_remove(self.status_bar_timer_id)
+        GLib.source_remove(self.midi_change_watch_id)
         self.mixer.destroy()
 
     # ---------------------------------------------------------------------------------------------
@@ -214,6 +222,7 @@ class JackMixer(SerializedObject):
             "meter-refresh-period-milliseconds-changed",
             self.on_meter_refresh_period_milliseconds_changed
         )
+        self.gui_factory.connect("show-status-bar-changed", self.on_show_status_bar_changed)
         self.gui_factory.emit_midi_behavior_mode()
 
         # Recent files manager
@@ -360,6 +369,12 @@ class JackMixer(SerializedObject):
         self.paned.pack1(self.scrolled_window, True, False)
         self.paned.pack2(self.scrolled_output, True, False)
 
+        # Status bar with DSP load, hidden unless enabled in preferences
+        self.status_bar = Gtk.Statusbar()
+        self.status_bar.set_no_show_all(True)
+        self.status_bar.set_visible(self.gui_factory.get_show_status_bar())
+        self.vbox_top.pack_start(self.status_bar, False, True, 0)
+
         self.window.connect("destroy", Gtk.main_quit)
         self.window.connect("delete-event", self.on_delete_event)
 
@@ -832,6 +847,11 @@ class JackMixer(SerializedObject):
                 self.hbox_inputs.remove(channel.get_parent())
                 break
 
+        # the engine stops excluding the channel from mix-minus output channels
+        for output_channel in self.output_channels:
+            if output_channel.mix_minus_channel is channel:
+                output_channel.mix_minus_channel = None
+
         if not self.channels:
             self.channel_edit_input_menu_item.set_sensitive(False)
             self.channel_remove_input_menu_item.set_sensitive(False)
@@ -862,6 +882,12 @@ class JackMixer(SerializedObject):
                 self.hbox_outputs.remove(channel.get_parent())
                 break
 
+        # mix-minus output channels of the channel become regular ones in the engine
+        for output_channel in self.output_channels:
+            if output_channel.mix_minus_source is channel:
+                output_channel.mix_minus_source = None
+                output_channel.mix_minus_channel = None
+
         if not self.output_channels:
             self.channel_edit_output_menu_item.set_sensitive(False)
             self.channel_remove_output_menu_item.set_sensitive(False)
@@ -976,15 +1002,41 @@ class JackMixer(SerializedObject):
         self.meter_refresh_timer_id = GLib.timeout_add(self.meter_refresh_period, self.read_meters)
 
     def read_meters(self):
+        meters = self.mixer.read_meters()
+        # All meters use the default meter scale, convert their values at once
+        scaled = self.gui_factory.get_default_meter_scale().db_to_scale_array(meters)
         for channel in self.channels:
-            channel.read_meter()
+            channel.read_meter(meters, scaled)
         for channel in self.output_channels:
-            channel.read_meter()
+            channel.read_meter(meters, scaled)
         return True
 
-    def midi_events_check(self):
-        for channel in self.channels + self.output_channels:
-            channel.midi_events_check()
+    def on_show_status_bar_changed(self, sender, value):
+        self.status_bar.set_visible(value)
+        self.update_status_bar()
+
+    def update_status_bar(self):
+        if not self.status_bar.get_visible():
+            return True
+
+        stats = self.mixer.process_stats
+        if stats is None:
+            text = _("DSP load: -")
+        else:
+            _min, avg, p99, max_ = stats["stages"][ProcessStage.PROCESS]
+            text = _("DSP load: {load:.1f}% (avg {avg:.0f} µs, p99 {p99:.0f} µs, "
+                     "max {max:.0f} µs of {period:.0f} µs)").format(
+                load=stats["load"] * 100, avg=avg, p99=p99, max=max_, period=stats["period"]
+            )
+
+        text += "  " + _("Xruns: {}").format(self.mixer.xruns)
+        text += "  " + _("Denormal cycles: {}").format(self.mixer.denormal_cycles)
+        self.status_bar.remove_all(0)
+        self.status_bar.push(0, text)
+        return True
+
+    def on_midi_change(self, fd, condition):
+        self.mixer.dispatch_midi_changes()
         return True
 
     def get_monitored_channel(self):
@@ -994,39 +1046,60 @@ class JackMixer(SerializedObject):
         if channel == self._monitored_channel:
             return
         self._monitored_channel = channel
+        monitor = self.monitor_channel
         if channel is None:
-            self.monitor_channel.out_mute = True
+            changes = [(monitor, Parameter.MUTE, True)]
         elif isinstance(channel, InputChannel):
             # reset all solo/mute settings
+            changes = []
             for in_channel in self.channels:
-                self.monitor_channel.set_solo(in_channel.channel, False)
-                self.monitor_channel.set_muted(in_channel.channel, False)
-            self.monitor_channel.set_solo(channel.channel, True)
-            self.monitor_channel.prefader = True
-            self.monitor_channel.out_mute = False
+                changes.append(
+                    (monitor, Parameter.SEND_SOLO, in_channel.channel, in_channel is channel)
+                )
+                changes.append((monitor, Parameter.SEND_MUTE, in_channel.channel, False))
+            changes.append((monitor, Parameter.PREFADER, True))
+            changes.append((monitor, Parameter.MUTE, False))
         else:
-            self.monitor_channel.prefader = False
-            self.monitor_channel.out_mute = False
+            changes = [(monitor, Parameter.PREFADER, False), (monitor, Parameter.MUTE, False)]
 
+        # switch the monitor over in one process cycle
         if channel:
-            self.update_monitor(channel)
+            changes.extend(self.get_monitor_changes(channel))
+        self.mixer.apply(changes)
 
     monitored_channel = property(get_monitored_channel, set_monitored_channel)
 
-    def update_monitor(self, channel):
-        if self._monitored_channel is not channel:
-            return
-        self.monitor_channel.volume = channel.channel.volume
-        self.monitor_channel.balance = channel.channel.balance
-        if isinstance(self.monitored_channel, OutputChannel):
+    def get_monitor_changes(self, channel):
+        monitor = self.monitor_channel
+        changes = [
+            (monitor, Parameter.VOLUME, channel.channel.volume),
+            (monitor, Parameter.BALANCE, channel.channel.balance),
+        ]
+        if isinstance(channel, OutputChannel):
             # sync solo/muted channels
             for input_channel in self.channels:
-                self.monitor_channel.set_solo(
-                    input_channel.channel, channel.channel.is_solo(input_channel.channel)
+                changes.append(
+                    (
+                        monitor,
+                        Parameter.SEND_SOLO,
+                        input_channel.channel,
+                        channel.channel.is_solo(input_channel.channel),
+                    )
                 )
-                self.monitor_channel.set_muted(
-                    input_channel.channel, channel.channel.is_muted(input_channel.channel)
+                changes.append(
+                    (
+                        monitor,
+                        Parameter.SEND_MUTE,
+                        input_channel.channel,
+                        channel.channel.is_muted(input_channel.channel),
+                    )
                 )
+        return changes
+
+    def update_monitor(self, channel):
+        if self._monitored_channel is not channel:
+            return
+        self.mixer.apply(self.get_monitor_changes(channel))
 
     def get_input_channel_by_name(self, name):
         for input_channel in self.channels:
@@ -1034,6 +1107,12 @@ class JackMixer(SerializedObject):
                 return input_channel
         return None
 
+    def get_output_channel_by_name(self, name):
+        for output_channel in self.output_channels:
+            if output_channel.channel.name == name:
+                return output_channel
+        return None
+
     # ---------------------------------------------------------------------------------------------
     # Mixer project (de-)serialization and file handling
 
@@ -1071,6 +1150,8 @@ class JackMixer(SerializedObject):
         for channel in self.unserialized_channels:
             if isinstance(channel, OutputChannel):
                 self.add_output_channel_precreated(channel)
+        for channel in self.output_channels:
+            channel.realize_mix_minus()
         del self.unserialized_channels
         width, height = self.window.get_size()
         if self.visible or not from_nsm:
@@ -1190,6 +1271,30 @@ def main():
         default="JACK_MIXER_DEBUG" in os.environ,
         help=_("enable debug logging messages"),
     )
+    parser.add_argument(
+        "-t",
+        "--threads",
+        metavar=_("COUNT"),
+        type=int,
+        default=0,
+        help=_("number of worker threads for audio processing (default: %(default)s)"),
+    )
+    parser.add_argument(
+        "--no-flush-denormals",
+        dest="flush_denormals",
+        action="store_false",
+        help=_("don't flush denormal numbers to zero in audio processing"),
+    )
+    parser.add_argument(
+        "--midi-split-frames",
+        metavar=_("FRAMES"),
+        type=int,
+        default=0,
+        help=_(
+            "apply MIDI control events at their exact time, splitting the period into "
+            "blocks of at least FRAMES frames (default: %(default)s, disabled)"
+        ),
+    )
     parser.add_argument(
         "client_name",
         metavar=_("NAME"),
@@ -1209,6 +1314,17 @@ def main():
         error_dialog(None, _("Mixer creation failed:\n\n{}"), e, debug=args.debug)
         sys.exit(1)
 
+    mixer.mixer.flush_denormals = args.flush_denormals
+
+    if args.midi_split_frames > 0:
+        mixer.mixer.midi_split_frames = args.midi_split_frames
+
+    if args.threads:
+        try:
+            mixer.mixer.worker_threads = args.threads
+        except (RuntimeError, OverflowError) as exc:
+            log.error(_("Could not start %d worker threads: %s"), args.threads, exc)
+
     if not mixer.nsm_client and args.config:
         try:
             with open(args.config) as fp:
@@ -26,6 +26,7 @@ from gi.repository import Pango
 from . import abspeak
 from . import meter
 from . import slider
+from ._jack_mixer import MeterValue
 from .serialization import SerializedObject
 from .styling import set_background_color, random_color
 
@@ -178,6 +179,7 @@ class Channel(Gtk.Box, SerializedObject):
 
     def realize(self):
         log.debug('Realizing channel "%s".', self.channel_name)
+        self.meter_slot = self.channel.meter_slot
         if self.future_out_mute is not None:
             self.channel.out_mute = self.future_out_mute
 
@@ -508,39 +510,42 @@ class Channel(Gtk.Box, SerializedObject):
             # Reset the kmeter rms
             self.channel.kmeter_reset()
 
-    def read_meter(self):
+    def read_meter(self, meters, scaled):
+        """Update meters from values returned by Mixer.read_meters(), and the same values
+        converted with the meter scale."""
         if not self.channel:
             return
 
-        if self.stereo:
+        slot = self.meter_slot
 
+        if self.meter_prefader:
+            peak = MeterValue.METER_PREFADER_LEFT
+            kmeter_rms = MeterValue.KMETER_RMS_PREFADER_LEFT
+            kmeter_peak = MeterValue.KMETER_PREFADER_LEFT
+            abspeak = MeterValue.ABSPEAK_PREFADER
+        else:
+            peak = MeterValue.METER_POSTFADER_LEFT
+            kmeter_rms = MeterValue.KMETER_RMS_POSTFADER_LEFT
+            kmeter_peak = MeterValue.KMETER_POSTFADER_LEFT
+            abspeak = MeterValue.ABSPEAK_POSTFADER
+
+        if self.stereo:
             if self.meter.kmetering:
-                if self.meter_prefader:
-                    self.meter.set_values_kmeter(*self.channel.kmeter_prefader)
-                else:
-                    self.meter.set_values_kmeter(*self.channel.kmeter_postfader)
+                self.meter.set_values_kmeter(
+                    scaled[slot, kmeter_rms],
+                    scaled[slot, kmeter_rms + 1],
+                    scaled[slot, kmeter_peak],
+                    scaled[slot, kmeter_peak + 1],
+                )
             else:
-                if self.meter_prefader:
-                    self.meter.set_values(*self.channel.meter_prefader)
-                else:
-                    self.meter.set_values(*self.channel.meter_postfader)
-
+                self.meter.set_values(scaled[slot, peak], scaled[slot, peak + 1])
         else:
             if self.meter.kmetering:
-                if self.meter_prefader:
-                    self.meter.set_value_kmeter(*self.channel.kmeter_prefader)
-                else:
-                    self.meter.set_value_kmeter(*self.channel.kmeter_postfader)
+                self.meter.set_value_kmeter(scaled[slot, kmeter_rms], scaled[slot, kmeter_peak])
             else:
-                if self.meter_prefader:
-                    self.meter.set_value(*self.channel.meter_prefader)
-                else:
-                    self.meter.set_value(*self.channel.meter_postfader)
+                self.meter.set_value(scaled[slot, peak])
 
-        if self.meter_prefader:
-            self.abspeak.set_peak(self.channel.abspeak_prefader)
-        else:
-            self.abspeak.set_peak(self.channel.abspeak_postfader)
+        self.abspeak.set_peak(meters[slot, abspeak])
 
     def update_balance(self, update_engine, from_midi=False):
         balance = self.balance_adjustment.get_value()
@@ -666,6 +671,8 @@ class InputChannel(Channel):
         if not self.wide:
             self.narrow()
 
+        self.channel.midi_change_callback = self.on_midi_event_received
+
     def unrealize(self):
         super().unrealize()
         if self.post_fader_output_channel:
@@ -719,11 +726,16 @@ class InputChannel(Channel):
                 ctlgroups.append(c)
         return ctlgroups
 
-    def midi_events_check(self):
-        if self.channel is not None and self.channel.midi_in_got_events:
-            self.mute.set_active(self.channel.out_mute)
-            self.solo.set_active(self.channel.solo)
-            super().on_midi_event_received()
+    def on_midi_event_received(self, *args):
+        self.mute.set_active(self.channel.out_mute)
+        self.solo.set_active(self.channel.solo)
+        # A recalled scene may have changed the routing as well
+        for ctlgroup in self.get_control_groups():
+            output_channel = ctlgroup.output_channel.channel
+            ctlgroup.mute.set_active(output_channel.is_muted(self.channel))
+            ctlgroup.solo.set_active(output_channel.is_solo(self.channel))
+            ctlgroup.prefader.set_active(output_channel.is_in_prefader(self.channel))
+        super().on_midi_event_received()
 
     def on_mute_button_pressed(self, button, event, *args):
         if event.button == 1 and event.state & Gdk.ModifierType.CONTROL_MASK:
@@ -825,6 +837,10 @@ class OutputChannel(Channel):
         self._init_muted_channels = None
         self._init_solo_channels = None
         self._init_prefader_channels = None
+        self._init_mix_minus_source = None
+        self._init_mix_minus_channel = None
+        self.mix_minus_source = None
+        self.mix_minus_channel = None
         self._color = Gdk.RGBA()
 
     @property
@@ -900,6 +916,8 @@ class OutputChannel(Channel):
         if not self.wide:
             self.narrow()
 
+        self.channel.midi_change_callback = self.on_midi_event_received
+
     def unrealize(self):
         # remove control groups from input channels
         for input_channel in self.app.channels:
@@ -909,6 +927,43 @@ class OutputChannel(Channel):
         self.channel.remove()
         self.channel = None
 
+    def set_mix_minus(self, source, channel=None):
+        # carry the mix of output channel source without input channel channel,
+        # or the regular mix of this channel again if source is None
+        self.channel.set_mix_minus(
+            source.channel if source else None, channel.channel if channel else None
+        )
+        self.mix_minus_source = source
+        self.mix_minus_channel = channel if source else None
+
+    def realize_mix_minus(self):
+        # the source may come after this channel in the project, so mix-minus
+        # settings are applied once all channels are realized
+        if self._init_mix_minus_source:
+            source = self.app.get_output_channel_by_name(self._init_mix_minus_source)
+            channel = None
+            if self._init_mix_minus_channel:
+                channel = self.app.get_input_channel_by_name(self._init_mix_minus_channel)
+
+            if source is None:
+                log.warning(
+                    'Mix-minus source "%s" of output channel "%s" not found.',
+                    self._init_mix_minus_source,
+                    self.channel_name,
+                )
+            else:
+                try:
+                    self.set_mix_minus(source, channel)
+                except RuntimeError as exc:
+                    log.error(
+                        'Could not set output channel "%s" to mix-minus: %s',
+                        self.channel_name,
+                        exc,
+                    )
+
+        self._init_mix_minus_source = None
+        self._init_mix_minus_channel = None
+
     def on_drag_data_received(self, widget, drag_context, x, y, data, info, time):
         source_name = data.get_data().decode("utf-8")
         if source_name == self.channel_name:
@@ -923,10 +978,9 @@ class OutputChannel(Channel):
                     channel.mute.set_active(False)
             return button.get_active()
 
-    def midi_events_check(self):
-        if self.channel is not None and self.channel.midi_in_got_events:
-            self.mute.set_active(self.channel.out_mute)
-            super().on_midi_event_received()
+    def on_midi_event_received(self, *args):
+        self.mute.set_active(self.channel.out_mute)
+        super().on_midi_event_received()
 
     @classmethod
     def serialization_name(cls):
@@ -962,6 +1016,12 @@ class OutputChannel(Channel):
             object_backend.add_property(
                 "prefader_channels", "|".join([x.channel.name for x in prefader_in_channels])
             )
+        if self.mix_minus_source:
+            object_backend.add_property("mix_minus_source", self.mix_minus_source.channel.name)
+            if self.mix_minus_channel:
+                object_backend.add_property(
+                    "mix_minus_channel", self.mix_minus_channel.channel.name
+                )
         object_backend.add_property("color", self.color.to_string())
         super().serialize(object_backend)
 
@@ -989,6 +1049,12 @@ class OutputChannel(Channel):
         elif name == "prefader_channels":
             self._init_prefader_channels = value.split("|")
             return True
+        elif name == "mix_minus_source":
+            self._init_mix_minus_source = value
+            return True
+        elif name == "mix_minus_channel":
+            self._init_mix_minus_channel = value
+            return True
         elif name == "color":
             c = Gdk.RGBA()
             c.parse(value)
@@ -1307,18 +1373,77 @@ class OutputChannelPropertiesDialog(ChannelPropertiesDialog):
         self.display_solo_buttons = Gtk.CheckButton.new_with_mnemonic(_("_Display solo buttons"))
         vbox.pack_start(self.display_solo_buttons, True, True, 0)
 
+        if not isinstance(self, NewChannelDialog):
+            grid = Gtk.Grid()
+            self.vbox.pack_start(self.create_frame(_("Mix-Minus"), grid), True, True, 0)
+            grid.set_row_spacing(8)
+            grid.set_column_spacing(8)
+            grid.set_column_homogeneous(True)
+
+            source_label = Gtk.Label.new_with_mnemonic(_("Mi_x of"))
+            source_label.set_halign(Gtk.Align.START)
+            grid.attach(source_label, 0, 0, 1, 1)
+            self.combo_mix_minus_source = Gtk.ComboBoxText()
+            self.combo_mix_minus_source.set_tooltip_text(
+                _("Carry the mix of another output channel instead of routing input channels")
+            )
+            self.combo_mix_minus_source.connect("changed", self.on_mix_minus_source_changed)
+            source_label.set_mnemonic_widget(self.combo_mix_minus_source)
+            grid.attach(self.combo_mix_minus_source, 1, 0, 2, 1)
+
+            excluded_label = Gtk.Label.new_with_mnemonic(_("_Excluding"))
+            excluded_label.set_halign(Gtk.Align.START)
+            grid.attach(excluded_label, 0, 1, 1, 1)
+            self.combo_mix_minus_channel = Gtk.ComboBoxText()
+            self.combo_mix_minus_channel.set_tooltip_text(
+                _("Input channel left out of the mix, e.g. the contributor fed by this output")
+            )
+            excluded_label.set_mnemonic_widget(self.combo_mix_minus_channel)
+            grid.attach(self.combo_mix_minus_channel, 1, 1, 2, 1)
+
         self.vbox.show_all()
 
     def fill_ui(self):
         super().fill_ui()
         self.display_solo_buttons.set_active(self.channel.display_solo_buttons)
         self.color_chooser_button.set_rgba(self.channel.color)
+        self.fill_mix_minus()
+
+    def fill_mix_minus(self):
+        self.combo_mix_minus_source.remove_all()
+        self.combo_mix_minus_source.append("", _("None"))
+        for output_channel in self.app.output_channels:
+            # mix-minus output channels can't be sources themselves
+            if output_channel is not self.channel and not output_channel.mix_minus_source:
+                name = output_channel.channel_name
+                self.combo_mix_minus_source.append(name, name)
+
+        self.combo_mix_minus_channel.remove_all()
+        self.combo_mix_minus_channel.append("", _("None"))
+        for input_channel in self.app.channels:
+            name = input_channel.channel_name
+            self.combo_mix_minus_channel.append(name, name)
+
+        source = self.channel.mix_minus_source
+        channel = self.channel.mix_minus_channel
+        self.combo_mix_minus_source.set_active_id(source.channel_name if source else "")
+        self.combo_mix_minus_channel.set_active_id(channel.channel_name if channel else "")
+
+        # nor can sources be mix-minus output channels
+        is_source = any(x.mix_minus_source is self.channel for x in self.app.output_channels)
+        self.combo_mix_minus_source.set_sensitive(not is_source)
+
+    def on_mix_minus_source_changed(self, combo):
+        self.combo_mix_minus_channel.set_sensitive(bool(combo.get_active_id()))
 
     def on_response_cb(self, dlg, response_id, *args):
         if response_id == Gtk.ResponseType.APPLY:
             self.channel.display_solo_buttons = self.display_solo_buttons.get_active()
             self.channel.set_color(self.color_chooser_button.get_rgba())
 
+            if not isinstance(self, NewChannelDialog):
+                self.apply_mix_minus()
+
         super().on_response_cb(dlg, response_id, *args)
 
         if response_id == Gtk.ResponseType.APPLY:
@@ -1327,6 +1452,24 @@ class OutputChannelPropertiesDialog(ChannelPropertiesDialog):
 
         return True
 
+    def apply_mix_minus(self):
+        source = self.app.get_output_channel_by_name(self.combo_mix_minus_source.get_active_id())
+        channel = self.app.get_input_channel_by_name(self.combo_mix_minus_channel.get_active_id())
+        if source is None:
+            channel = None
+
+        if source is self.channel.mix_minus_source and channel is self.channel.mix_minus_channel:
+            return
+
+        try:
+            self.channel.set_mix_minus(source, channel)
+        except RuntimeError as exc:
+            log.error(
+                'Could not set output channel "%s" to mix-minus: %s',
+                self.channel.channel_name,
+                exc,
+            )
+
 
 class NewOutputChannelDialog(NewChannelDialog, OutputChannelPropertiesDialog):
     def __init__(self, app, title=None):
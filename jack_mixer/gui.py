@@ -86,6 +86,7 @@ class Factory(GObject.GObject, SerializedObject):
         self.auto_reset_peak_meters = False
         self.auto_reset_peak_meters_time_seconds = 2.0
         self.meter_refresh_period_milliseconds = 33
+        self.show_status_bar = False
 
     def read_preferences(self):
         self.config.read(self.path)
@@ -134,6 +135,9 @@ class Factory(GObject.GObject, SerializedObject):
             "Preferences", "meter_refresh_period_milliseconds",
             fallback=self.meter_refresh_period_milliseconds
         )
+        self.show_status_bar = self.config.getboolean(
+            "Preferences", "show_status_bar", fallback=self.show_status_bar
+        )
 
     def write_preferences(self):
         self.config["Preferences"] = {}
@@ -151,6 +155,7 @@ class Factory(GObject.GObject, SerializedObject):
             str(self.auto_reset_peak_meters_time_seconds)
         self.config["Preferences"]["meter_refresh_period_milliseconds"] = \
             str(self.meter_refresh_period_milliseconds)
+        self.config["Preferences"]["show_status_bar"] = str(self.show_status_bar)
 
         with open(self.path, "w") as configfile:
             self.config.write(configfile)
@@ -210,6 +215,9 @@ class Factory(GObject.GObject, SerializedObject):
     def set_meter_refresh_period_milliseconds(self, period):
         self._update_setting("meter_refresh_period_milliseconds", period)
 
+    def set_show_status_bar(self, show):
+        self._update_setting("show_status_bar", show)
+
     def get_confirm_quit(self):
         return self.confirm_quit
 
@@ -250,6 +258,9 @@ class Factory(GObject.GObject, SerializedObject):
     def get_meter_refresh_period_milliseconds(self):
         return self.meter_refresh_period_milliseconds
 
+    def get_show_status_bar(self):
+        return self.show_status_bar
+
     def emit_midi_behavior_mode(self):
         self.emit("midi-behavior-mode-changed", self.midi_behavior_mode)
 
@@ -282,6 +293,7 @@ class Factory(GObject.GObject, SerializedObject):
                 self.get_meter_refresh_period_milliseconds()
             )
         )
+        object_backend.add_property("show_status_bar", str(self.get_show_status_bar()))
 
     def unserialize_property(self, name, value):
         if name == "confirm_quit":
@@ -316,6 +328,9 @@ class Factory(GObject.GObject, SerializedObject):
             return True
         elif name == "meter_refresh_period_milliseconds":
             self.set_meter_refresh_period_milliseconds(int(value))
+        elif name == "show_status_bar":
+            self.set_show_status_bar(value == "True")
+            return True
         return False
 
 
@@ -403,3 +418,10 @@ GObject.signal_new(
     None,
     [int],
 )
+GObject.signal_new(
+    "show-status-bar-changed",
+    Factory,
+    GObject.SignalFlags.RUN_FIRST | GObject.SignalFlags.ACTION,
+    None,
+    [bool],
+)
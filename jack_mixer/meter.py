@@ -158,8 +158,6 @@ class MonoMeterWidget(MeterWidget):
         super().__init__(scale)
         self.value = 0.0
         self.pk = 0.0
-        self.raw_value = 0.0
-        self.raw_pk = 0.0
 
     def draw(self, widget, cairo_ctx):
         self.draw_background(cairo_ctx)
@@ -171,31 +169,20 @@ class MonoMeterWidget(MeterWidget):
             self.draw_peak(cairo_ctx, self.pk, x, width)
 
     def set_value(self, value):
-        if value != self.raw_value:
-            self.raw_value = value
-            self.value = self.scale.db_to_scale(value)
-            self.invalidate_all()
-
-        if value == self.raw_value:
-            return
-
-        self.raw_value = value
-        old_value = self.value
-        self.value = self.scale.db_to_scale(value)
-
-        if (abs(old_value-self.value) * self.height) > 1:
+        """Update the meter, with value already converted with the meter scale."""
+        if value != self.value:
+            self.value = value
             self.invalidate_all()
 
     def set_value_kmeter(self, value, pk):
-        if value == self.raw_value and pk == self.raw_pk:
+        """Update the kmeter, with values already converted with the meter scale."""
+        if value == self.value and pk == self.pk:
             return
 
-        self.raw_value = value
-        self.raw_pk = pk
         old_value = self.value
         old_pk = self.pk
-        self.value = self.scale.db_to_scale(value)
-        self.pk = self.scale.db_to_scale(pk)
+        self.value = value
+        self.pk = pk
 
         if (abs(old_value - self.value) * self.height) > 0.01 or (
             abs(old_pk - self.pk) * self.height
@@ -212,12 +199,6 @@ class StereoMeterWidget(MeterWidget):
         self.left = 0.0
         self.right = 0.0
 
-        self.raw_left_pk = 0.0
-        self.raw_right_pk = 0.0
-
-        self.raw_left = 0.0
-        self.raw_right = 0.0
-
     def draw(self, widget, cairo_ctx):
         self.draw_background(cairo_ctx)
 
@@ -233,15 +214,14 @@ class StereoMeterWidget(MeterWidget):
             self.draw_peak(cairo_ctx, self.pk_right, right_x, width)
 
     def set_values(self, left, right):
-        if left == self.raw_left and right == self.raw_right:
+        """Update the meter, with values already converted with the meter scale."""
+        if left == self.left and right == self.right:
             return
 
-        self.raw_left = left
-        self.raw_right = right
         old_left = self.left
         old_right = self.right
-        self.left = self.scale.db_to_scale(left)
-        self.right = self.scale.db_to_scale(right)
+        self.left = left
+        self.right = right
 
         if (
             (abs(old_left - self.left) * self.height) > 0.01
@@ -250,26 +230,23 @@ class StereoMeterWidget(MeterWidget):
             self.invalidate_all()
 
     def set_values_kmeter(self, left, right, pk_l, pk_r):
+        """Update the kmeter, with values already converted with the meter scale."""
         if (
-            left == self.raw_left
-            and right == self.raw_right
-            and pk_l == self.raw_left_pk
-            and pk_r == self.raw_right_pk
+            left == self.left
+            and right == self.right
+            and pk_l == self.pk_left
+            and pk_r == self.pk_right
         ):
             return
 
-        self.raw_left = left
-        self.raw_right = right
-        self.raw_left_pk = pk_l
-        self.raw_right_pk = pk_r
         old_left = self.left
         old_right = self.right
         old_pk_left = self.pk_left
         old_pk_right = self.pk_right
-        self.left = self.scale.db_to_scale(left)
-        self.right = self.scale.db_to_scale(right)
-        self.pk_left = self.scale.db_to_scale(pk_l)
-        self.pk_right = self.scale.db_to_scale(pk_r)
+        self.left = left
+        self.right = right
+        self.pk_left = pk_l
+        self.pk_right = pk_r
 
         if (
             (abs(old_left - self.left) * self.height) > 0.01
@@ -96,6 +96,14 @@ class PreferencesDialog(Gtk.Dialog):
         self.custom_widgets_checkbutton.connect("toggled", self.on_custom_widget_toggled)
         interface_vbox.pack_start(self.custom_widgets_checkbutton, True, True, 3)
 
+        self.status_bar_checkbutton = Gtk.CheckButton(_("Show status bar"))
+        self.status_bar_checkbutton.set_tooltip_text(
+            _("Show DSP load and number of xruns below the channels")
+        )
+        self.status_bar_checkbutton.set_active(self.app.gui_factory.get_show_status_bar())
+        self.status_bar_checkbutton.connect("toggled", self.on_status_bar_toggled)
+        interface_vbox.pack_start(self.status_bar_checkbutton, True, True, 3)
+
         color_tooltip = _("Draw the volume meters with the selected solid color")
         self.vumeter_color_checkbutton = Gtk.CheckButton(_("Use custom vumeter color"))
         self.vumeter_color_checkbutton.set_tooltip_text(color_tooltip)
@@ -342,6 +350,9 @@ class PreferencesDialog(Gtk.Dialog):
     def on_custom_widget_toggled(self, *args):
         self.app.gui_factory.set_use_custom_widgets(self.custom_widgets_checkbutton.get_active())
 
+    def on_status_bar_toggled(self, *args):
+        self.app.gui_factory.set_show_status_bar(self.status_bar_checkbutton.get_active())
+
     def on_auto_reset_peak_meters_toggled(self, *args):
         self.app.gui_factory.set_auto_reset_peak_meters(
             self.auto_reset_peak_meters_checkbutton.get_active()
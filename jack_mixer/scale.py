@@ -15,6 +15,7 @@
 # along with this program; if not, write to the Free Software
 # Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA.
 
+import array
 import logging
 import math
 
@@ -24,6 +25,14 @@ from ._jack_mixer import Scale
 log = logging.getLogger(__name__)
 
 
+def map_array(function, values):
+    """Apply function to each value of a float32 buffer, returning float32 memoryview of the same
+    shape, for scales not implemented by thresholds"""
+    values = memoryview(values)
+    result = array.array("f", (function(value) for value in values.cast("B").cast("f")))
+    return memoryview(result).cast("B").cast("f", values.shape)
+
+
 class Mark:
     """Encapsulates scale linear function edge and coefficients for scale = a * dB + b formula"""
 
@@ -63,6 +72,11 @@ class Base:
         """Convert number in range 0.0-1.0 used in GUI to dBFS value"""
         return self.scale.scale_to_db(scale)
 
+    def db_to_scale_array(self, values):
+        """Convert float32 buffer of dBFS values, like the one returned by
+        Mixer.read_meters(), to float32 memoryview of numbers in range 0.0-1.0"""
+        return self.scale.db_to_scale_array(values)
+
     def add_mark(self, db):
         self.marks.append(Mark(db, -1.0))
 
@@ -186,6 +200,9 @@ class K20(Base):
         v = math.pow(10.0, db / 20.0)
         return self.mapk20(v) / 450.0
 
+    def db_to_scale_array(self, values):
+        return map_array(self.db_to_scale, values)
+
     def add_mark(self, db, text):
         self.marks.append(Mark(db, self.db_to_scale(db), text))
 
@@ -225,6 +242,9 @@ class K14(Base):
         v = math.pow(10.0, db / 20.0)
         return self.mapk14(v) / 448.3
 
+    def db_to_scale_array(self, values):
+        return map_array(self.db_to_scale, values)
+
     def add_mark(self, db, text):
         self.marks.append(Mark(db, self.db_to_scale(db), text))
 
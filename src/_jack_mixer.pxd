@@ -6,6 +6,9 @@
 
 from libcpp cimport bool
 
+cdef extern from "dsp.h":
+    cdef const char * dsp_get_kernel_name()
+
 cdef extern from "jack_mixer.h":
     # scale.h
     ctypedef void * jack_mixer_scale_t;
@@ -17,6 +20,12 @@ cdef extern from "jack_mixer.h":
     cdef void scale_calculate_coefficients(jack_mixer_scale_t scale)
     cdef double scale_db_to_scale(jack_mixer_scale_t scale, double db)
     cdef double scale_scale_to_db(jack_mixer_scale_t scale, double scale_value)
+    cdef double scale_midi_value_to_db(jack_mixer_scale_t scale, unsigned int value)
+    cdef void scale_db_to_scale_array(
+        jack_mixer_scale_t scale,
+        const float * db_ptr,
+        float * scale_value_ptr,
+        unsigned int count) nogil
     cdef void scale_destroy(jack_mixer_scale_t scale)
 
     # jack_mixer.h
@@ -33,6 +42,44 @@ cdef extern from "jack_mixer.h":
     cdef enum meter_mode:
         pass
 
+    cdef struct meter_values:
+        float meter_prefader[2]
+        float meter_postfader[2]
+        float kmeter_rms_prefader[2]
+        float kmeter_prefader[2]
+        float kmeter_rms_postfader[2]
+        float kmeter_postfader[2]
+        float abspeak_prefader
+        float abspeak_postfader
+
+    cdef struct stage_stats:
+        float min
+        float avg
+        float p99
+        float max
+
+    cdef struct process_stats:
+        unsigned int cycles
+        float period
+        float load
+        stage_stats stages[5]  # Stage_Count
+
+    cdef enum channel_parameter:
+        pass
+
+    cdef struct channel_change:
+        jack_mixer_channel_t channel
+        jack_mixer_channel_t input_channel
+        channel_parameter parameter
+        double value
+
+    cdef struct memory_usage:
+        size_t scratch
+        size_t topology
+        size_t channels
+        size_t meters
+        size_t total
+
     ctypedef enum jack_mixer_error_t:
         pass
 
@@ -42,9 +89,17 @@ cdef extern from "jack_mixer.h":
 
     # mixer
     cdef jack_mixer_t mixer_create "create" (const char * jack_client_name_ptr, bool stereo)
+    cdef jack_mixer_t mixer_create_offline "create_offline" (
+        const char * client_name_ptr,
+        unsigned int sample_rate,
+        unsigned int buffer_size)
     cdef void mixer_destroy "destroy" (jack_mixer_t mixer)
     cdef unsigned int mixer_get_channels_count "get_channels_count" (jack_mixer_t mixer)
     cdef const char * mixer_get_client_name "get_client_name" (jack_mixer_t mixer)
+    cdef unsigned int mixer_get_sample_rate "get_sample_rate" (jack_mixer_t mixer)
+    cdef unsigned int mixer_get_buffer_size "get_buffer_size" (jack_mixer_t mixer)
+    cdef bool mixer_is_offline "is_offline" (jack_mixer_t mixer)
+    cdef int mixer_offline_process "offline_process" (jack_mixer_t mixer, unsigned int nframes) nogil
     cdef int mixer_get_last_midi_cc "get_last_midi_cc" (jack_mixer_t mixer)
     cdef void mixer_set_last_midi_cc "set_last_midi_cc" (
         jack_mixer_t mixer,
@@ -53,6 +108,16 @@ cdef extern from "jack_mixer.h":
     cdef void mixer_set_midi_behavior_mode "set_midi_behavior_mode" (
         jack_mixer_t mixer,
         midi_behavior_mode mode)
+    cdef unsigned int mixer_get_meter_slots_count "get_meter_slots_count" (jack_mixer_t mixer)
+    cdef unsigned int mixer_read_meters "read_meters" (
+        jack_mixer_t mixer,
+        meter_values * values,
+        unsigned int count)
+    cdef int mixer_get_midi_change_fd "get_midi_change_fd" (jack_mixer_t mixer)
+    cdef void mixer_dispatch_midi_changes "dispatch_midi_changes" (jack_mixer_t mixer)
+    cdef bool mixer_get_process_stats "get_process_stats" (jack_mixer_t mixer, process_stats * stats)
+    cdef unsigned int mixer_get_xruns_count "get_xruns_count" (jack_mixer_t mixer)
+    cdef void mixer_get_memory_usage "get_memory_usage" (jack_mixer_t mixer, memory_usage * usage)
     cdef jack_mixer_channel_t mixer_add_channel "add_channel" (
         jack_mixer_t mixer,
         const char * channel_name,
@@ -64,6 +129,26 @@ cdef extern from "jack_mixer.h":
         bool system)
     cdef bool mixer_get_kmetering "get_kmetering" (jack_mixer_t mixer)
     cdef void mixer_set_kmetering "set_kmetering" (jack_mixer_t mixer, bool flag)
+    cdef bool mixer_get_block_processing "get_block_processing" (jack_mixer_t mixer)
+    cdef void mixer_set_block_processing "set_block_processing" (jack_mixer_t mixer, bool flag)
+    cdef bool mixer_get_flush_denormals "get_flush_denormals" (jack_mixer_t mixer)
+    cdef void mixer_set_flush_denormals "set_flush_denormals" (jack_mixer_t mixer, bool flag)
+    cdef unsigned int mixer_get_denormal_cycles_count "get_denormal_cycles_count" (jack_mixer_t mixer)
+    cdef unsigned int mixer_get_midi_split_frames "get_midi_split_frames" (jack_mixer_t mixer)
+    cdef void mixer_set_midi_split_frames "set_midi_split_frames" (jack_mixer_t mixer, unsigned int frames)
+    cdef unsigned int mixer_get_worker_threads "get_worker_threads" (jack_mixer_t mixer)
+    cdef int mixer_set_worker_threads "set_worker_threads" (jack_mixer_t mixer, unsigned int count)
+    cdef int mixer_apply_changes "apply_changes" (
+        jack_mixer_t mixer,
+        const channel_change * changes,
+        unsigned int count) nogil
+    cdef int mixer_store_scene "store_scene" (jack_mixer_t mixer, int scene)
+    cdef int mixer_recall_scene "recall_scene" (jack_mixer_t mixer, int scene, double crossfade)
+    cdef int mixer_clear_scene "clear_scene" (jack_mixer_t mixer, int scene)
+    cdef bool mixer_is_scene_stored "is_scene_stored" (jack_mixer_t mixer, int scene)
+    cdef int mixer_get_current_scene "get_current_scene" (jack_mixer_t mixer)
+    cdef double mixer_get_scene_crossfade "get_scene_crossfade" (jack_mixer_t mixer)
+    cdef void mixer_set_scene_crossfade "set_scene_crossfade" (jack_mixer_t mixer, double crossfade)
 
     # not used by Python
     #cdef void channels_volumes_read(jack_mixer_t mixer)
@@ -117,6 +202,12 @@ cdef extern from "jack_mixer.h":
     cdef void channel_unsolo(jack_mixer_channel_t channel)
 
     cdef bool channel_is_stereo(jack_mixer_channel_t channel)
+    cdef unsigned int channel_get_meter_slot(jack_mixer_channel_t channel)
+    cdef unsigned int channel_get_nan_events_count(jack_mixer_channel_t channel)
+    cdef int channel_set_offline_buffers(
+        jack_mixer_channel_t channel,
+        float * left_buffer_ptr,
+        float * right_buffer_ptr)
 
     cdef void channel_set_midi_change_callback(
         jack_mixer_channel_t channel,
@@ -155,6 +246,7 @@ cdef extern from "jack_mixer.h":
         bool muted_value)
     cdef bool output_channel_is_prefader(
         jack_mixer_output_channel_t output_channel)
+    cdef double output_channel_get_mix_time(jack_mixer_output_channel_t output_channel)
     cdef void output_channel_set_prefader(
         jack_mixer_output_channel_t output_channel,
         bool pfl_value)
@@ -172,4 +264,12 @@ cdef extern from "jack_mixer.h":
         jack_mixer_output_channel_t output_channel,
         jack_mixer_channel_t channel,
         bool solo_value)
+    cdef int output_channel_set_mix_minus(
+        jack_mixer_output_channel_t output_channel,
+        jack_mixer_output_channel_t source,
+        jack_mixer_channel_t channel)
+    cdef jack_mixer_output_channel_t output_channel_get_mix_minus_source(
+        jack_mixer_output_channel_t output_channel)
+    cdef jack_mixer_channel_t output_channel_get_mix_minus_channel(
+        jack_mixer_output_channel_t output_channel)
     cdef void remove_output_channel(jack_mixer_output_channel_t output_channel)
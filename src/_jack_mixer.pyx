@@ -3,10 +3,12 @@
 #
 """Python bindings for jack_mixer.c and scale.c using Cython."""
 
-__all__ = ("Scale", "MidiBehaviour", "Mixer")
+__all__ = ("Scale", "MidiBehaviour", "MeterValue", "ProcessStage", "Parameter", "Mixer")
 
 import enum
 
+from cython.view cimport array as cvarray
+
 from _jack_mixer cimport *
 
 
@@ -48,6 +50,54 @@ class MeterMode(enum.IntEnum):
     POST_FADER = 1
 
 
+class MeterValue(enum.IntEnum):
+    """Column index of values returned by `Mixer.read_meters()`.
+
+    Right side values of mono channels are -inf.
+    """
+    METER_PREFADER_LEFT = 0
+    METER_PREFADER_RIGHT = 1
+    METER_POSTFADER_LEFT = 2
+    METER_POSTFADER_RIGHT = 3
+    KMETER_RMS_PREFADER_LEFT = 4
+    KMETER_RMS_PREFADER_RIGHT = 5
+    KMETER_PREFADER_LEFT = 6
+    KMETER_PREFADER_RIGHT = 7
+    KMETER_RMS_POSTFADER_LEFT = 8
+    KMETER_RMS_POSTFADER_RIGHT = 9
+    KMETER_POSTFADER_LEFT = 10
+    KMETER_POSTFADER_RIGHT = 11
+    ABSPEAK_PREFADER = 12
+    ABSPEAK_POSTFADER = 13
+
+
+class ProcessStage(enum.IntEnum):
+    """Stage of the process cycle in `Mixer.process_stats`."""
+    MIDI_IN = 0
+    INPUTS = 1
+    OUTPUTS = 2
+    MIDI_OUT = 3
+    PROCESS = 4
+
+
+class Parameter(enum.IntEnum):
+    """Channel parameter changed by `Mixer.apply()`.
+
+    `SOLO` applies to input channels only, `PREFADER` to output channels
+    only. The `SEND_*` parameters set the routing of an input channel into
+    an output channel, like `OutputChannel.set_muted()`, `set_solo()` and
+    `set_in_prefader()`.
+    """
+    VOLUME = 0
+    BALANCE = 1
+    MUTE = 2
+    SOLO = 3
+    PREFADER = 4
+    SEND_MUTE = 5
+    SEND_SOLO = 6
+    SEND_PREFADER = 7
+
+
 cdef class Scale:
     """Mixer level scale representation.
 
@@ -83,6 +133,24 @@ cdef class Scale:
         """Return dB value responding to given scale value."""
         return scale_scale_to_db(self._scale, scale_value)
 
+    def db_to_scale_array(self, values):
+        """Return scale values responding to given dB values.
+
+        Takes a non-empty C-contiguous float32 buffer of any shape, like the
+        memoryview returned by `Mixer.read_meters()`, and returns a float32
+        memoryview of the same shape.
+        """
+        cdef object db_view = memoryview(values)
+        cdef const float[::1] db_values = db_view.cast("B").cast("f")
+        cdef unsigned int count = db_values.shape[0]
+        cdef cvarray result = cvarray(shape=(count,), itemsize=sizeof(float), format="f")
+        cdef float[::1] scale_values = result
+
+        with nogil:
+            scale_db_to_scale_array(self._scale, &db_values[0], &scale_values[0], count)
+
+        return memoryview(result).cast("B").cast("f", db_view.shape)
+
 
 cdef class Mixer:
     """Jack Mixer representation.
@@ -92,10 +160,15 @@ cdef class Mixer:
 
     cdef jack_mixer_t _mixer
     cdef bool _stereo
+    cdef dict _offline_buffers
 
-    def __cinit__(self, name, stereo=True):
+    def __cinit__(self, name, stereo=True, offline=False, sample_rate=48000, buffer_size=1024):
         self._stereo = stereo
-        self._mixer = mixer_create(name.encode('utf-8'), stereo)
+        self._offline_buffers = {}
+        if offline:
+            self._mixer = mixer_create_offline(name.encode('utf-8'), sample_rate, buffer_size)
+        else:
+            self._mixer = mixer_create(name.encode('utf-8'), stereo)
         if self._mixer == NULL:
             raise RuntimeError(jack_mixer_error_str().decode('utf-8'))
 
@@ -122,6 +195,69 @@ cdef class Mixer:
         """Jack client name of mixer."""
         return mixer_get_client_name(self._mixer).decode('utf-8')
 
+    @property
+    def sample_rate(self):
+        """Sample rate of mixer in Hz."""
+        return mixer_get_sample_rate(self._mixer)
+
+    @property
+    def buffer_size(self):
+        """Maximum number of frames of a process cycle."""
+        return mixer_get_buffer_size(self._mixer)
+
+    @property
+    def offline(self):
+        """Whether the mixer runs without JACK, see `process_offline()`."""
+        return mixer_is_offline(self._mixer)
+
+    def set_offline_buffers(self, Channel channel, float[::1] left, float[::1] right=None):
+        """Set the float32 buffers an offline mixer uses for channel ports.
+
+        Input channels read their signal from the buffers, output channels
+        write to them, in each following process cycle. Buffers must hold
+        at least `buffer_size` samples. `right` is required for stereo
+        channels and ignored for mono ones. Pass `None` as `left` to make
+        inputs silent and discard outputs again.
+        """
+        cdef float * left_ptr = NULL
+        cdef float * right_ptr = NULL
+        cdef unsigned int size = mixer_get_buffer_size(self._mixer)
+
+        if left is not None:
+            if channel_is_stereo(channel._channel) and right is None:
+                raise ValueError("stereo channels need a right buffer")
+            for buffer in (left, right):
+                if buffer is not None and buffer.shape[0] < size:
+                    raise ValueError("buffers must hold at least %u samples" % size)
+
+            left_ptr = &left[0]
+            if right is not None:
+                right_ptr = &right[0]
+
+        if channel_set_offline_buffers(channel._channel, left_ptr, right_ptr) != 0:
+            raise RuntimeError("mixer is not offline")
+
+        # Keep buffers alive while the mixer uses them
+        if left is None:
+            self._offline_buffers.pop(channel.meter_slot, None)
+        else:
+            self._offline_buffers[channel.meter_slot] = (left, right)
+
+    def process_offline(self, nframes=None):
+        """Run one process cycle of an offline mixer.
+
+        Processes `nframes` frames, by default `buffer_size`, from and to
+        the buffers set with `set_offline_buffers()`.
+        """
+        cdef unsigned int frames = self.buffer_size if nframes is None else nframes
+        cdef int ret
+
+        with nogil:
+            ret = mixer_offline_process(self._mixer, frames)
+
+        if ret != 0:
+            raise RuntimeError(jack_mixer_error_str().decode('utf-8'))
+
     @property
     def last_midi_cc(self):
         """Last received MIDI control change message."""
@@ -144,6 +280,85 @@ cdef class Mixer:
         mixer_set_midi_behavior_mode(self._mixer,
                                      mode.value if isinstance(mode, MidiBehaviour) else mode)
 
+    def read_meters(self):
+        """Read meter values of all channels at once.
+
+        Returns a two-dimensional float32 memoryview in dBFS, with a row for
+        each channel meter slot (see `Channel.meter_slot`) and a column for
+        each `MeterValue`. Reading resets kmeter RMS values of all channels.
+        """
+        cdef unsigned int count = mixer_get_meter_slots_count(self._mixer)
+        cdef cvarray values = cvarray(shape=(count, sizeof(meter_values) // sizeof(float)),
+                                      itemsize=sizeof(float), format="f")
+        mixer_read_meters(self._mixer, <meter_values *> values.data, count)
+        return memoryview(values)
+
+    @property
+    def midi_change_fd(self):
+        """File descriptor which becomes readable when channels were changed via MIDI.
+
+        Watch it in the main loop and call `dispatch_midi_changes()` when
+        it is readable.
+        """
+        return mixer_get_midi_change_fd(self._mixer)
+
+    @property
+    def process_stats(self):
+        """Timing of about the last second of process cycles.
+
+        Returns `None` until enough cycles were processed, otherwise a dict
+        with the number of `cycles`, the average `period` duration in µs,
+        the DSP `load` (share of the period spent processing) and the
+        `stages` of the cycle, mapping each `ProcessStage` to a tuple of
+        the minimum, average, 99th percentile and maximum duration in µs.
+        """
+        cdef process_stats stats
+
+        if not mixer_get_process_stats(self._mixer, &stats):
+            return None
+
+        return {
+            "cycles": stats.cycles,
+            "period": stats.period,
+            "load": stats.load,
+            "stages": {
+                stage: (stats.stages[stage].min, stats.stages[stage].avg,
+                        stats.stages[stage].p99, stats.stages[stage].max)
+                for stage in ProcessStage
+            },
+        }
+
+    @property
+    def xruns(self):
+        """Number of xruns reported by JACK since the mixer was created."""
+        return mixer_get_xruns_count(self._mixer)
+
+    @property
+    def memory_usage(self):
+        """Memory used by the mixer engine in bytes.
+
+        Returns a dict with the size of the `scratch` buffers for one period
+        of all channels, the published `topology`, the `channels` state, the
+        published `meters` values and the `total` of these.
+        """
+        cdef memory_usage usage
+
+        mixer_get_memory_usage(self._mixer, &usage)
+        return {
+            "scratch": usage.scratch,
+            "topology": usage.topology,
+            "channels": usage.channels,
+            "meters": usage.meters,
+            "total": usage.total,
+        }
+
+    def dispatch_midi_changes(self):
+        """Call the `midi_change_callback` of channels changed via MIDI.
+
+        Must be called from the thread which adds and removes channels.
+        """
+        mixer_dispatch_midi_changes(self._mixer)
+
     cpdef add_channel(self, channel_name, stereo=None):
         """Add a stereo or mono input channel with given name to the mixer.
 
@@ -188,6 +403,161 @@ cdef class Mixer:
     def kmetering(self, bool flag):
         mixer_set_kmetering(self._mixer, flag)
 
+    @property
+    def block_processing(self):
+        """Using vectorized block kernels for channels with constant gain."""
+        return mixer_get_block_processing(self._mixer)
+
+    @block_processing.setter
+    def block_processing(self, bool flag):
+        mixer_set_block_processing(self._mixer, flag)
+
+    @property
+    def flush_denormals(self):
+        """Flushing denormal numbers to zero in the audio processing threads."""
+        return mixer_get_flush_denormals(self._mixer)
+
+    @flush_denormals.setter
+    def flush_denormals(self, bool flag):
+        mixer_set_flush_denormals(self._mixer, flag)
+
+    @property
+    def denormal_cycles(self):
+        """Number of process cycles which computed with denormal numbers."""
+        return mixer_get_denormal_cycles_count(self._mixer)
+
+    @property
+    def midi_split_frames(self):
+        """Minimum block size in frames when splitting a period at MIDI control events.
+
+        0 (the default) applies all MIDI control events at the start of the period.
+        """
+        return mixer_get_midi_split_frames(self._mixer)
+
+    @midi_split_frames.setter
+    def midi_split_frames(self, unsigned int frames):
+        mixer_set_midi_split_frames(self._mixer, frames)
+
+    @property
+    def worker_threads(self):
+        """Number of worker threads sharing the processing with the JACK process thread.
+
+        0 (the default) does all processing in the JACK process thread.
+        """
+        return mixer_get_worker_threads(self._mixer)
+
+    @worker_threads.setter
+    def worker_threads(self, unsigned int count):
+        if mixer_set_worker_threads(self._mixer, count) != 0:
+            raise RuntimeError(jack_mixer_error_str().decode('utf-8'))
+
+    @property
+    def dsp_kernels(self):
+        """Name of the block kernel implementation selected for this CPU."""
+        return dsp_get_kernel_name().decode('utf-8')
+
+    def apply(self, changes):
+        """Apply a sequence of channel parameter changes at once.
+
+        Each change is a `(channel, parameter, value)` tuple, with a
+        `Parameter` and a value as taken by the corresponding channel
+        property, or `(output_channel, parameter, input_channel, value)` for
+        the `SEND_*` parameters. All changes take effect in the same process
+        cycle. Volume, balance, mute and solo read back from channels
+        reflect them once that cycle started.
+        """
+        cdef list items = list(changes)
+        cdef unsigned int count = len(items)
+        cdef cvarray buffer
+        cdef channel_change * changes_ptr
+        cdef Channel channel
+        cdef OutputChannel output_channel
+        cdef unsigned int i
+        cdef int ret
+
+        if count == 0:
+            return
+
+        buffer = cvarray(shape=(count * sizeof(channel_change),), itemsize=1, format="B")
+        changes_ptr = <channel_change *> buffer.data
+
+        for i in range(count):
+            change = items[i]
+            parameter = Parameter(change[1])
+            changes_ptr[i].parameter = <channel_parameter> <int> parameter
+            changes_ptr[i].input_channel = NULL
+
+            if parameter >= Parameter.SEND_MUTE:
+                output_channel, _, channel, value = change
+                if isinstance(channel, OutputChannel):
+                    raise ValueError("sends can only be changed for input channels")
+                changes_ptr[i].channel = output_channel._channel
+                changes_ptr[i].input_channel = channel._channel
+            else:
+                channel, _, value = change
+                if parameter == Parameter.SOLO and isinstance(channel, OutputChannel):
+                    raise ValueError("output channels can not be soloed")
+                if parameter == Parameter.PREFADER and not isinstance(channel, OutputChannel):
+                    raise ValueError("only output channels can be set to pre-fader")
+                changes_ptr[i].channel = channel._channel
+
+            changes_ptr[i].value = value
+
+        with nogil:
+            ret = mixer_apply_changes(self._mixer, changes_ptr, count)
+
+        if ret != 0:
+            raise RuntimeError(jack_mixer_error_str().decode('utf-8'))
+
+    def store_scene(self, int scene):
+        """Store volume, balance, mute, solo and routing of all channels as a scene.
+
+        Scenes are numbered 0-127, like the MIDI Program Change messages
+        recalling them. System output channels are not included.
+        """
+        if mixer_store_scene(self._mixer, scene) != 0:
+            raise ValueError(jack_mixer_error_str().decode('utf-8'))
+
+    def recall_scene(self, int scene, double crossfade=0.0):
+        """Recall a stored scene, fading volume and balance over `crossfade` seconds.
+
+        The engine applies the scene to all channels in the same period and
+        calls the `midi_change_callback` of every channel on the next
+        `dispatch_midi_changes()`.
+        """
+        if crossfade < 0:
+            raise ValueError("crossfade time must not be negative")
+
+        if mixer_recall_scene(self._mixer, scene, crossfade) != 0:
+            raise ValueError(jack_mixer_error_str().decode('utf-8'))
+
+    def clear_scene(self, int scene):
+        """Forget a stored scene."""
+        if mixer_clear_scene(self._mixer, scene) != 0:
+            raise ValueError(jack_mixer_error_str().decode('utf-8'))
+
+    def is_scene_stored(self, int scene):
+        """Whether a scene was stored with the given number."""
+        return mixer_is_scene_stored(self._mixer, scene)
+
+    @property
+    def current_scene(self):
+        """Number of the last recalled scene, `None` if none was recalled."""
+        cdef int scene = mixer_get_current_scene(self._mixer)
+        return scene if scene != -1 else None
+
+    @property
+    def scene_crossfade(self):
+        """Crossfade time in seconds of scenes recalled via MIDI Program Change."""
+        return mixer_get_scene_crossfade(self._mixer)
+
+    @scene_crossfade.setter
+    def scene_crossfade(self, double crossfade):
+        if crossfade < 0:
+            raise ValueError("crossfade time must not be negative")
+
+        mixer_set_scene_crossfade(self._mixer, crossfade)
+
 cdef class Channel:
     """Jack Mixer (input) channel representation.
 
@@ -257,6 +627,16 @@ cdef class Channel:
         """Is channel stereo or mono?"""
         return channel_is_stereo(self._channel)
 
+    @property
+    def meter_slot(self):
+        """Row of the channel in meter values returned by `Mixer.read_meters()`."""
+        return channel_get_meter_slot(self._channel)
+
+    @property
+    def nan_events(self):
+        """Number of input blocks with Inf or NaN samples, which were silenced."""
+        return channel_get_nan_events_count(self._channel)
+
     @property
     def kmeter_prefader(self):
         """Read channel prefader kmeter.
@@ -336,7 +716,8 @@ cdef class Channel:
     def midi_change_callback(self):
         """Function to be called when a channel property is changed via MIDI.
 
-        The callback function takes no arguments.
+        The callback function takes no arguments. It is called from
+        `Mixer.dispatch_midi_changes()`.
 
         Assign `None` to remove any existing callback.
         """
@@ -519,6 +900,11 @@ cdef class OutputChannel(Channel):
     def prefader(self, bool pfl):
         output_channel_set_prefader(self._output_channel, pfl)
 
+    @property
+    def mix_time(self):
+        """Average time spent mixing this channel per process cycle in µs."""
+        return output_channel_get_mix_time(self._output_channel)
+
     def is_in_prefader(self, Channel channel):
         """Is a channel set as prefader?"""
         return output_channel_is_in_prefader(self._output_channel, channel._channel)
@@ -543,6 +929,29 @@ cdef class OutputChannel(Channel):
         """Set a channel as solo."""
         output_channel_set_solo(self._output_channel, channel._channel, value)
 
+    @property
+    def is_mix_minus(self):
+        """Does this channel carry the mix of another output channel minus one input channel?"""
+        return output_channel_get_mix_minus_source(self._output_channel) != NULL
+
+    def set_mix_minus(self, OutputChannel source, Channel channel=None):
+        """Carry the mix of source without the signal of channel (mix-minus).
+
+        The sum of source is computed once for all its mix-minus channels.
+        This channel's own input channel routing is not used while set.
+        Pass None as source to turn it back into a regular output channel.
+        """
+        cdef jack_mixer_output_channel_t source_ptr = NULL
+        cdef jack_mixer_channel_t channel_ptr = NULL
+
+        if source is not None:
+            source_ptr = source._output_channel
+        if channel is not None:
+            channel_ptr = channel._channel
+
+        if output_channel_set_mix_minus(self._output_channel, source_ptr, channel_ptr) != 0:
+            raise RuntimeError(jack_mixer_error_str().decode('utf-8'))
+
     def remove(self):
         """Remove output channel."""
         remove_output_channel(self._output_channel)
@@ -0,0 +1,225 @@
+/* -*- Mode: C ; c-basic-offset: 2 -*- */
+/*****************************************************************************
+ *
+ *   This file is part of jack_mixer
+ *
+ *   This program is free software; you can redistribute it and/or modify
+ *   it under the terms of the GNU General Public License as published by
+ *   the Free Software Foundation; version 2 of the License
+ *
+ *   This program is distributed in the hope that it will be useful,
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ *   GNU General Public License for more details.
+ *
+ *   You should have received a copy of the GNU General Public License
+ *   along with this program; if not, write to the Free Software
+ *   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA.
+ *
+ *****************************************************************************/
+
+/*
+ * Audio backends of the mixer engine
+ *
+ * The engine talks to the audio system through the functions below only,
+ * so it can run either as a JACK client or offline. The offline backend
+ * runs process cycles on request of the caller, on buffers supplied by
+ * the caller, without any audio server.
+ *
+ * Port types and flags are the JACK ones for all backends.
+ */
+
+#ifndef _BACKEND_H
+#define _BACKEND_H
+
+#include <stdbool.h>
+#include <pthread.h>
+#include <jack/jack.h>
+
+typedef struct backend_port backend_port_t;
+
+struct backend;
+
+struct backend_ops {
+  const char * name;
+  void (*close)(struct backend * backend_ptr);
+  const char * (*get_client_name)(struct backend * backend_ptr);
+  jack_nframes_t (*get_sample_rate)(struct backend * backend_ptr);
+  jack_nframes_t (*get_buffer_size)(struct backend * backend_ptr);
+  int (*set_process_callback)(struct backend * backend_ptr, JackProcessCallback callback, void * arg);
+  int (*set_buffer_size_callback)(struct backend * backend_ptr, JackBufferSizeCallback callback, void * arg);
+  int (*set_xrun_callback)(struct backend * backend_ptr, JackXRunCallback callback, void * arg);
+  int (*activate)(struct backend * backend_ptr);
+  backend_port_t * (*port_register)(struct backend * backend_ptr, const char * name, const char * type,
+                                    unsigned long flags);
+  int (*port_unregister)(struct backend * backend_ptr, backend_port_t * port_ptr);
+  int (*port_rename)(struct backend * backend_ptr, backend_port_t * port_ptr, const char * name);
+  void * (*port_get_buffer)(backend_port_t * port_ptr, jack_nframes_t nframes);
+  bool (*port_connected)(backend_port_t * port_ptr);
+  int (*create_thread)(struct backend * backend_ptr, pthread_t * thread_ptr, void *(*fn)(void *), void * arg);
+};
+
+struct backend {
+  const struct backend_ops *ops;
+};
+
+/* Open a JACK client, returns NULL on failure */
+struct backend *
+backend_jack_open(
+  const char * client_name);
+
+/*
+ * Open an offline backend running at the given sample rate, with periods
+ * of at most buffer_size frames. Returns NULL on failure.
+ */
+struct backend *
+backend_offline_open(
+  const char * client_name,
+  jack_nframes_t sample_rate,
+  jack_nframes_t buffer_size);
+
+bool
+backend_is_offline(
+  struct backend * backend_ptr);
+
+/*
+ * Run one process cycle of nframes frames on an offline backend, returns
+ * the process callback result, or -1 if nframes is larger than the buffer
+ * size or the backend is not active
+ */
+int
+backend_offline_process(
+  struct backend * backend_ptr,
+  jack_nframes_t nframes);
+
+/*
+ * Use buffer, at least buffer_size samples long and owned by the caller,
+ * for an audio port of an offline backend. Input ports read the signal
+ * from it and output ports write to it. NULL reverts to an internal
+ * buffer, silent for input ports.
+ */
+void
+backend_offline_set_port_buffer(
+  struct backend * backend_ptr,
+  backend_port_t * port_ptr,
+  float * buffer);
+
+static inline void
+backend_close(
+  struct backend * backend_ptr)
+{
+  backend_ptr->ops->close(backend_ptr);
+}
+
+static inline const char *
+backend_get_client_name(
+  struct backend * backend_ptr)
+{
+  return backend_ptr->ops->get_client_name(backend_ptr);
+}
+
+static inline jack_nframes_t
+backend_get_sample_rate(
+  struct backend * backend_ptr)
+{
+  return backend_ptr->ops->get_sample_rate(backend_ptr);
+}
+
+static inline jack_nframes_t
+backend_get_buffer_size(
+  struct backend * backend_ptr)
+{
+  return backend_ptr->ops->get_buffer_size(backend_ptr);
+}
+
+static inline int
+backend_set_process_callback(
+  struct backend * backend_ptr,
+  JackProcessCallback callback,
+  void * arg)
+{
+  return backend_ptr->ops->set_process_callback(backend_ptr, callback, arg);
+}
+
+static inline int
+backend_set_buffer_size_callback(
+  struct backend * backend_ptr,
+  JackBufferSizeCallback callback,
+  void * arg)
+{
+  return backend_ptr->ops->set_buffer_size_callback(backend_ptr, callback, arg);
+}
+
+static inline int
+backend_set_xrun_callback(
+  struct backend * backend_ptr,
+  JackXRunCallback callback,
+  void * arg)
+{
+  return backend_ptr->ops->set_xrun_callback(backend_ptr, callback, arg);
+}
+
+static inline int
+backend_activate(
+  struct backend * backend_ptr)
+{
+  return backend_ptr->ops->activate(backend_ptr);
+}
+
+static inline backend_port_t *
+backend_port_register(
+  struct backend * backend_ptr,
+  const char * name,
+  const char * type,
+  unsigned long flags)
+{
+  return backend_ptr->ops->port_register(backend_ptr, name, type, flags);
+}
+
+static inline int
+backend_port_unregister(
+  struct backend * backend_ptr,
+  backend_port_t * port_ptr)
+{
+  return backend_ptr->ops->port_unregister(backend_ptr, port_ptr);
+}
+
+static inline int
+backend_port_rename(
+  struct backend * backend_ptr,
+  backend_port_t * port_ptr,
+  const char * name)
+{
+  return backend_ptr->ops->port_rename(backend_ptr, port_ptr, name);
+}
+
+/* Called from the process callback only */
+static inline void *
+backend_port_get_buffer(
+  struct backend * backend_ptr,
+  backend_port_t * port_ptr,
+  jack_nframes_t nframes)
+{
+  return backend_ptr->ops->port_get_buffer(port_ptr, nframes);
+}
+
+static inline bool
+backend_port_connected(
+  struct backend * backend_ptr,
+  backend_port_t * port_ptr)
+{
+  return backend_ptr->ops->port_connected(port_ptr);
+}
+
+/* Create a thread for sharing the work of the process callback */
+static inline int
+backend_create_thread(
+  struct backend * backend_ptr,
+  pthread_t * thread_ptr,
+  void *(*fn)(void *),
+  void * arg)
+{
+  return backend_ptr->ops->create_thread(backend_ptr, thread_ptr, fn, arg);
+}
+
+#endif /* #ifndef _BACKEND_H */
@@ -0,0 +1,195 @@
+/* -*- Mode: C ; c-basic-offset: 2 -*- */
+/*****************************************************************************
+ *
+ *   This file is part of jack_mixer
+ *
+ *   This program is free software; you can redistribute it and/or modify
+ *   it under the terms of the GNU General Public License as published by
+ *   the Free Software Foundation; version 2 of the License
+ *
+ *   This program is distributed in the hope that it will be useful,
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ *   GNU General Public License for more details.
+ *
+ *   You should have received a copy of the GNU General Public License
+ *   along with this program; if not, write to the Free Software
+ *   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA.
+ *
+ *****************************************************************************/
+
+/* Backend running the mixer as a JACK client */
+
+#include <stdlib.h>
+#include <jack/jack.h>
+
+#include "backend.h"
+
+struct jack_backend {
+  struct backend backend;
+  jack_client_t *client;
+};
+
+#define jack_backend_ptr ((struct jack_backend *)backend_ptr)
+
+static void
+jack_close(
+  struct backend * backend_ptr)
+{
+  jack_client_close(jack_backend_ptr->client);
+  free(jack_backend_ptr);
+}
+
+static const char *
+jack_get_client_name_op(
+  struct backend * backend_ptr)
+{
+  return jack_get_client_name(jack_backend_ptr->client);
+}
+
+static jack_nframes_t
+jack_get_sample_rate_op(
+  struct backend * backend_ptr)
+{
+  return jack_get_sample_rate(jack_backend_ptr->client);
+}
+
+static jack_nframes_t
+jack_get_buffer_size_op(
+  struct backend * backend_ptr)
+{
+  return jack_get_buffer_size(jack_backend_ptr->client);
+}
+
+static int
+jack_set_process_callback_op(
+  struct backend * backend_ptr,
+  JackProcessCallback callback,
+  void * arg)
+{
+  return jack_set_process_callback(jack_backend_ptr->client, callback, arg);
+}
+
+static int
+jack_set_buffer_size_callback_op(
+  struct backend * backend_ptr,
+  JackBufferSizeCallback callback,
+  void * arg)
+{
+  return jack_set_buffer_size_callback(jack_backend_ptr->client, callback, arg);
+}
+
+static int
+jack_set_xrun_callback_op(
+  struct backend * backend_ptr,
+  JackXRunCallback callback,
+  void * arg)
+{
+  return jack_set_xrun_callback(jack_backend_ptr->client, callback, arg);
+}
+
+static int
+jack_activate_op(
+  struct backend * backend_ptr)
+{
+  return jack_activate(jack_backend_ptr->client);
+}
+
+static backend_port_t *
+jack_port_register_op(
+  struct backend * backend_ptr,
+  const char * name,
+  const char * type,
+  unsigned long flags)
+{
+  return (backend_port_t *)jack_port_register(jack_backend_ptr->client, name, type, flags, 0);
+}
+
+static int
+jack_port_unregister_op(
+  struct backend * backend_ptr,
+  backend_port_t * port_ptr)
+{
+  return jack_port_unregister(jack_backend_ptr->client, (jack_port_t *)port_ptr);
+}
+
+static int
+jack_port_rename_op(
+  struct backend * backend_ptr,
+  backend_port_t * port_ptr,
+  const char * name)
+{
+  return jack_port_rename(jack_backend_ptr->client, (jack_port_t *)port_ptr, name);
+}
+
+static void *
+jack_port_get_buffer_op(
+  backend_port_t * port_ptr,
+  jack_nframes_t nframes)
+{
+  return jack_port_get_buffer((jack_port_t *)port_ptr, nframes);
+}
+
+static bool
+jack_port_connected_op(
+  backend_port_t * port_ptr)
+{
+  return jack_port_connected((jack_port_t *)port_ptr) != 0;
+}
+
+static int
+jack_create_thread_op(
+  struct backend * backend_ptr,
+  pthread_t * thread_ptr,
+  void *(*fn)(void *),
+  void * arg)
+{
+  /* Run with real-time priority when the JACK server does */
+  return jack_client_create_thread(jack_backend_ptr->client,
+                                   thread_ptr,
+                                   jack_client_real_time_priority(jack_backend_ptr->client),
+                                   jack_is_realtime(jack_backend_ptr->client),
+                                   fn,
+                                   arg);
+}
+
+static const struct backend_ops jack_backend_ops = {
+  .name = "jack",
+  .close = jack_close,
+  .get_client_name = jack_get_client_name_op,
+  .get_sample_rate = jack_get_sample_rate_op,
+  .get_buffer_size = jack_get_buffer_size_op,
+  .set_process_callback = jack_set_process_callback_op,
+  .set_buffer_size_callback = jack_set_buffer_size_callback_op,
+  .set_xrun_callback = jack_set_xrun_callback_op,
+  .activate = jack_activate_op,
+  .port_register = jack_port_register_op,
+  .port_unregister = jack_port_unregister_op,
+  .port_rename = jack_port_rename_op,
+  .port_get_buffer = jack_port_get_buffer_op,
+  .port_connected = jack_port_connected_op,
+  .create_thread = jack_create_thread_op,
+};
+
+struct backend *
+backend_jack_open(
+  const char * client_name)
+{
+  struct jack_backend *backend_ptr;
+
+  backend_ptr = malloc(sizeof(struct jack_backend));
+  if (backend_ptr == NULL)
+  {
+    return NULL;
+  }
+
+  backend_ptr->backend.ops = &jack_backend_ops;
+  backend_ptr->client = jack_client_open(client_name, 0, NULL);
+  if (backend_ptr->client == NULL)
+  {
+    free(backend_ptr);
+    return NULL;
+  }
+
+  return &backend_ptr->backend;
+}
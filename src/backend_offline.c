@@ -0,0 +1,384 @@
+/* -*- Mode: C ; c-basic-offset: 2 -*- */
+/*****************************************************************************
+ *
+ *   This file is part of jack_mixer
+ *
+ *   This program is free software; you can redistribute it and/or modify
+ *   it under the terms of the GNU General Public License as published by
+ *   the Free Software Foundation; version 2 of the License
+ *
+ *   This program is distributed in the hope that it will be useful,
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ *   GNU General Public License for more details.
+ *
+ *   You should have received a copy of the GNU General Public License
+ *   along with this program; if not, write to the Free Software
+ *   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA.
+ *
+ *****************************************************************************/
+
+/*
+ * Backend running the mixer without any audio server
+ *
+ * Process cycles run in the thread calling backend_offline_process(), on
+ * buffers supplied by the caller. Audio ports without such a buffer read
+ * silence and write to an internal buffer. MIDI ports have no buffer, the
+ * process callback skips them.
+ *
+ * A mutex serializes process cycles with changes of ports, so channels
+ * may be added, removed and fed from another thread.
+ */
+
+#include <stdlib.h>
+#include <string.h>
+#include <pthread.h>
+#include <jack/jack.h>
+
+#include "backend.h"
+
+struct backend_port {
+  struct backend_port *next;
+  char *name;
+  unsigned long flags;
+  bool audio;
+  float *buffer;                /* Internal buffer */
+  float *user_buffer;           /* Buffer set by the caller, or NULL */
+};
+
+struct offline_backend {
+  struct backend backend;
+  char *client_name;
+  jack_nframes_t sample_rate;
+  jack_nframes_t buffer_size;
+  JackProcessCallback process;
+  void *process_arg;
+  bool active;
+  pthread_mutex_t mutex;
+  struct backend_port *ports;
+};
+
+#define offline_backend_ptr ((struct offline_backend *)backend_ptr)
+
+static void
+free_port(
+  struct backend_port * port_ptr)
+{
+  free(port_ptr->buffer);
+  free(port_ptr->name);
+  free(port_ptr);
+}
+
+static void
+offline_close(
+  struct backend * backend_ptr)
+{
+  struct backend_port *port_ptr;
+
+  while (offline_backend_ptr->ports != NULL)
+  {
+    port_ptr = offline_backend_ptr->ports;
+    offline_backend_ptr->ports = port_ptr->next;
+    free_port(port_ptr);
+  }
+
+  pthread_mutex_destroy(&offline_backend_ptr->mutex);
+  free(offline_backend_ptr->client_name);
+  free(offline_backend_ptr);
+}
+
+static const char *
+offline_get_client_name(
+  struct backend * backend_ptr)
+{
+  return offline_backend_ptr->client_name;
+}
+
+static jack_nframes_t
+offline_get_sample_rate(
+  struct backend * backend_ptr)
+{
+  return offline_backend_ptr->sample_rate;
+}
+
+static jack_nframes_t
+offline_get_buffer_size(
+  struct backend * backend_ptr)
+{
+  return offline_backend_ptr->buffer_size;
+}
+
+static int
+offline_set_process_callback(
+  struct backend * backend_ptr,
+  JackProcessCallback callback,
+  void * arg)
+{
+  offline_backend_ptr->process = callback;
+  offline_backend_ptr->process_arg = arg;
+  return 0;
+}
+
+static int
+offline_set_buffer_size_callback(
+  struct backend * backend_ptr,
+  JackBufferSizeCallback callback,
+  void * arg)
+{
+  (void) backend_ptr;
+  (void) callback;
+  (void) arg;
+
+  /* The buffer size never changes */
+  return 0;
+}
+
+static int
+offline_set_xrun_callback(
+  struct backend * backend_ptr,
+  JackXRunCallback callback,
+  void * arg)
+{
+  (void) backend_ptr;
+  (void) callback;
+  (void) arg;
+
+  /* Cycles never run late without a deadline */
+  return 0;
+}
+
+static int
+offline_activate(
+  struct backend * backend_ptr)
+{
+  offline_backend_ptr->active = true;
+  return 0;
+}
+
+static backend_port_t *
+offline_port_register(
+  struct backend * backend_ptr,
+  const char * name,
+  const char * type,
+  unsigned long flags)
+{
+  struct backend_port *port_ptr;
+
+  port_ptr = calloc(1, sizeof(struct backend_port));
+  if (port_ptr == NULL)
+  {
+    return NULL;
+  }
+
+  port_ptr->name = strdup(name);
+  if (port_ptr->name == NULL)
+  {
+    goto fail_free;
+  }
+
+  port_ptr->flags = flags;
+  port_ptr->audio = strcmp(type, JACK_DEFAULT_AUDIO_TYPE) == 0;
+  if (port_ptr->audio)
+  {
+    port_ptr->buffer = calloc(offline_backend_ptr->buffer_size, sizeof(float));
+    if (port_ptr->buffer == NULL)
+    {
+      goto fail_free;
+    }
+  }
+
+  pthread_mutex_lock(&offline_backend_ptr->mutex);
+  port_ptr->next = offline_backend_ptr->ports;
+  offline_backend_ptr->ports = port_ptr;
+  pthread_mutex_unlock(&offline_backend_ptr->mutex);
+
+  return port_ptr;
+
+fail_free:
+  free_port(port_ptr);
+  return NULL;
+}
+
+static int
+offline_port_unregister(
+  struct backend * backend_ptr,
+  backend_port_t * port_ptr)
+{
+  struct backend_port **link_ptr;
+
+  pthread_mutex_lock(&offline_backend_ptr->mutex);
+
+  for (link_ptr = &offline_backend_ptr->ports; *link_ptr != NULL; link_ptr = &(*link_ptr)->next)
+  {
+    if (*link_ptr == port_ptr)
+    {
+      *link_ptr = port_ptr->next;
+      pthread_mutex_unlock(&offline_backend_ptr->mutex);
+      free_port(port_ptr);
+      return 0;
+    }
+  }
+
+  pthread_mutex_unlock(&offline_backend_ptr->mutex);
+  return -1;
+}
+
+static int
+offline_port_rename(
+  struct backend * backend_ptr,
+  backend_port_t * port_ptr,
+  const char * name)
+{
+  (void) backend_ptr;
+  char *name_ptr;
+
+  name_ptr = strdup(name);
+  if (name_ptr == NULL)
+  {
+    return -1;
+  }
+
+  free(port_ptr->name);
+  port_ptr->name = name_ptr;
+  return 0;
+}
+
+static void *
+offline_port_get_buffer(
+  backend_port_t * port_ptr,
+  jack_nframes_t nframes)
+{
+  (void) nframes;
+
+  if (!port_ptr->audio)
+  {
+    return NULL;
+  }
+
+  if (port_ptr->user_buffer != NULL)
+  {
+    return port_ptr->user_buffer;
+  }
+
+  return port_ptr->buffer;
+}
+
+static bool
+offline_port_connected(
+  backend_port_t * port_ptr)
+{
+  /* Output ports always count as connected, so they are always mixed */
+  return (port_ptr->flags & JackPortIsOutput) || port_ptr->user_buffer != NULL;
+}
+
+static int
+offline_create_thread(
+  struct backend * backend_ptr,
+  pthread_t * thread_ptr,
+  void *(*fn)(void *),
+  void * arg)
+{
+  (void) backend_ptr;
+  return pthread_create(thread_ptr, NULL, fn, arg);
+}
+
+static const struct backend_ops offline_backend_ops = {
+  .name = "offline",
+  .close = offline_close,
+  .get_client_name = offline_get_client_name,
+  .get_sample_rate = offline_get_sample_rate,
+  .get_buffer_size = offline_get_buffer_size,
+  .set_process_callback = offline_set_process_callback,
+  .set_buffer_size_callback = offline_set_buffer_size_callback,
+  .set_xrun_callback = offline_set_xrun_callback,
+  .activate = offline_activate,
+  .port_register = offline_port_register,
+  .port_unregister = offline_port_unregister,
+  .port_rename = offline_port_rename,
+  .port_get_buffer = offline_port_get_buffer,
+  .port_connected = offline_port_connected,
+  .create_thread = offline_create_thread,
+};
+
+struct backend *
+backend_offline_open(
+  const char * client_name,
+  jack_nframes_t sample_rate,
+  jack_nframes_t buffer_size)
+{
+  struct offline_backend *backend_ptr;
+
+  if (sample_rate == 0 || buffer_size == 0)
+  {
+    return NULL;
+  }
+
+  backend_ptr = calloc(1, sizeof(struct offline_backend));
+  if (backend_ptr == NULL)
+  {
+    return NULL;
+  }
+
+  backend_ptr->client_name = strdup(client_name);
+  if (backend_ptr->client_name == NULL)
+  {
+    free(backend_ptr);
+    return NULL;
+  }
+
+  backend_ptr->backend.ops = &offline_backend_ops;
+  backend_ptr->sample_rate = sample_rate;
+  backend_ptr->buffer_size = buffer_size;
+  pthread_mutex_init(&backend_ptr->mutex, NULL);
+
+  return &backend_ptr->backend;
+}
+
+bool
+backend_is_offline(
+  struct backend * backend_ptr)
+{
+  return backend_ptr->ops == &offline_backend_ops;
+}
+
+int
+backend_offline_process(
+  struct backend * backend_ptr,
+  jack_nframes_t nframes)
+{
+  struct backend_port *port_ptr;
+  int ret;
+
+  if (!offline_backend_ptr->active || offline_backend_ptr->process == NULL ||
+      nframes > offline_backend_ptr->buffer_size)
+  {
+    return -1;
+  }
+
+  pthread_mutex_lock(&offline_backend_ptr->mutex);
+
+  /* Input ports not fed by the caller are silent */
+  for (port_ptr = offline_backend_ptr->ports; port_ptr != NULL; port_ptr = port_ptr->next)
+  {
+    if (port_ptr->audio && (port_ptr->flags & JackPortIsInput) && port_ptr->user_buffer == NULL)
+    {
+      memset(port_ptr->buffer, 0, nframes * sizeof(float));
+    }
+  }
+
+  ret = offline_backend_ptr->process(nframes, offline_backend_ptr->process_arg);
+
+  pthread_mutex_unlock(&offline_backend_ptr->mutex);
+  return ret;
+}
+
+void
+backend_offline_set_port_buffer(
+  struct backend * backend_ptr,
+  backend_port_t * port_ptr,
+  float * buffer)
+{
+  pthread_mutex_lock(&offline_backend_ptr->mutex);
+  port_ptr->user_buffer = buffer;
+  pthread_mutex_unlock(&offline_backend_ptr->mutex);
+}
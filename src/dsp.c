@@ -0,0 +1,707 @@
+/* -*- Mode: C ; c-basic-offset: 2 -*- */
+/*****************************************************************************
+ *
+ *   This file is part of jack_mixer
+ *
+ *   This program is free software; you can redistribute it and/or modify
+ *   it under the terms of the GNU General Public License as published by
+ *   the Free Software Foundation; version 2 of the License
+ *
+ *   This program is distributed in the hope that it will be useful,
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ *   GNU General Public License for more details.
+ *
+ *   You should have received a copy of the GNU General Public License
+ *   along with this program; if not, write to the Free Software
+ *   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA.
+ *
+ *****************************************************************************/
+
+#include <fenv.h>
+#include <stdbool.h>
+#include <stdint.h>
+#include <stdlib.h>
+#include <string.h>
+#include <math.h>
+
+#if defined(__SSE2__)
+#include <emmintrin.h>
+#endif
+
+#if defined(__x86_64__) && defined(__GNUC__)
+#include <immintrin.h>
+#define HAVE_AVX_KERNELS
+#endif
+
+#include "dsp.h"
+#include "log.h"
+
+struct dsp_kernels {
+  const char * name;
+  bool (*is_finite)(const float *, unsigned int);
+  bool (*is_silent)(const float *, unsigned int);
+  void (*mix)(const float *, float *, float, unsigned int);
+  void (*gain_peak)(const float *, float *, float, unsigned int, float *, float *);
+  void (*gain_peak_mono)(const float *, float *, float *, float, float, unsigned int, float *, float *);
+};
+
+/* Portable implementation, also used for the tail of a block by the others */
+
+static bool
+generic_is_finite(
+  const float * in,
+  unsigned int count)
+{
+  unsigned int i;
+  float acc = 0.0f;
+
+  /* x - x is 0 for finite x and NaN otherwise */
+  for (i = 0; i < count; i++)
+  {
+    acc += in[i] - in[i];
+  }
+
+  return acc == 0.0f;
+}
+
+static bool
+generic_is_silent(
+  const float * in,
+  unsigned int count)
+{
+  unsigned int i;
+
+  /* NaN compares unequal to 0 as well */
+  for (i = 0; i < count; i++)
+  {
+    if (in[i] != 0.0f)
+    {
+      return false;
+    }
+  }
+
+  return true;
+}
+
+static void
+generic_mix(
+  const float * in,
+  float * out,
+  float gain,
+  unsigned int count)
+{
+  unsigned int i;
+
+  for (i = 0; i < count; i++)
+  {
+    out[i] += in[i] * gain;
+  }
+}
+
+static void
+generic_gain_peak(
+  const float * in,
+  float * out,
+  float gain,
+  unsigned int count,
+  float * in_peak,
+  float * out_peak)
+{
+  unsigned int i;
+  float in_max = *in_peak;
+  float out_max = *out_peak;
+
+  for (i = 0; i < count; i++)
+  {
+    float x = in[i];
+    float y = x * gain;
+
+    out[i] = y;
+    x = fabsf(x);
+    y = fabsf(y);
+    in_max = x > in_max ? x : in_max;
+    out_max = y > out_max ? y : out_max;
+  }
+
+  *in_peak = in_max;
+  *out_peak = out_max;
+}
+
+static void
+generic_gain_peak_mono(
+  const float * in,
+  float * out_left,
+  float * out_right,
+  float gain_left,
+  float gain_right,
+  unsigned int count,
+  float * in_peak,
+  float * out_peak)
+{
+  unsigned int i;
+  float in_max = *in_peak;
+  float out_max = *out_peak;
+
+  for (i = 0; i < count; i++)
+  {
+    float x = in[i];
+    float l = x * gain_left;
+    float r = x * gain_right;
+    float y;
+
+    out_left[i] = l;
+    out_right[i] = r;
+    x = fabsf(x);
+    y = (fabsf(l) + fabsf(r)) / 2;
+    in_max = x > in_max ? x : in_max;
+    out_max = y > out_max ? y : out_max;
+  }
+
+  *in_peak = in_max;
+  *out_peak = out_max;
+}
+
+static const struct dsp_kernels generic_kernels = {
+  "generic",
+  generic_is_finite,
+  generic_is_silent,
+  generic_mix,
+  generic_gain_peak,
+  generic_gain_peak_mono,
+};
+
+#if defined(__SSE2__)
+
+static inline __m128
+sse2_abs(
+  __m128 x)
+{
+  return _mm_and_ps(x, _mm_castsi128_ps(_mm_set1_epi32(0x7fffffff)));
+}
+
+static inline float
+sse2_max(
+  __m128 x,
+  float value)
+{
+  float tmp[4];
+  int i;
+
+  _mm_storeu_ps(tmp, x);
+  for (i = 0; i < 4; i++)
+  {
+    value = tmp[i] > value ? tmp[i] : value;
+  }
+
+  return value;
+}
+
+static bool
+sse2_is_finite(
+  const float * in,
+  unsigned int count)
+{
+  unsigned int i;
+  __m128 acc = _mm_setzero_ps();
+
+  for (i = 0; i + 4 <= count; i += 4)
+  {
+    __m128 x = _mm_loadu_ps(in + i);
+    acc = _mm_add_ps(acc, _mm_sub_ps(x, x));
+  }
+
+  if (_mm_movemask_ps(_mm_cmpneq_ps(acc, _mm_setzero_ps())))
+  {
+    return false;
+  }
+
+  return generic_is_finite(in + i, count - i);
+}
+
+static bool
+sse2_is_silent(
+  const float * in,
+  unsigned int count)
+{
+  unsigned int i;
+
+  /* The absolute value of a sample is all zero bits only for +0 and -0 */
+  for (i = 0; i + 4 <= count; i += 4)
+  {
+    __m128 x = sse2_abs(_mm_loadu_ps(in + i));
+
+    if (_mm_movemask_epi8(_mm_cmpeq_epi32(_mm_castps_si128(x), _mm_setzero_si128())) != 0xffff)
+    {
+      return false;
+    }
+  }
+
+  return generic_is_silent(in + i, count - i);
+}
+
+static void
+sse2_mix(
+  const float * in,
+  float * out,
+  float gain,
+  unsigned int count)
+{
+  unsigned int i;
+  __m128 g = _mm_set1_ps(gain);
+
+  for (i = 0; i + 8 <= count; i += 8)
+  {
+    __m128 a = _mm_mul_ps(_mm_loadu_ps(in + i), g);
+    __m128 b = _mm_mul_ps(_mm_loadu_ps(in + i + 4), g);
+
+    _mm_storeu_ps(out + i, _mm_add_ps(_mm_loadu_ps(out + i), a));
+    _mm_storeu_ps(out + i + 4, _mm_add_ps(_mm_loadu_ps(out + i + 4), b));
+  }
+
+  generic_mix(in + i, out + i, gain, count - i);
+}
+
+static void
+sse2_gain_peak(
+  const float * in,
+  float * out,
+  float gain,
+  unsigned int count,
+  float * in_peak,
+  float * out_peak)
+{
+  unsigned int i;
+  __m128 g = _mm_set1_ps(gain);
+  __m128 in_max = _mm_set1_ps(*in_peak);
+  __m128 out_max = _mm_set1_ps(*out_peak);
+
+  for (i = 0; i + 4 <= count; i += 4)
+  {
+    __m128 x = _mm_loadu_ps(in + i);
+    __m128 y = _mm_mul_ps(x, g);
+
+    _mm_storeu_ps(out + i, y);
+    in_max = _mm_max_ps(sse2_abs(x), in_max);
+    out_max = _mm_max_ps(sse2_abs(y), out_max);
+  }
+
+  *in_peak = sse2_max(in_max, *in_peak);
+  *out_peak = sse2_max(out_max, *out_peak);
+  generic_gain_peak(in + i, out + i, gain, count - i, in_peak, out_peak);
+}
+
+static void
+sse2_gain_peak_mono(
+  const float * in,
+  float * out_left,
+  float * out_right,
+  float gain_left,
+  float gain_right,
+  unsigned int count,
+  float * in_peak,
+  float * out_peak)
+{
+  unsigned int i;
+  __m128 gl = _mm_set1_ps(gain_left);
+  __m128 gr = _mm_set1_ps(gain_right);
+  __m128 half = _mm_set1_ps(0.5f);
+  __m128 in_max = _mm_set1_ps(*in_peak);
+  __m128 out_max = _mm_set1_ps(*out_peak);
+
+  for (i = 0; i + 4 <= count; i += 4)
+  {
+    __m128 x = _mm_loadu_ps(in + i);
+    __m128 l = _mm_mul_ps(x, gl);
+    __m128 r = _mm_mul_ps(x, gr);
+
+    _mm_storeu_ps(out_left + i, l);
+    _mm_storeu_ps(out_right + i, r);
+    in_max = _mm_max_ps(sse2_abs(x), in_max);
+    out_max = _mm_max_ps(_mm_mul_ps(_mm_add_ps(sse2_abs(l), sse2_abs(r)), half), out_max);
+  }
+
+  *in_peak = sse2_max(in_max, *in_peak);
+  *out_peak = sse2_max(out_max, *out_peak);
+  generic_gain_peak_mono(in + i, out_left + i, out_right + i, gain_left, gain_right,
+                         count - i, in_peak, out_peak);
+}
+
+static const struct dsp_kernels sse2_kernels = {
+  "sse2",
+  sse2_is_finite,
+  sse2_is_silent,
+  sse2_mix,
+  sse2_gain_peak,
+  sse2_gain_peak_mono,
+};
+
+#endif /* #if defined(__SSE2__) */
+
+#if defined(HAVE_AVX_KERNELS)
+
+__attribute__((target("avx")))
+static inline __m256
+avx_abs(
+  __m256 x)
+{
+  return _mm256_and_ps(x, _mm256_castsi256_ps(_mm256_set1_epi32(0x7fffffff)));
+}
+
+__attribute__((target("avx")))
+static inline float
+avx_max(
+  __m256 x,
+  float value)
+{
+  return sse2_max(_mm_max_ps(_mm256_castps256_ps128(x), _mm256_extractf128_ps(x, 1)), value);
+}
+
+__attribute__((target("avx")))
+static bool
+avx_is_finite(
+  const float * in,
+  unsigned int count)
+{
+  unsigned int i;
+  __m256 acc = _mm256_setzero_ps();
+
+  for (i = 0; i + 8 <= count; i += 8)
+  {
+    __m256 x = _mm256_loadu_ps(in + i);
+    acc = _mm256_add_ps(acc, _mm256_sub_ps(x, x));
+  }
+
+  if (_mm256_movemask_ps(_mm256_cmp_ps(acc, _mm256_setzero_ps(), _CMP_NEQ_UQ)))
+  {
+    return false;
+  }
+
+  return generic_is_finite(in + i, count - i);
+}
+
+__attribute__((target("avx")))
+static bool
+avx_is_silent(
+  const float * in,
+  unsigned int count)
+{
+  unsigned int i;
+
+  /* The absolute value of a sample is all zero bits only for +0 and -0 */
+  for (i = 0; i + 8 <= count; i += 8)
+  {
+    __m256i x = _mm256_castps_si256(avx_abs(_mm256_loadu_ps(in + i)));
+
+    if (!_mm256_testz_si256(x, x))
+    {
+      return false;
+    }
+  }
+
+  return generic_is_silent(in + i, count - i);
+}
+
+__attribute__((target("avx")))
+static void
+avx_mix(
+  const float * in,
+  float * out,
+  float gain,
+  unsigned int count)
+{
+  unsigned int i;
+  __m256 g = _mm256_set1_ps(gain);
+
+  for (i = 0; i + 16 <= count; i += 16)
+  {
+    __m256 a = _mm256_mul_ps(_mm256_loadu_ps(in + i), g);
+    __m256 b = _mm256_mul_ps(_mm256_loadu_ps(in + i + 8), g);
+
+    _mm256_storeu_ps(out + i, _mm256_add_ps(_mm256_loadu_ps(out + i), a));
+    _mm256_storeu_ps(out + i + 8, _mm256_add_ps(_mm256_loadu_ps(out + i + 8), b));
+  }
+
+  generic_mix(in + i, out + i, gain, count - i);
+}
+
+__attribute__((target("avx")))
+static void
+avx_gain_peak(
+  const float * in,
+  float * out,
+  float gain,
+  unsigned int count,
+  float * in_peak,
+  float * out_peak)
+{
+  unsigned int i;
+  __m256 g = _mm256_set1_ps(gain);
+  __m256 in_max = _mm256_set1_ps(*in_peak);
+  __m256 out_max = _mm256_set1_ps(*out_peak);
+
+  for (i = 0; i + 8 <= count; i += 8)
+  {
+    __m256 x = _mm256_loadu_ps(in + i);
+    __m256 y = _mm256_mul_ps(x, g);
+
+    _mm256_storeu_ps(out + i, y);
+    in_max = _mm256_max_ps(avx_abs(x), in_max);
+    out_max = _mm256_max_ps(avx_abs(y), out_max);
+  }
+
+  *in_peak = avx_max(in_max, *in_peak);
+  *out_peak = avx_max(out_max, *out_peak);
+  generic_gain_peak(in + i, out + i, gain, count - i, in_peak, out_peak);
+}
+
+__attribute__((target("avx")))
+static void
+avx_gain_peak_mono(
+  const float * in,
+  float * out_left,
+  float * out_right,
+  float gain_left,
+  float gain_right,
+  unsigned int count,
+  float * in_peak,
+  float * out_peak)
+{
+  unsigned int i;
+  __m256 gl = _mm256_set1_ps(gain_left);
+  __m256 gr = _mm256_set1_ps(gain_right);
+  __m256 half = _mm256_set1_ps(0.5f);
+  __m256 in_max = _mm256_set1_ps(*in_peak);
+  __m256 out_max = _mm256_set1_ps(*out_peak);
+
+  for (i = 0; i + 8 <= count; i += 8)
+  {
+    __m256 x = _mm256_loadu_ps(in + i);
+    __m256 l = _mm256_mul_ps(x, gl);
+    __m256 r = _mm256_mul_ps(x, gr);
+
+    _mm256_storeu_ps(out_left + i, l);
+    _mm256_storeu_ps(out_right + i, r);
+    in_max = _mm256_max_ps(avx_abs(x), in_max);
+    out_max = _mm256_max_ps(_mm256_mul_ps(_mm256_add_ps(avx_abs(l), avx_abs(r)), half), out_max);
+  }
+
+  *in_peak = avx_max(in_max, *in_peak);
+  *out_peak = avx_max(out_max, *out_peak);
+  generic_gain_peak_mono(in + i, out_left + i, out_right + i, gain_left, gain_right,
+                         count - i, in_peak, out_peak);
+}
+
+static const struct dsp_kernels avx_kernels = {
+  "avx",
+  avx_is_finite,
+  avx_is_silent,
+  avx_mix,
+  avx_gain_peak,
+  avx_gain_peak_mono,
+};
+
+#endif /* #if defined(HAVE_AVX_KERNELS) */
+
+static const struct dsp_kernels * kernels = &generic_kernels;
+
+void
+dsp_init()
+{
+#if defined(__SSE2__)
+  kernels = &sse2_kernels;
+#endif
+
+#if defined(HAVE_AVX_KERNELS)
+  __builtin_cpu_init();
+  if (__builtin_cpu_supports("avx"))
+  {
+    kernels = &avx_kernels;
+  }
+#endif
+
+  LOG_DEBUG("Using %s DSP kernels", kernels->name);
+}
+
+const char *
+dsp_get_kernel_name()
+{
+  return kernels->name;
+}
+
+float *
+dsp_buffer_alloc(
+  unsigned int count)
+{
+  void *ptr;
+  size_t size = (count * sizeof(float) + DSP_ALIGNMENT - 1) & ~(size_t)(DSP_ALIGNMENT - 1);
+
+  if (posix_memalign(&ptr, DSP_ALIGNMENT, size) != 0)
+  {
+    return NULL;
+  }
+
+  memset(ptr, 0, size);
+  return ptr;
+}
+
+bool
+dsp_is_finite(
+  const float * in,
+  unsigned int count)
+{
+  return kernels->is_finite(in, count);
+}
+
+bool
+dsp_is_silent(
+  const float * in,
+  unsigned int count)
+{
+  return kernels->is_silent(in, count);
+}
+
+void
+dsp_mix(
+  const float * in,
+  float * out,
+  float gain,
+  unsigned int count)
+{
+  kernels->mix(in, out, gain, count);
+}
+
+void
+dsp_gain_peak(
+  const float * in,
+  float * out,
+  float gain,
+  unsigned int count,
+  float * in_peak,
+  float * out_peak)
+{
+  kernels->gain_peak(in, out, gain, count, in_peak, out_peak);
+}
+
+void
+dsp_gain_peak_mono(
+  const float * in,
+  float * out_left,
+  float * out_right,
+  float gain_left,
+  float gain_right,
+  unsigned int count,
+  float * in_peak,
+  float * out_peak)
+{
+  kernels->gain_peak_mono(in, out_left, out_right, gain_left, gain_right, count, in_peak, out_peak);
+}
+
+#if defined(__SSE2__)
+
+#define MXCSR_DE (1 << 1)       /* denormal operand flag */
+#define MXCSR_UE (1 << 4)       /* underflow flag */
+#define MXCSR_DAZ (1 << 6)      /* denormals are zero */
+#define MXCSR_FTZ (1 << 15)     /* flush to zero */
+
+#elif defined(__aarch64__)
+
+#define FPCR_FZ (1 << 24)       /* flush to zero, for inputs and results */
+
+#endif
+
+/* Denormal mode last set in this thread, -1 if never set */
+static __thread int flush_denormals_mode = -1;
+
+bool
+dsp_set_flush_denormals(
+  bool enable)
+{
+  if (flush_denormals_mode == (int)enable)
+  {
+    return true;
+  }
+
+  flush_denormals_mode = enable;
+
+#if defined(__SSE2__)
+  if (enable)
+    _mm_setcsr(_mm_getcsr() | MXCSR_DAZ | MXCSR_FTZ);
+  else
+    _mm_setcsr(_mm_getcsr() & ~(MXCSR_DAZ | MXCSR_FTZ));
+  return true;
+#elif defined(__aarch64__)
+  uint64_t fpcr;
+
+  __asm__ __volatile__ ("mrs %0, fpcr" : "=r" (fpcr));
+  if (enable)
+    fpcr |= FPCR_FZ;
+  else
+    fpcr &= ~(uint64_t)FPCR_FZ;
+  __asm__ __volatile__ ("msr fpcr, %0" : : "r" (fpcr));
+  return true;
+#else
+  return !enable;
+#endif
+}
+
+uint64_t
+dsp_save_fp_mode()
+{
+#if defined(__SSE2__)
+  return _mm_getcsr();
+#elif defined(__aarch64__)
+  uint64_t fpcr;
+
+  __asm__ __volatile__ ("mrs %0, fpcr" : "=r" (fpcr));
+  return fpcr;
+#else
+  return 0;
+#endif
+}
+
+void
+dsp_restore_fp_mode(
+  uint64_t mode)
+{
+  /* The denormal mode of the thread is not known anymore */
+  flush_denormals_mode = -1;
+
+#if defined(__SSE2__)
+  _mm_setcsr((unsigned int)mode);
+#elif defined(__aarch64__)
+  __asm__ __volatile__ ("msr fpcr, %0" : : "r" (mode));
+#else
+  (void)mode;
+#endif
+}
+
+bool
+dsp_take_denormals_flag()
+{
+#if defined(__SSE2__)
+  unsigned int csr = _mm_getcsr();
+
+  /* Flushed results raise the underflow flag as well, but cost nothing */
+  if ((csr & MXCSR_DE) || ((csr & MXCSR_UE) && !(csr & MXCSR_FTZ)))
+  {
+    _mm_setcsr(csr & ~(MXCSR_DE | MXCSR_UE));
+    return true;
+  }
+
+  if (csr & MXCSR_UE)
+  {
+    _mm_setcsr(csr & ~MXCSR_UE);
+  }
+
+  return false;
+#else
+  if (fetestexcept(FE_UNDERFLOW))
+  {
+    feclearexcept(FE_UNDERFLOW);
+    return true;
+  }
+
+  return false;
+#endif
+}
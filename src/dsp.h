@@ -0,0 +1,131 @@
+/* -*- Mode: C ; c-basic-offset: 2 -*- */
+/*****************************************************************************
+ *
+ *   This file is part of jack_mixer
+ *
+ *   This program is free software; you can redistribute it and/or modify
+ *   it under the terms of the GNU General Public License as published by
+ *   the Free Software Foundation; version 2 of the License
+ *
+ *   This program is distributed in the hope that it will be useful,
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ *   GNU General Public License for more details.
+ *
+ *   You should have received a copy of the GNU General Public License
+ *   along with this program; if not, write to the Free Software
+ *   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA.
+ *
+ *****************************************************************************/
+
+/*
+ * Block processing kernels
+ *
+ * Each kernel works on a whole block of samples without branching per
+ * sample. The implementation is selected at run time by dsp_init(),
+ * depending on the instruction set extensions supported by the CPU.
+ */
+
+#ifndef _DSP_H
+#define _DSP_H
+
+#include <stdbool.h>
+#include <stdint.h>
+
+/* Alignment of buffers returned by dsp_buffer_alloc(), in bytes */
+#define DSP_ALIGNMENT 64
+
+/* Select the fastest kernel implementation supported by the CPU */
+void
+dsp_init();
+
+/* Name of the kernel implementation selected by dsp_init() */
+const char *
+dsp_get_kernel_name();
+
+/*
+ * Allocate a zeroed buffer of count samples aligned to DSP_ALIGNMENT,
+ * to be freed with free(). Returns NULL on failure.
+ */
+float *
+dsp_buffer_alloc(
+  unsigned int count);
+
+/*
+ * Flush denormal numbers to zero in floating point operations of the
+ * calling thread, or stop doing so. Returns false if the CPU doesn't
+ * support it.
+ */
+bool
+dsp_set_flush_denormals(
+  bool enable);
+
+/*
+ * Floating point control state of the calling thread, including the
+ * denormal mode, to be restored by dsp_restore_fp_mode()
+ */
+uint64_t
+dsp_save_fp_mode();
+
+void
+dsp_restore_fp_mode(
+  uint64_t mode);
+
+/*
+ * Returns true if floating point operations of the calling thread computed
+ * with denormal numbers since the previous call
+ */
+bool
+dsp_take_denormals_flag();
+
+/* Returns false if the block contains any Inf or NaN sample */
+bool
+dsp_is_finite(
+  const float * in,
+  unsigned int count);
+
+/* Returns true if all samples of the block are +0 or -0 */
+bool
+dsp_is_silent(
+  const float * in,
+  unsigned int count);
+
+/* Add in * gain to out */
+void
+dsp_mix(
+  const float * in,
+  float * out,
+  float gain,
+  unsigned int count);
+
+/*
+ * Write in * gain to out and raise *in_peak and *out_peak to the largest
+ * absolute value of in and out respectively. NaN samples are not taken
+ * into account for peak values. in and out may be the same buffer.
+ */
+void
+dsp_gain_peak(
+  const float * in,
+  float * out,
+  float gain,
+  unsigned int count,
+  float * in_peak,
+  float * out_peak);
+
+/*
+ * Write in * gain_left to out_left and in * gain_right to out_right,
+ * raise *in_peak to the largest absolute value of in and *out_peak to
+ * the largest average of the absolute values of out_left and out_right
+ */
+void
+dsp_gain_peak_mono(
+  const float * in,
+  float * out_left,
+  float * out_right,
+  float gain_left,
+  float gain_right,
+  unsigned int count,
+  float * in_peak,
+  float * out_peak);
+
+#endif /* #ifndef _DSP_H */
@@ -35,6 +35,7 @@
 #include <locale.h>
 #include <getopt.h>
 #include <signal.h>
+#include <poll.h>
 #include <unistd.h>
 #include "jack_mixer.h"
 
@@ -42,18 +43,21 @@
 
 jack_mixer_t mixer;
 bool keepRunning = true;
+volatile sig_atomic_t storeScene = false;
 
 void
 usage()
 {
 	const char* _usage = _(
 "Usage: "
-"jack_mix_box [-n <name>] [-p] [-s] [-v <dB>] MIDI_CC...\n"
+"jack_mix_box [-f <seconds>] [-n <name>] [-p] [-s] [-t <count>] [-v <dB>] MIDI_CC...\n"
 "\n"
+"-f|--fade    crossfade time in seconds of recalled scenes (default 0.01)\n"
 "-h|--help    print this help message\n"
 "-n|--name    set JACK client name\n"
 "-p|--pickup  enable MIDI pickup mode (default: jump-to-value)\n"
 "-s|--stereo  make all input channels stereo with left+right input\n"
+"-t|--threads number of worker threads for processing (default 0, i.e. none)\n"
 "-v|--volume  initial volume gain in dBFS (default 0.0, i.e. unity gain)\n"
 "\n"
 "Each positional argument is interpreted as a MIDI Control Change number and\n"
@@ -61,7 +65,11 @@ usage()
 "volume can be controlled via the given MIDI Control Change.\n"
 "\n"
 "Send SIGUSR1 to the process to have the current volumes reported per input\n"
-"channel.\n\n");
+"channel.\n"
+"\n"
+"A MIDI Program Change recalls the scene with the same number. Send SIGUSR2\n"
+"to the process to store the current volumes as the last recalled scene, or\n"
+"as scene 0 if none was recalled yet.\n\n");
 	fputs(_usage, stdout);
 }
 
@@ -72,6 +80,13 @@ reportVolume(int sig)
 	channels_volumes_read(mixer);
 }
 
+void
+triggerStoreScene(int sig)
+{
+	(void)sig;
+	storeScene = true;
+}
+
 void
 triggerShutDown(int sig)
 {
@@ -89,6 +104,9 @@ main(int argc, char *argv[])
 	bool bStereo = false;
 	enum midi_behavior_mode ePickup = Jump_To_Value;
 	double initialVolume = 0.0f; //in dbFS
+	unsigned int workerThreads = 0;
+	double crossfade = -1.0;
+	struct pollfd midi_change_poll;
 	char * localedir;
 
 	localedir = getenv("LOCALEDIR");
@@ -100,26 +118,34 @@ main(int argc, char *argv[])
 		int c;
 		static struct option long_options[] =
 		{
+			{"fade",  required_argument, 0, 'f'},
 			{"name",  required_argument, 0, 'n'},
 			{"help",  no_argument, 0, 'h'},
 			{"pickup",  no_argument, 0, 'p'},
 			{"stereo",  no_argument, 0, 's'},
+			{"threads",  required_argument, 0, 't'},
 			{"volume",  required_argument, 0, 'v'},
 			{0, 0, 0, 0}
 		};
 		int option_index = 0;
 
-		c = getopt_long (argc, argv, "sphn:v:", long_options, &option_index);
+		c = getopt_long (argc, argv, "sphf:n:t:v:", long_options, &option_index);
 		if (c == -1)
 			break;
 
 		switch (c) {
+			case 'f':
+				crossfade = strtod(optarg, NULL);
+				break;
 			case 'n':
 				jack_cli_name = strdup(optarg);
 				break;
 			case 's':
 				bStereo = true;
 				break;
+			case 't':
+				workerThreads = strtoul(optarg, NULL, 10);
+				break;
 			case 'v':
 				initialVolume = strtod(optarg, NULL);
 				break;
@@ -159,6 +185,13 @@ main(int argc, char *argv[])
 	channel_set_midi_scale(main_mix_channel, scale);
 	channel_volume_write(main_mix_channel, 0.0);
 	set_midi_behavior_mode(mixer, ePickup);
+	if (crossfade >= 0) {
+		set_scene_crossfade(mixer, crossfade);
+	}
+
+	if (workerThreads > 0 && set_worker_threads(mixer, workerThreads) != 0) {
+		fputs(jack_mixer_error_str(), stderr);
+	}
 
 	channel_index = 0;
 	while (optind < argc) {
@@ -183,12 +216,23 @@ main(int argc, char *argv[])
 	}
 
 	signal(SIGUSR1, reportVolume);
+	signal(SIGUSR2, triggerStoreScene);
 	signal(SIGTERM, triggerShutDown);
 	signal(SIGHUP, triggerShutDown);
 	signal(SIGINT, triggerShutDown);
 
+	midi_change_poll.fd = get_midi_change_fd(mixer);
+	midi_change_poll.events = POLLIN;
+
 	while (keepRunning) {
-		usleep(500u * 1000u); //500msec
+		/* Interrupted by signals, woken up by MIDI changes */
+		poll(&midi_change_poll, 1, 500); //500msec
+		dispatch_midi_changes(mixer);
+
+		if (storeScene) {
+			storeScene = false;
+			store_scene(mixer, get_current_scene(mixer) != -1 ? get_current_scene(mixer) : 0);
+		}
 	}
 
 	remove_channels(mixer);
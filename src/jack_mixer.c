@@ -30,16 +30,24 @@
 #include <libintl.h>
 #include <locale.h>
 #include <jack/jack.h>
+#include <jack/ringbuffer.h>
 #if defined(HAVE_JACK_MIDI)
 #include <jack/midiport.h>
 #endif
 #include <assert.h>
 #include <pthread.h>
+#include <sched.h>
+#include <unistd.h>
+#include <fcntl.h>
 
 #include <glib.h>
 
 #include "jack_mixer.h"
+#include "backend.h"
+#include "dsp.h"
 #include "log.h"
+#include "pool.h"
+#include "timing.h"
 
 #define _(String) String
 
@@ -48,6 +56,7 @@ struct kmeter {
   float _z2;        // filter state
   float _rms;       // max rms value since last read()
   float _dpk;       // current digital peak value
+  float _pk;        // digital peak of this JACK period so far
   int _cnt;         // digital peak hold counter
   bool _flag;       // flag set by read(), resets _rms
   int _hold;        // number of JACK periods to hold peak value
@@ -55,23 +64,68 @@ struct kmeter {
   float _omega;     // ballistics filter constant.
 };
 
-struct channel {
-  struct jack_mixer * mixer_ptr;
-  char * name;
+/*
+ * Gain or balance transition, computed once per parameter change
+ *
+ * A ramp consists of up to two segments, in each of which the value is
+ * updated per sample with a single multiply-add: value = value * mul + add.
+ * A geometric segment (add = 0) interpolates linearly in dB, a linear
+ * segment (mul = 1) is used for balance and for ramps from/to silence.
+ */
+struct ramp {
+  float value;                  /* current value */
+  float target;                 /* value after the ramp has finished */
+  unsigned int count;           /* samples left in current segment, 0 if not ramping */
+  float mul;
+  float add;
+  unsigned int next_count;      /* samples in the following segment, 0 if none */
+  float next_value;             /* first value of the following segment */
+  float next_mul;
+  float next_add;
+};
+
+/*
+ * Channel state used by the process thread in every cycle
+ *
+ * Kept apart from the rest of the channel in blocks of cache aligned
+ * entries indexed by channel slot, see alloc_channel_slot(), so channels
+ * processed one after the other are close in memory and channels processed
+ * by different worker threads never share a cache line.
+ */
+struct channel_state {
   bool stereo;
   bool out_mute;
-  float volume_transition_seconds;
-  unsigned int num_volume_transition_steps;
-  float volume;
-  jack_nframes_t volume_idx;
+  bool solo;
+  bool NaN_detected;
+  bool idle;                    /* input is silent or unconnected, frames are all zero */
+  unsigned int quarantine;      /* periods left to output silence after Inf or NaN input */
+  unsigned int nan_events;      /* blocks of input that contained Inf or NaN */
+  jack_nframes_t zero_frames;   /* leading frames known to be zero while idle */
+
+  struct ramp volume;           /* owned by the process thread */
   float volume_new;
-  float balance;
-  jack_nframes_t balance_idx;
+  struct ramp balance;          /* owned by the process thread */
   float balance_new;
-  float volume_left;
-  float volume_left_new;
-  float volume_right;
-  float volume_right_new;
+  unsigned int ramp_steps;      /* length of the next transitions if not 0, set by scene recalls */
+
+  backend_port_t * port_left;
+  backend_port_t * port_right;
+  jack_default_audio_sample_t * left_buffer_ptr;
+  jack_default_audio_sample_t * right_buffer_ptr;
+
+  jack_default_audio_sample_t * tmp_mixed_frames_left;
+  jack_default_audio_sample_t * tmp_mixed_frames_right;
+  jack_default_audio_sample_t * frames_left;
+  jack_default_audio_sample_t * frames_right;
+  jack_default_audio_sample_t * prefader_frames_left;
+  jack_default_audio_sample_t * prefader_frames_right;
+
+  jack_nframes_t peak_frames;
+  float peak_left_prefader;
+  float peak_left_postfader;
+  float peak_right_prefader;
+  float peak_right_postfader;
+
   float meter_left_postfader;
   float meter_left_prefader;
   float meter_right_postfader;
@@ -82,27 +136,30 @@ struct channel {
   struct kmeter kmeter_right;
   struct kmeter kmeter_prefader_left;
   struct kmeter kmeter_prefader_right;
+} __attribute__((aligned(DSP_ALIGNMENT)));
 
-  jack_port_t * port_left;
-  jack_port_t * port_right;
-
-  jack_nframes_t peak_frames;
-  float peak_left_prefader;
-  float peak_left_postfader;
-  float peak_right_prefader;
-  float peak_right_postfader;
+/* Channel states allocated at once, a new block is added when all are in use */
+#define CHANNEL_STATE_BLOCK_SIZE 32
 
-  jack_default_audio_sample_t * tmp_mixed_frames_left;
-  jack_default_audio_sample_t * tmp_mixed_frames_right;
-  jack_default_audio_sample_t * frames_left;
-  jack_default_audio_sample_t * frames_right;
-  jack_default_audio_sample_t * prefader_frames_left;
-  jack_default_audio_sample_t * prefader_frames_right;
+/* Periods an input channel stays silent after Inf or NaN input, the
+ * offending one included, before its volume ramps back in */
+#define NAN_QUARANTINE_PERIODS 8
 
-  jack_default_audio_sample_t * left_buffer_ptr;
-  jack_default_audio_sample_t * right_buffer_ptr;
+/* Channel settings stored in a scene */
+struct scene_values {
+  bool stored;                  /* the channel existed when the scene was stored */
+  bool out_mute;
+  bool solo;
+  float volume;                 /* linear, like volume_new */
+  float balance;
+};
 
-  bool NaN_detected;
+struct channel {
+  struct channel_state * state;
+  struct jack_mixer * mixer_ptr;
+  char * name;
+  float volume_transition_seconds;
+  unsigned int num_volume_transition_steps;
 
   int8_t midi_cc_volume_index;
   int8_t midi_cc_balance_index;
@@ -112,11 +169,72 @@ struct channel {
   bool midi_cc_balance_picked_up;
 
   bool midi_in_got_events;
-  int midi_out_has_events;
+  int midi_out_has_events;      /* CHANNEL_* flags, non-zero while queued for MIDI out */
+  struct channel *midi_out_next; /* next channel in the MIDI out queue */
   void (*midi_change_callback) (void*);
   void *midi_change_callback_data;
+  bool midi_change_queued;      /* waiting in the mixer MIDI change queue */
+
+  unsigned int meter_slot;      /* index in the mixer meter values and channel states */
 
   jack_mixer_scale_t midi_scale;
+
+  struct scene_values scenes[SCENES_COUNT];
+};
+
+/* A single input channel routed to an output channel */
+struct send {
+  struct channel *channel;
+  bool prefader;                /* input channel is set to pre-fader for this output */
+  bool solo;                    /* input channel is soloed for this output */
+  float gain;                   /* applied when mixing into the output channel */
+};
+
+/*
+ * Precomputed routing of input channels into one output channel
+ *
+ * Built from the soloed/muted/prefader lists of the output channel on the
+ * control thread and published to the process thread as a whole. Input
+ * channels muted for the output channel are not included. A mix-minus
+ * output channel has no sends of its own, it takes the sum of its source.
+ */
+struct routing {
+  bool prefader;                /* the output channel was pre-fader when the routing was built */
+  bool has_solo;                /* any input channel is soloed for this output */
+  bool keep_sum;                /* the pre-fader sum is kept for mix-minus outputs of this one */
+  int mix_minus_source;         /* snapshot index of the source of a mix-minus output, -1 if none */
+  int mix_minus_send;           /* index of the excluded send in the routing of the source, -1 if none */
+  int partial_sum;              /* snapshot index of the partial sum of the leading sends, -1 if none */
+  unsigned int shared_count;    /* leading sends summed in the partial sum */
+  unsigned int count;
+  struct send sends[];
+};
+
+/*
+ * Sum of the sends shared by output channels with overlapping routing
+ *
+ * Found when the snapshot is built, mixed once per cycle and then used as
+ * the base of the mix of each output channel sharing it, which only adds
+ * its remaining sends. Output channels sharing a partial sum include input
+ * channels by the same rules, see get_send_frames().
+ */
+struct partial_sum {
+  bool system;
+  bool prefader;                /* output channels switched to or from pre-fader later don't use it */
+  bool has_solo;
+  bool stereo;                  /* any output channel sharing it is stereo */
+  jack_default_audio_sample_t * frames_left; /* scratch buffers, see bind_scratch() */
+  jack_default_audio_sample_t * frames_right;
+  unsigned int count;
+  struct send sends[];
+};
+
+/* Routing of input channels into an output channel stored in a scene */
+struct scene_routing {
+  GSList *soloed_channels;
+  GSList *muted_channels;
+  GSList *prefader_channels;
+  bool prefader;
 };
 
 struct output_channel {
@@ -124,27 +242,151 @@ struct output_channel {
   GSList *soloed_channels;
   GSList *muted_channels;
   GSList *prefader_channels;
+  struct scene_routing scenes[SCENES_COUNT];
+  struct output_channel *mix_minus_source; /* output channel this one carries the mix of, or NULL */
+  struct channel *mix_minus_channel; /* input channel excluded from the mix of the source, or NULL */
 
   bool system; /* system channel, without any associated UI */
   bool prefader;
+
+  uint64_t mix_time_sum;        /* ns spent mixing in the current statistics window */
+  uint32_t mix_time;            /* Average ns per cycle in the last window */
+};
+
+/*
+ * Immutable view of the mixer topology used by the process thread
+ *
+ * Built on the control thread whenever channels are added or removed or
+ * routing changes, and swapped in atomically as a whole. Channels are
+ * stored in the same order as in the mixer channel lists, except for
+ * mix-minus output channels, which come after all others so they are
+ * mixed once the sums of their sources are complete.
+ *
+ * Each stored scene has a snapshot with its routing, which the process
+ * thread switches to when the scene is recalled via MIDI, until the
+ * control thread applied that routing to the output channels. A scene
+ * snapshot has the same channels as its parent and uses its scratch
+ * buffers.
+ */
+struct snapshot {
+  unsigned int input_channels_count;
+  unsigned int output_channels_count;
+  unsigned int mix_minus_index; /* index of the first mix-minus output channel */
+  struct channel **input_channels;
+  struct output_channel **output_channels;
+  struct routing **routings;    /* routing for each output channel */
+  unsigned int partial_sums_count;
+  struct partial_sum **partial_sums;
+  jack_nframes_t frames;        /* period size the scratch buffers are allocated for */
+  size_t scratch_size;          /* bytes */
+  float *scratch;               /* scratch buffers of all channels, see bind_scratch() */
+  struct snapshot **scenes;     /* snapshot of each stored scene, NULL if no scene is stored */
+  unsigned int routing_recalls; /* scenes recalled via MIDI whose routing the output channels had */
+};
+
+/* Scratch buffers of one period used by each input and output channel and partial sum */
+#define INPUT_SCRATCH_BUFFERS 4
+#define OUTPUT_SCRATCH_BUFFERS 4
+#define PARTIAL_SUM_SCRATCH_BUFFERS 2
+
+/* Memory no longer published to the process thread, waiting to be freed */
+struct garbage {
+  void *ptr;
+  void (*free_fn)(void *);
+  unsigned int cycle;           /* process cycle at the time of retirement */
+};
+
+/*
+ * Meter values of all channels, indexed by channel meter slot
+ *
+ * Written by the process thread at the end of each cycle and copied by
+ * read_meters(). seq is odd while the process thread is writing, so a
+ * reader can detect a copy overlapping with a write and retry.
+ */
+struct meters {
+  unsigned int seq;
+  unsigned int count;           /* number of slots */
+  struct meter_values values[]; /* linear values */
+};
+
+/* Meter slots allocated at first, grown when more channels are added */
+#define METER_SLOTS_COUNT 32
+
+/* Room for channels changed via MIDI in waiting for dispatch, twice the number of CCs */
+#define MIDI_CHANGE_QUEUE_SIZE 256
+
+/* Channel parameter controlled by a MIDI CC */
+enum midi_cc_param {
+  MIDI_CC_NONE,
+  MIDI_CC_VOLUME,
+  MIDI_CC_BALANCE,
+  MIDI_CC_MUTE,
+  MIDI_CC_SOLO,
+};
+
+/* Entry of the MIDI CC dispatch table, indexed by CC number */
+struct midi_cc_target {
+  struct channel *channel;      /* NULL if the CC is not mapped */
+  enum midi_cc_param param;
+};
+
+/* Changes passed to apply_changes() in one call, for the process thread */
+struct change_batch {
+  struct change_batch *next;    /* batch passed earlier, if not taken by the process thread yet */
+  unsigned int count;
+  struct channel_change changes[];
 };
 
 struct jack_mixer {
-  pthread_mutex_t mutex;
-  jack_client_t * jack_client;
+  pthread_mutex_t mutex;        /* serializes snapshot updates and garbage collection */
+  struct backend * backend;
   GSList *input_channels_list;
   GSList *output_channels_list;
-  GSList *soloed_channels;
+  unsigned int soloed_channels_count;
+
+  struct snapshot *snapshot;    /* topology currently published to the process thread */
+  struct snapshot *bound_snapshot; /* snapshot channel scratch buffers point into, process thread only */
+  jack_nframes_t buffer_size;   /* period size for the scratch buffers of new snapshots */
+  unsigned int cycle;           /* number of completed process cycles */
+  GSList *garbage;
+
+  struct pool *pool;            /* worker threads, NULL to process in the JACK thread only */
+  struct meters *meters;        /* meter values published by the process thread */
+  struct channel_state **state_blocks; /* channel states indexed by slot, never moved */
+  unsigned int state_blocks_count;
+  struct timing timing;         /* durations of process cycle stages */
+  unsigned int xruns;           /* xruns reported by JACK since the mixer was created */
+
+  struct channel *midi_out_queue; /* lock-free stack of channels with pending MIDI out events */
+  struct change_batch *change_batches; /* lock-free stack of batches from apply_changes() */
 
-  jack_port_t * port_midi_in;
-  jack_port_t * port_midi_out;
+  jack_ringbuffer_t *midi_changes; /* channels changed via MIDI in, see dispatch_midi_changes() */
+  int midi_change_pipe[2];      /* readable while changes are waiting to be dispatched */
+  bool midi_change_signalled;   /* a byte was written to the pipe and not read yet */
+
+  backend_port_t * port_midi_in;
+  backend_port_t * port_midi_out;
 
   bool kmetering;
+  bool block_processing;        /* use block kernels for channels not in transition */
+  bool flush_denormals;         /* flush denormal numbers to zero in the process and worker threads */
+  unsigned int denormal_cycles; /* process cycles which computed with denormal numbers */
+  unsigned int midi_split_frames; /* minimum block size when splitting cycles at MIDI events, 0 to not split */
 
   int8_t last_midi_cc;
   enum midi_behavior_mode midi_behavior;
 
-  struct channel* midi_cc_map[128];
+  struct midi_cc_target midi_cc_map[128];
+
+  bool scene_stored[SCENES_COUNT];
+  int current_scene;            /* last recalled scene, -1 if none */
+  unsigned int scene_crossfade_steps; /* transition length of scenes recalled via MIDI */
+  uint64_t scene_recall;        /* scene + 1 and transition length << 32 for the process thread, 0 if none */
+  uint64_t scene_routing;       /* scene + 1 and MIDI recalls << 32, its routing is applied by dispatch_midi_changes() */
+  unsigned int routing_recalls; /* MIDI recalls whose routing was applied, included in new snapshots */
+  unsigned int midi_recalls;    /* scenes recalled via MIDI, process thread only */
+  unsigned int midi_recall_scene; /* the last of them, process thread only */
+  bool scene_recalled;          /* a scene was applied, dispatch_midi_changes() runs all channel callbacks */
 };
 
 static jack_mixer_output_channel_t
@@ -164,6 +406,20 @@ unset_midi_cc_mapping(
   struct jack_mixer * mixer,
   int8_t cc);
 
+static int
+update_snapshot(
+  struct jack_mixer *mixer_ptr);
+
+static void
+retire(
+  struct jack_mixer *mixer_ptr,
+  void *ptr,
+  void (*free_fn)(void *));
+
+static void
+free_channel(
+  void *ptr);
+
 float
 value_to_db(
   float value)
@@ -183,6 +439,9 @@ db_to_value(
   return powf(10.0, db / 20.0);
 }
 
+/* Part of volume transitions from/to silence, which is interpolated linearly */
+#define INTERPOLATION_LINEAR_FRACTION 0.01
+
 double
 interpolate(
   double start,
@@ -191,7 +450,7 @@ interpolate(
   int steps)
 {
   double ret;
-  double frac = 0.01;
+  double frac = INTERPOLATION_LINEAR_FRACTION;
   LOG_DEBUG("Interpolation: start=%f -> end=%f, step=%d", start, end, step);
   if (start <= 0) {
     if (step <= frac * steps) {
@@ -216,6 +475,167 @@ interpolate(
   return ret;
 }
 
+static void
+ramp_init(
+  struct ramp *ramp_ptr,
+  float value)
+{
+  ramp_ptr->value = value;
+  ramp_ptr->target = value;
+  ramp_ptr->count = 0;
+  ramp_ptr->next_count = 0;
+}
+
+/*
+ * Start a transition from the current value to end over steps samples,
+ * following the same curve as interpolate()
+ */
+static void
+ramp_start_db(
+  struct ramp *ramp_ptr,
+  float end,
+  unsigned int steps)
+{
+  double frac = INTERPOLATION_LINEAR_FRACTION;
+  double start = ramp_ptr->value;
+  unsigned int split;
+
+  ramp_ptr->target = end;
+  ramp_ptr->next_count = 0;
+
+  if (steps == 0 || start == end)
+  {
+    ramp_ptr->value = end;
+    ramp_ptr->count = 0;
+    return;
+  }
+
+  if (start <= 0) {
+    /* Linear fade-in up to frac * end, then dB-linear */
+    split = MIN((unsigned int)(frac * steps) + 1, steps);
+    ramp_ptr->value = 0;
+    ramp_ptr->count = split;
+    ramp_ptr->mul = 1;
+    ramp_ptr->add = frac * end / steps;
+    ramp_ptr->next_count = steps - split;
+    ramp_ptr->next_value = interpolate(start, end, split, steps);
+    ramp_ptr->next_mul = pow(1 / frac, 1.0 / steps);
+    ramp_ptr->next_add = 0;
+  }
+  else if (end <= 0) {
+    /* dB-linear down to frac * start, then linear fade-out */
+    split = MIN((unsigned int)ceil((1 - frac) * steps), steps);
+    ramp_ptr->count = split;
+    ramp_ptr->mul = pow(frac, 1.0 / steps);
+    ramp_ptr->add = 0;
+    ramp_ptr->next_count = steps - split;
+    ramp_ptr->next_value = interpolate(start, end, split, steps);
+    ramp_ptr->next_mul = 1;
+    ramp_ptr->next_add = -frac * start / steps;
+  }
+  else {
+    ramp_ptr->count = steps;
+    ramp_ptr->mul = pow(end / start, 1.0 / steps);
+    ramp_ptr->add = 0;
+  }
+
+  /* Skip empty first segment */
+  if (ramp_ptr->count == 0)
+  {
+    ramp_ptr->value = ramp_ptr->next_value;
+    ramp_ptr->count = ramp_ptr->next_count;
+    ramp_ptr->mul = ramp_ptr->next_mul;
+    ramp_ptr->add = ramp_ptr->next_add;
+    ramp_ptr->next_count = 0;
+  }
+}
+
+/*
+ * Start a linear transition from the current value to end over steps samples
+ */
+static void
+ramp_start_linear(
+  struct ramp *ramp_ptr,
+  float end,
+  unsigned int steps)
+{
+  ramp_ptr->target = end;
+  ramp_ptr->next_count = 0;
+
+  if (steps == 0 || ramp_ptr->value == end)
+  {
+    ramp_ptr->value = end;
+    ramp_ptr->count = 0;
+    return;
+  }
+
+  ramp_ptr->count = steps;
+  ramp_ptr->mul = 1;
+  ramp_ptr->add = (end - ramp_ptr->value) / steps;
+}
+
+/*
+ * Return current value of ramp and advance it by one sample
+ */
+static inline float
+ramp_next(
+  struct ramp *ramp_ptr)
+{
+  float value = ramp_ptr->value;
+
+  if (ramp_ptr->count == 0)
+  {
+    return value;
+  }
+
+  if (--ramp_ptr->count != 0)
+  {
+    ramp_ptr->value = value * ramp_ptr->mul + ramp_ptr->add;
+  }
+  else if (ramp_ptr->next_count != 0)
+  {
+    ramp_ptr->value = ramp_ptr->next_value;
+    ramp_ptr->count = ramp_ptr->next_count;
+    ramp_ptr->mul = ramp_ptr->next_mul;
+    ramp_ptr->add = ramp_ptr->next_add;
+    ramp_ptr->next_count = 0;
+  }
+  else
+  {
+    /* Land exactly on target */
+    ramp_ptr->value = ramp_ptr->target;
+  }
+
+  return value;
+}
+
+/*
+ * Start volume and balance transitions if parameters were changed since the last period
+ */
+static inline void
+update_ramps(
+  struct channel *channel_ptr)
+{
+  unsigned int steps = channel_ptr->num_volume_transition_steps;
+
+  /* A scene recall sets the length of the transitions it starts */
+  if (channel_ptr->state->ramp_steps != 0)
+  {
+    steps = channel_ptr->state->ramp_steps;
+    channel_ptr->state->ramp_steps = 0;
+  }
+
+  if (channel_ptr->state->volume_new != channel_ptr->state->volume.target)
+  {
+    ramp_start_db(&channel_ptr->state->volume, channel_ptr->state->volume_new, steps);
+  }
+
+  if (channel_ptr->state->balance_new != channel_ptr->state->balance.target)
+  {
+    ramp_start_linear(&channel_ptr->state->balance, channel_ptr->state->balance_new, steps);
+  }
+}
+
 
 const char* const _jack_mixer_error_str[] = {
   /* JACK_MIXER_NO_ERROR */
@@ -230,6 +650,8 @@ const char* const _jack_mixer_error_str[] = {
   _("Could not set JACK process callback.\n"),
   /* JACK_MIXER_ERROR_JACK_SET_BUFFER_SIZE_CALLBACK */
   _("Could not set JACK buffer size callback.\n"),
+  /* JACK_MIXER_ERROR_JACK_SET_XRUN_CALLBACK */
+  _("Could not set JACK xrun callback.\n"),
   /* JACK_MIXER_ERROR_JACK_ACTIVATE */
   _("Could not activate JACK client.\n"),
   /* JACK_MIXER_ERROR_CHANNEL_MALLOC */
@@ -253,7 +675,23 @@ const char* const _jack_mixer_error_str[] = {
   /* JACK_MIXER_ERROR_INVALID_CC */
   _("Control Change number out of range.\n"),
   /* JACK_MIXER_ERROR_NO_FREE_CC */
-  _("No free Control Change number.\n")
+  _("No free Control Change number.\n"),
+  /* JACK_MIXER_ERROR_WORKER_THREADS */
+  _("Could not start worker threads.\n"),
+  /* JACK_MIXER_ERROR_MIDI_CHANGE_QUEUE */
+  _("Could not create MIDI change notification queue.\n"),
+  /* JACK_MIXER_ERROR_OFFLINE_BACKEND_CREATE */
+  _("Could not create offline backend.\n"),
+  /* JACK_MIXER_ERROR_OFFLINE_PROCESS */
+  _("Could not run offline process cycle.\n"),
+  /* JACK_MIXER_ERROR_INVALID_SCENE */
+  _("Scene number out of range or scene not stored.\n"),
+  /* JACK_MIXER_ERROR_CHANGES_MALLOC */
+  _("Could not allocate memory for parameter changes.\n"),
+  /* JACK_MIXER_ERROR_INVALID_MIX_MINUS */
+  _("Mix-minus source can't be the output channel itself or a mix-minus output channel.\n"),
+  /* JACK_MIXER_ERROR_SCENE_MALLOC */
+  _("Could not allocate memory for scene routing.\n")
 };
 
 jack_mixer_error_t _jack_mixer_error = JACK_MIXER_NO_ERROR;
@@ -317,7 +755,7 @@ channel_rename(
 
   channel_ptr->name = new_name;
 
-  if (channel_ptr->stereo)
+  if (channel_ptr->state->stereo)
   {
     channel_name_size = strlen(name);
     port_name = malloc(channel_name_size + 3);
@@ -327,7 +765,7 @@ channel_rename(
     port_name[channel_name_size+1] = 'L';
     port_name[channel_name_size+2] = 0;
 
-    ret = jack_port_rename(channel_ptr->mixer_ptr->jack_client, channel_ptr->port_left, port_name);
+    ret = backend_port_rename(channel_ptr->mixer_ptr->backend, channel_ptr->state->port_left, port_name);
     if (ret != 0)
     {
       _jack_mixer_error = JACK_MIXER_ERROR_JACK_RENAME_PORT_LEFT;
@@ -336,7 +774,7 @@ channel_rename(
 
     port_name[channel_name_size+1] = 'R';
 
-    ret = jack_port_rename(channel_ptr->mixer_ptr->jack_client, channel_ptr->port_right, port_name);
+    ret = backend_port_rename(channel_ptr->mixer_ptr->backend, channel_ptr->state->port_right, port_name);
     if (ret != 0)
     {
       _jack_mixer_error = JACK_MIXER_ERROR_JACK_RENAME_PORT_RIGHT;
@@ -347,7 +785,7 @@ channel_rename(
   }
   else
   {
-    ret = jack_port_rename(channel_ptr->mixer_ptr->jack_client, channel_ptr->port_left, name);
+    ret = backend_port_rename(channel_ptr->mixer_ptr->backend, channel_ptr->state->port_left, name);
     if (ret != 0)
     {
       _jack_mixer_error = JACK_MIXER_ERROR_JACK_RENAME_PORT;
@@ -365,7 +803,43 @@ bool
 channel_is_stereo(
   jack_mixer_channel_t channel)
 {
-  return channel_ptr->stereo;
+  return channel_ptr->state->stereo;
+}
+
+unsigned int
+channel_get_meter_slot(
+  jack_mixer_channel_t channel)
+{
+  return channel_ptr->meter_slot;
+}
+
+unsigned int
+channel_get_nan_events_count(
+  jack_mixer_channel_t channel)
+{
+  return __atomic_load_n(&channel_ptr->state->nan_events, __ATOMIC_RELAXED);
+}
+
+int
+channel_set_offline_buffers(
+  jack_mixer_channel_t channel,
+  float * left_buffer_ptr,
+  float * right_buffer_ptr)
+{
+  struct backend * backend_ptr = channel_ptr->mixer_ptr->backend;
+
+  if (!backend_is_offline(backend_ptr))
+  {
+    return -1;
+  }
+
+  backend_offline_set_port_buffer(backend_ptr, channel_ptr->state->port_left, left_buffer_ptr);
+  if (channel_ptr->state->stereo)
+  {
+    backend_offline_set_port_buffer(backend_ptr, channel_ptr->state->port_right, right_buffer_ptr);
+  }
+
+  return 0;
 }
 
 int8_t
@@ -375,6 +849,22 @@ channel_get_balance_midi_cc(
   return channel_ptr->midi_cc_balance_index;
 }
 
+/*
+ * Set the entry of the MIDI CC dispatch table for given MIDI CC
+ *
+ * This is an internal (static) function
+ */
+static inline void
+map_midi_cc(
+  struct jack_mixer * mixer,
+  int8_t cc,
+  struct channel * target,
+  enum midi_cc_param param)
+{
+  mixer->midi_cc_map[cc].param = param;
+  mixer->midi_cc_map[cc].channel = target;
+}
+
 /*
  * Remove assignment for given MIDI CC
  *
@@ -385,25 +875,29 @@ unset_midi_cc_mapping(
   struct jack_mixer * mixer,
   int8_t cc)
 {
-  struct channel *channel = mixer->midi_cc_map[cc];
+  struct channel *channel = mixer->midi_cc_map[cc].channel;
   if (!channel) {
     return;
   }
 
-  if (channel->midi_cc_volume_index == cc) {
+  switch (mixer->midi_cc_map[cc].param) {
+  case MIDI_CC_VOLUME:
     channel->midi_cc_volume_index = -1;
-  }
-  else if (channel->midi_cc_balance_index == cc) {
+    break;
+  case MIDI_CC_BALANCE:
     channel->midi_cc_balance_index = -1;
-  }
-  else if (channel->midi_cc_mute_index == cc) {
+    break;
+  case MIDI_CC_MUTE:
     channel->midi_cc_mute_index = -1;
-  }
-  else if (channel->midi_cc_solo_index == cc) {
+    break;
+  case MIDI_CC_SOLO:
     channel->midi_cc_solo_index = -1;
+    break;
+  case MIDI_CC_NONE:
+    break;
   }
 
-  mixer->midi_cc_map[cc] = NULL;
+  map_midi_cc(mixer, cc, NULL, MIDI_CC_NONE);
 }
 
 int
@@ -420,9 +914,9 @@ channel_set_balance_midi_cc(
   unset_midi_cc_mapping(channel_ptr->mixer_ptr, new_cc);
   /* Remove previous balance CC mapped to this channel (if any) */
   if (channel_ptr->midi_cc_balance_index != -1) {
-    channel_ptr->mixer_ptr->midi_cc_map[channel_ptr->midi_cc_balance_index] = NULL;
+    map_midi_cc(channel_ptr->mixer_ptr, channel_ptr->midi_cc_balance_index, NULL, MIDI_CC_NONE);
   }
-  channel_ptr->mixer_ptr->midi_cc_map[new_cc] = channel_ptr;
+  map_midi_cc(channel_ptr->mixer_ptr, new_cc, channel_ptr, MIDI_CC_BALANCE);
   channel_ptr->midi_cc_balance_index = new_cc;
   return 0;
 }
@@ -448,9 +942,9 @@ channel_set_volume_midi_cc(
   unset_midi_cc_mapping(channel_ptr->mixer_ptr, new_cc);
   /* remove previous volume CC mapped to this channel (if any) */
   if (channel_ptr->midi_cc_volume_index != -1) {
-    channel_ptr->mixer_ptr->midi_cc_map[channel_ptr->midi_cc_volume_index] = NULL;
+    map_midi_cc(channel_ptr->mixer_ptr, channel_ptr->midi_cc_volume_index, NULL, MIDI_CC_NONE);
   }
-  channel_ptr->mixer_ptr->midi_cc_map[new_cc] = channel_ptr;
+  map_midi_cc(channel_ptr->mixer_ptr, new_cc, channel_ptr, MIDI_CC_VOLUME);
   channel_ptr->midi_cc_volume_index = new_cc;
   return 0;
 }
@@ -476,9 +970,9 @@ channel_set_mute_midi_cc(
   unset_midi_cc_mapping(channel_ptr->mixer_ptr, new_cc);
   /* Remove previous mute CC mapped to this channel (if any) */
   if (channel_ptr->midi_cc_mute_index != -1) {
-    channel_ptr->mixer_ptr->midi_cc_map[channel_ptr->midi_cc_mute_index] = NULL;
+    map_midi_cc(channel_ptr->mixer_ptr, channel_ptr->midi_cc_mute_index, NULL, MIDI_CC_NONE);
   }
-  channel_ptr->mixer_ptr->midi_cc_map[new_cc] = channel_ptr;
+  map_midi_cc(channel_ptr->mixer_ptr, new_cc, channel_ptr, MIDI_CC_MUTE);
   channel_ptr->midi_cc_mute_index = new_cc;
   return 0;
 }
@@ -522,9 +1016,9 @@ channel_set_solo_midi_cc(
   unset_midi_cc_mapping(channel_ptr->mixer_ptr, new_cc);
   /* Remove previous solo CC mapped to this channel (if any) */
   if (channel_ptr->midi_cc_solo_index != -1) {
-    channel_ptr->mixer_ptr->midi_cc_map[channel_ptr->midi_cc_solo_index] = NULL;
+    map_midi_cc(channel_ptr->mixer_ptr, channel_ptr->midi_cc_solo_index, NULL, MIDI_CC_NONE);
   }
-  channel_ptr->mixer_ptr->midi_cc_map[new_cc] = channel_ptr;
+  map_midi_cc(channel_ptr->mixer_ptr, new_cc, channel_ptr, MIDI_CC_SOLO);
   channel_ptr->midi_cc_solo_index = new_cc;
   return 0;
 }
@@ -537,9 +1031,9 @@ channel_autoset_volume_midi_cc(
 
   for (int i = 11 ; i < 128 ; i++)
   {
-    if (!mixer_ptr->midi_cc_map[i])
+    if (!mixer_ptr->midi_cc_map[i].channel)
     {
-      mixer_ptr->midi_cc_map[i] = channel_ptr;
+      map_midi_cc(mixer_ptr, i, channel_ptr, MIDI_CC_VOLUME);
       channel_ptr->midi_cc_volume_index = i;
 
       LOG_DEBUG("New channel \"%s\" volume mapped to CC#%i.", channel_ptr->name, i);
@@ -558,9 +1052,9 @@ channel_autoset_balance_midi_cc(
 
   for (int i = 11; i < 128 ; i++)
   {
-    if (!mixer_ptr->midi_cc_map[i])
+    if (!mixer_ptr->midi_cc_map[i].channel)
     {
-      mixer_ptr->midi_cc_map[i] = channel_ptr;
+      map_midi_cc(mixer_ptr, i, channel_ptr, MIDI_CC_BALANCE);
       channel_ptr->midi_cc_balance_index = i;
 
       LOG_DEBUG("New channel \"%s\" balance mapped to CC#%i.", channel_ptr->name, i);
@@ -579,9 +1073,9 @@ channel_autoset_mute_midi_cc(
 
   for (int i = 11; i < 128 ; i++)
   {
-    if (!mixer_ptr->midi_cc_map[i])
+    if (!mixer_ptr->midi_cc_map[i].channel)
     {
-      mixer_ptr->midi_cc_map[i] = channel_ptr;
+      map_midi_cc(mixer_ptr, i, channel_ptr, MIDI_CC_MUTE);
       channel_ptr->midi_cc_mute_index = i;
 
       LOG_DEBUG("New channel \"%s\" mute mapped to CC#%i.", channel_ptr->name, i);
@@ -600,9 +1094,9 @@ channel_autoset_solo_midi_cc(
 
   for (int i = 11; i < 128 ; i++)
   {
-    if (!mixer_ptr->midi_cc_map[i])
+    if (!mixer_ptr->midi_cc_map[i].channel)
     {
-      mixer_ptr->midi_cc_map[i] = channel_ptr;
+      map_midi_cc(mixer_ptr, i, channel_ptr, MIDI_CC_SOLO);
       channel_ptr->midi_cc_solo_index = i;
 
       LOG_DEBUG("New channel \"%s\" solo mapped to CC#%i.", channel_ptr->name, i);
@@ -618,52 +1112,74 @@ remove_channel(
   jack_mixer_channel_t channel)
 {
   GSList *list_ptr;
-  channel_ptr->mixer_ptr->input_channels_list = g_slist_remove(
-                  channel_ptr->mixer_ptr->input_channels_list, channel_ptr);
-  free(channel_ptr->name);
+  struct jack_mixer *mixer_ptr = channel_ptr->mixer_ptr;
+  struct scene_routing *routing_ptr;
+  unsigned int scene;
 
-  /* remove references to input channel from all output channels */
-  for (list_ptr = channel_ptr->mixer_ptr->output_channels_list; list_ptr; list_ptr = g_slist_next(list_ptr))
+  mixer_ptr->input_channels_list = g_slist_remove(mixer_ptr->input_channels_list, channel_ptr);
+
+  /* remove references to input channel from all output channels and their scenes */
+  for (list_ptr = mixer_ptr->output_channels_list; list_ptr; list_ptr = g_slist_next(list_ptr))
   {
     struct output_channel *output_channel_ptr = list_ptr->data;
-    output_channel_set_solo(output_channel_ptr, channel, false);
-    output_channel_set_muted(output_channel_ptr, channel, false);
+    output_channel_ptr->soloed_channels = g_slist_remove(output_channel_ptr->soloed_channels, channel);
+    output_channel_ptr->muted_channels = g_slist_remove(output_channel_ptr->muted_channels, channel);
+    output_channel_ptr->prefader_channels = g_slist_remove(output_channel_ptr->prefader_channels, channel);
+    if (output_channel_ptr->mix_minus_channel == channel_ptr)
+    {
+      output_channel_ptr->mix_minus_channel = NULL;
+    }
+
+    for (scene = 0; scene < SCENES_COUNT; scene++)
+    {
+      routing_ptr = &output_channel_ptr->scenes[scene];
+      routing_ptr->soloed_channels = g_slist_remove(routing_ptr->soloed_channels, channel);
+      routing_ptr->muted_channels = g_slist_remove(routing_ptr->muted_channels, channel);
+      routing_ptr->prefader_channels = g_slist_remove(routing_ptr->prefader_channels, channel);
+    }
+  }
+
+  /* stop the process thread from seeing the channel */
+  update_snapshot(mixer_ptr);
+
+  if (__atomic_exchange_n(&channel_ptr->state->solo, false, __ATOMIC_ACQ_REL))
+  {
+    __atomic_sub_fetch(&mixer_ptr->soloed_channels_count, 1, __ATOMIC_RELAXED);
   }
 
-  jack_port_unregister(channel_ptr->mixer_ptr->jack_client, channel_ptr->port_left);
-  if (channel_ptr->stereo)
+  backend_port_unregister(mixer_ptr->backend, channel_ptr->state->port_left);
+  if (channel_ptr->state->stereo)
   {
-    jack_port_unregister(channel_ptr->mixer_ptr->jack_client, channel_ptr->port_right);
+    backend_port_unregister(mixer_ptr->backend, channel_ptr->state->port_right);
   }
 
   if (channel_ptr->midi_cc_volume_index != -1)
   {
-    assert(channel_ptr->mixer_ptr->midi_cc_map[channel_ptr->midi_cc_volume_index] == channel_ptr);
-    channel_ptr->mixer_ptr->midi_cc_map[channel_ptr->midi_cc_volume_index] = NULL;
+    assert(mixer_ptr->midi_cc_map[channel_ptr->midi_cc_volume_index].channel == channel_ptr);
+    map_midi_cc(mixer_ptr, channel_ptr->midi_cc_volume_index, NULL, MIDI_CC_NONE);
   }
 
   if (channel_ptr->midi_cc_balance_index != -1)
   {
-    assert(channel_ptr->mixer_ptr->midi_cc_map[channel_ptr->midi_cc_balance_index] == channel_ptr);
-    channel_ptr->mixer_ptr->midi_cc_map[channel_ptr->midi_cc_balance_index] = NULL;
+    assert(mixer_ptr->midi_cc_map[channel_ptr->midi_cc_balance_index].channel == channel_ptr);
+    map_midi_cc(mixer_ptr, channel_ptr->midi_cc_balance_index, NULL, MIDI_CC_NONE);
   }
 
   if (channel_ptr->midi_cc_mute_index != -1)
   {
-    assert(channel_ptr->mixer_ptr->midi_cc_map[channel_ptr->midi_cc_mute_index] == channel_ptr);
-    channel_ptr->mixer_ptr->midi_cc_map[channel_ptr->midi_cc_mute_index] = NULL;
+    assert(mixer_ptr->midi_cc_map[channel_ptr->midi_cc_mute_index].channel == channel_ptr);
+    map_midi_cc(mixer_ptr, channel_ptr->midi_cc_mute_index, NULL, MIDI_CC_NONE);
   }
   if (channel_ptr->midi_cc_solo_index != -1)
   {
-    assert(channel_ptr->mixer_ptr->midi_cc_map[channel_ptr->midi_cc_solo_index] == channel_ptr);
-    channel_ptr->mixer_ptr->midi_cc_map[channel_ptr->midi_cc_solo_index] = NULL;
+    assert(mixer_ptr->midi_cc_map[channel_ptr->midi_cc_solo_index].channel == channel_ptr);
+    map_midi_cc(mixer_ptr, channel_ptr->midi_cc_solo_index, NULL, MIDI_CC_NONE);
   }
 
-  free(channel_ptr->frames_left);
-  free(channel_ptr->frames_right);
-  free(channel_ptr->prefader_frames_left);
-  free(channel_ptr->prefader_frames_right);
-  free(channel_ptr);
+  /* the process thread may still be using the channel in the current cycle */
+  pthread_mutex_lock(&mixer_ptr->mutex);
+  retire(mixer_ptr, channel_ptr, free_channel);
+  pthread_mutex_unlock(&mixer_ptr->mutex);
 }
 
 void
@@ -675,11 +1191,11 @@ channel_stereo_meter_read(
 {
   assert(channel_ptr);
   if (mode == Pre_Fader) {
-    *left_ptr = value_to_db(channel_ptr->meter_left_prefader);
-    *right_ptr = value_to_db(channel_ptr->meter_right_prefader);
+    *left_ptr = value_to_db(channel_ptr->state->meter_left_prefader);
+    *right_ptr = value_to_db(channel_ptr->state->meter_right_prefader);
   } else {
-    *left_ptr = value_to_db(channel_ptr->meter_left_postfader);
-    *right_ptr = value_to_db(channel_ptr->meter_right_postfader);
+    *left_ptr = value_to_db(channel_ptr->state->meter_left_postfader);
+    *right_ptr = value_to_db(channel_ptr->state->meter_right_postfader);
   }
 }
 
@@ -691,9 +1207,9 @@ channel_mono_meter_read(
   enum meter_mode mode)
 {
   if (mode == Pre_Fader) {
-    *mono_ptr = value_to_db(channel_ptr->meter_left_prefader);
+    *mono_ptr = value_to_db(channel_ptr->state->meter_left_prefader);
   } else {
-    *mono_ptr = value_to_db(channel_ptr->meter_left_postfader);
+    *mono_ptr = value_to_db(channel_ptr->state->meter_left_postfader);
   }
 }
 
@@ -710,11 +1226,11 @@ channel_stereo_kmeter_read(
   struct kmeter *kmeter_right;
   assert(channel_ptr);
   if (mode == Pre_Fader) {
-    kmeter_left = &channel_ptr->kmeter_prefader_left;
-    kmeter_right = &channel_ptr->kmeter_prefader_right;
+    kmeter_left = &channel_ptr->state->kmeter_prefader_left;
+    kmeter_right = &channel_ptr->state->kmeter_prefader_right;
   } else {
-    kmeter_left = &channel_ptr->kmeter_left;
-    kmeter_right = &channel_ptr->kmeter_right;
+    kmeter_left = &channel_ptr->state->kmeter_left;
+    kmeter_right = &channel_ptr->state->kmeter_right;
   }
   *left_ptr = value_to_db(kmeter_left->_dpk);
   *right_ptr = value_to_db(kmeter_right->_dpk);
@@ -733,9 +1249,9 @@ channel_mono_kmeter_read(
 {
   struct kmeter *kmeter;
   if (mode == Pre_Fader) {
-    kmeter = &channel_ptr->kmeter_prefader_left;
+    kmeter = &channel_ptr->state->kmeter_prefader_left;
   } else {
-    kmeter = &channel_ptr->kmeter_left;
+    kmeter = &channel_ptr->state->kmeter_left;
   }
   *mono_ptr = value_to_db(kmeter->_dpk);
   *mono_rms_ptr = value_to_db(kmeter->_rms);
@@ -747,9 +1263,9 @@ channel_mono_kmeter_reset(
   jack_mixer_channel_t channel)
 {
   struct kmeter *kmeter;
-  kmeter = &channel_ptr->kmeter_prefader_left;
+  kmeter = &channel_ptr->state->kmeter_prefader_left;
   kmeter->_flag = true;
-  kmeter = &channel_ptr->kmeter_left;
+  kmeter = &channel_ptr->state->kmeter_left;
   kmeter->_flag = true;
 }
 
@@ -759,12 +1275,41 @@ channel_stereo_kmeter_reset(
 {
   struct kmeter *kmeter;
   channel_mono_kmeter_reset(channel);
-  kmeter = &channel_ptr->kmeter_prefader_right;
+  kmeter = &channel_ptr->state->kmeter_prefader_right;
   kmeter->_flag = true;
-  kmeter = &channel_ptr->kmeter_right;
+  kmeter = &channel_ptr->state->kmeter_right;
   kmeter->_flag = true;
 }
 
+/*
+ * Flag parameter changes to be sent to MIDI out by the process thread
+ *
+ * The channel is pushed on the mixer MIDI out queue when it has no pending
+ * events yet, so it is queued at most once however many changes are made
+ * before the next process cycle. Safe to call from any thread.
+ */
+static void
+channel_queue_midi_out(
+  struct channel * channel,
+  int events)
+{
+  struct jack_mixer *mixer_ptr = channel_ptr->mixer_ptr;
+
+  if (__atomic_fetch_or(&channel_ptr->midi_out_has_events, events, __ATOMIC_ACQ_REL) != 0)
+  {
+    /* already queued */
+    return;
+  }
+
+  channel_ptr->midi_out_next = __atomic_load_n(&mixer_ptr->midi_out_queue, __ATOMIC_RELAXED);
+  while (!__atomic_compare_exchange_n(&mixer_ptr->midi_out_queue,
+                                      &channel_ptr->midi_out_next,
+                                      channel_ptr,
+                                      true,
+                                      __ATOMIC_RELEASE,
+                                      __ATOMIC_RELAXED));
+}
+
 void
 channel_volume_write(
   jack_mixer_channel_t channel,
@@ -772,19 +1317,12 @@ channel_volume_write(
 {
   assert(channel_ptr);
   double value = db_to_value(volume);
-  /*If changing volume and find we're in the middle of a previous transition,
-   *then set current volume to place in transition to avoid a jump.*/
-  if (channel_ptr->volume_new != channel_ptr->volume) {
-    channel_ptr->volume = interpolate(channel_ptr->volume,
-                                      channel_ptr->volume_new,
-                                      channel_ptr->volume_idx,
-                                      channel_ptr->num_volume_transition_steps);
-  }
-  channel_ptr->volume_idx = 0;
-  if (channel_ptr->volume_new != value) {
-    channel_ptr->midi_out_has_events |= CHANNEL_VOLUME;
-  }
-  channel_ptr->volume_new = value;
+  /* The process thread picks up the new value and starts a transition
+   * from wherever the current one is, to avoid a jump. */
+  if (channel_ptr->state->volume_new != value) {
+    channel_queue_midi_out(channel_ptr, CHANNEL_VOLUME);
+  }
+  channel_ptr->state->volume_new = value;
   LOG_DEBUG("\"%s\" volume -> %f.", channel_ptr->name, value);
 }
 
@@ -793,7 +1331,7 @@ channel_volume_read(
   jack_mixer_channel_t channel)
 {
   assert(channel_ptr);
-  return value_to_db(channel_ptr->volume_new);
+  return value_to_db(channel_ptr->state->volume_new);
 }
 
 void
@@ -809,7 +1347,7 @@ channels_volumes_read(
         pChannel = (struct channel *)node_ptr->data;
         double vol = channel_volume_read( (jack_mixer_channel_t)pChannel);
         printf(gettext("%s: volume is %f dbFS for mixer channel: %s\n"),
-               jack_get_client_name(pMixer->jack_client), vol, pChannel->name);
+               backend_get_client_name(pMixer->backend), vol, pChannel->name);
     }
 }
 
@@ -819,16 +1357,10 @@ channel_balance_write(
   double balance)
 {
   assert(channel_ptr);
-  if (channel_ptr->balance != channel_ptr->balance_new) {
-    channel_ptr->balance = channel_ptr->balance + channel_ptr->balance_idx *
-      (channel_ptr->balance_new - channel_ptr->balance) /
-      channel_ptr->num_volume_transition_steps;
+  if (channel_ptr->state->balance_new != balance) {
+    channel_queue_midi_out(channel_ptr, CHANNEL_BALANCE);
   }
-  channel_ptr->balance_idx = 0;
-  if (channel_ptr->balance_new != balance) {
-    channel_ptr->midi_out_has_events |= CHANNEL_BALANCE;
-  }
-  channel_ptr->balance_new = balance;
+  channel_ptr->state->balance_new = balance;
   LOG_DEBUG("\"%s\" balance -> %f", channel_ptr->name, balance);
 }
 
@@ -837,7 +1369,7 @@ channel_balance_read(
   jack_mixer_channel_t channel)
 {
   assert(channel_ptr);
-  return channel_ptr->balance_new;
+  return channel_ptr->state->balance_new;
 }
 
 double
@@ -846,13 +1378,13 @@ channel_abspeak_read(
   enum meter_mode mode)
 {
   assert(channel_ptr);
-  if (channel_ptr->NaN_detected)
+  if (channel_ptr->state->NaN_detected)
   {
     return sqrt(-1);
   }
   else
   {
-    return value_to_db(mode == Post_Fader ? channel_ptr->abspeak_postfader : channel_ptr->abspeak_prefader);
+    return value_to_db(mode == Post_Fader ? channel_ptr->state->abspeak_postfader : channel_ptr->state->abspeak_prefader);
   }
 }
 
@@ -862,20 +1394,20 @@ channel_abspeak_reset(
   enum meter_mode mode)
 {
   if (mode == Post_Fader) {
-    channel_ptr->abspeak_postfader = 0;
+    channel_ptr->state->abspeak_postfader = 0;
   } else if (mode == Pre_Fader) {
-    channel_ptr->abspeak_prefader = 0;
+    channel_ptr->state->abspeak_prefader = 0;
   }
-  channel_ptr->NaN_detected = false;
+  channel_ptr->state->NaN_detected = false;
 }
 
 void
 channel_out_mute(
   jack_mixer_channel_t channel)
 {
-  if (!channel_ptr->out_mute) {
-    channel_ptr->out_mute = true;
-    channel_ptr->midi_out_has_events |= CHANNEL_MUTE;
+  if (!channel_ptr->state->out_mute) {
+    channel_ptr->state->out_mute = true;
+    channel_queue_midi_out(channel_ptr, CHANNEL_MUTE);
     LOG_DEBUG("\"%s\" muted.", channel_ptr->name);
   }
 }
@@ -884,9 +1416,9 @@ void
 channel_out_unmute(
   jack_mixer_channel_t channel)
 {
-  if (channel_ptr->out_mute) {
-    channel_ptr->out_mute = false;
-    channel_ptr->midi_out_has_events |= CHANNEL_MUTE;
+  if (channel_ptr->state->out_mute) {
+    channel_ptr->state->out_mute = false;
+    channel_queue_midi_out(channel_ptr, CHANNEL_MUTE);
     LOG_DEBUG("\"%s\" un-muted.", channel_ptr->name);
   }
 }
@@ -895,17 +1427,22 @@ bool
 channel_is_out_muted(
   jack_mixer_channel_t channel)
 {
-  return channel_ptr->out_mute;
+  return channel_ptr->state->out_mute;
 }
 
+/*
+ * Solo and unsolo are called from the API and from MIDI handling in the
+ * process thread, so the flag and the count are only changed atomically,
+ * and the count only follows actual changes of the flag
+ */
 void
 channel_solo(
   jack_mixer_channel_t channel)
 {
-  if (g_slist_find(channel_ptr->mixer_ptr->soloed_channels, channel) != NULL)
+  if (__atomic_exchange_n(&channel_ptr->state->solo, true, __ATOMIC_ACQ_REL))
     return;
-  channel_ptr->mixer_ptr->soloed_channels = g_slist_prepend(channel_ptr->mixer_ptr->soloed_channels, channel);
-  channel_ptr->midi_out_has_events |= CHANNEL_SOLO;
+  __atomic_add_fetch(&channel_ptr->mixer_ptr->soloed_channels_count, 1, __ATOMIC_RELAXED);
+  channel_queue_midi_out(channel_ptr, CHANNEL_SOLO);
   LOG_DEBUG("\"%s\" soloed.", channel_ptr->name);
 }
 
@@ -913,10 +1450,10 @@ void
 channel_unsolo(
   jack_mixer_channel_t channel)
 {
-  if (g_slist_find(channel_ptr->mixer_ptr->soloed_channels, channel) == NULL)
+  if (!__atomic_exchange_n(&channel_ptr->state->solo, false, __ATOMIC_ACQ_REL))
     return;
-  channel_ptr->mixer_ptr->soloed_channels = g_slist_remove(channel_ptr->mixer_ptr->soloed_channels, channel);
-  channel_ptr->midi_out_has_events |= CHANNEL_SOLO;
+  __atomic_sub_fetch(&channel_ptr->mixer_ptr->soloed_channels_count, 1, __ATOMIC_RELAXED);
+  channel_queue_midi_out(channel_ptr, CHANNEL_SOLO);
   LOG_DEBUG("\"%s\" un-soloed.", channel_ptr->name);
 }
 
@@ -924,9 +1461,7 @@ bool
 channel_is_soloed(
   jack_mixer_channel_t channel)
 {
-  if (g_slist_find(channel_ptr->mixer_ptr->soloed_channels, channel))
-    return true;
-  return false;
+  return __atomic_load_n(&channel_ptr->state->solo, __ATOMIC_RELAXED);
 }
 
 void
@@ -959,1006 +1494,3848 @@ channel_get_midi_in_got_events(
 #undef channel_ptr
 
 /*
- * Process input channels and mix them into one output channel signal
+ * Free retired memory which can't be in use by the process thread anymore
+ *
+ * If all is true, free everything regardless (only safe when the JACK
+ * client is closed). The mixer mutex must be held.
  */
-static inline void
-mix_one(
-  struct output_channel *output_mix_channel,
-  GSList *channels_list,        /* All input channels */
-  jack_nframes_t start,         /* Index of first sample to process */
-  jack_nframes_t end)           /* Index of sample to stop processing before */
+static void
+collect_garbage(
+  struct jack_mixer *mixer_ptr,
+  bool all)
 {
-  jack_nframes_t i;
-
   GSList *node_ptr;
-  struct channel * channel_ptr;
-  jack_default_audio_sample_t frame_left;
-  jack_default_audio_sample_t frame_right;
-  jack_default_audio_sample_t frame_left_pre;
-  jack_default_audio_sample_t frame_right_pre;
-
-  struct channel *mix_channel = (struct channel*)output_mix_channel;
+  GSList *next_ptr;
+  struct garbage *garbage_ptr;
+  unsigned int cycle = __atomic_load_n(&mixer_ptr->cycle, __ATOMIC_ACQUIRE);
 
-  /* Zero intermediate mix & output buffers */
-  for (i = start; i < end; i++)
+  for (node_ptr = mixer_ptr->garbage; node_ptr; node_ptr = next_ptr)
   {
-    mix_channel->left_buffer_ptr[i] = mix_channel->tmp_mixed_frames_left[i] = 0.0;
-    if (mix_channel->stereo)
-      mix_channel->right_buffer_ptr[i] = mix_channel->tmp_mixed_frames_right[i] = 0.0;
+    next_ptr = g_slist_next(node_ptr);
+    garbage_ptr = node_ptr->data;
+
+    /* A whole process cycle ran after retirement, so nobody can hold a
+     * reference. The cycle in progress at retirement time is not enough,
+     * as it may have drained the MIDI out queue before a removed channel
+     * was queued. */
+    if (all || cycle - garbage_ptr->cycle >= 2)
+    {
+      garbage_ptr->free_fn(garbage_ptr->ptr);
+      free(garbage_ptr);
+      mixer_ptr->garbage = g_slist_delete_link(mixer_ptr->garbage, node_ptr);
+    }
   }
+}
+
+/*
+ * Free memory which was visible to the process thread once it is safe to do so
+ *
+ * The mixer mutex must be held.
+ */
+static void
+retire(
+  struct jack_mixer *mixer_ptr,
+  void *ptr,
+  void (*free_fn)(void *))
+{
+  struct garbage *garbage_ptr;
+
+  collect_garbage(mixer_ptr, false);
 
-  /* For each input channel: */
-  for (node_ptr = channels_list; node_ptr; node_ptr = g_slist_next(node_ptr))
+  if (ptr == NULL)
   {
-    channel_ptr = node_ptr->data;
+    return;
+  }
 
-    /* Skip input channels with activated mute for this output channel */
-    if (g_slist_find(output_mix_channel->muted_channels, channel_ptr) != NULL || channel_ptr->out_mute) {
-      continue;
-    }
+  garbage_ptr = malloc(sizeof(struct garbage));
+  if (garbage_ptr == NULL)
+  {
+    /* Leaking is better than freeing memory that may still be in use */
+    LOG_ERROR("Could not allocate memory for retiring %p.", ptr);
+    return;
+  }
 
-    /* Mix signal of all input channels going to this output channel:
-     *
-     * Only add the signal from this input channel:
-     *
-     * - if there are no globally soloed channels and no soloed channels for this output-channel;
-     * - or if the input channel is globally soloed and the output channel is not a system
-     *   channel (direct out or monitor out);
-     * - or if the input channel is soloed for this output channel.
-     *
-     * */
-    if ((!channel_ptr->mixer_ptr->soloed_channels && !output_mix_channel->soloed_channels) ||
-        (channel_ptr->mixer_ptr->soloed_channels &&
-         g_slist_find(channel_ptr->mixer_ptr->soloed_channels, channel_ptr) != NULL &&
-         !output_mix_channel->system) ||
-        (output_mix_channel->soloed_channels &&
-         g_slist_find(output_mix_channel->soloed_channels, channel_ptr) != NULL))
-    {
-
-      /* Get either post or pre-fader signal */
-      for (i = start ; i < end ; i++)
-      {
-        /* Left/mono signal */
-        if (! output_mix_channel->prefader &&
-            g_slist_find(output_mix_channel->prefader_channels, channel_ptr) == NULL)
-        {
-          frame_left = channel_ptr->frames_left[i-start];
-        }
-        else {
-          /* Output channel is globally set to pre-fader routing or
-           * input channel has pre-fader routing set for this output channel
-           */
-          frame_left = channel_ptr->prefader_frames_left[i-start];
-        }
+  garbage_ptr->ptr = ptr;
+  garbage_ptr->free_fn = free_fn;
+  garbage_ptr->cycle = __atomic_load_n(&mixer_ptr->cycle, __ATOMIC_ACQUIRE);
+  mixer_ptr->garbage = g_slist_prepend(mixer_ptr->garbage, garbage_ptr);
+}
 
-        if (frame_left == NAN)
-          break;
+static void
+free_channel(
+  void *ptr)
+{
+  struct channel *channel_ptr = ptr;
 
-        mix_channel->tmp_mixed_frames_left[i] += frame_left;
+  free(channel_ptr->name);
+  free(channel_ptr);
+}
 
-        /* Right signal */
-        if (mix_channel->stereo)
-        {
-          if (! output_mix_channel->prefader &&
-              g_slist_find(output_mix_channel->prefader_channels, channel_ptr) == NULL)
-          {
-            frame_right = channel_ptr->frames_right[i-start];
-          }
-          else {
-            /* Pre-fader routing */
-            frame_right = channel_ptr->prefader_frames_right[i-start];
-          }
+/*
+ * Build routing table of an output channel from its solo/mute/prefader
+ * settings, or from the ones stored in scene if it is not -1 and the output
+ * channel was stored in it
+ */
+static struct routing *
+create_routing(
+  struct jack_mixer *mixer_ptr,
+  struct output_channel *output_channel_ptr,
+  int scene)
+{
+  struct routing *routing_ptr;
+  struct send *send_ptr;
+  struct channel *channel_ptr;
+  GSList *soloed_channels = output_channel_ptr->soloed_channels;
+  GSList *muted_channels = output_channel_ptr->muted_channels;
+  GSList *prefader_channels = output_channel_ptr->prefader_channels;
+  bool prefader = output_channel_ptr->prefader;
+  GSList *node_ptr;
 
-          if (frame_right == NAN)
-            break;
+  if (scene != -1 && output_channel_ptr->channel.scenes[scene].stored)
+  {
+    soloed_channels = output_channel_ptr->scenes[scene].soloed_channels;
+    muted_channels = output_channel_ptr->scenes[scene].muted_channels;
+    prefader_channels = output_channel_ptr->scenes[scene].prefader_channels;
+    prefader = output_channel_ptr->scenes[scene].prefader;
+  }
 
-          mix_channel->tmp_mixed_frames_right[i] += frame_right;
-        }
-      }
-    }
+  routing_ptr = malloc(sizeof(struct routing) +
+                       g_slist_length(mixer_ptr->input_channels_list) * sizeof(struct send));
+  if (routing_ptr == NULL)
+  {
+    return NULL;
   }
 
-  /* Apply output channel volume and compute meter signal and peak values */
-  unsigned int steps = mix_channel->num_volume_transition_steps;
+  routing_ptr->prefader = prefader;
+  routing_ptr->has_solo = soloed_channels != NULL;
+  routing_ptr->keep_sum = false;
+  routing_ptr->mix_minus_source = -1;
+  routing_ptr->mix_minus_send = -1;
+  routing_ptr->partial_sum = -1;
+  routing_ptr->shared_count = 0;
+  routing_ptr->count = 0;
 
-  for (i = start ; i < end ; i++)
+  if (output_channel_ptr->mix_minus_source != NULL)
   {
-    mix_channel->prefader_frames_left[i] = mix_channel->tmp_mixed_frames_left[i];
-    mix_channel->prefader_frames_right[i] = mix_channel->tmp_mixed_frames_right[i];
-    /** Apply fader volume if output channel is not set to pre-fader routing */
-    if (! output_mix_channel->prefader) {
-      float volume = mix_channel->volume;
-      float volume_new = mix_channel->volume_new;
-      float vol = volume;
-      float balance = mix_channel->balance;
-      float balance_new = mix_channel->balance_new;
-      float bal = balance;
-
-      /* Do interpolation during transition to target volume level */
-      if (volume != volume_new) {
-        vol = interpolate(volume, volume_new, mix_channel->volume_idx, steps);
-      }
+    return routing_ptr;
+  }
 
-      /* Do interpolation during transition to target balance */
-      if (balance != balance_new) {
-        bal = mix_channel->balance_idx * (balance_new - balance) / steps + balance;
-      }
+  for (node_ptr = mixer_ptr->input_channels_list; node_ptr; node_ptr = g_slist_next(node_ptr))
+  {
+    channel_ptr = node_ptr->data;
 
-      float vol_l;
-      float vol_r;
+    if (g_slist_find(muted_channels, channel_ptr) != NULL)
+    {
+      continue;
+    }
 
-      /* Calculate left+right gain from volume and balance levels */
-      if (mix_channel->stereo) {
-        if (bal > 0) {
-          vol_l = vol * (1 - bal);
-          vol_r = vol;
-        }
-        else {
-          vol_l = vol;
-          vol_r = vol * (1 + bal);
-        }
-      }
-      else {
-        vol_l = vol * (1 - bal);
-        vol_r = vol * (1 + bal);
-      }
+    send_ptr = &routing_ptr->sends[routing_ptr->count++];
+    send_ptr->channel = channel_ptr;
+    send_ptr->prefader = g_slist_find(prefader_channels, channel_ptr) != NULL;
+    send_ptr->solo = g_slist_find(soloed_channels, channel_ptr) != NULL;
+    send_ptr->gain = 1.0f;
+  }
 
-      /* Apply gain to output mix */
-      mix_channel->tmp_mixed_frames_left[i] *= vol_l;
-      mix_channel->tmp_mixed_frames_right[i] *= vol_r;
-    }
+  return routing_ptr;
+}
 
+/*
+ * Send mixes saved when output channels share a partial sum, each of them
+ * copying the partial sum costs about as much as mixing one more send
+ */
+static inline int
+partial_sum_saving(
+  unsigned int shared_count,
+  unsigned int members_count)
+{
+  return (int)(shared_count * (members_count - 1)) - (int)members_count;
+}
 
-    /* Get peak signal, left/right and combined */
-    frame_left = fabsf(mix_channel->tmp_mixed_frames_left[i]);
-    frame_left_pre = fabsf(mix_channel->prefader_frames_left[i]);
+static inline bool
+is_same_send(
+  const struct send *send_ptr,
+  const struct send *other_send_ptr)
+{
+  return send_ptr->channel == other_send_ptr->channel &&
+    send_ptr->prefader == other_send_ptr->prefader &&
+    send_ptr->solo == other_send_ptr->solo &&
+    send_ptr->gain == other_send_ptr->gain;
+}
 
-    if (mix_channel->peak_left_prefader < frame_left_pre)
-    {
-      mix_channel->peak_left_prefader = frame_left_pre;
-    }
+/*
+ * Find groups of output channels of a snapshot sharing enough sends to mix
+ * them once as a partial sum, and move the shared sends to the front of
+ * the routing of each member
+ *
+ * Only output channels including input channels by the same rules can
+ * share sends. They are grouped greedily in snapshot order, an output
+ * channel joins a group if that saves more send mixes than it costs by
+ * shrinking the shared sends. Mix-minus output channels have no sends.
+ *
+ * Returns 0 on success, -1 if memory allocation failed.
+ */
+static int
+find_partial_sums(
+  struct snapshot *snapshot_ptr)
+{
+  unsigned int outputs_count = snapshot_ptr->mix_minus_index;
+  unsigned int inputs_count = snapshot_ptr->input_channels_count;
+  int *send_index = NULL;       /* send of each input channel in each routing, -1 if muted */
+  bool *shared = NULL;          /* input channels with the same send in all group members */
+  bool *grouped = NULL;
+  unsigned int *members = NULL;
+  struct send *sends = NULL;    /* routing sends being reordered */
+  struct partial_sum **partial_sums_ptr;
+  struct partial_sum *partial_sum_ptr;
+  struct output_channel *output_channel_ptr;
+  struct output_channel *other_channel_ptr;
+  struct routing *routing_ptr;
+  struct routing *other_routing_ptr;
+  unsigned int shared_count;
+  unsigned int members_count;
+  unsigned int count;
+  unsigned int i;
+  unsigned int j;
+  unsigned int k;
+  unsigned int m;
+  int *index_ptr;
+  int *other_index_ptr;
+  int ret = -1;
+
+  if (outputs_count < 2 || inputs_count == 0)
+  {
+    return 0;
+  }
 
-    if (mix_channel->peak_left_postfader < frame_left)
+  send_index = malloc(outputs_count * inputs_count * sizeof(int));
+  shared = malloc(inputs_count * sizeof(bool));
+  grouped = calloc(outputs_count, sizeof(bool));
+  members = malloc(outputs_count * sizeof(unsigned int));
+  sends = malloc(inputs_count * sizeof(struct send));
+  if (send_index == NULL || shared == NULL || grouped == NULL || members == NULL || sends == NULL)
+  {
+    goto exit;
+  }
+
+  /* Sends are in the same order as the input channels, see create_routing() */
+  for (i = 0; i < outputs_count; i++)
+  {
+    routing_ptr = snapshot_ptr->routings[i];
+    index_ptr = send_index + i * inputs_count;
+
+    for (k = 0, j = 0; k < inputs_count; k++)
     {
-      mix_channel->peak_left_postfader = frame_left;
+      if (j < routing_ptr->count && routing_ptr->sends[j].channel == snapshot_ptr->input_channels[k])
+      {
+        index_ptr[k] = j++;
+      }
+      else
+      {
+        index_ptr[k] = -1;
+      }
     }
+  }
+
+  for (i = 0; i < outputs_count; i++)
+  {
+    output_channel_ptr = snapshot_ptr->output_channels[i];
+    routing_ptr = snapshot_ptr->routings[i];
+    index_ptr = send_index + i * inputs_count;
 
-    if (frame_left > mix_channel->abspeak_postfader)
+    if (grouped[i] || routing_ptr->count == 0)
     {
-      mix_channel->abspeak_postfader = frame_left;
+      continue;
     }
 
-    if (frame_left_pre > mix_channel->abspeak_prefader)
+    for (k = 0; k < inputs_count; k++)
     {
-      mix_channel->abspeak_prefader = frame_left_pre;
+      shared[k] = index_ptr[k] != -1;
     }
+    shared_count = routing_ptr->count;
+    members[0] = i;
+    members_count = 1;
 
-    /* This seems to duplicate what was already done right above? */
-    if (mix_channel->stereo)
+    for (j = i + 1; j < outputs_count; j++)
     {
-      frame_right = fabsf(mix_channel->tmp_mixed_frames_right[i]);
-      frame_right_pre = fabsf(mix_channel->prefader_frames_right[i]);
-
-      if (mix_channel->peak_right_prefader < frame_right_pre)
+      other_channel_ptr = snapshot_ptr->output_channels[j];
+      other_routing_ptr = snapshot_ptr->routings[j];
+      other_index_ptr = send_index + j * inputs_count;
+
+      if (grouped[j] ||
+          other_routing_ptr->has_solo != routing_ptr->has_solo ||
+          other_channel_ptr->system != output_channel_ptr->system ||
+          other_routing_ptr->prefader != routing_ptr->prefader)
       {
-        mix_channel->peak_right_prefader = frame_right_pre;
+        continue;
       }
 
-      if (mix_channel->peak_right_postfader < frame_right)
+      for (k = 0, count = 0; k < inputs_count; k++)
       {
-        mix_channel->peak_right_postfader = frame_right;
+        if (shared[k] && other_index_ptr[k] != -1 &&
+            is_same_send(&routing_ptr->sends[index_ptr[k]], &other_routing_ptr->sends[other_index_ptr[k]]))
+        {
+          count++;
+        }
       }
 
-      if (frame_right > mix_channel->abspeak_postfader)
+      if (partial_sum_saving(count, members_count + 1) <= partial_sum_saving(shared_count, members_count))
       {
-        mix_channel->abspeak_postfader = frame_right;
+        continue;
       }
 
-      if (frame_right_pre > mix_channel->abspeak_prefader)
+      for (k = 0; k < inputs_count; k++)
       {
-        mix_channel->abspeak_prefader = frame_right_pre;
+        shared[k] = shared[k] && other_index_ptr[k] != -1 &&
+          is_same_send(&routing_ptr->sends[index_ptr[k]], &other_routing_ptr->sends[other_index_ptr[k]]);
       }
+      shared_count = count;
+      members[members_count++] = j;
     }
 
-    /* update left/right peak values every so often */
-    mix_channel->peak_frames++;
-    if (mix_channel->peak_frames >= PEAK_FRAMES_CHUNK)
+    if (members_count < 2 || partial_sum_saving(shared_count, members_count) <= 0)
     {
-      mix_channel->meter_left_prefader = mix_channel->peak_left_prefader;
-      mix_channel->peak_left_prefader = 0.0;
-
-      mix_channel->meter_left_postfader = mix_channel->peak_left_postfader;
-      mix_channel->peak_left_postfader = 0.0;
-
-      if (mix_channel->stereo)
-      {
-        mix_channel->meter_right_prefader = mix_channel->peak_right_prefader;
-        mix_channel->peak_right_prefader = 0.0;
-
-        mix_channel->meter_right_postfader = mix_channel->peak_right_postfader;
-        mix_channel->peak_right_postfader = 0.0;
-      }
-
-      mix_channel->peak_frames = 0;
-    }
-
-    /* Finish off volume interpolation */
-    mix_channel->volume_idx++;
-    if ((mix_channel->volume != mix_channel->volume_new) && (mix_channel->volume_idx == steps)) {
-      mix_channel->volume = mix_channel->volume_new;
-      mix_channel->volume_idx = 0;
-    }
-    /* Finish off volume interpolation */
-    mix_channel->balance_idx++;
-    if ((mix_channel->balance != mix_channel->balance_new) && (mix_channel->balance_idx == steps)) {
-      mix_channel->balance = mix_channel->balance_new;
-      mix_channel->balance_idx = 0;
-    }
-
-    /* Finally, if output channel is not muted, put signal into output buffer */
-    if (!mix_channel->out_mute) {
-        mix_channel->left_buffer_ptr[i] = mix_channel->tmp_mixed_frames_left[i];
-        if (mix_channel->stereo)
-          mix_channel->right_buffer_ptr[i] = mix_channel->tmp_mixed_frames_right[i];
+      continue;
     }
-  }
-
-  /* Calculate k-metering for output channel*/
-
-  if (mix_channel->mixer_ptr->kmetering) {
-    kmeter_process(&mix_channel->kmeter_left, mix_channel->tmp_mixed_frames_left, start, end);
-    kmeter_process(&mix_channel->kmeter_right, mix_channel->tmp_mixed_frames_right, start, end);
-    kmeter_process(&mix_channel->kmeter_prefader_left, mix_channel->prefader_frames_left, start, end);
-    kmeter_process(&mix_channel->kmeter_prefader_right, mix_channel->prefader_frames_right, start, end);
-  }
-}
-
-static inline void
-calc_channel_frames(
-  struct channel *channel_ptr,
-  jack_nframes_t start,
-  jack_nframes_t end)
-{
-  jack_nframes_t i;
-  jack_default_audio_sample_t frame_left = 0.0f;
-  jack_default_audio_sample_t frame_right = 0.0f;
-  jack_default_audio_sample_t frame_left_pre = 0.0f;
-  jack_default_audio_sample_t frame_right_pre = 0.0f;
-  unsigned int steps = channel_ptr->num_volume_transition_steps;
 
-  for (i = start ; i < end ; i++)
-  {
-    if (i-start >= MAX_BLOCK_SIZE)
+    partial_sums_ptr = realloc(snapshot_ptr->partial_sums,
+                               (snapshot_ptr->partial_sums_count + 1) * sizeof(struct partial_sum *));
+    if (partial_sums_ptr == NULL)
     {
-      fprintf(stderr, "i-start too high: %d - %d\n", i, start);
+      goto exit;
     }
+    snapshot_ptr->partial_sums = partial_sums_ptr;
 
-    /* Save pre-fader signal */
-    channel_ptr->prefader_frames_left[i-start] = channel_ptr->left_buffer_ptr[i];
-    if (channel_ptr->stereo)
-      channel_ptr->prefader_frames_right[i-start] = channel_ptr->right_buffer_ptr[i];
-
-    /* Detect de-normals */
-    if (!FLOAT_EXISTS(channel_ptr->left_buffer_ptr[i]))
+    partial_sum_ptr = malloc(sizeof(struct partial_sum) + shared_count * sizeof(struct send));
+    if (partial_sum_ptr == NULL)
     {
-      channel_ptr->NaN_detected = true;
-      channel_ptr->frames_left[i-start] = NAN;
-      break;
+      goto exit;
     }
+    snapshot_ptr->partial_sums[snapshot_ptr->partial_sums_count] = partial_sum_ptr;
 
-    /* Get current and target channel volume and balance. */
-    float volume = channel_ptr->volume;
-    float volume_new = channel_ptr->volume_new;
-    float vol = volume;
-    float balance = channel_ptr->balance;
-    float balance_new = channel_ptr->balance_new;
-    float bal = balance;
+    partial_sum_ptr->system = output_channel_ptr->system;
+    partial_sum_ptr->prefader = routing_ptr->prefader;
+    partial_sum_ptr->has_solo = routing_ptr->has_solo;
+    partial_sum_ptr->stereo = false;
+    partial_sum_ptr->frames_left = NULL;
+    partial_sum_ptr->frames_right = NULL;
+    partial_sum_ptr->count = 0;
 
-    /* During transition do interpolation to target volume level */
-    if (channel_ptr->volume != channel_ptr->volume_new) {
-      vol = interpolate(volume, volume_new, channel_ptr->volume_idx, steps);
-    }
-
-    /* During transition do interpolation to target balance */
-    if (channel_ptr->balance != channel_ptr->balance_new) {
-      bal = channel_ptr->balance_idx * (balance_new - balance) / steps + balance;
-    }
-
-    /* Calculate left+right gain from volume and balance levels */
-    float vol_l;
-    float vol_r;
-    if (channel_ptr->stereo) {
-      if (bal > 0) {
-        vol_l = vol * (1 - bal);
-        vol_r = vol;
-      }
-      else {
-        vol_l = vol;
-        vol_r = vol * (1 + bal);
-      }
-    }
-    else {
-      vol_l = vol * (1 - bal);
-      vol_r = vol * (1 + bal);
-    }
-
-    /* Calculate left channel post-fader sample */
-    frame_left = channel_ptr->left_buffer_ptr[i] * vol_l;
-    frame_left_pre = channel_ptr->left_buffer_ptr[i];
-
-    /* Calculate right channel post-fader sample */
-    if (channel_ptr->stereo)
+    for (k = 0; k < inputs_count; k++)
     {
-      if (!FLOAT_EXISTS(channel_ptr->right_buffer_ptr[i]))
+      if (shared[k])
       {
-        channel_ptr->NaN_detected = true;
-        channel_ptr->frames_right[i-start] = NAN;
-        break;
+        partial_sum_ptr->sends[partial_sum_ptr->count++] = routing_ptr->sends[index_ptr[k]];
       }
-
-      frame_right = channel_ptr->right_buffer_ptr[i] * vol_r;
-      frame_right_pre = channel_ptr->right_buffer_ptr[i];
-    }
-    else
-    {
-      frame_right = channel_ptr->left_buffer_ptr[i] * vol_r;
-      frame_right_pre = channel_ptr->left_buffer_ptr[i];
     }
-    channel_ptr->frames_left[i-start] = frame_left;
-    channel_ptr->frames_right[i-start] = frame_right;
 
-    /* Calculate left+right peak-level and, if need be,
-     * update abspeak level
-     */
-    if (channel_ptr->stereo)
+    /* Shared sends go first, the others keep their order after them */
+    for (m = 0; m < members_count; m++)
     {
-      frame_left = fabsf(frame_left);
-      frame_right = fabsf(frame_right);
-      frame_left_pre = fabsf(frame_left_pre);
-      frame_right_pre = fabsf(frame_right_pre);
-
-      if (channel_ptr->peak_left_prefader < frame_left_pre)
-      {
-        channel_ptr->peak_left_prefader = frame_left_pre;
-      }
-
-      if (channel_ptr->peak_left_postfader < frame_left)
-      {
-        channel_ptr->peak_left_postfader = frame_left;
-      }
+      other_routing_ptr = snapshot_ptr->routings[members[m]];
+      other_index_ptr = send_index + members[m] * inputs_count;
 
-      if (frame_left > channel_ptr->abspeak_postfader)
+      for (k = 0, count = 0; k < inputs_count; k++)
       {
-        channel_ptr->abspeak_postfader = frame_left;
+        if (shared[k])
+        {
+          sends[count++] = other_routing_ptr->sends[other_index_ptr[k]];
+        }
       }
-
-      if (frame_left_pre > channel_ptr->abspeak_prefader)
+      for (k = 0; k < inputs_count; k++)
       {
-        channel_ptr->abspeak_prefader = frame_left_pre;
+        if (!shared[k] && other_index_ptr[k] != -1)
+        {
+          sends[count++] = other_routing_ptr->sends[other_index_ptr[k]];
+        }
       }
+      memcpy(other_routing_ptr->sends, sends, count * sizeof(struct send));
 
-      if (channel_ptr->peak_right_prefader < frame_right_pre)
-      {
-        channel_ptr->peak_right_prefader = frame_right_pre;
-      }
+      other_routing_ptr->partial_sum = snapshot_ptr->partial_sums_count;
+      other_routing_ptr->shared_count = shared_count;
+      grouped[members[m]] = true;
 
-      if (channel_ptr->peak_right_postfader < frame_right)
+      if (((struct channel *)snapshot_ptr->output_channels[members[m]])->state->stereo)
       {
-        channel_ptr->peak_right_postfader = frame_right;
+        partial_sum_ptr->stereo = true;
       }
+    }
 
-      if (frame_right > channel_ptr->abspeak_postfader)
-      {
-        channel_ptr->abspeak_postfader = frame_right;
-      }
+    snapshot_ptr->partial_sums_count++;
+  }
 
-      if (frame_right_pre > channel_ptr->abspeak_prefader)
-      {
-        channel_ptr->abspeak_prefader = frame_right_pre;
-      }
-    }
-    else
-    {
-      frame_left = (fabsf(frame_left) + fabsf(frame_right)) / 2;
-      frame_left_pre = fabsf(frame_left_pre);
+  ret = 0;
 
-      if (channel_ptr->peak_left_prefader < frame_left_pre)
-      {
-        channel_ptr->peak_left_prefader = frame_left_pre;
-      }
+exit:
+  free(send_index);
+  free(shared);
+  free(grouped);
+  free(members);
+  free(sends);
+  return ret;
+}
 
-      if (channel_ptr->peak_left_postfader < frame_left)
-      {
-        channel_ptr->peak_left_postfader = frame_left;
-      }
+/*
+ * Link the routing of each mix-minus output channel of a snapshot to the
+ * routing of its source and the send it excludes
+ */
+static void
+link_mix_minus_routings(
+  struct snapshot *snapshot_ptr)
+{
+  struct output_channel *output_channel_ptr;
+  struct routing *routing_ptr;
+  struct routing *source_routing_ptr;
+  unsigned int i;
+  unsigned int j;
 
-      if (frame_left > channel_ptr->abspeak_postfader)
-      {
-        channel_ptr->abspeak_postfader = frame_left;
-      }
+  for (i = snapshot_ptr->mix_minus_index; i < snapshot_ptr->output_channels_count; i++)
+  {
+    output_channel_ptr = snapshot_ptr->output_channels[i];
+    routing_ptr = snapshot_ptr->routings[i];
 
-      if (frame_left_pre > channel_ptr->abspeak_prefader)
+    for (j = 0; j < snapshot_ptr->mix_minus_index; j++)
+    {
+      if (snapshot_ptr->output_channels[j] == output_channel_ptr->mix_minus_source)
       {
-        channel_ptr->abspeak_prefader = frame_left_pre;
+        break;
       }
     }
+    assert(j < snapshot_ptr->mix_minus_index);
+
+    source_routing_ptr = snapshot_ptr->routings[j];
+    source_routing_ptr->keep_sum = true;
+    routing_ptr->mix_minus_source = j;
 
-    /* Update input channel volume meter every so often */
-    channel_ptr->peak_frames++;
-    if (channel_ptr->peak_frames >= PEAK_FRAMES_CHUNK)
+    /* An input channel muted for the source has nothing to subtract */
+    for (j = 0; j < source_routing_ptr->count; j++)
     {
-      channel_ptr->meter_left_postfader = channel_ptr->peak_left_postfader;
-      channel_ptr->peak_left_postfader = 0.0;
-      channel_ptr->meter_left_prefader = channel_ptr->peak_left_prefader;
-      channel_ptr->peak_left_prefader = 0.0;
-      if (channel_ptr->stereo)
+      if (source_routing_ptr->sends[j].channel == output_channel_ptr->mix_minus_channel)
       {
-        channel_ptr->meter_right_postfader = channel_ptr->peak_right_postfader;
-        channel_ptr->peak_right_postfader = 0.0;
-        channel_ptr->meter_right_prefader = channel_ptr->peak_right_prefader;
-        channel_ptr->peak_right_prefader = 0.0;
+        routing_ptr->mix_minus_send = j;
+        break;
       }
-
-      channel_ptr->peak_frames = 0;
-    }
-
-    /* Finish off volume & balance level interpolation */
-    channel_ptr->volume_idx++;
-    if ((channel_ptr->volume != channel_ptr->volume_new) &&
-     (channel_ptr->volume_idx >= steps)) {
-      channel_ptr->volume = channel_ptr->volume_new;
-      channel_ptr->volume_idx = 0;
-    }
-    channel_ptr->balance_idx++;
-    if ((channel_ptr->balance != channel_ptr->balance_new) &&
-     (channel_ptr->balance_idx >= steps)) {
-      channel_ptr->balance = channel_ptr->balance_new;
-      channel_ptr->balance_idx = 0;
     }
   }
-
-  /* Calculate k-metering for input channel */
-  if (channel_ptr->mixer_ptr->kmetering) {
-    kmeter_process(&channel_ptr->kmeter_left, channel_ptr->frames_left, start, end);
-    if (channel_ptr->stereo) {
-      kmeter_process(&channel_ptr->kmeter_right, channel_ptr->frames_right, start, end);
-    }
-    kmeter_process(&channel_ptr->kmeter_prefader_left, channel_ptr->prefader_frames_left, start, end);
-    if (channel_ptr->stereo)
-      kmeter_process(&channel_ptr->kmeter_prefader_right, channel_ptr->prefader_frames_right, start, end);
-    }
 }
 
-static inline void
-mix(
-  struct jack_mixer * mixer_ptr,
-  jack_nframes_t start,         /* Index of first sample to process */
-  jack_nframes_t end)           /* Index of sample to stop processing before */
+static void
+free_snapshot(
+  void *ptr)
 {
-  GSList *node_ptr;
-  struct output_channel * output_channel_ptr;
-  struct channel *channel_ptr;
+  struct snapshot *snapshot_ptr = ptr;
+  unsigned int i;
 
-  /* Calculate pre/post-fader output and peak values for each input channel */
-  for (node_ptr = mixer_ptr->input_channels_list; node_ptr; node_ptr = g_slist_next(node_ptr))
+  for (i = 0; i < snapshot_ptr->output_channels_count; i++)
   {
-    channel_ptr = (struct channel*)node_ptr->data;
-    calc_channel_frames(channel_ptr, start, end);
+    free(snapshot_ptr->routings[i]);
   }
 
-  /* For all output channels: */
-  for (node_ptr = mixer_ptr->output_channels_list; node_ptr; node_ptr = g_slist_next(node_ptr))
+  for (i = 0; i < snapshot_ptr->partial_sums_count; i++)
   {
-    output_channel_ptr = node_ptr->data;
-    channel_ptr = (struct channel*)output_channel_ptr;
+    free(snapshot_ptr->partial_sums[i]);
+  }
 
-    if (output_channel_ptr->system)
+  if (snapshot_ptr->scenes != NULL)
+  {
+    for (i = 0; i < SCENES_COUNT; i++)
     {
-      /* Don't bother mixing the channels if we are not connected */
-      if (channel_ptr->stereo)
+      if (snapshot_ptr->scenes[i] != NULL)
       {
-        if (jack_port_connected(channel_ptr->port_left) == 0 &&
-            jack_port_connected(channel_ptr->port_right) == 0)
-          continue;
-      }
-      else {
-        if (jack_port_connected(channel_ptr->port_left) == 0)
-          continue;
+        /* The scratch buffers belong to this snapshot */
+        snapshot_ptr->scenes[i]->scratch = NULL;
+        free_snapshot(snapshot_ptr->scenes[i]);
       }
     }
-
-    /* Mix this output channel */
-    mix_one(output_channel_ptr, mixer_ptr->input_channels_list, start, end);
+    free(snapshot_ptr->scenes);
   }
+
+  free(snapshot_ptr->partial_sums);
+  free(snapshot_ptr->scratch);
+  free(snapshot_ptr);
 }
 
-static inline void
-update_channel_buffers(
-  struct channel * channel_ptr,
-  jack_nframes_t nframes)
+static inline size_t
+snapshot_size(
+  unsigned int input_channels_count,
+  unsigned int output_channels_count)
 {
-  channel_ptr->left_buffer_ptr = jack_port_get_buffer(channel_ptr->port_left, nframes);
-
-  if (channel_ptr->stereo)
-  {
-    channel_ptr->right_buffer_ptr = jack_port_get_buffer(channel_ptr->port_right, nframes);
-  }
+  return sizeof(struct snapshot) +
+    input_channels_count * sizeof(struct channel *) +
+    output_channels_count * sizeof(struct output_channel *) +
+    output_channels_count * sizeof(struct routing *);
 }
 
-static inline void
-kmeter_calc_hold_fall(
-  int *hold,
-  float *fall,
-  jack_nframes_t nframes,
-  jack_nframes_t sr)
-  {
-    float t;
-    t = (float) nframes / sr;
-    *hold = (int)(0.5 / t + 0.5f);
-    *fall = powf(10.0f, -0.05f * 10.5f * t);
-  }
+/* Allocate a snapshot and its channel arrays as one block */
+static struct snapshot *
+alloc_snapshot(
+  unsigned int input_channels_count,
+  unsigned int output_channels_count)
+{
+  struct snapshot *snapshot_ptr;
 
-static inline void
-set_kmeters_peak_params(
-  struct channel *channel_ptr,
-  jack_nframes_t nframes)
+  snapshot_ptr = calloc(1, snapshot_size(input_channels_count, output_channels_count));
+  if (snapshot_ptr == NULL)
   {
-    int hold;
-    float fall;
-    jack_nframes_t sr = jack_get_sample_rate(channel_ptr->mixer_ptr->jack_client);
-    kmeter_calc_hold_fall(&hold, &fall, nframes, sr);
-    channel_ptr->kmeter_left._hold = hold;
-    channel_ptr->kmeter_right._hold = hold;
-    channel_ptr->kmeter_left._fall = fall;
-    channel_ptr->kmeter_right._fall = fall;
-    channel_ptr->kmeter_prefader_left._hold = hold;
-    channel_ptr->kmeter_prefader_right._hold = hold;
-    channel_ptr->kmeter_prefader_left._fall = fall;
-    channel_ptr->kmeter_prefader_right._fall = fall;
+    return NULL;
   }
 
-static int jack_buffer_size_cb(jack_nframes_t nframes, void *arg) {
-    struct jack_mixer *mixer_ptr  = (struct jack_mixer *) arg;
-    struct channel *channel_ptr;
-    GSList *list_ptr;
-    /* Get input ports buffer pointers */
-    for (list_ptr = mixer_ptr->input_channels_list; list_ptr; list_ptr = g_slist_next(list_ptr))
-    {
-      channel_ptr = list_ptr->data;
-      set_kmeters_peak_params(channel_ptr, nframes);
-    }
+  snapshot_ptr->input_channels = (struct channel **)(snapshot_ptr + 1);
+  snapshot_ptr->output_channels =
+    (struct output_channel **)(snapshot_ptr->input_channels + input_channels_count);
+  snapshot_ptr->routings = (struct routing **)(snapshot_ptr->output_channels + output_channels_count);
+  snapshot_ptr->input_channels_count = input_channels_count;
 
-    /* Get output ports buffer pointer */
-    for (list_ptr = mixer_ptr->output_channels_list; list_ptr; list_ptr = g_slist_next(list_ptr))
-    {
-      channel_ptr = list_ptr->data;
-      set_kmeters_peak_params(channel_ptr, nframes);
-    }
-    return 0;
+  return snapshot_ptr;
 }
 
-#define mixer_ptr ((struct jack_mixer *)context)
-
-static int
-process(
-  jack_nframes_t nframes,
-  void * context)
+/*
+ * Copy a snapshot with its routings, partial sums and scene snapshots, but
+ * without scratch buffers, so the same topology can be published again for
+ * a different period size
+ */
+static struct snapshot *
+copy_snapshot(
+  struct snapshot *snapshot_ptr)
 {
-  GSList *node_ptr;
-  struct channel * channel_ptr;
-#if defined(HAVE_JACK_MIDI)
-  jack_nframes_t i;
-  jack_nframes_t event_count;
-  jack_midi_event_t in_event;
-  unsigned char* midi_out_buffer;
-  void * midi_buffer;
-  double volume, balance;
-  uint8_t cc_channel_index;
-  uint8_t cc_num, cc_val, cur_cc_val;
-#endif
+  struct snapshot *copy_ptr;
+  size_t size;
+  unsigned int i;
 
-  /* Get input ports buffer pointers */
-  for (node_ptr = mixer_ptr->input_channels_list; node_ptr; node_ptr = g_slist_next(node_ptr))
+  copy_ptr = alloc_snapshot(snapshot_ptr->input_channels_count, snapshot_ptr->output_channels_count);
+  if (copy_ptr == NULL)
   {
-    channel_ptr = node_ptr->data;
-    update_channel_buffers(channel_ptr, nframes);
+    return NULL;
   }
 
-  /* Get output ports buffer pointer */
-  for (node_ptr = mixer_ptr->output_channels_list; node_ptr; node_ptr = g_slist_next(node_ptr))
+  memcpy(copy_ptr->input_channels, snapshot_ptr->input_channels,
+         snapshot_ptr->input_channels_count * sizeof(struct channel *));
+  memcpy(copy_ptr->output_channels, snapshot_ptr->output_channels,
+         snapshot_ptr->output_channels_count * sizeof(struct output_channel *));
+  copy_ptr->mix_minus_index = snapshot_ptr->mix_minus_index;
+
+  for (i = 0; i < snapshot_ptr->output_channels_count; i++)
   {
-    channel_ptr = node_ptr->data;
-    update_channel_buffers(channel_ptr, nframes);
-  }
+    size = sizeof(struct routing) + snapshot_ptr->routings[i]->count * sizeof(struct send);
+    copy_ptr->routings[i] = malloc(size);
+    /* count routings allocated so far, so free_snapshot() can clean up */
+    copy_ptr->output_channels_count = i + 1;
+    if (copy_ptr->routings[i] == NULL)
+    {
+      free_snapshot(copy_ptr);
+      return NULL;
+    }
 
-#if defined(HAVE_JACK_MIDI)
-  midi_buffer = jack_port_get_buffer(mixer_ptr->port_midi_in, nframes);
-  event_count = jack_midi_get_event_count(midi_buffer);
+    memcpy(copy_ptr->routings[i], snapshot_ptr->routings[i], size);
+  }
 
-  for (i = 0 ; i < event_count; i++)
+  if (snapshot_ptr->partial_sums_count != 0)
   {
-    jack_midi_event_get(&in_event, midi_buffer, i);
-
-    if (in_event.size != 3 ||
-        (in_event.buffer[0] & 0xF0) != 0xB0 ||
-        in_event.buffer[1] > 127 ||
-        in_event.buffer[2] > 127)
+    copy_ptr->partial_sums = calloc(snapshot_ptr->partial_sums_count, sizeof(struct partial_sum *));
+    if (copy_ptr->partial_sums == NULL)
     {
-      continue;
+      free_snapshot(copy_ptr);
+      return NULL;
     }
+    copy_ptr->partial_sums_count = snapshot_ptr->partial_sums_count;
 
-    assert(in_event.time < nframes);
-
-    cc_num = (uint8_t)(in_event.buffer[1] & 0x7F);
-    cc_val = (uint8_t)(in_event.buffer[2] & 0x7F);
-    mixer_ptr->last_midi_cc = (int8_t)cc_num;
+    for (i = 0; i < snapshot_ptr->partial_sums_count; i++)
+    {
+      size = sizeof(struct partial_sum) + snapshot_ptr->partial_sums[i]->count * sizeof(struct send);
+      copy_ptr->partial_sums[i] = malloc(size);
+      if (copy_ptr->partial_sums[i] == NULL)
+      {
+        free_snapshot(copy_ptr);
+        return NULL;
+      }
 
-    LOG_DEBUG("%u: CC#%u -> %u", (unsigned int)(in_event.buffer[0]), cc_num, cc_val);
+      memcpy(copy_ptr->partial_sums[i], snapshot_ptr->partial_sums[i], size);
+    }
+  }
 
-    /* Do we have a mapping for particular CC? */
-    channel_ptr = mixer_ptr->midi_cc_map[cc_num];
-    if (channel_ptr)
+  if (snapshot_ptr->scenes != NULL)
+  {
+    copy_ptr->scenes = calloc(SCENES_COUNT, sizeof(struct snapshot *));
+    if (copy_ptr->scenes == NULL)
     {
-      if (channel_ptr->midi_cc_balance_index == cc_num)
-      {
-        if (cc_val < 63) {
-          balance = MAP(cc_val, 0.0, 63.0, -1.0, -0.015625);
-        }
-        else {
-          balance = MAP(cc_val, 64.0, 127.0, 0.0, 1.0);
-        }
-        if (mixer_ptr->midi_behavior == Pick_Up &&
-            !channel_ptr->midi_cc_balance_picked_up &&
-            channel_balance_read(channel_ptr) - balance < BALANCE_PICKUP_THRESHOLD)
-        {
-          channel_set_midi_cc_balance_picked_up(channel_ptr, true);
-        }
-        if ((mixer_ptr->midi_behavior == Pick_Up &&
-            channel_ptr->midi_cc_balance_picked_up) ||
-            mixer_ptr->midi_behavior == Jump_To_Value)
-        {
-          channel_balance_write(channel_ptr, balance);
+      free_snapshot(copy_ptr);
+      return NULL;
+    }
 
-        }
-      }
-      else if (channel_ptr->midi_cc_volume_index == cc_num)
+    for (i = 0; i < SCENES_COUNT; i++)
+    {
+      if (snapshot_ptr->scenes[i] == NULL)
       {
-        /* Is a MIDI scale set for corresponding channel? */
-        if (channel_ptr->midi_scale) {
-          volume = scale_scale_to_db(channel_ptr->midi_scale,
-                                     (double)cc_val / 127);
-          if (mixer_ptr->midi_behavior == Pick_Up &&
-              !channel_ptr->midi_cc_volume_picked_up)
-          {
-              /* MIDI control in pick-up mode but not picked up yet */
-              cur_cc_val = (uint8_t)(127 * scale_db_to_scale(
-                channel_ptr->midi_scale,
-                value_to_db(channel_ptr->volume)));
-              if (cc_val == cur_cc_val)
-              {
-                /* Incoming MIDI CC value matches current volume level
-                 * --> MIDI control is picked up
-                 */
-                channel_set_midi_cc_volume_picked_up(channel_ptr, true);
-              }
-          }
-          if ((mixer_ptr->midi_behavior == Pick_Up &&
-              channel_ptr->midi_cc_volume_picked_up) ||
-              mixer_ptr->midi_behavior == Jump_To_Value)
-          {
-            channel_volume_write(channel_ptr, volume);
-          }
-        }
+        continue;
       }
-      else if (channel_ptr->midi_cc_mute_index == cc_num)
-      {
-        if (cc_val >= 64) {
-          channel_out_mute(channel_ptr);
-        }
-        else {
-          channel_out_unmute(channel_ptr);
-        }
 
-      }
-      else if (channel_ptr->midi_cc_solo_index == cc_num)
+      copy_ptr->scenes[i] = copy_snapshot(snapshot_ptr->scenes[i]);
+      if (copy_ptr->scenes[i] == NULL)
       {
-        if (cc_val >= 64) {
-            channel_solo(channel_ptr);
-        }
-        else {
-            channel_unsolo(channel_ptr);
-        }
-      }
-      channel_ptr->midi_in_got_events = true;
-      if (channel_ptr->midi_change_callback) {
-        channel_ptr->midi_change_callback(channel_ptr->midi_change_callback_data);
+        free_snapshot(copy_ptr);
+        return NULL;
       }
     }
-
   }
 
-  midi_buffer = jack_port_get_buffer(mixer_ptr->port_midi_out, nframes);
-  jack_midi_clear_buffer(midi_buffer);
+  copy_ptr->routing_recalls = snapshot_ptr->routing_recalls;
+
+  return copy_ptr;
+}
+
+/* Samples per scratch buffer, rounded up so that every buffer stays aligned */
+static inline jack_nframes_t
+scratch_stride(
+  jack_nframes_t frames)
+{
+  const jack_nframes_t align = DSP_ALIGNMENT / sizeof(float);
+
+  return (frames + align - 1) & ~(align - 1);
+}
+
+/*
+ * Allocate the scratch buffers of all channels of a snapshot as one
+ * aligned block, for periods of up to frames samples
+ *
+ * Scene snapshots use the same block, which has room for the partial sums
+ * of the one using the most.
+ */
+static int
+alloc_scratch(
+  struct snapshot *snapshot_ptr,
+  jack_nframes_t frames)
+{
+  unsigned int partial_sums_count = snapshot_ptr->partial_sums_count;
+  unsigned int count;
+  unsigned int samples;
+  unsigned int i;
 
-  for(i=0; i<nframes; i++)
+  if (snapshot_ptr->scenes != NULL)
   {
-    for (cc_channel_index=0; cc_channel_index<128; cc_channel_index++)
+    for (i = 0; i < SCENES_COUNT; i++)
     {
-      channel_ptr = mixer_ptr->midi_cc_map[cc_channel_index];
-      if (!channel_ptr)
+      if (snapshot_ptr->scenes[i] != NULL)
       {
-        continue;
-      }
-      if (!channel_ptr->midi_out_has_events)
-      {
-        continue;
+        partial_sums_count = MAX(partial_sums_count, snapshot_ptr->scenes[i]->partial_sums_count);
       }
-      if (channel_ptr->midi_out_has_events & CHANNEL_VOLUME && channel_ptr->midi_scale)
-      {
-          midi_out_buffer = jack_midi_event_reserve(midi_buffer, 0, 3);
-          if (!midi_out_buffer)
-            continue;
-
-          midi_out_buffer[0] = 0xB0; /* control change */
-          midi_out_buffer[1] = channel_ptr->midi_cc_volume_index;
-          midi_out_buffer[2] = (unsigned char)(127 * scale_db_to_scale(channel_ptr->midi_scale,
-                                               value_to_db(channel_ptr->volume_new)));
-
-          LOG_DEBUG(
-            "%u: CC#%u <- %u",
-            (unsigned int)midi_out_buffer[0],
-            (unsigned int)midi_out_buffer[1],
-            (unsigned int)midi_out_buffer[2]);
-      }
-      if (channel_ptr->midi_out_has_events & CHANNEL_BALANCE)
-      {
-          midi_out_buffer = jack_midi_event_reserve(midi_buffer, 0, 3);
-          if (!midi_out_buffer)
-            continue;
-
-          midi_out_buffer[0] = 0xB0; /* control change */
-          midi_out_buffer[1] = channel_ptr->midi_cc_balance_index;
-          balance = channel_balance_read(channel_ptr);
-          if (balance < 0.0) {
-            midi_out_buffer[2] = (unsigned char)(MAP(balance, -1.0, -0.015625, 0.0, 63.0) + 0.5);
-          }
-          else {
-            midi_out_buffer[2] = (unsigned char)(MAP(balance, 0.0, 1.0, 64.0, 127.0) + 0.5);
-          }
+    }
+  }
 
-          LOG_DEBUG(
-            "%u: CC#%u <- %u",
-            (unsigned int)midi_out_buffer[0],
-            (unsigned int)midi_out_buffer[1],
-            (unsigned int)midi_out_buffer[2]);
-      }
-      if (channel_ptr->midi_out_has_events & CHANNEL_MUTE)
-      {
-          midi_out_buffer = jack_midi_event_reserve(midi_buffer, 0, 3);
-          if (!midi_out_buffer)
-            continue;
-
-          midi_out_buffer[0] = 0xB0; /* control change */
-          midi_out_buffer[1] = channel_ptr->midi_cc_mute_index;
-          midi_out_buffer[2] = (unsigned char)(channel_is_out_muted(channel_ptr) ? 127 : 0);
-
-          LOG_DEBUG(
-            "%u: CC#%u <- %u",
-            (unsigned int)midi_out_buffer[0],
-            (unsigned int)midi_out_buffer[1],
-            (unsigned int)midi_out_buffer[2]);
-      }
-      if (channel_ptr->midi_out_has_events & CHANNEL_SOLO)
+  count = snapshot_ptr->input_channels_count * INPUT_SCRATCH_BUFFERS +
+    snapshot_ptr->output_channels_count * OUTPUT_SCRATCH_BUFFERS +
+    partial_sums_count * PARTIAL_SUM_SCRATCH_BUFFERS;
+  samples = MAX(count * scratch_stride(frames), 1);
+
+  snapshot_ptr->scratch = dsp_buffer_alloc(samples);
+  if (snapshot_ptr->scratch == NULL)
+  {
+    return -1;
+  }
+
+  snapshot_ptr->frames = frames;
+  snapshot_ptr->scratch_size = samples * sizeof(float);
+
+  if (snapshot_ptr->scenes != NULL)
+  {
+    for (i = 0; i < SCENES_COUNT; i++)
+    {
+      if (snapshot_ptr->scenes[i] != NULL)
       {
-          midi_out_buffer = jack_midi_event_reserve(midi_buffer, 0, 3);
-          if (!midi_out_buffer)
-            continue;
-
-          midi_out_buffer[0] = 0xB0; /* control change */
-          midi_out_buffer[1] = channel_ptr->midi_cc_solo_index;
-          midi_out_buffer[2] = (unsigned char)(channel_is_soloed(channel_ptr) ? 127 : 0);
-
-          LOG_DEBUG(
-            "%u: CC#%u <- %u",
-            (unsigned int)midi_out_buffer[0],
-            (unsigned int)midi_out_buffer[1],
-            (unsigned int)midi_out_buffer[2]);
+        snapshot_ptr->scenes[i]->scratch = snapshot_ptr->scratch;
+        snapshot_ptr->scenes[i]->frames = frames;
       }
-      channel_ptr->midi_out_has_events = 0;
     }
   }
 
-#endif
-
-  mix(mixer_ptr, 0, nframes);
-
   return 0;
 }
 
-#undef mixer_ptr
-
-jack_mixer_t
-create(
-  const char * jack_client_name_ptr,
-  bool stereo)
+/*
+ * Point the scratch buffers of all channels into the block of a snapshot
+ *
+ * Called from the process thread when it picks up a new snapshot. The
+ * block of the previous one is freed with it, once no cycle can be using
+ * it anymore.
+ */
+static void
+bind_scratch(
+  struct snapshot *snapshot_ptr)
 {
-  (void) stereo;
-  int ret;
-  struct jack_mixer * mixer_ptr;
-  int i;
-  char * localedir;
+  jack_nframes_t stride = scratch_stride(snapshot_ptr->frames);
+  float *buffer_ptr = snapshot_ptr->scratch;
+  struct channel *channel_ptr;
+  unsigned int i;
 
-  localedir = getenv("LOCALEDIR");
-  setlocale(LC_ALL, "");
-  bindtextdomain("jack_mixer", localedir != NULL ? localedir : LOCALEDIR);
-  textdomain("jack_mixer");
+  for (i = 0; i < snapshot_ptr->input_channels_count; i++)
+  {
+    channel_ptr = snapshot_ptr->input_channels[i];
+    channel_ptr->state->frames_left = buffer_ptr;
+    channel_ptr->state->frames_right = buffer_ptr + stride;
+    channel_ptr->state->prefader_frames_left = buffer_ptr + 2 * stride;
+    channel_ptr->state->prefader_frames_right = buffer_ptr + 3 * stride;
+    buffer_ptr += INPUT_SCRATCH_BUFFERS * stride;
+
+    /* Frames of an idle channel have to be cleared again in the new buffers */
+    channel_ptr->state->idle = false;
+  }
 
-  mixer_ptr = malloc(sizeof(struct jack_mixer));
-  if (mixer_ptr == NULL)
+  for (i = 0; i < snapshot_ptr->output_channels_count; i++)
   {
-    goto exit;
+    channel_ptr = (struct channel *)snapshot_ptr->output_channels[i];
+    channel_ptr->state->tmp_mixed_frames_left = buffer_ptr;
+    channel_ptr->state->tmp_mixed_frames_right = buffer_ptr + stride;
+    channel_ptr->state->prefader_frames_left = buffer_ptr + 2 * stride;
+    channel_ptr->state->prefader_frames_right = buffer_ptr + 3 * stride;
+    buffer_ptr += OUTPUT_SCRATCH_BUFFERS * stride;
   }
 
-  ret = pthread_mutex_init(&mixer_ptr->mutex, NULL);
-  if (ret != 0)
+  for (i = 0; i < snapshot_ptr->partial_sums_count; i++)
   {
-    goto exit_free;
+    snapshot_ptr->partial_sums[i]->frames_left = buffer_ptr;
+    snapshot_ptr->partial_sums[i]->frames_right = buffer_ptr + stride;
+    buffer_ptr += PARTIAL_SUM_SCRATCH_BUFFERS * stride;
   }
+}
 
-  mixer_ptr->input_channels_list = NULL;
-  mixer_ptr->output_channels_list = NULL;
+/*
+ * Allocate scratch buffers for a new snapshot and publish it to the process
+ * thread, retiring the previous one. The mixer mutex must be held.
+ */
+static int
+publish_snapshot(
+  struct jack_mixer *mixer_ptr,
+  struct snapshot *snapshot_ptr)
+{
+  struct snapshot *old_snapshot_ptr;
 
-  mixer_ptr->soloed_channels = NULL;
+  if (alloc_scratch(snapshot_ptr, mixer_ptr->buffer_size) != 0)
+  {
+    return -1;
+  }
 
-  mixer_ptr->kmetering = true;
+  old_snapshot_ptr = mixer_ptr->snapshot;
+  __atomic_store_n(&mixer_ptr->snapshot, snapshot_ptr, __ATOMIC_RELEASE);
+  retire(mixer_ptr, old_snapshot_ptr, free_snapshot);
 
-  mixer_ptr->last_midi_cc = -1;
+  return 0;
+}
 
-  mixer_ptr->midi_behavior = Jump_To_Value;
+/*
+ * Build a snapshot of the mixer topology, with the routing stored in scene
+ * if it is not -1, without publishing it
+ *
+ * Returns NULL if memory allocation failed.
+ */
+static struct snapshot *
+create_snapshot(
+  struct jack_mixer *mixer_ptr,
+  int scene)
+{
+  struct snapshot *snapshot_ptr;
+  unsigned int input_channels_count = g_slist_length(mixer_ptr->input_channels_list);
+  unsigned int output_channels_count = g_slist_length(mixer_ptr->output_channels_list);
+  unsigned int pass;
+  unsigned int i;
+  GSList *node_ptr;
+  struct output_channel *output_channel_ptr;
 
-  for (i = 0 ; i < 128 ; i++)
+  snapshot_ptr = alloc_snapshot(input_channels_count, output_channels_count);
+  if (snapshot_ptr == NULL)
   {
-    mixer_ptr->midi_cc_map[i] = NULL;
+    return NULL;
   }
 
-  LOG_DEBUG("Initializing JACK.");
-  mixer_ptr->jack_client = jack_client_open(jack_client_name_ptr, 0, NULL);
-  if (mixer_ptr->jack_client == NULL)
+  for (node_ptr = mixer_ptr->input_channels_list, i = 0; node_ptr; node_ptr = g_slist_next(node_ptr), i++)
   {
-    _jack_mixer_error = JACK_MIXER_ERROR_JACK_CLIENT_CREATE;
-    goto exit_destroy_mutex;
+    snapshot_ptr->input_channels[i] = node_ptr->data;
+  }
+
+  /* Regular output channels first, then mix-minus output channels */
+  for (pass = 0, i = 0; pass < 2; pass++)
+  {
+    if (pass == 1)
+    {
+      snapshot_ptr->mix_minus_index = i;
+    }
+
+    for (node_ptr = mixer_ptr->output_channels_list; node_ptr; node_ptr = g_slist_next(node_ptr))
+    {
+      output_channel_ptr = node_ptr->data;
+      if ((output_channel_ptr->mix_minus_source != NULL) != (pass == 1))
+      {
+        continue;
+      }
+
+      snapshot_ptr->output_channels[i] = output_channel_ptr;
+      snapshot_ptr->routings[i] = create_routing(mixer_ptr, output_channel_ptr, scene);
+      /* count routings allocated so far, so free_snapshot() can clean up */
+      snapshot_ptr->output_channels_count = ++i;
+      if (snapshot_ptr->routings[i - 1] == NULL)
+      {
+        free_snapshot(snapshot_ptr);
+        return NULL;
+      }
+    }
+  }
+
+  /* Sends of output channels sharing a partial sum are reordered */
+  if (find_partial_sums(snapshot_ptr) != 0)
+  {
+    free_snapshot(snapshot_ptr);
+    return NULL;
+  }
+
+  link_mix_minus_routings(snapshot_ptr);
+
+  return snapshot_ptr;
+}
+
+/*
+ * Build a new snapshot of the mixer topology and publish it to the process thread
+ *
+ * Must be called whenever channels are added or removed, the
+ * solo/mute/prefader settings of an output channel change or scenes are
+ * stored or cleared. The previous snapshot is freed once the process
+ * thread can't be using it anymore.
+ *
+ * Returns 0 on success, -1 if memory allocation failed, in which case the
+ * previously published snapshot stays in effect.
+ */
+static int
+update_snapshot(
+  struct jack_mixer *mixer_ptr)
+{
+  struct snapshot *snapshot_ptr;
+  unsigned int scene;
+  int ret;
+
+  snapshot_ptr = create_snapshot(mixer_ptr, -1);
+  if (snapshot_ptr == NULL)
+  {
+    goto fail;
+  }
+
+  /* The process thread switches to these when a scene is recalled via MIDI */
+  for (scene = 0; scene < SCENES_COUNT; scene++)
+  {
+    if (!mixer_ptr->scene_stored[scene])
+    {
+      continue;
+    }
+
+    if (snapshot_ptr->scenes == NULL)
+    {
+      snapshot_ptr->scenes = calloc(SCENES_COUNT, sizeof(struct snapshot *));
+      if (snapshot_ptr->scenes == NULL)
+      {
+        goto fail_free_snapshot;
+      }
+    }
+
+    snapshot_ptr->scenes[scene] = create_snapshot(mixer_ptr, scene);
+    if (snapshot_ptr->scenes[scene] == NULL)
+    {
+      goto fail_free_snapshot;
+    }
+  }
+
+  snapshot_ptr->routing_recalls = mixer_ptr->routing_recalls;
+
+  /* The period size may change concurrently, see jack_buffer_size_cb() */
+  pthread_mutex_lock(&mixer_ptr->mutex);
+  ret = publish_snapshot(mixer_ptr, snapshot_ptr);
+  pthread_mutex_unlock(&mixer_ptr->mutex);
+  if (ret != 0)
+  {
+    goto fail_free_snapshot;
+  }
+
+  return 0;
+
+fail_free_snapshot:
+  free_snapshot(snapshot_ptr);
+
+fail:
+  LOG_ERROR("Could not allocate memory for mixer snapshot.");
+  return -1;
+}
+
+static struct meters *
+create_meters(
+  unsigned int count)
+{
+  struct meters *meters_ptr;
+
+  meters_ptr = calloc(1, sizeof(struct meters) + count * sizeof(struct meter_values));
+  if (meters_ptr == NULL)
+  {
+    return NULL;
+  }
+
+  meters_ptr->count = count;
+  return meters_ptr;
+}
+
+/*
+ * Check whether a channel uses a slot, including removed channels that
+ * the process thread may still be processing
+ */
+static bool
+is_slot_used(
+  struct jack_mixer *mixer_ptr,
+  unsigned int slot)
+{
+  GSList *node_ptr;
+  struct garbage *garbage_ptr;
+  bool used = false;
+
+  for (node_ptr = mixer_ptr->input_channels_list; node_ptr; node_ptr = g_slist_next(node_ptr))
+  {
+    if (((struct channel *)node_ptr->data)->meter_slot == slot)
+    {
+      return true;
+    }
+  }
+
+  for (node_ptr = mixer_ptr->output_channels_list; node_ptr; node_ptr = g_slist_next(node_ptr))
+  {
+    if (((struct channel *)node_ptr->data)->meter_slot == slot)
+    {
+      return true;
+    }
+  }
+
+  pthread_mutex_lock(&mixer_ptr->mutex);
+  for (node_ptr = mixer_ptr->garbage; node_ptr; node_ptr = g_slist_next(node_ptr))
+  {
+    garbage_ptr = node_ptr->data;
+    if (garbage_ptr->free_fn == free_channel &&
+        ((struct channel *)garbage_ptr->ptr)->meter_slot == slot)
+    {
+      used = true;
+      break;
+    }
+  }
+  pthread_mutex_unlock(&mixer_ptr->mutex);
+
+  return used;
+}
+
+/*
+ * Find the lowest slot not used by any channel and assign it to a new
+ * channel, making room for it in the published meter values and the
+ * channel state blocks if needed. The channel state is zeroed.
+ */
+static int
+alloc_channel_slot(
+  struct jack_mixer *mixer_ptr,
+  struct channel *channel_ptr)
+{
+  struct meters *meters_ptr = mixer_ptr->meters;
+  struct meters *new_meters_ptr;
+  struct channel_state **blocks_ptr;
+  void *block_ptr;
+  unsigned int slot;
+
+  for (slot = 0; is_slot_used(mixer_ptr, slot); slot++);
+
+  if (slot >= meters_ptr->count)
+  {
+    new_meters_ptr = create_meters(MAX(2 * meters_ptr->count, slot + 1));
+    if (new_meters_ptr == NULL)
+    {
+      return -1;
+    }
+
+    /* Values written while copying are published again in the next cycle */
+    memcpy(new_meters_ptr->values, meters_ptr->values, meters_ptr->count * sizeof(struct meter_values));
+
+    pthread_mutex_lock(&mixer_ptr->mutex);
+    __atomic_store_n(&mixer_ptr->meters, new_meters_ptr, __ATOMIC_RELEASE);
+    retire(mixer_ptr, meters_ptr, free);
+    pthread_mutex_unlock(&mixer_ptr->mutex);
+  }
+
+  /* Only the control thread uses the block table, so it may be moved */
+  if (slot / CHANNEL_STATE_BLOCK_SIZE >= mixer_ptr->state_blocks_count)
+  {
+    blocks_ptr = realloc(mixer_ptr->state_blocks,
+                         (mixer_ptr->state_blocks_count + 1) * sizeof(struct channel_state *));
+    if (blocks_ptr == NULL)
+    {
+      return -1;
+    }
+    mixer_ptr->state_blocks = blocks_ptr;
+
+    if (posix_memalign(&block_ptr, DSP_ALIGNMENT, CHANNEL_STATE_BLOCK_SIZE * sizeof(struct channel_state)) != 0)
+    {
+      return -1;
+    }
+    mixer_ptr->state_blocks[mixer_ptr->state_blocks_count++] = block_ptr;
+  }
+
+  channel_ptr->meter_slot = slot;
+  channel_ptr->state = &mixer_ptr->state_blocks[slot / CHANNEL_STATE_BLOCK_SIZE][slot % CHANNEL_STATE_BLOCK_SIZE];
+  memset(channel_ptr->state, 0, sizeof(struct channel_state));
+  return 0;
+}
+
+/*
+ * Calculate left+right gain from volume and balance levels
+ */
+static inline void
+calc_channel_gains(
+  struct channel *channel_ptr,
+  float vol,
+  float bal,
+  float *vol_l_ptr,
+  float *vol_r_ptr)
+{
+  if (channel_ptr->state->stereo) {
+    if (bal > 0) {
+      *vol_l_ptr = vol * (1 - bal);
+      *vol_r_ptr = vol;
+    }
+    else {
+      *vol_l_ptr = vol;
+      *vol_r_ptr = vol * (1 + bal);
+    }
+  }
+  else {
+    *vol_l_ptr = vol * (1 - bal);
+    *vol_r_ptr = vol * (1 + bal);
+  }
+}
+
+/*
+ * Update input channel volume meter every so often
+ */
+static inline void
+update_channel_meters(
+  struct channel *channel_ptr,
+  jack_nframes_t frames)
+{
+  channel_ptr->state->peak_frames += frames;
+  if (channel_ptr->state->peak_frames >= PEAK_FRAMES_CHUNK)
+  {
+    channel_ptr->state->meter_left_postfader = channel_ptr->state->peak_left_postfader;
+    channel_ptr->state->peak_left_postfader = 0.0;
+    channel_ptr->state->meter_left_prefader = channel_ptr->state->peak_left_prefader;
+    channel_ptr->state->peak_left_prefader = 0.0;
+    if (channel_ptr->state->stereo)
+    {
+      channel_ptr->state->meter_right_postfader = channel_ptr->state->peak_right_postfader;
+      channel_ptr->state->peak_right_postfader = 0.0;
+      channel_ptr->state->meter_right_prefader = channel_ptr->state->peak_right_prefader;
+      channel_ptr->state->peak_right_prefader = 0.0;
+    }
+
+    channel_ptr->state->peak_frames = 0;
+  }
+}
+
+/*
+ * Apply output channel volume in place and compute peak values, a whole
+ * block at a time
+ */
+static inline void
+mix_one_block(
+  struct output_channel *output_mix_channel,
+  jack_default_audio_sample_t *frames_left,
+  jack_default_audio_sample_t *frames_right,
+  jack_nframes_t start,
+  jack_nframes_t end)
+{
+  jack_nframes_t i;
+  jack_nframes_t count;
+  float vol_l = 1.0f;
+  float vol_r = 1.0f;
+
+  struct channel *mix_channel = (struct channel*)output_mix_channel;
+
+  /* Apply fader volume if output channel is not set to pre-fader routing */
+  if (! output_mix_channel->prefader) {
+    calc_channel_gains(mix_channel, mix_channel->state->volume.value, mix_channel->state->balance.value,
+                       &vol_l, &vol_r);
+  }
+
+  for (i = start ; i < end ; i += count)
+  {
+    float peak_left_pre = 0.0f;
+    float peak_left_post = 0.0f;
+    float peak_right_pre = 0.0f;
+    float peak_right_post = 0.0f;
+
+    count = MIN(end - i, PEAK_FRAMES_CHUNK - mix_channel->state->peak_frames);
+
+    dsp_gain_peak(frames_left + i, frames_left + i, vol_l, count, &peak_left_pre, &peak_left_post);
+
+    if (mix_channel->state->stereo)
+    {
+      dsp_gain_peak(frames_right + i, frames_right + i, vol_r, count, &peak_right_pre, &peak_right_post);
+
+      mix_channel->state->peak_right_prefader = MAX(mix_channel->state->peak_right_prefader, peak_right_pre);
+      mix_channel->state->peak_right_postfader = MAX(mix_channel->state->peak_right_postfader, peak_right_post);
+      mix_channel->state->abspeak_prefader = MAX(mix_channel->state->abspeak_prefader, peak_right_pre);
+      mix_channel->state->abspeak_postfader = MAX(mix_channel->state->abspeak_postfader, peak_right_post);
+    }
+
+    mix_channel->state->peak_left_prefader = MAX(mix_channel->state->peak_left_prefader, peak_left_pre);
+    mix_channel->state->peak_left_postfader = MAX(mix_channel->state->peak_left_postfader, peak_left_post);
+    mix_channel->state->abspeak_prefader = MAX(mix_channel->state->abspeak_prefader, peak_left_pre);
+    mix_channel->state->abspeak_postfader = MAX(mix_channel->state->abspeak_postfader, peak_left_post);
+
+    update_channel_meters(mix_channel, count);
+  }
+}
+
+/*
+ * Apply output channel volume in place and compute peak values one sample
+ * at a time, used during volume and balance transitions
+ */
+static inline void
+mix_one_ramp(
+  struct output_channel *output_mix_channel,
+  jack_default_audio_sample_t *frames_left,
+  jack_default_audio_sample_t *frames_right,
+  jack_nframes_t start,
+  jack_nframes_t end)
+{
+  jack_nframes_t i;
+  jack_default_audio_sample_t frame_left;
+  jack_default_audio_sample_t frame_right;
+  jack_default_audio_sample_t frame_left_pre;
+  jack_default_audio_sample_t frame_right_pre;
+
+  struct channel *mix_channel = (struct channel*)output_mix_channel;
+
+  for (i = start ; i < end ; i++)
+  {
+    /* Get current volume and balance, doing interpolation during transition */
+    float vol = ramp_next(&mix_channel->state->volume);
+    float bal = ramp_next(&mix_channel->state->balance);
+
+    /* The pre-fader signal is only kept in the buffer until gain is applied */
+    frame_left_pre = fabsf(frames_left[i]);
+
+    /** Apply fader volume if output channel is not set to pre-fader routing */
+    if (! output_mix_channel->prefader) {
+      float vol_l;
+      float vol_r;
+
+      calc_channel_gains(mix_channel, vol, bal, &vol_l, &vol_r);
+
+      /* Apply gain to output mix */
+      frames_left[i] *= vol_l;
+      if (mix_channel->state->stereo)
+      {
+        frame_right_pre = fabsf(frames_right[i]);
+        frames_right[i] *= vol_r;
+      }
+    }
+    else if (mix_channel->state->stereo)
+    {
+      frame_right_pre = fabsf(frames_right[i]);
+    }
+
+
+    /* Get peak signal, left/right and combined */
+    frame_left = fabsf(frames_left[i]);
+
+    if (mix_channel->state->peak_left_prefader < frame_left_pre)
+    {
+      mix_channel->state->peak_left_prefader = frame_left_pre;
+    }
+
+    if (mix_channel->state->peak_left_postfader < frame_left)
+    {
+      mix_channel->state->peak_left_postfader = frame_left;
+    }
+
+    if (frame_left > mix_channel->state->abspeak_postfader)
+    {
+      mix_channel->state->abspeak_postfader = frame_left;
+    }
+
+    if (frame_left_pre > mix_channel->state->abspeak_prefader)
+    {
+      mix_channel->state->abspeak_prefader = frame_left_pre;
+    }
+
+    if (mix_channel->state->stereo)
+    {
+      frame_right = fabsf(frames_right[i]);
+
+      if (mix_channel->state->peak_right_prefader < frame_right_pre)
+      {
+        mix_channel->state->peak_right_prefader = frame_right_pre;
+      }
+
+      if (mix_channel->state->peak_right_postfader < frame_right)
+      {
+        mix_channel->state->peak_right_postfader = frame_right;
+      }
+
+      if (frame_right > mix_channel->state->abspeak_postfader)
+      {
+        mix_channel->state->abspeak_postfader = frame_right;
+      }
+
+      if (frame_right_pre > mix_channel->state->abspeak_prefader)
+      {
+        mix_channel->state->abspeak_prefader = frame_right_pre;
+      }
+    }
+
+    /* update left/right peak values every so often */
+    update_channel_meters(mix_channel, 1);
+  }
+}
+
+/*
+ * Get the signal an input channel sends into an output channel
+ *
+ * Returns false if the input channel doesn't contribute to the mix of the
+ * output channel in the current cycle.
+ */
+static inline bool
+get_send_frames(
+  bool system,                  /* the output channel is a system channel */
+  bool prefader,                /* the output channel is set to pre-fader routing */
+  bool has_solo,                /* any input channel is soloed for the output channel */
+  struct send *send_ptr,
+  jack_default_audio_sample_t **frames_left_ptr,
+  jack_default_audio_sample_t **frames_right_ptr)
+{
+  struct channel *channel_ptr = send_ptr->channel;
+
+  /* Skip input channels with activated mute or without any signal */
+  if (channel_ptr->state->out_mute || channel_ptr->state->idle) {
+    return false;
+  }
+
+  /* Mix signal of all input channels going to this output channel:
+   *
+   * Only add the signal from this input channel:
+   *
+   * - if there are no globally soloed channels and no soloed channels for this output-channel;
+   * - or if the input channel is globally soloed and the output channel is not a system
+   *   channel (direct out or monitor out);
+   * - or if the input channel is soloed for this output channel.
+   *
+   * */
+  if (!((!__atomic_load_n(&channel_ptr->mixer_ptr->soloed_channels_count, __ATOMIC_RELAXED) && !has_solo) ||
+        (__atomic_load_n(&channel_ptr->state->solo, __ATOMIC_RELAXED) && !system) ||
+        send_ptr->solo))
+  {
+    return false;
+  }
+
+  /* Get either post or pre-fader signal */
+  if (! prefader && ! send_ptr->prefader)
+  {
+    *frames_left_ptr = channel_ptr->state->frames_left;
+    *frames_right_ptr = channel_ptr->state->frames_right;
+  }
+  else {
+    /* Output channel is globally set to pre-fader routing or
+     * input channel has pre-fader routing set for this output channel
+     */
+    *frames_left_ptr = channel_ptr->state->prefader_frames_left;
+    *frames_right_ptr = channel_ptr->state->prefader_frames_right;
+  }
+
+  return true;
+}
+
+/*
+ * Mix the sends shared by the output channels using a partial sum
+ */
+static inline void
+mix_partial_sum(
+  struct partial_sum *partial_sum_ptr,
+  jack_nframes_t start,         /* Index of first sample to process */
+  jack_nframes_t end)           /* Index of sample to stop processing before */
+{
+  unsigned int send_index;
+  jack_nframes_t frames = end - start;
+  struct send *send_ptr;
+  jack_default_audio_sample_t *send_frames_left;
+  jack_default_audio_sample_t *send_frames_right;
+
+  memset(partial_sum_ptr->frames_left + start, 0, frames * sizeof(jack_default_audio_sample_t));
+  if (partial_sum_ptr->stereo)
+    memset(partial_sum_ptr->frames_right + start, 0, frames * sizeof(jack_default_audio_sample_t));
+
+  for (send_index = 0; send_index < partial_sum_ptr->count; send_index++)
+  {
+    send_ptr = &partial_sum_ptr->sends[send_index];
+
+    if (!get_send_frames(partial_sum_ptr->system, partial_sum_ptr->prefader, partial_sum_ptr->has_solo,
+                         send_ptr, &send_frames_left, &send_frames_right))
+    {
+      continue;
+    }
+
+    dsp_mix(send_frames_left, partial_sum_ptr->frames_left + start, send_ptr->gain, frames);
+    if (partial_sum_ptr->stereo)
+      dsp_mix(send_frames_right, partial_sum_ptr->frames_right + start, send_ptr->gain, frames);
+  }
+}
+
+/*
+ * Compute the signal of a mix-minus output channel from the pre-fader sum
+ * of its source, minus what the excluded input channel sent into it
+ */
+static inline void
+mix_minus(
+  struct snapshot *snapshot_ptr,
+  struct output_channel *output_mix_channel,
+  struct routing *routing_ptr,
+  jack_default_audio_sample_t *frames_left,
+  jack_default_audio_sample_t *frames_right,
+  jack_nframes_t start,
+  jack_nframes_t end)
+{
+  jack_nframes_t frames = end - start;
+  struct output_channel *source_ptr = snapshot_ptr->output_channels[routing_ptr->mix_minus_source];
+  struct routing *source_routing_ptr = snapshot_ptr->routings[routing_ptr->mix_minus_source];
+  struct channel *source_channel = (struct channel*)source_ptr;
+  struct channel *mix_channel = (struct channel*)output_mix_channel;
+  struct send *send_ptr;
+  jack_default_audio_sample_t *sum_left = source_channel->state->prefader_frames_left;
+  jack_default_audio_sample_t *sum_right = source_channel->state->prefader_frames_right;
+  jack_default_audio_sample_t *send_frames_left;
+  jack_default_audio_sample_t *send_frames_right;
+
+  /* A mono source only sums left signals, which then go to both sides */
+  if (!source_channel->state->stereo)
+  {
+    sum_right = sum_left;
+  }
+
+  memcpy(frames_left + start, sum_left + start, frames * sizeof(jack_default_audio_sample_t));
+  if (mix_channel->state->stereo)
+    memcpy(frames_right + start, sum_right + start, frames * sizeof(jack_default_audio_sample_t));
+
+  if (routing_ptr->mix_minus_send < 0)
+  {
+    return;
+  }
+
+  send_ptr = &source_routing_ptr->sends[routing_ptr->mix_minus_send];
+  if (!get_send_frames(source_ptr->system, source_ptr->prefader, source_routing_ptr->has_solo, send_ptr,
+                       &send_frames_left, &send_frames_right))
+  {
+    return;
+  }
+
+  if (!source_channel->state->stereo)
+  {
+    send_frames_right = send_frames_left;
+  }
+
+  dsp_mix(send_frames_left, frames_left + start, -send_ptr->gain, frames);
+  if (mix_channel->state->stereo)
+    dsp_mix(send_frames_right, frames_right + start, -send_ptr->gain, frames);
+}
+
+/*
+ * Process input channels and mix them into one output channel signal
+ *
+ * The mix is summed and has its gain applied in place in the output port
+ * buffers. The intermediate buffers are only used while the output channel
+ * is muted, and the pre-fader signal is only kept for k-metering.
+ */
+static inline void
+mix_one(
+  struct snapshot *snapshot_ptr,
+  struct output_channel *output_mix_channel,
+  struct routing *routing_ptr,  /* Input channels routed to this output channel */
+  jack_nframes_t start,         /* Index of first sample to process */
+  jack_nframes_t end)           /* Index of sample to stop processing before */
+{
+  unsigned int send_index;
+  jack_nframes_t frames = end - start;
+
+  struct send *send_ptr;
+  struct partial_sum *partial_sum_ptr = NULL;
+  jack_default_audio_sample_t *send_frames_left;
+  jack_default_audio_sample_t *send_frames_right;
+  jack_default_audio_sample_t *frames_left;
+  jack_default_audio_sample_t *frames_right;
+  jack_default_audio_sample_t *prefader_frames_left;
+  jack_default_audio_sample_t *prefader_frames_right;
+
+  struct channel *mix_channel = (struct channel*)output_mix_channel;
+  bool kmetering = mix_channel->mixer_ptr->kmetering;
+  bool prefader = output_mix_channel->prefader;
+
+  /* A muted output channel is still mixed for its meters */
+  if (!mix_channel->state->out_mute)
+  {
+    frames_left = mix_channel->state->left_buffer_ptr;
+    frames_right = mix_channel->state->stereo ? mix_channel->state->right_buffer_ptr : mix_channel->state->tmp_mixed_frames_right;
+  }
+  else {
+    frames_left = mix_channel->state->tmp_mixed_frames_left;
+    frames_right = mix_channel->state->tmp_mixed_frames_right;
+  }
+
+  if (routing_ptr->mix_minus_source >= 0)
+  {
+    mix_minus(snapshot_ptr, output_mix_channel, routing_ptr, frames_left, frames_right, start, end);
+  }
+  else
+  {
+    if (routing_ptr->partial_sum >= 0)
+    {
+      partial_sum_ptr = snapshot_ptr->partial_sums[routing_ptr->partial_sum];
+    }
+
+    /* Start from the sum of the shared sends, unless this output channel was
+     * switched to or from pre-fader routing since the partial sum was set up */
+    if (partial_sum_ptr != NULL && partial_sum_ptr->prefader == prefader)
+    {
+      memcpy(frames_left + start, partial_sum_ptr->frames_left + start,
+             frames * sizeof(jack_default_audio_sample_t));
+      if (mix_channel->state->stereo)
+        memcpy(frames_right + start, partial_sum_ptr->frames_right + start,
+               frames * sizeof(jack_default_audio_sample_t));
+      send_index = routing_ptr->shared_count;
+    }
+    else
+    {
+      /* Zero mix buffers */
+      memset(frames_left + start, 0, frames * sizeof(jack_default_audio_sample_t));
+      if (mix_channel->state->stereo)
+        memset(frames_right + start, 0, frames * sizeof(jack_default_audio_sample_t));
+      send_index = 0;
+    }
+
+    /* For each input channel not muted for this output channel: */
+    for (; send_index < routing_ptr->count; send_index++)
+    {
+      send_ptr = &routing_ptr->sends[send_index];
+
+      if (!get_send_frames(output_mix_channel->system, prefader, routing_ptr->has_solo, send_ptr,
+                           &send_frames_left, &send_frames_right))
+      {
+        continue;
+      }
+
+      dsp_mix(send_frames_left, frames_left + start, send_ptr->gain, frames);
+      if (mix_channel->state->stereo)
+        dsp_mix(send_frames_right, frames_right + start, send_ptr->gain, frames);
+    }
+  }
+
+  /* Save pre-fader signal for k-metering and mix-minus output channels,
+   * without fader volume both are the same */
+  prefader_frames_left = frames_left;
+  prefader_frames_right = frames_right;
+  if ((kmetering && ! output_mix_channel->prefader) || routing_ptr->keep_sum)
+  {
+    prefader_frames_left = mix_channel->state->prefader_frames_left;
+    prefader_frames_right = mix_channel->state->prefader_frames_right;
+    memcpy(prefader_frames_left + start, frames_left + start, frames * sizeof(jack_default_audio_sample_t));
+    if (mix_channel->state->stereo)
+      memcpy(prefader_frames_right + start, frames_right + start, frames * sizeof(jack_default_audio_sample_t));
+  }
+
+  /* Apply output channel volume and compute meter signal and peak values */
+  update_ramps(mix_channel);
+
+  if (mix_channel->mixer_ptr->block_processing &&
+      mix_channel->state->volume.count == 0 &&
+      mix_channel->state->balance.count == 0)
+  {
+    mix_one_block(output_mix_channel, frames_left, frames_right, start, end);
+  }
+  else
+  {
+    mix_one_ramp(output_mix_channel, frames_left, frames_right, start, end);
+  }
+
+  /* Finally, if output channel is muted, silence the output buffer */
+  if (mix_channel->state->out_mute) {
+    memset(mix_channel->state->left_buffer_ptr + start, 0, frames * sizeof(jack_default_audio_sample_t));
+    if (mix_channel->state->stereo)
+      memset(mix_channel->state->right_buffer_ptr + start, 0, frames * sizeof(jack_default_audio_sample_t));
+  }
+
+  /* Calculate k-metering for output channel*/
+
+  if (kmetering) {
+    kmeter_process(&mix_channel->state->kmeter_left, frames_left, start, end);
+    kmeter_process(&mix_channel->state->kmeter_prefader_left, prefader_frames_left, start, end);
+    if (mix_channel->state->stereo) {
+      kmeter_process(&mix_channel->state->kmeter_right, frames_right, start, end);
+      kmeter_process(&mix_channel->state->kmeter_prefader_right, prefader_frames_right, start, end);
+    }
+  }
+}
+
+/*
+ * Calculate pre/post-fader output and peak values of an input channel
+ * with constant gain, a whole block at a time
+ */
+static inline void
+calc_channel_frames_block(
+  struct channel *channel_ptr,
+  jack_nframes_t start,
+  jack_nframes_t end)
+{
+  jack_nframes_t i;
+  jack_nframes_t count;
+  float vol_l;
+  float vol_r;
+
+  calc_channel_gains(channel_ptr, channel_ptr->state->volume.value, channel_ptr->state->balance.value,
+                     &vol_l, &vol_r);
+
+  /* Save pre-fader signal */
+  memcpy(channel_ptr->state->prefader_frames_left, channel_ptr->state->left_buffer_ptr + start,
+         (end - start) * sizeof(jack_default_audio_sample_t));
+  if (channel_ptr->state->stereo)
+    memcpy(channel_ptr->state->prefader_frames_right, channel_ptr->state->right_buffer_ptr + start,
+           (end - start) * sizeof(jack_default_audio_sample_t));
+
+  /* Peak values are collected separately for each meter update interval */
+  for (i = start ; i < end ; i += count)
+  {
+    float peak_left_pre = 0.0f;
+    float peak_left_post = 0.0f;
+    float peak_right_pre = 0.0f;
+    float peak_right_post = 0.0f;
+
+    count = MIN(end - i, PEAK_FRAMES_CHUNK - channel_ptr->state->peak_frames);
+
+    if (channel_ptr->state->stereo)
+    {
+      dsp_gain_peak(channel_ptr->state->left_buffer_ptr + i, channel_ptr->state->frames_left + (i - start),
+                    vol_l, count, &peak_left_pre, &peak_left_post);
+      dsp_gain_peak(channel_ptr->state->right_buffer_ptr + i, channel_ptr->state->frames_right + (i - start),
+                    vol_r, count, &peak_right_pre, &peak_right_post);
+
+      channel_ptr->state->peak_right_prefader = MAX(channel_ptr->state->peak_right_prefader, peak_right_pre);
+      channel_ptr->state->peak_right_postfader = MAX(channel_ptr->state->peak_right_postfader, peak_right_post);
+      channel_ptr->state->abspeak_prefader = MAX(channel_ptr->state->abspeak_prefader, peak_right_pre);
+      channel_ptr->state->abspeak_postfader = MAX(channel_ptr->state->abspeak_postfader, peak_right_post);
+    }
+    else
+    {
+      dsp_gain_peak_mono(channel_ptr->state->left_buffer_ptr + i, channel_ptr->state->frames_left + (i - start),
+                         channel_ptr->state->frames_right + (i - start), vol_l, vol_r, count,
+                         &peak_left_pre, &peak_left_post);
+    }
+
+    channel_ptr->state->peak_left_prefader = MAX(channel_ptr->state->peak_left_prefader, peak_left_pre);
+    channel_ptr->state->peak_left_postfader = MAX(channel_ptr->state->peak_left_postfader, peak_left_post);
+    channel_ptr->state->abspeak_prefader = MAX(channel_ptr->state->abspeak_prefader, peak_left_pre);
+    channel_ptr->state->abspeak_postfader = MAX(channel_ptr->state->abspeak_postfader, peak_left_post);
+
+    update_channel_meters(channel_ptr, count);
+  }
+}
+
+/*
+ * Calculate pre/post-fader output and peak values of an input channel
+ * one sample at a time, used during volume and balance transitions
+ */
+static inline void
+calc_channel_frames_ramp(
+  struct channel *channel_ptr,
+  jack_nframes_t start,
+  jack_nframes_t end)
+{
+  jack_nframes_t i;
+  jack_default_audio_sample_t frame_left = 0.0f;
+  jack_default_audio_sample_t frame_right = 0.0f;
+  jack_default_audio_sample_t frame_left_pre = 0.0f;
+  jack_default_audio_sample_t frame_right_pre = 0.0f;
+
+  for (i = start ; i < end ; i++)
+  {
+    /* Save pre-fader signal */
+    channel_ptr->state->prefader_frames_left[i-start] = channel_ptr->state->left_buffer_ptr[i];
+    if (channel_ptr->state->stereo)
+      channel_ptr->state->prefader_frames_right[i-start] = channel_ptr->state->right_buffer_ptr[i];
+
+    /* Get current channel volume and balance, doing interpolation during transition */
+    float vol = ramp_next(&channel_ptr->state->volume);
+    float bal = ramp_next(&channel_ptr->state->balance);
+
+    /* Calculate left+right gain from volume and balance levels */
+    float vol_l;
+    float vol_r;
+    calc_channel_gains(channel_ptr, vol, bal, &vol_l, &vol_r);
+
+    /* Calculate left channel post-fader sample */
+    frame_left = channel_ptr->state->left_buffer_ptr[i] * vol_l;
+    frame_left_pre = channel_ptr->state->left_buffer_ptr[i];
+
+    /* Calculate right channel post-fader sample */
+    if (channel_ptr->state->stereo)
+    {
+      frame_right = channel_ptr->state->right_buffer_ptr[i] * vol_r;
+      frame_right_pre = channel_ptr->state->right_buffer_ptr[i];
+    }
+    else
+    {
+      frame_right = channel_ptr->state->left_buffer_ptr[i] * vol_r;
+      frame_right_pre = channel_ptr->state->left_buffer_ptr[i];
+    }
+    channel_ptr->state->frames_left[i-start] = frame_left;
+    channel_ptr->state->frames_right[i-start] = frame_right;
+
+    /* Calculate left+right peak-level and, if need be,
+     * update abspeak level
+     */
+    if (channel_ptr->state->stereo)
+    {
+      frame_left = fabsf(frame_left);
+      frame_right = fabsf(frame_right);
+      frame_left_pre = fabsf(frame_left_pre);
+      frame_right_pre = fabsf(frame_right_pre);
+
+      if (channel_ptr->state->peak_left_prefader < frame_left_pre)
+      {
+        channel_ptr->state->peak_left_prefader = frame_left_pre;
+      }
+
+      if (channel_ptr->state->peak_left_postfader < frame_left)
+      {
+        channel_ptr->state->peak_left_postfader = frame_left;
+      }
+
+      if (frame_left > channel_ptr->state->abspeak_postfader)
+      {
+        channel_ptr->state->abspeak_postfader = frame_left;
+      }
+
+      if (frame_left_pre > channel_ptr->state->abspeak_prefader)
+      {
+        channel_ptr->state->abspeak_prefader = frame_left_pre;
+      }
+
+      if (channel_ptr->state->peak_right_prefader < frame_right_pre)
+      {
+        channel_ptr->state->peak_right_prefader = frame_right_pre;
+      }
+
+      if (channel_ptr->state->peak_right_postfader < frame_right)
+      {
+        channel_ptr->state->peak_right_postfader = frame_right;
+      }
+
+      if (frame_right > channel_ptr->state->abspeak_postfader)
+      {
+        channel_ptr->state->abspeak_postfader = frame_right;
+      }
+
+      if (frame_right_pre > channel_ptr->state->abspeak_prefader)
+      {
+        channel_ptr->state->abspeak_prefader = frame_right_pre;
+      }
+    }
+    else
+    {
+      frame_left = (fabsf(frame_left) + fabsf(frame_right)) / 2;
+      frame_left_pre = fabsf(frame_left_pre);
+
+      if (channel_ptr->state->peak_left_prefader < frame_left_pre)
+      {
+        channel_ptr->state->peak_left_prefader = frame_left_pre;
+      }
+
+      if (channel_ptr->state->peak_left_postfader < frame_left)
+      {
+        channel_ptr->state->peak_left_postfader = frame_left;
+      }
+
+      if (frame_left > channel_ptr->state->abspeak_postfader)
+      {
+        channel_ptr->state->abspeak_postfader = frame_left;
+      }
+
+      if (frame_left_pre > channel_ptr->state->abspeak_prefader)
+      {
+        channel_ptr->state->abspeak_prefader = frame_left_pre;
+      }
+    }
+
+    update_channel_meters(channel_ptr, 1);
+  }
+}
+
+/*
+ * Check whether all input samples of a channel in this block are finite
+ */
+static inline bool
+is_channel_finite(
+  struct channel *channel_ptr,
+  jack_nframes_t start,
+  jack_nframes_t end)
+{
+  return dsp_is_finite(channel_ptr->state->left_buffer_ptr + start, end - start) &&
+    (!channel_ptr->state->stereo || dsp_is_finite(channel_ptr->state->right_buffer_ptr + start, end - start));
+}
+
+/*
+ * Check whether an input channel carries no signal in this block, either
+ * because its ports are not connected or because all samples are zero
+ */
+static inline bool
+is_channel_silent(
+  struct channel *channel_ptr,
+  jack_nframes_t start,
+  jack_nframes_t end)
+{
+  struct backend *backend_ptr = channel_ptr->mixer_ptr->backend;
+
+  if (!backend_port_connected(backend_ptr, channel_ptr->state->port_left) &&
+      (!channel_ptr->state->stereo || !backend_port_connected(backend_ptr, channel_ptr->state->port_right)))
+  {
+    return true;
+  }
+
+  return dsp_is_silent(channel_ptr->state->left_buffer_ptr + start, end - start) &&
+    (!channel_ptr->state->stereo || dsp_is_silent(channel_ptr->state->right_buffer_ptr + start, end - start));
+}
+
+/*
+ * Skip the gain and peak calculation of a silent input channel, only
+ * letting its meters decay as they would with zero input
+ */
+static inline void
+calc_channel_frames_idle(
+  struct channel *channel_ptr,
+  jack_nframes_t start,
+  jack_nframes_t end)
+{
+  jack_nframes_t i;
+  jack_nframes_t count;
+
+  /* The frames are only written while the channel is not idle, so they
+   * need to be cleared once when it becomes idle or the block grows */
+  if (!channel_ptr->state->idle)
+  {
+    channel_ptr->state->zero_frames = 0;
+    channel_ptr->state->idle = true;
+  }
+
+  if (end > channel_ptr->state->zero_frames)
+  {
+    memset(channel_ptr->state->frames_left, 0, end * sizeof(jack_default_audio_sample_t));
+    memset(channel_ptr->state->frames_right, 0, end * sizeof(jack_default_audio_sample_t));
+    memset(channel_ptr->state->prefader_frames_left, 0, end * sizeof(jack_default_audio_sample_t));
+    memset(channel_ptr->state->prefader_frames_right, 0, end * sizeof(jack_default_audio_sample_t));
+    channel_ptr->state->zero_frames = end;
+  }
+
+  /* Peak values of zero input don't raise the pending peaks */
+  for (i = start ; i < end ; i += count)
+  {
+    count = MIN(end - i, PEAK_FRAMES_CHUNK - channel_ptr->state->peak_frames);
+    update_channel_meters(channel_ptr, count);
+  }
+
+  if (channel_ptr->mixer_ptr->kmetering) {
+    kmeter_process_silence(&channel_ptr->state->kmeter_left, end - start);
+    kmeter_process_silence(&channel_ptr->state->kmeter_prefader_left, end - start);
+    if (channel_ptr->state->stereo) {
+      kmeter_process_silence(&channel_ptr->state->kmeter_right, end - start);
+      kmeter_process_silence(&channel_ptr->state->kmeter_prefader_right, end - start);
+    }
+  }
+}
+
+static inline void
+calc_channel_frames(
+  struct channel *channel_ptr,
+  jack_nframes_t start,
+  jack_nframes_t end)
+{
+  /* A block with Inf or NaN samples is replaced by silence, and the channel
+   * stays silent for a few periods so a misbehaving client doesn't keep
+   * bursting into the outputs. Its volume then ramps in from silence. */
+  if (channel_ptr->state->quarantine != 0 && start == 0)
+  {
+    channel_ptr->state->quarantine--;
+  }
+
+  if (!is_channel_finite(channel_ptr, start, end))
+  {
+    channel_ptr->state->NaN_detected = true;
+    channel_ptr->state->quarantine = NAN_QUARANTINE_PERIODS;
+    __atomic_add_fetch(&channel_ptr->state->nan_events, 1, __ATOMIC_RELAXED);
+    ramp_init(&channel_ptr->state->volume, 0);
+  }
+
+  if (channel_ptr->state->quarantine != 0)
+  {
+    calc_channel_frames_idle(channel_ptr, start, end);
+    return;
+  }
+
+  update_ramps(channel_ptr);
+
+  /* Volume and balance transitions still run on silent input */
+  if (channel_ptr->state->volume.count == 0 &&
+      channel_ptr->state->balance.count == 0 &&
+      is_channel_silent(channel_ptr, start, end))
+  {
+    calc_channel_frames_idle(channel_ptr, start, end);
+    return;
+  }
+
+  channel_ptr->state->idle = false;
+
+  if (channel_ptr->mixer_ptr->block_processing &&
+      channel_ptr->state->volume.count == 0 &&
+      channel_ptr->state->balance.count == 0)
+  {
+    calc_channel_frames_block(channel_ptr, start, end);
+  }
+  else
+  {
+    calc_channel_frames_ramp(channel_ptr, start, end);
+  }
+
+  /* Calculate k-metering for input channel, whose frames are relative to
+   * the start of the block */
+  if (channel_ptr->mixer_ptr->kmetering) {
+    kmeter_process(&channel_ptr->state->kmeter_left, channel_ptr->state->frames_left, 0, end - start);
+    if (channel_ptr->state->stereo) {
+      kmeter_process(&channel_ptr->state->kmeter_right, channel_ptr->state->frames_right, 0, end - start);
+    }
+    kmeter_process(&channel_ptr->state->kmeter_prefader_left, channel_ptr->state->prefader_frames_left, 0, end - start);
+    if (channel_ptr->state->stereo)
+      kmeter_process(&channel_ptr->state->kmeter_prefader_right, channel_ptr->state->prefader_frames_right, 0, end - start);
+    }
+}
+
+/* Part of a period to be processed by a worker pool job */
+struct mix_job {
+  struct snapshot * snapshot;
+  jack_nframes_t start;
+  jack_nframes_t end;
+  bool flush_denormals;         /* flush denormal numbers to zero in the thread running a job */
+  bool denormals;               /* set when a job computed with denormal numbers */
+};
+
+/* Floating point mode and flags are per thread, so each job takes care of its own */
+static inline void
+begin_job(
+  struct mix_job * job_ptr)
+{
+  dsp_set_flush_denormals(job_ptr->flush_denormals);
+}
+
+static inline void
+end_job(
+  struct mix_job * job_ptr)
+{
+  if (dsp_take_denormals_flag())
+  {
+    __atomic_store_n(&job_ptr->denormals, true, __ATOMIC_RELAXED);
+  }
+}
+
+static void
+calc_channel_frames_job(
+  void * context,
+  unsigned int index)
+{
+  struct mix_job *job_ptr = context;
+
+  begin_job(job_ptr);
+  calc_channel_frames(job_ptr->snapshot->input_channels[index], job_ptr->start, job_ptr->end);
+  end_job(job_ptr);
+}
+
+static void
+mix_one_job(
+  void * context,
+  unsigned int index)
+{
+  struct mix_job *job_ptr = context;
+  struct output_channel *output_channel_ptr = job_ptr->snapshot->output_channels[index];
+  struct channel *channel_ptr = (struct channel*)output_channel_ptr;
+  uint64_t start;
+
+  /* Mix-minus output channels need the sum of their source nonetheless */
+  if (output_channel_ptr->system && !job_ptr->snapshot->routings[index]->keep_sum)
+  {
+    /* Don't bother mixing the channels if we are not connected */
+    if (channel_ptr->state->stereo)
+    {
+      if (!backend_port_connected(channel_ptr->mixer_ptr->backend, channel_ptr->state->port_left) &&
+          !backend_port_connected(channel_ptr->mixer_ptr->backend, channel_ptr->state->port_right))
+        return;
+    }
+    else {
+      if (!backend_port_connected(channel_ptr->mixer_ptr->backend, channel_ptr->state->port_left))
+        return;
+    }
+  }
+
+  /* Mix this output channel */
+  begin_job(job_ptr);
+  start = timing_now();
+  mix_one(job_ptr->snapshot, output_channel_ptr, job_ptr->snapshot->routings[index],
+          job_ptr->start, job_ptr->end);
+  output_channel_ptr->mix_time_sum += timing_now() - start;
+  end_job(job_ptr);
+}
+
+static void
+partial_sum_job(
+  void * context,
+  unsigned int index)
+{
+  struct mix_job *job_ptr = context;
+
+  begin_job(job_ptr);
+  mix_partial_sum(job_ptr->snapshot->partial_sums[index], job_ptr->start, job_ptr->end);
+  end_job(job_ptr);
+}
+
+static void
+mix_minus_job(
+  void * context,
+  unsigned int index)
+{
+  struct mix_job *job_ptr = context;
+
+  mix_one_job(context, job_ptr->snapshot->mix_minus_index + index);
+}
+
+/*
+ * Process all channels of a snapshot
+ *
+ * Returns true if any thread computed with denormal numbers.
+ */
+static inline bool
+mix(
+  struct snapshot * snapshot_ptr,
+  struct pool * pool_ptr,       /* Worker threads to share the work with, or NULL */
+  uint64_t * stage_times,       /* Durations of stages in ns to add to, indexed by process_stage */
+  bool flush_denormals,         /* Flush denormal numbers to zero in worker threads */
+  jack_nframes_t start,         /* Index of first sample to process */
+  jack_nframes_t end)           /* Index of sample to stop processing before */
+{
+  unsigned int i;
+  struct mix_job job = { snapshot_ptr, start, end, flush_denormals, false };
+  uint64_t stage_start = timing_now();
+  uint64_t time;
+
+  /* Each channel only writes to its own buffers, and output channels only
+   * read input channel buffers once all of them are done, so the result
+   * doesn't depend on how channels are distributed over threads. The same
+   * goes for partial sums and the output channels sharing them, and for
+   * mix-minus output channels and the sums of their sources. */
+  if (pool_ptr != NULL)
+  {
+    /* Calculate pre/post-fader output and peak values for each input channel */
+    pool_run(pool_ptr, calc_channel_frames_job, &job, snapshot_ptr->input_channels_count);
+    time = timing_now();
+    stage_times[Stage_Inputs] += time - stage_start;
+
+    /* Mix partial sums, all output channels, then mix-minus output channels */
+    if (snapshot_ptr->partial_sums_count != 0)
+    {
+      pool_run(pool_ptr, partial_sum_job, &job, snapshot_ptr->partial_sums_count);
+    }
+    pool_run(pool_ptr, mix_one_job, &job, snapshot_ptr->mix_minus_index);
+    if (snapshot_ptr->mix_minus_index < snapshot_ptr->output_channels_count)
+    {
+      pool_run(pool_ptr, mix_minus_job, &job,
+               snapshot_ptr->output_channels_count - snapshot_ptr->mix_minus_index);
+    }
+    stage_times[Stage_Outputs] += timing_now() - time;
+    return job.denormals;
+  }
+
+  /* Calculate pre/post-fader output and peak values for each input channel */
+  for (i = 0; i < snapshot_ptr->input_channels_count; i++)
+  {
+    calc_channel_frames_job(&job, i);
+  }
+  time = timing_now();
+  stage_times[Stage_Inputs] += time - stage_start;
+
+  /* Mix sends shared by output channels */
+  for (i = 0; i < snapshot_ptr->partial_sums_count; i++)
+  {
+    partial_sum_job(&job, i);
+  }
+
+  /* For all output channels, mix-minus output channels last: */
+  for (i = 0; i < snapshot_ptr->output_channels_count; i++)
+  {
+    mix_one_job(&job, i);
+  }
+  stage_times[Stage_Outputs] += timing_now() - time;
+  return job.denormals;
+}
+
+static inline void
+update_channel_buffers(
+  struct channel * channel_ptr,
+  jack_nframes_t nframes)
+{
+  channel_ptr->state->left_buffer_ptr = backend_port_get_buffer(channel_ptr->mixer_ptr->backend, channel_ptr->state->port_left, nframes);
+
+  if (channel_ptr->state->stereo)
+  {
+    channel_ptr->state->right_buffer_ptr = backend_port_get_buffer(channel_ptr->mixer_ptr->backend, channel_ptr->state->port_right, nframes);
+  }
+}
+
+static inline void
+kmeter_calc_hold_fall(
+  int *hold,
+  float *fall,
+  jack_nframes_t nframes,
+  jack_nframes_t sr)
+  {
+    float t;
+    t = (float) nframes / sr;
+    *hold = (int)(0.5 / t + 0.5f);
+    *fall = powf(10.0f, -0.05f * 10.5f * t);
+  }
+
+static inline void
+set_kmeters_peak_params(
+  struct channel *channel_ptr,
+  jack_nframes_t nframes)
+  {
+    int hold;
+    float fall;
+    jack_nframes_t sr = backend_get_sample_rate(channel_ptr->mixer_ptr->backend);
+    kmeter_calc_hold_fall(&hold, &fall, nframes, sr);
+    channel_ptr->state->kmeter_left._hold = hold;
+    channel_ptr->state->kmeter_right._hold = hold;
+    channel_ptr->state->kmeter_left._fall = fall;
+    channel_ptr->state->kmeter_right._fall = fall;
+    channel_ptr->state->kmeter_prefader_left._hold = hold;
+    channel_ptr->state->kmeter_prefader_right._hold = hold;
+    channel_ptr->state->kmeter_prefader_left._fall = fall;
+    channel_ptr->state->kmeter_prefader_right._fall = fall;
+  }
+
+static int
+xrun_cb(
+  void * arg)
+{
+  struct jack_mixer *mixer_ptr = arg;
+
+  __atomic_add_fetch(&mixer_ptr->xruns, 1, __ATOMIC_RELAXED);
+  return 0;
+}
+
+static int jack_buffer_size_cb(jack_nframes_t nframes, void *arg) {
+    struct jack_mixer *mixer_ptr  = (struct jack_mixer *) arg;
+    struct snapshot *snapshot_ptr;
+    unsigned int i;
+
+    pthread_mutex_lock(&mixer_ptr->mutex);
+    snapshot_ptr = mixer_ptr->snapshot;
+
+    /* Get input ports buffer pointers */
+    for (i = 0; i < snapshot_ptr->input_channels_count; i++)
+    {
+      set_kmeters_peak_params(snapshot_ptr->input_channels[i], nframes);
+    }
+
+    /* Get output ports buffer pointer */
+    for (i = 0; i < snapshot_ptr->output_channels_count; i++)
+    {
+      set_kmeters_peak_params((struct channel *)snapshot_ptr->output_channels[i], nframes);
+    }
+
+    /* Publish the same topology again with scratch buffers for the new period size */
+    mixer_ptr->buffer_size = nframes;
+    snapshot_ptr = copy_snapshot(snapshot_ptr);
+    if (snapshot_ptr == NULL || publish_snapshot(mixer_ptr, snapshot_ptr) != 0)
+    {
+      /* The process thread outputs silence until the next snapshot update */
+      LOG_ERROR("Could not allocate scratch buffers for %u frames.", nframes);
+      if (snapshot_ptr != NULL)
+      {
+        free_snapshot(snapshot_ptr);
+      }
+    }
+
+    pthread_mutex_unlock(&mixer_ptr->mutex);
+    return 0;
+}
+
+static void
+publish_channel_meters(
+  struct meters * meters_ptr,
+  struct channel * channel_ptr)
+{
+  struct meter_values *values_ptr;
+
+  if (channel_ptr->meter_slot >= meters_ptr->count)
+  {
+    return;
+  }
+
+  values_ptr = &meters_ptr->values[channel_ptr->meter_slot];
+
+  values_ptr->meter_prefader[0] = channel_ptr->state->meter_left_prefader;
+  values_ptr->meter_postfader[0] = channel_ptr->state->meter_left_postfader;
+  values_ptr->kmeter_rms_prefader[0] = channel_ptr->state->kmeter_prefader_left._rms;
+  values_ptr->kmeter_prefader[0] = channel_ptr->state->kmeter_prefader_left._dpk;
+  values_ptr->kmeter_rms_postfader[0] = channel_ptr->state->kmeter_left._rms;
+  values_ptr->kmeter_postfader[0] = channel_ptr->state->kmeter_left._dpk;
+
+  if (channel_ptr->state->stereo)
+  {
+    values_ptr->meter_prefader[1] = channel_ptr->state->meter_right_prefader;
+    values_ptr->meter_postfader[1] = channel_ptr->state->meter_right_postfader;
+    values_ptr->kmeter_rms_prefader[1] = channel_ptr->state->kmeter_prefader_right._rms;
+    values_ptr->kmeter_prefader[1] = channel_ptr->state->kmeter_prefader_right._dpk;
+    values_ptr->kmeter_rms_postfader[1] = channel_ptr->state->kmeter_right._rms;
+    values_ptr->kmeter_postfader[1] = channel_ptr->state->kmeter_right._dpk;
+  }
+  else
+  {
+    values_ptr->meter_prefader[1] = 0.0;
+    values_ptr->meter_postfader[1] = 0.0;
+    values_ptr->kmeter_rms_prefader[1] = 0.0;
+    values_ptr->kmeter_prefader[1] = 0.0;
+    values_ptr->kmeter_rms_postfader[1] = 0.0;
+    values_ptr->kmeter_postfader[1] = 0.0;
+  }
+
+  if (channel_ptr->state->NaN_detected)
+  {
+    values_ptr->abspeak_prefader = NAN;
+    values_ptr->abspeak_postfader = NAN;
+  }
+  else
+  {
+    values_ptr->abspeak_prefader = channel_ptr->state->abspeak_prefader;
+    values_ptr->abspeak_postfader = channel_ptr->state->abspeak_postfader;
+  }
+}
+
+/* Publish the average mixing time of output channels in the statistics window just finished */
+static void
+publish_mix_times(
+  struct snapshot * snapshot_ptr,
+  unsigned int cycles)
+{
+  struct output_channel *output_channel_ptr;
+  unsigned int i;
+
+  for (i = 0; i < snapshot_ptr->output_channels_count; i++)
+  {
+    output_channel_ptr = snapshot_ptr->output_channels[i];
+    __atomic_store_n(&output_channel_ptr->mix_time, output_channel_ptr->mix_time_sum / cycles,
+                     __ATOMIC_RELAXED);
+    output_channel_ptr->mix_time_sum = 0;
+  }
+}
+
+/* Finish the K-meter values of a channel after the last block of a period */
+static inline void
+end_kmeter_period(
+  struct channel * channel_ptr)
+{
+  kmeter_end_period(&channel_ptr->state->kmeter_left);
+  kmeter_end_period(&channel_ptr->state->kmeter_prefader_left);
+  if (channel_ptr->state->stereo) {
+    kmeter_end_period(&channel_ptr->state->kmeter_right);
+    kmeter_end_period(&channel_ptr->state->kmeter_prefader_right);
+  }
+}
+
+/* Publish the meter values of all channels for read_meters() */
+static void
+publish_meters(
+  struct meters * meters_ptr,
+  struct snapshot * snapshot_ptr)
+{
+  unsigned int seq = meters_ptr->seq; /* only written by the process thread */
+  unsigned int i;
+
+  __atomic_store_n(&meters_ptr->seq, seq + 1, __ATOMIC_RELAXED);
+  __atomic_thread_fence(__ATOMIC_RELEASE);
+
+  for (i = 0; i < snapshot_ptr->input_channels_count; i++)
+  {
+    publish_channel_meters(meters_ptr, snapshot_ptr->input_channels[i]);
+  }
+
+  for (i = 0; i < snapshot_ptr->output_channels_count; i++)
+  {
+    publish_channel_meters(meters_ptr, (struct channel *)snapshot_ptr->output_channels[i]);
+  }
+
+  __atomic_store_n(&meters_ptr->seq, seq + 2, __ATOMIC_RELEASE);
+}
+
+/*
+ * Wake up the thread calling dispatch_midi_changes() by a non-blocking
+ * write to a pipe, unless a wake up is pending already
+ */
+static void
+wake_midi_change_dispatch(
+  struct jack_mixer * mixer_ptr)
+{
+  char byte = 0;
+
+  if (!__atomic_exchange_n(&mixer_ptr->midi_change_signalled, true, __ATOMIC_ACQ_REL))
+  {
+    if (write(mixer_ptr->midi_change_pipe[1], &byte, 1) != 1)
+    {
+      /* Can't do anything about it here, the pipe holds one byte at most
+       * so it can't be full */
+    }
+  }
+}
+
+/* Set the volume, balance and mute of a channel to the values stored in a scene */
+static void
+apply_scene_values(
+  struct channel * channel_ptr,
+  struct scene_values * values_ptr,
+  unsigned int steps)
+{
+  if (channel_ptr->state->volume_new != values_ptr->volume)
+  {
+    channel_queue_midi_out(channel_ptr, CHANNEL_VOLUME);
+  }
+  channel_ptr->state->volume_new = values_ptr->volume;
+  channel_balance_write(channel_ptr, values_ptr->balance);
+
+  if (values_ptr->out_mute)
+  {
+    channel_out_mute(channel_ptr);
+  }
+  else
+  {
+    channel_out_unmute(channel_ptr);
+  }
+
+  channel_ptr->state->ramp_steps = steps;
+}
+
+/*
+ * Apply the values stored in a scene to all channels of a snapshot, with
+ * volume and balance transitions of steps samples
+ *
+ * Called from the process thread before any channel is processed, so all
+ * channels start their transitions in the same period. Mute, solo and
+ * pre-fader switch at the start of the transitions. dispatch_midi_changes()
+ * runs the callbacks of all channels afterwards.
+ */
+static void
+apply_scene(
+  struct jack_mixer * mixer_ptr,
+  struct snapshot * snapshot_ptr,
+  unsigned int scene,
+  unsigned int steps)
+{
+  struct channel *channel_ptr;
+  struct output_channel *output_channel_ptr;
+  unsigned int i;
+
+  for (i = 0; i < snapshot_ptr->input_channels_count; i++)
+  {
+    channel_ptr = snapshot_ptr->input_channels[i];
+    if (!channel_ptr->scenes[scene].stored)
+    {
+      continue;
+    }
+
+    apply_scene_values(channel_ptr, &channel_ptr->scenes[scene], steps);
+    if (channel_ptr->scenes[scene].solo)
+    {
+      channel_solo(channel_ptr);
+    }
+    else
+    {
+      channel_unsolo(channel_ptr);
+    }
+  }
+
+  /* System output channels are never stored */
+  for (i = 0; i < snapshot_ptr->output_channels_count; i++)
+  {
+    output_channel_ptr = snapshot_ptr->output_channels[i];
+    if (output_channel_ptr->channel.scenes[scene].stored)
+    {
+      apply_scene_values(&output_channel_ptr->channel, &output_channel_ptr->channel.scenes[scene], steps);
+      output_channel_ptr->prefader = output_channel_ptr->scenes[scene].prefader;
+    }
+  }
+
+  __atomic_store_n(&mixer_ptr->current_scene, (int)scene, __ATOMIC_RELAXED);
+  __atomic_store_n(&mixer_ptr->scene_recalled, true, __ATOMIC_RELEASE);
+  wake_midi_change_dispatch(mixer_ptr);
+}
+
+/*
+ * Apply the changes of all batches passed to apply_changes() since the
+ * last cycle, in the order they were passed
+ *
+ * Called from the process thread before any channel is processed. Routing
+ * changes were published by apply_changes() already.
+ */
+static void
+apply_change_batches(
+  struct change_batch * batch_ptr)
+{
+  struct change_batch *queue_ptr = NULL;
+  struct change_batch *next_ptr;
+  struct channel_change *change_ptr;
+  unsigned int i;
+
+  /* Batches were pushed on a stack */
+  while (batch_ptr)
+  {
+    next_ptr = batch_ptr->next;
+    batch_ptr->next = queue_ptr;
+    queue_ptr = batch_ptr;
+    batch_ptr = next_ptr;
+  }
+
+  for (batch_ptr = queue_ptr; batch_ptr; batch_ptr = batch_ptr->next)
+  {
+    for (i = 0; i < batch_ptr->count; i++)
+    {
+      change_ptr = &batch_ptr->changes[i];
+      switch (change_ptr->parameter)
+      {
+      case Parameter_Volume:
+        channel_volume_write(change_ptr->channel, change_ptr->value);
+        break;
+      case Parameter_Balance:
+        channel_balance_write(change_ptr->channel, change_ptr->value);
+        break;
+      case Parameter_Mute:
+        if (change_ptr->value != 0) {
+          channel_out_mute(change_ptr->channel);
+        }
+        else {
+          channel_out_unmute(change_ptr->channel);
+        }
+        break;
+      case Parameter_Solo:
+        if (change_ptr->value != 0) {
+          channel_solo(change_ptr->channel);
+        }
+        else {
+          channel_unsolo(change_ptr->channel);
+        }
+        break;
+      case Parameter_Prefader:
+        ((struct output_channel *)change_ptr->channel)->prefader = change_ptr->value != 0;
+        break;
+      case Parameter_Send_Mute:
+      case Parameter_Send_Solo:
+      case Parameter_Send_Prefader:
+        break;
+      }
+    }
+  }
+}
+
+#if defined(HAVE_JACK_MIDI)
+/*
+ * Snapshot with the routing of a scene which can be recalled via MIDI,
+ * NULL if the scene is not stored or being stored again
+ */
+static inline struct snapshot *
+get_scene_snapshot(
+  struct jack_mixer * mixer_ptr,
+  struct snapshot * snapshot_ptr,
+  unsigned int scene)
+{
+  if (snapshot_ptr->scenes == NULL ||
+      !__atomic_load_n(&mixer_ptr->scene_stored[scene], __ATOMIC_ACQUIRE))
+  {
+    return NULL;
+  }
+
+  return snapshot_ptr->scenes[scene];
+}
+
+/* Check whether a MIDI event changes any channel, see process() */
+static bool
+is_midi_event_mapped(
+  struct jack_mixer * mixer_ptr,
+  struct snapshot * snapshot_ptr,
+  jack_midi_event_t * event_ptr)
+{
+  if (event_ptr->size == 2 &&
+      (event_ptr->buffer[0] & 0xF0) == 0xC0 &&
+      event_ptr->buffer[1] <= 127)
+  {
+    return get_scene_snapshot(mixer_ptr, snapshot_ptr, event_ptr->buffer[1]) != NULL;
+  }
+
+  if (event_ptr->size == 3 &&
+      (event_ptr->buffer[0] & 0xF0) == 0xB0 &&
+      event_ptr->buffer[1] <= 127 &&
+      event_ptr->buffer[2] <= 127)
+  {
+    return mixer_ptr->midi_cc_map[event_ptr->buffer[1]].channel != NULL;
+  }
+
+  return false;
+}
+
+/*
+ * Queue a channel changed via MIDI in for dispatch_midi_changes()
+ *
+ * Called from the process thread, so it must not block: the channel is
+ * written to a lock-free ring buffer, and the dispatching thread is woken
+ * up by a non-blocking write to a pipe unless a wake up is pending already.
+ */
+static void
+post_midi_change(
+  struct jack_mixer * mixer_ptr,
+  struct channel * channel_ptr)
+{
+  if (__atomic_exchange_n(&channel_ptr->midi_change_queued, true, __ATOMIC_ACQ_REL))
+  {
+    /* not dispatched yet, the callback will see the latest values */
+    return;
+  }
+
+  if (jack_ringbuffer_write_space(mixer_ptr->midi_changes) < sizeof(channel_ptr))
+  {
+    /* Only a few channels can be mapped to CCs, so this means nobody is
+     * dispatching changes */
+    __atomic_store_n(&channel_ptr->midi_change_queued, false, __ATOMIC_RELEASE);
+    return;
+  }
+
+  jack_ringbuffer_write(mixer_ptr->midi_changes, (const char *)&channel_ptr, sizeof(channel_ptr));
+  wake_midi_change_dispatch(mixer_ptr);
+}
+
+/* Write one control change message to a MIDI out buffer */
+static void
+send_midi_cc(
+  void * midi_buffer,
+  int8_t cc_num,
+  unsigned char cc_val)
+{
+  unsigned char* midi_out_buffer;
+
+  if (cc_num < 0)
+  {
+    /* parameter not mapped to any CC */
+    return;
+  }
+
+  midi_out_buffer = jack_midi_event_reserve(midi_buffer, 0, 3);
+  if (!midi_out_buffer)
+  {
+    return;
+  }
+
+  midi_out_buffer[0] = 0xB0; /* control change */
+  midi_out_buffer[1] = (unsigned char)cc_num;
+  midi_out_buffer[2] = cc_val;
+
+  LOG_DEBUG(
+    "%u: CC#%u <- %u",
+    (unsigned int)midi_out_buffer[0],
+    (unsigned int)midi_out_buffer[1],
+    (unsigned int)midi_out_buffer[2]);
+}
+
+/* Send the current value of each channel parameter flagged in events */
+static void
+send_midi_out_events(
+  void * midi_buffer,
+  struct channel * channel_ptr,
+  int events)
+{
+  double balance;
+
+  if (events & CHANNEL_VOLUME && channel_ptr->midi_scale)
+  {
+    send_midi_cc(midi_buffer,
+                 channel_ptr->midi_cc_volume_index,
+                 (unsigned char)(127 * scale_db_to_scale(channel_ptr->midi_scale,
+                                                         value_to_db(channel_ptr->state->volume_new))));
+  }
+  if (events & CHANNEL_BALANCE)
+  {
+    balance = channel_balance_read(channel_ptr);
+    if (balance < 0.0) {
+      send_midi_cc(midi_buffer,
+                   channel_ptr->midi_cc_balance_index,
+                   (unsigned char)(MAP(balance, -1.0, -0.015625, 0.0, 63.0) + 0.5));
+    }
+    else {
+      send_midi_cc(midi_buffer,
+                   channel_ptr->midi_cc_balance_index,
+                   (unsigned char)(MAP(balance, 0.0, 1.0, 64.0, 127.0) + 0.5));
+    }
+  }
+  if (events & CHANNEL_MUTE)
+  {
+    send_midi_cc(midi_buffer,
+                 channel_ptr->midi_cc_mute_index,
+                 (unsigned char)(channel_is_out_muted(channel_ptr) ? 127 : 0));
+  }
+  if (events & CHANNEL_SOLO)
+  {
+    send_midi_cc(midi_buffer,
+                 channel_ptr->midi_cc_solo_index,
+                 (unsigned char)(channel_is_soloed(channel_ptr) ? 127 : 0));
+  }
+}
+#endif
+
+#define mixer_ptr ((struct jack_mixer *)context)
+
+static int
+process(
+  jack_nframes_t nframes,
+  void * context)
+{
+  struct snapshot * published_ptr;
+  struct snapshot * snapshot_ptr;
+  unsigned int channel_index;
+  struct channel * channel_ptr;
+  uint64_t cycle_start = timing_now();
+  unsigned int window_cycles;
+  bool flush_denormals;
+  bool denormals = false;
+  uint64_t scene_recall;
+  unsigned int scene;
+  struct change_batch * batch_ptr;
+  struct pool * pool_ptr;
+  uint64_t stage_times[Stage_Count] = { 0 };
+  jack_nframes_t block_start = 0; /* first frame not processed yet */
+  bool can_mix;
+#if defined(HAVE_JACK_MIDI)
+  unsigned int split_frames;
+  struct snapshot * scene_snapshot_ptr;
+  uint64_t stage_start;
+  uint64_t mix_start;
+  jack_nframes_t i;
+  jack_nframes_t event_count;
+  jack_midi_event_t in_event;
+  void * midi_buffer;
+  double volume, balance, current;
+  struct midi_cc_target * target_ptr;
+  uint8_t cc_num, cc_val;
+  struct channel * queue_ptr;
+  struct channel * next_ptr;
+  int events;
+#endif
+
+  /* Denormal numbers slow down floating point operations on many CPUs */
+  flush_denormals = __atomic_load_n(&mixer_ptr->flush_denormals, __ATOMIC_RELAXED);
+  dsp_set_flush_denormals(flush_denormals);
+
+  /* Taken first, so the snapshot below includes the routing of the scene and changes */
+  scene_recall = __atomic_exchange_n(&mixer_ptr->scene_recall, 0, __ATOMIC_ACQUIRE);
+  batch_ptr = __atomic_exchange_n(&mixer_ptr->change_batches, NULL, __ATOMIC_ACQUIRE);
+
+  /* Use the same topology for the whole cycle, unless a scene is recalled via MIDI */
+  published_ptr = __atomic_load_n(&mixer_ptr->snapshot, __ATOMIC_ACQUIRE);
+  snapshot_ptr = published_ptr;
+
+#if defined(HAVE_JACK_MIDI)
+  /* The routing of a scene recalled via MIDI is used until the control thread applied it */
+  if (published_ptr->routing_recalls != mixer_ptr->midi_recalls &&
+      get_scene_snapshot(mixer_ptr, published_ptr, mixer_ptr->midi_recall_scene) != NULL)
+  {
+    snapshot_ptr = published_ptr->scenes[mixer_ptr->midi_recall_scene];
+  }
+#endif
+
+  if (snapshot_ptr != mixer_ptr->bound_snapshot)
+  {
+    bind_scratch(snapshot_ptr);
+    mixer_ptr->bound_snapshot = snapshot_ptr;
+  }
+
+  /* Scratch buffers for this period size may not have been allocated */
+  can_mix = nframes <= snapshot_ptr->frames;
+  pool_ptr = __atomic_load_n(&mixer_ptr->pool, __ATOMIC_ACQUIRE);
+
+  /* Scene recalled by recall_scene(), unless it is being stored again */
+  if (scene_recall != 0)
+  {
+    scene = (unsigned int)(scene_recall & 0xFFFFFFFF) - 1;
+    if (__atomic_load_n(&mixer_ptr->scene_stored[scene], __ATOMIC_ACQUIRE))
+    {
+      apply_scene(mixer_ptr, snapshot_ptr, scene, (unsigned int)(scene_recall >> 32));
+    }
+  }
+
+  /* Changes passed to apply_changes(), freed by the control thread after this cycle */
+  if (batch_ptr != NULL)
+  {
+    apply_change_batches(batch_ptr);
+  }
+
+  /* Get input ports buffer pointers */
+  for (channel_index = 0; channel_index < snapshot_ptr->input_channels_count; channel_index++)
+  {
+    update_channel_buffers(snapshot_ptr->input_channels[channel_index], nframes);
+  }
+
+  /* Get output ports buffer pointer */
+  for (channel_index = 0; channel_index < snapshot_ptr->output_channels_count; channel_index++)
+  {
+    update_channel_buffers((struct channel *)snapshot_ptr->output_channels[channel_index], nframes);
+  }
+
+#if defined(HAVE_JACK_MIDI)
+  stage_start = timing_now();
+
+  /* The offline backend has no MIDI buffers */
+  midi_buffer = backend_port_get_buffer(mixer_ptr->backend, mixer_ptr->port_midi_in, nframes);
+  event_count = midi_buffer != NULL ? jack_midi_get_event_count(midi_buffer) : 0;
+  split_frames = __atomic_load_n(&mixer_ptr->midi_split_frames, __ATOMIC_RELAXED);
+
+  for (i = 0 ; i < event_count; i++)
+  {
+    jack_midi_event_get(&in_event, midi_buffer, i);
+
+    /* Process the frames before the event, so it takes effect at its
+     * exact time, unless they would make a block that is too short. */
+    if (split_frames != 0 &&
+        can_mix &&
+        in_event.time < nframes &&
+        in_event.time - block_start >= split_frames &&
+        is_midi_event_mapped(mixer_ptr, published_ptr, &in_event))
+    {
+      mix_start = timing_now();
+      denormals |= mix(snapshot_ptr, pool_ptr, stage_times, flush_denormals, block_start, in_event.time);
+      block_start = in_event.time;
+      stage_start += timing_now() - mix_start;
+    }
+
+    /* A Program Change recalls the scene with the same number */
+    if (in_event.size == 2 &&
+        (in_event.buffer[0] & 0xF0) == 0xC0 &&
+        in_event.buffer[1] <= 127)
+    {
+      scene = in_event.buffer[1];
+      LOG_DEBUG("%u: PC#%u", (unsigned int)(in_event.buffer[0]), scene);
+      scene_snapshot_ptr = get_scene_snapshot(mixer_ptr, published_ptr, scene);
+      if (scene_snapshot_ptr != NULL)
+      {
+        /* The routing of the scene switches along with its values, the
+         * control thread applies it to the output channels later */
+        mixer_ptr->midi_recalls++;
+        mixer_ptr->midi_recall_scene = scene;
+        __atomic_store_n(&mixer_ptr->scene_routing, ((uint64_t)mixer_ptr->midi_recalls << 32) | (scene + 1),
+                         __ATOMIC_RELEASE);
+
+        snapshot_ptr = scene_snapshot_ptr;
+        if (snapshot_ptr != mixer_ptr->bound_snapshot)
+        {
+          bind_scratch(snapshot_ptr);
+          mixer_ptr->bound_snapshot = snapshot_ptr;
+        }
+
+        apply_scene(mixer_ptr, snapshot_ptr, scene,
+                    __atomic_load_n(&mixer_ptr->scene_crossfade_steps, __ATOMIC_RELAXED));
+      }
+      continue;
+    }
+
+    if (in_event.size != 3 ||
+        (in_event.buffer[0] & 0xF0) != 0xB0 ||
+        in_event.buffer[1] > 127 ||
+        in_event.buffer[2] > 127)
+    {
+      continue;
+    }
+
+    assert(in_event.time < nframes);
+
+    cc_num = (uint8_t)(in_event.buffer[1] & 0x7F);
+    cc_val = (uint8_t)(in_event.buffer[2] & 0x7F);
+    mixer_ptr->last_midi_cc = (int8_t)cc_num;
+
+    LOG_DEBUG("%u: CC#%u -> %u", (unsigned int)(in_event.buffer[0]), cc_num, cc_val);
+
+    /* Do we have a mapping for particular CC? */
+    target_ptr = &mixer_ptr->midi_cc_map[cc_num];
+    channel_ptr = target_ptr->channel;
+    if (channel_ptr)
+    {
+      switch (target_ptr->param)
+      {
+      case MIDI_CC_BALANCE:
+        if (cc_val < 63) {
+          balance = MAP(cc_val, 0.0, 63.0, -1.0, -0.015625);
+        }
+        else {
+          balance = MAP(cc_val, 64.0, 127.0, 0.0, 1.0);
+        }
+        if (mixer_ptr->midi_behavior == Pick_Up &&
+            !channel_ptr->midi_cc_balance_picked_up &&
+            channel_balance_read(channel_ptr) - balance < BALANCE_PICKUP_THRESHOLD)
+        {
+          channel_set_midi_cc_balance_picked_up(channel_ptr, true);
+        }
+        if ((mixer_ptr->midi_behavior == Pick_Up &&
+            channel_ptr->midi_cc_balance_picked_up) ||
+            mixer_ptr->midi_behavior == Jump_To_Value)
+        {
+          channel_balance_write(channel_ptr, balance);
+
+        }
+        break;
+      case MIDI_CC_VOLUME:
+        /* Is a MIDI scale set for corresponding channel? */
+        if (channel_ptr->midi_scale) {
+          volume = scale_midi_value_to_db(channel_ptr->midi_scale, cc_val);
+          if (mixer_ptr->midi_behavior == Pick_Up &&
+              !channel_ptr->midi_cc_volume_picked_up)
+          {
+              /* MIDI control in pick-up mode but not picked up yet
+               *
+               * The incoming MIDI CC value matches the current volume level
+               * if the level lies between the volumes of this and the next
+               * CC value --> MIDI control is picked up
+               */
+              current = value_to_db(channel_ptr->state->volume.value);
+              if (current >= volume &&
+                  (cc_val == 127 || current < scale_midi_value_to_db(channel_ptr->midi_scale, cc_val + 1)))
+              {
+                channel_set_midi_cc_volume_picked_up(channel_ptr, true);
+              }
+          }
+          if ((mixer_ptr->midi_behavior == Pick_Up &&
+              channel_ptr->midi_cc_volume_picked_up) ||
+              mixer_ptr->midi_behavior == Jump_To_Value)
+          {
+            channel_volume_write(channel_ptr, volume);
+          }
+        }
+        break;
+      case MIDI_CC_MUTE:
+        if (cc_val >= 64) {
+          channel_out_mute(channel_ptr);
+        }
+        else {
+          channel_out_unmute(channel_ptr);
+        }
+        break;
+      case MIDI_CC_SOLO:
+        if (cc_val >= 64) {
+            channel_solo(channel_ptr);
+        }
+        else {
+            channel_unsolo(channel_ptr);
+        }
+        break;
+      case MIDI_CC_NONE:
+        break;
+      }
+      channel_ptr->midi_in_got_events = true;
+      post_midi_change(mixer_ptr, channel_ptr);
+    }
+
+  }
+
+  timing_record(&mixer_ptr->timing, Stage_Midi_In, timing_now() - stage_start);
+  stage_start = timing_now();
+
+  midi_buffer = backend_port_get_buffer(mixer_ptr->backend, mixer_ptr->port_midi_out, nframes);
+  if (midi_buffer != NULL)
+  {
+    jack_midi_clear_buffer(midi_buffer);
+  }
+
+  /* Take all queued channels at once, changes made from now on go to the next cycle */
+  channel_ptr = __atomic_exchange_n(&mixer_ptr->midi_out_queue, NULL, __ATOMIC_ACQUIRE);
+  if (channel_ptr)
+  {
+    /* Channels were pushed on a stack, reverse it to send changes in order */
+    queue_ptr = NULL;
+    while (channel_ptr)
+    {
+      next_ptr = channel_ptr->midi_out_next;
+      channel_ptr->midi_out_next = queue_ptr;
+      queue_ptr = channel_ptr;
+      channel_ptr = next_ptr;
+    }
+
+    for (channel_ptr = queue_ptr; channel_ptr; channel_ptr = next_ptr)
+    {
+      /* The channel may be queued again as soon as its events are taken */
+      next_ptr = channel_ptr->midi_out_next;
+      events = __atomic_exchange_n(&channel_ptr->midi_out_has_events, 0, __ATOMIC_ACQ_REL);
+      if (midi_buffer != NULL)
+      {
+        send_midi_out_events(midi_buffer, channel_ptr, events);
+      }
+    }
+  }
+
+  timing_record(&mixer_ptr->timing, Stage_Midi_Out, timing_now() - stage_start);
+#endif
+
+  if (can_mix)
+  {
+    denormals |= mix(snapshot_ptr, pool_ptr, stage_times, flush_denormals, block_start, nframes);
+    if (mixer_ptr->kmetering)
+    {
+      for (channel_index = 0; channel_index < snapshot_ptr->input_channels_count; channel_index++)
+      {
+        end_kmeter_period(snapshot_ptr->input_channels[channel_index]);
+      }
+      for (channel_index = 0; channel_index < snapshot_ptr->output_channels_count; channel_index++)
+      {
+        end_kmeter_period((struct channel *)snapshot_ptr->output_channels[channel_index]);
+      }
+    }
+    timing_record(&mixer_ptr->timing, Stage_Inputs, stage_times[Stage_Inputs]);
+    timing_record(&mixer_ptr->timing, Stage_Outputs, stage_times[Stage_Outputs]);
+  }
+  else
+  {
+    /* Scratch buffers for this period size could not be allocated */
+    for (channel_index = 0; channel_index < snapshot_ptr->output_channels_count; channel_index++)
+    {
+      channel_ptr = (struct channel *)snapshot_ptr->output_channels[channel_index];
+      memset(channel_ptr->state->left_buffer_ptr, 0, nframes * sizeof(jack_default_audio_sample_t));
+      if (channel_ptr->state->stereo)
+        memset(channel_ptr->state->right_buffer_ptr, 0, nframes * sizeof(jack_default_audio_sample_t));
+    }
+  }
+
+  publish_meters(__atomic_load_n(&mixer_ptr->meters, __ATOMIC_ACQUIRE), snapshot_ptr);
+
+  /* Flags of the process thread also cover the MIDI handling of this cycle */
+  if (dsp_take_denormals_flag() || denormals)
+  {
+    __atomic_add_fetch(&mixer_ptr->denormal_cycles, 1, __ATOMIC_RELAXED);
+  }
+
+  timing_record(&mixer_ptr->timing, Stage_Process, timing_now() - cycle_start);
+  window_cycles = timing_end_cycle(&mixer_ptr->timing, nframes, backend_get_sample_rate(mixer_ptr->backend));
+  if (window_cycles != 0)
+  {
+    publish_mix_times(snapshot_ptr, window_cycles);
+  }
+
+  /* Let the control thread know that published data from before this cycle is not in use anymore */
+  __atomic_add_fetch(&mixer_ptr->cycle, 1, __ATOMIC_RELEASE);
+
+  return 0;
+}
+
+#undef mixer_ptr
+
+/* Create a mixer running on backend_ptr, which is closed on failure */
+static jack_mixer_t
+create_mixer(
+  struct backend * backend_ptr)
+{
+  int ret;
+  struct jack_mixer * mixer_ptr;
+  int i;
+  char * localedir;
+
+  localedir = getenv("LOCALEDIR");
+  setlocale(LC_ALL, "");
+  bindtextdomain("jack_mixer", localedir != NULL ? localedir : LOCALEDIR);
+  textdomain("jack_mixer");
+
+  mixer_ptr = malloc(sizeof(struct jack_mixer));
+  if (mixer_ptr == NULL)
+  {
+    goto exit;
+  }
+
+  ret = pthread_mutex_init(&mixer_ptr->mutex, NULL);
+  if (ret != 0)
+  {
+    goto exit_free;
+  }
+
+  mixer_ptr->input_channels_list = NULL;
+  mixer_ptr->output_channels_list = NULL;
+
+  mixer_ptr->soloed_channels_count = 0;
+
+  mixer_ptr->snapshot = NULL;
+  mixer_ptr->bound_snapshot = NULL;
+  mixer_ptr->cycle = 0;
+  mixer_ptr->garbage = NULL;
+
+  mixer_ptr->pool = NULL;
+
+  mixer_ptr->meters = create_meters(METER_SLOTS_COUNT);
+  mixer_ptr->state_blocks = NULL;
+  mixer_ptr->state_blocks_count = 0;
+  if (mixer_ptr->meters == NULL)
+  {
+    goto exit_destroy_mutex;
+  }
+
+  mixer_ptr->midi_out_queue = NULL;
+  mixer_ptr->change_batches = NULL;
+
+  timing_init(&mixer_ptr->timing);
+  mixer_ptr->xruns = 0;
+
+  mixer_ptr->midi_change_signalled = false;
+  mixer_ptr->midi_changes = jack_ringbuffer_create(MIDI_CHANGE_QUEUE_SIZE * sizeof(struct channel *));
+  if (mixer_ptr->midi_changes == NULL)
+  {
+    _jack_mixer_error = JACK_MIXER_ERROR_MIDI_CHANGE_QUEUE;
+    goto exit_free_meters;
+  }
+
+  ret = pipe(mixer_ptr->midi_change_pipe);
+  if (ret != 0)
+  {
+    _jack_mixer_error = JACK_MIXER_ERROR_MIDI_CHANGE_QUEUE;
+    goto exit_free_midi_changes;
+  }
+
+  for (i = 0 ; i < 2 ; i++)
+  {
+    fcntl(mixer_ptr->midi_change_pipe[i], F_SETFL, O_NONBLOCK);
+    fcntl(mixer_ptr->midi_change_pipe[i], F_SETFD, FD_CLOEXEC);
+  }
+
+  mixer_ptr->kmetering = true;
+  mixer_ptr->block_processing = true;
+  mixer_ptr->flush_denormals = true;
+  mixer_ptr->denormal_cycles = 0;
+  mixer_ptr->midi_split_frames = 0;
+  dsp_init();
+
+  mixer_ptr->last_midi_cc = -1;
+
+  mixer_ptr->midi_behavior = Jump_To_Value;
+
+  for (i = 0 ; i < 128 ; i++)
+  {
+    map_midi_cc(mixer_ptr, i, NULL, MIDI_CC_NONE);
+  }
+
+  mixer_ptr->backend = backend_ptr;
+  mixer_ptr->buffer_size = backend_get_buffer_size(mixer_ptr->backend);
+  LOG_DEBUG("Sample rate: %u", backend_get_sample_rate(mixer_ptr->backend));
+
+  memset(mixer_ptr->scene_stored, 0, sizeof(mixer_ptr->scene_stored));
+  mixer_ptr->current_scene = -1;
+  mixer_ptr->scene_crossfade_steps =
+    VOLUME_TRANSITION_SECONDS * backend_get_sample_rate(mixer_ptr->backend) + 1;
+  mixer_ptr->scene_recall = 0;
+  mixer_ptr->scene_routing = 0;
+  mixer_ptr->routing_recalls = 0;
+  mixer_ptr->midi_recalls = 0;
+  mixer_ptr->midi_recall_scene = 0;
+  mixer_ptr->scene_recalled = false;
+
+  /* Publish empty topology, so the process thread always has one */
+  ret = update_snapshot(mixer_ptr);
+  if (ret != 0)
+  {
+    goto exit_close_midi_change_pipe;
+  }
+
+#if defined(HAVE_JACK_MIDI)
+  mixer_ptr->port_midi_in = backend_port_register(mixer_ptr->backend, "midi in",
+                                                  JACK_DEFAULT_MIDI_TYPE, JackPortIsInput);
+  if (mixer_ptr->port_midi_in == NULL)
+  {
+    _jack_mixer_error = JACK_MIXER_ERROR_JACK_MIDI_IN_CREATE;
+    goto exit_free_snapshot;
+  }
+
+  mixer_ptr->port_midi_out = backend_port_register(mixer_ptr->backend, "midi out",
+                                                   JACK_DEFAULT_MIDI_TYPE, JackPortIsOutput);
+  if (mixer_ptr->port_midi_out == NULL)
+  {
+    _jack_mixer_error = JACK_MIXER_ERROR_JACK_MIDI_OUT_CREATE;
+    goto exit_free_snapshot;
+  }
+
+#endif
+
+  ret = backend_set_process_callback(mixer_ptr->backend, process, mixer_ptr);
+  if (ret != 0)
+  {
+    _jack_mixer_error = JACK_MIXER_ERROR_JACK_SET_PROCESS_CALLBACK;
+    goto exit_free_snapshot;
+  }
+
+  ret = backend_set_buffer_size_callback(mixer_ptr->backend, jack_buffer_size_cb, mixer_ptr);
+  if (ret != 0)
+  {
+    _jack_mixer_error = JACK_MIXER_ERROR_JACK_SET_BUFFER_SIZE_CALLBACK;
+    goto exit_free_snapshot;
+  }
+
+  ret = backend_set_xrun_callback(mixer_ptr->backend, xrun_cb, mixer_ptr);
+  if (ret != 0)
+  {
+    _jack_mixer_error = JACK_MIXER_ERROR_JACK_SET_XRUN_CALLBACK;
+    goto exit_free_snapshot;
+  }
+
+  ret = backend_activate(mixer_ptr->backend);
+  if (ret != 0)
+  {
+    _jack_mixer_error = JACK_MIXER_ERROR_JACK_ACTIVATE;
+    goto exit_free_snapshot;
+  }
+
+  return mixer_ptr;
+
+exit_free_snapshot:
+  retire(mixer_ptr, mixer_ptr->snapshot, free_snapshot);
+  collect_garbage(mixer_ptr, true);
+
+exit_close_midi_change_pipe:
+  close(mixer_ptr->midi_change_pipe[0]);
+  close(mixer_ptr->midi_change_pipe[1]);
+
+exit_free_midi_changes:
+  jack_ringbuffer_free(mixer_ptr->midi_changes);
+
+exit_free_meters:
+  free(mixer_ptr->meters);
+
+exit_destroy_mutex:
+  pthread_mutex_destroy(&mixer_ptr->mutex);
+
+exit_free:
+  free(mixer_ptr);
+
+exit:
+  /* this should clear all other resources we obtained through the backend */
+  backend_close(backend_ptr);
+  return NULL;
+}
+
+jack_mixer_t
+create(
+  const char * jack_client_name_ptr,
+  bool stereo)
+{
+  (void) stereo;
+  struct backend * backend_ptr;
+
+  LOG_DEBUG("Initializing JACK.");
+  backend_ptr = backend_jack_open(jack_client_name_ptr);
+  if (backend_ptr == NULL)
+  {
+    _jack_mixer_error = JACK_MIXER_ERROR_JACK_CLIENT_CREATE;
+    return NULL;
+  }
+
+  LOG_DEBUG("JACK client created.");
+  return create_mixer(backend_ptr);
+}
+
+jack_mixer_t
+create_offline(
+  const char * client_name_ptr,
+  unsigned int sample_rate,
+  unsigned int buffer_size)
+{
+  struct backend * backend_ptr;
+
+  backend_ptr = backend_offline_open(client_name_ptr, sample_rate, buffer_size);
+  if (backend_ptr == NULL)
+  {
+    _jack_mixer_error = JACK_MIXER_ERROR_OFFLINE_BACKEND_CREATE;
+    return NULL;
+  }
+
+  return create_mixer(backend_ptr);
+}
+
+#define mixer_ctx_ptr ((struct jack_mixer *)mixer)
+
+void
+destroy(
+  jack_mixer_t mixer)
+{
+  unsigned int i;
+
+  LOG_DEBUG("Uninitializing JACK.");
+  assert(mixer_ctx_ptr->backend != NULL);
+  backend_close(mixer_ctx_ptr->backend);
+  retire(mixer_ctx_ptr, mixer_ctx_ptr->snapshot, free_snapshot);
+  retire(mixer_ctx_ptr, mixer_ctx_ptr->meters, free);
+  if (mixer_ctx_ptr->pool != NULL)
+  {
+    retire(mixer_ctx_ptr, mixer_ctx_ptr->pool, pool_destroy);
+  }
+  collect_garbage(mixer_ctx_ptr, true);
+  for (i = 0; i < mixer_ctx_ptr->state_blocks_count; i++)
+  {
+    free(mixer_ctx_ptr->state_blocks[i]);
+  }
+  free(mixer_ctx_ptr->state_blocks);
+  close(mixer_ctx_ptr->midi_change_pipe[0]);
+  close(mixer_ctx_ptr->midi_change_pipe[1]);
+  jack_ringbuffer_free(mixer_ctx_ptr->midi_changes);
+  pthread_mutex_destroy(&mixer_ctx_ptr->mutex);
+  free(mixer_ctx_ptr);
+}
+
+
+unsigned int
+get_channels_count(
+  jack_mixer_t mixer)
+{
+  return g_slist_length(mixer_ctx_ptr->input_channels_list);
+}
+
+const char*
+get_client_name(
+  jack_mixer_t mixer)
+{
+  return backend_get_client_name(mixer_ctx_ptr->backend);
+}
+
+unsigned int
+get_sample_rate(
+  jack_mixer_t mixer)
+{
+  return backend_get_sample_rate(mixer_ctx_ptr->backend);
+}
+
+unsigned int
+get_buffer_size(
+  jack_mixer_t mixer)
+{
+  return backend_get_buffer_size(mixer_ctx_ptr->backend);
+}
+
+bool
+is_offline(
+  jack_mixer_t mixer)
+{
+  return backend_is_offline(mixer_ctx_ptr->backend);
+}
+
+int
+offline_process(
+  jack_mixer_t mixer,
+  unsigned int nframes)
+{
+  uint64_t fp_mode;
+  int ret;
+
+  if (!backend_is_offline(mixer_ctx_ptr->backend))
+  {
+    _jack_mixer_error = JACK_MIXER_ERROR_OFFLINE_PROCESS;
+    return -1;
+  }
+
+  /* The cycle runs in the calling thread, whose denormal mode is not ours to keep */
+  fp_mode = dsp_save_fp_mode();
+  ret = backend_offline_process(mixer_ctx_ptr->backend, nframes);
+  dsp_restore_fp_mode(fp_mode);
+
+  if (ret != 0)
+  {
+    _jack_mixer_error = JACK_MIXER_ERROR_OFFLINE_PROCESS;
+    return -1;
+  }
+
+  return 0;
+}
+
+bool
+get_kmetering(
+  jack_mixer_t mixer)
+{
+  return mixer_ctx_ptr->kmetering;
+}
+
+void
+set_kmetering(
+  jack_mixer_t mixer,
+  bool flag)
+{
+  mixer_ctx_ptr->kmetering = flag;
+}
+
+bool
+get_block_processing(
+  jack_mixer_t mixer)
+{
+  return mixer_ctx_ptr->block_processing;
+}
+
+void
+set_block_processing(
+  jack_mixer_t mixer,
+  bool flag)
+{
+  mixer_ctx_ptr->block_processing = flag;
+}
+
+bool
+get_flush_denormals(
+  jack_mixer_t mixer)
+{
+  return __atomic_load_n(&mixer_ctx_ptr->flush_denormals, __ATOMIC_RELAXED);
+}
+
+void
+set_flush_denormals(
+  jack_mixer_t mixer,
+  bool flag)
+{
+  __atomic_store_n(&mixer_ctx_ptr->flush_denormals, flag, __ATOMIC_RELAXED);
+}
+
+unsigned int
+get_denormal_cycles_count(
+  jack_mixer_t mixer)
+{
+  return __atomic_load_n(&mixer_ctx_ptr->denormal_cycles, __ATOMIC_RELAXED);
+}
+
+unsigned int
+get_midi_split_frames(
+  jack_mixer_t mixer)
+{
+  return __atomic_load_n(&mixer_ctx_ptr->midi_split_frames, __ATOMIC_RELAXED);
+}
+
+void
+set_midi_split_frames(
+  jack_mixer_t mixer,
+  unsigned int frames)
+{
+  __atomic_store_n(&mixer_ctx_ptr->midi_split_frames, frames, __ATOMIC_RELAXED);
+}
+
+unsigned int
+get_worker_threads(
+  jack_mixer_t mixer)
+{
+  struct pool *pool_ptr = mixer_ctx_ptr->pool;
+
+  return pool_ptr != NULL ? pool_get_threads_count(pool_ptr) : 0;
+}
+
+int
+set_worker_threads(
+  jack_mixer_t mixer,
+  unsigned int count)
+{
+  struct pool *pool_ptr = NULL;
+  struct pool *old_pool_ptr;
+
+  if (count > MAX_WORKER_THREADS)
+  {
+    _jack_mixer_error = JACK_MIXER_ERROR_WORKER_THREADS;
+    return -1;
+  }
+
+  if (count > 0)
+  {
+    pool_ptr = pool_create(mixer_ctx_ptr->backend, count);
+    if (pool_ptr == NULL)
+    {
+      _jack_mixer_error = JACK_MIXER_ERROR_WORKER_THREADS;
+      return -1;
+    }
+  }
+
+  pthread_mutex_lock(&mixer_ctx_ptr->mutex);
+  old_pool_ptr = mixer_ctx_ptr->pool;
+  __atomic_store_n(&mixer_ctx_ptr->pool, pool_ptr, __ATOMIC_RELEASE);
+  if (old_pool_ptr != NULL)
+  {
+    retire(mixer_ctx_ptr, old_pool_ptr, pool_destroy);
+  }
+  pthread_mutex_unlock(&mixer_ctx_ptr->mutex);
+
+  return 0;
+}
+
+int8_t
+get_last_midi_cc(
+  jack_mixer_t mixer)
+{
+  return mixer_ctx_ptr->last_midi_cc;
+}
+
+void
+set_last_midi_cc(
+  jack_mixer_t mixer,
+  int8_t new_cc) {
+  mixer_ctx_ptr->last_midi_cc = new_cc;
+}
+
+int
+get_midi_behavior_mode(
+  jack_mixer_t mixer)
+{
+  return mixer_ctx_ptr->midi_behavior;
+}
+
+void
+set_midi_behavior_mode(
+  jack_mixer_t mixer,
+  enum midi_behavior_mode mode)
+{
+  mixer_ctx_ptr->midi_behavior = mode;
+}
+
+unsigned int
+get_meter_slots_count(
+  jack_mixer_t mixer)
+{
+  return mixer_ctx_ptr->meters->count;
+}
+
+unsigned int
+read_meters(
+  jack_mixer_t mixer,
+  struct meter_values * values,
+  unsigned int count)
+{
+  /* Only replaced by this thread, so it can't be freed while copying */
+  struct meters *meters_ptr = mixer_ctx_ptr->meters;
+  float *value_ptr;
+  float *end_ptr;
+  unsigned int seq;
+  GSList *node_ptr;
+
+  count = MIN(count, meters_ptr->count);
+
+  do
+  {
+    while ((seq = __atomic_load_n(&meters_ptr->seq, __ATOMIC_ACQUIRE)) & 1)
+    {
+      sched_yield();
+    }
+
+    memcpy(values, meters_ptr->values, count * sizeof(struct meter_values));
+
+    __atomic_thread_fence(__ATOMIC_ACQUIRE);
+  }
+  while (__atomic_load_n(&meters_ptr->seq, __ATOMIC_RELAXED) != seq);
+
+  /* struct meter_values only contains floats */
+  end_ptr = (float *)(values + count);
+  for (value_ptr = (float *)values; value_ptr < end_ptr; value_ptr++)
+  {
+    *value_ptr = value_to_db(*value_ptr);
+  }
+
+  /* Start new RMS periods, as reading kmeters of single channels does */
+  for (node_ptr = mixer_ctx_ptr->input_channels_list; node_ptr; node_ptr = g_slist_next(node_ptr))
+  {
+    channel_stereo_kmeter_reset(node_ptr->data);
+  }
+  for (node_ptr = mixer_ctx_ptr->output_channels_list; node_ptr; node_ptr = g_slist_next(node_ptr))
+  {
+    channel_stereo_kmeter_reset(node_ptr->data);
+  }
+
+  return count;
+}
+
+int
+get_midi_change_fd(
+  jack_mixer_t mixer)
+{
+  return mixer_ctx_ptr->midi_change_pipe[0];
+}
+
+bool
+get_process_stats(
+  jack_mixer_t mixer,
+  struct process_stats * stats_ptr)
+{
+  return timing_read(&mixer_ctx_ptr->timing, backend_get_sample_rate(mixer_ctx_ptr->backend), stats_ptr);
+}
+
+unsigned int
+get_xruns_count(
+  jack_mixer_t mixer)
+{
+  return __atomic_load_n(&mixer_ctx_ptr->xruns, __ATOMIC_RELAXED);
+}
+
+/* Bytes used by the channel arrays, routings and partial sums of a snapshot and its scenes */
+static size_t
+get_topology_size(
+  struct snapshot *snapshot_ptr)
+{
+  size_t size;
+  unsigned int i;
+
+  size = snapshot_size(snapshot_ptr->input_channels_count, snapshot_ptr->output_channels_count);
+  for (i = 0; i < snapshot_ptr->output_channels_count; i++)
+  {
+    size += sizeof(struct routing) + snapshot_ptr->routings[i]->count * sizeof(struct send);
+  }
+  for (i = 0; i < snapshot_ptr->partial_sums_count; i++)
+  {
+    size += sizeof(struct partial_sum *) + sizeof(struct partial_sum) +
+      snapshot_ptr->partial_sums[i]->count * sizeof(struct send);
+  }
+
+  if (snapshot_ptr->scenes != NULL)
+  {
+    size += SCENES_COUNT * sizeof(struct snapshot *);
+    for (i = 0; i < SCENES_COUNT; i++)
+    {
+      if (snapshot_ptr->scenes[i] != NULL)
+      {
+        size += get_topology_size(snapshot_ptr->scenes[i]);
+      }
+    }
+  }
+
+  return size;
+}
+
+void
+get_memory_usage(
+  jack_mixer_t mixer,
+  struct memory_usage * usage_ptr)
+{
+  struct snapshot *snapshot_ptr;
+
+  pthread_mutex_lock(&mixer_ctx_ptr->mutex);
+  snapshot_ptr = mixer_ctx_ptr->snapshot;
+
+  usage_ptr->scratch = snapshot_ptr->scratch_size;
+  usage_ptr->topology = get_topology_size(snapshot_ptr);
+  usage_ptr->channels = snapshot_ptr->input_channels_count * sizeof(struct channel) +
+    snapshot_ptr->output_channels_count * sizeof(struct output_channel) +
+    mixer_ctx_ptr->state_blocks_count * CHANNEL_STATE_BLOCK_SIZE * sizeof(struct channel_state);
+  usage_ptr->meters = sizeof(struct meters) + mixer_ctx_ptr->meters->count * sizeof(struct meter_values);
+
+  pthread_mutex_unlock(&mixer_ctx_ptr->mutex);
+
+  usage_ptr->total = usage_ptr->scratch + usage_ptr->topology + usage_ptr->channels + usage_ptr->meters;
+}
+
+/* Free the routing stored in a scene for an output channel */
+static void
+free_scene_routing(
+  struct scene_routing *routing_ptr)
+{
+  g_slist_free(routing_ptr->soloed_channels);
+  g_slist_free(routing_ptr->muted_channels);
+  g_slist_free(routing_ptr->prefader_channels);
+  routing_ptr->soloed_channels = NULL;
+  routing_ptr->muted_channels = NULL;
+  routing_ptr->prefader_channels = NULL;
+}
+
+/*
+ * Restore the solo/mute/prefader routing of the output channels stored in
+ * a scene and publish it to the process thread
+ */
+static int
+apply_scene_routing(
+  struct jack_mixer *mixer_ptr,
+  unsigned int scene)
+{
+  struct output_channel *output_channel_ptr;
+  struct scene_routing *routing_ptr;
+  GSList *node_ptr;
+
+  for (node_ptr = mixer_ptr->output_channels_list; node_ptr; node_ptr = g_slist_next(node_ptr))
+  {
+    output_channel_ptr = node_ptr->data;
+    if (!output_channel_ptr->channel.scenes[scene].stored)
+    {
+      continue;
+    }
+
+    routing_ptr = &output_channel_ptr->scenes[scene];
+    g_slist_free(output_channel_ptr->soloed_channels);
+    g_slist_free(output_channel_ptr->muted_channels);
+    g_slist_free(output_channel_ptr->prefader_channels);
+    output_channel_ptr->soloed_channels = g_slist_copy(routing_ptr->soloed_channels);
+    output_channel_ptr->muted_channels = g_slist_copy(routing_ptr->muted_channels);
+    output_channel_ptr->prefader_channels = g_slist_copy(routing_ptr->prefader_channels);
+    output_channel_ptr->prefader = routing_ptr->prefader;
+  }
+
+  return update_snapshot(mixer_ptr);
+}
+
+void
+dispatch_midi_changes(
+  jack_mixer_t mixer)
+{
+  struct channel *channel_ptr;
+  char buffer[16];
+  uint64_t scene_routing;
+  bool recalled;
+  GSList *node_ptr;
+
+  /* Changes posted from now on need a new wake up */
+  __atomic_store_n(&mixer_ctx_ptr->midi_change_signalled, false, __ATOMIC_RELEASE);
+  while (read(mixer_ctx_ptr->midi_change_pipe[0], buffer, sizeof(buffer)) > 0);
+
+  /* The process thread uses the routing of a scene recalled via MIDI until
+   * it is published with the routing of the output channels */
+  scene_routing = __atomic_exchange_n(&mixer_ctx_ptr->scene_routing, 0, __ATOMIC_ACQ_REL);
+  if (scene_routing != 0)
+  {
+    mixer_ctx_ptr->routing_recalls = (unsigned int)(scene_routing >> 32);
+    apply_scene_routing(mixer_ctx_ptr, (unsigned int)(scene_routing & 0xFFFFFFFF) - 1);
+  }
+
+  /* A recalled scene may have changed any channel, so all callbacks are run below */
+  recalled = __atomic_exchange_n(&mixer_ctx_ptr->scene_recalled, false, __ATOMIC_ACQ_REL);
+
+  while (jack_ringbuffer_read_space(mixer_ctx_ptr->midi_changes) >= sizeof(channel_ptr))
+  {
+    jack_ringbuffer_read(mixer_ctx_ptr->midi_changes, (char *)&channel_ptr, sizeof(channel_ptr));
+
+    /* The channel may have been removed after the change was posted */
+    if (g_slist_find(mixer_ctx_ptr->input_channels_list, channel_ptr) == NULL &&
+        g_slist_find(mixer_ctx_ptr->output_channels_list, channel_ptr) == NULL)
+    {
+      continue;
+    }
+
+    __atomic_store_n(&channel_ptr->midi_change_queued, false, __ATOMIC_RELEASE);
+
+    if (channel_ptr->midi_change_callback && !recalled)
+    {
+      channel_ptr->midi_change_callback(channel_ptr->midi_change_callback_data);
+    }
+  }
+
+  if (!recalled)
+  {
+    return;
+  }
+
+  for (node_ptr = mixer_ctx_ptr->input_channels_list; node_ptr; node_ptr = g_slist_next(node_ptr))
+  {
+    channel_ptr = node_ptr->data;
+    if (channel_ptr->midi_change_callback)
+    {
+      channel_ptr->midi_change_callback(channel_ptr->midi_change_callback_data);
+    }
+  }
+
+  for (node_ptr = mixer_ctx_ptr->output_channels_list; node_ptr; node_ptr = g_slist_next(node_ptr))
+  {
+    channel_ptr = node_ptr->data;
+    if (channel_ptr->midi_change_callback)
+    {
+      channel_ptr->midi_change_callback(channel_ptr->midi_change_callback_data);
+    }
+  }
+}
+
+/*
+ * Add channel to or remove it from a routing list of an output channel,
+ * returns true if the list changed
+ */
+static bool
+update_routing_list(
+  GSList **list_ptr,
+  jack_mixer_channel_t channel,
+  bool value)
+{
+  if (value) {
+    if (g_slist_find(*list_ptr, channel) != NULL)
+      return false;
+    *list_ptr = g_slist_prepend(*list_ptr, channel);
+  }
+  else {
+    if (g_slist_find(*list_ptr, channel) == NULL)
+      return false;
+    *list_ptr = g_slist_remove(*list_ptr, channel);
+  }
+
+  return true;
+}
+
+int
+apply_changes(
+  jack_mixer_t mixer,
+  const struct channel_change * changes_ptr,
+  unsigned int count)
+{
+  struct change_batch *batch_ptr;
+  struct output_channel *output_channel_ptr;
+  bool routing = false;
+  unsigned int i;
+
+  batch_ptr = malloc(sizeof(struct change_batch) + count * sizeof(struct channel_change));
+  if (batch_ptr == NULL)
+  {
+    _jack_mixer_error = JACK_MIXER_ERROR_CHANGES_MALLOC;
+    return -1;
+  }
+  batch_ptr->count = 0;
+
+  for (i = 0; i < count; i++)
+  {
+    output_channel_ptr = changes_ptr[i].channel;
+    switch (changes_ptr[i].parameter)
+    {
+    case Parameter_Send_Mute:
+      routing |= update_routing_list(&output_channel_ptr->muted_channels,
+                                     changes_ptr[i].input_channel, changes_ptr[i].value != 0);
+      break;
+    case Parameter_Send_Solo:
+      routing |= update_routing_list(&output_channel_ptr->soloed_channels,
+                                     changes_ptr[i].input_channel, changes_ptr[i].value != 0);
+      break;
+    case Parameter_Send_Prefader:
+      routing |= update_routing_list(&output_channel_ptr->prefader_channels,
+                                     changes_ptr[i].input_channel, changes_ptr[i].value != 0);
+      break;
+    default:
+      batch_ptr->changes[batch_ptr->count++] = changes_ptr[i];
+      break;
+    }
+  }
+
+  /* Published before the batch, so the process thread applies both in the same cycle */
+  if (routing)
+  {
+    update_snapshot(mixer_ctx_ptr);
+  }
+
+  if (batch_ptr->count == 0)
+  {
+    free(batch_ptr);
+    return 0;
+  }
+
+  batch_ptr->next = __atomic_load_n(&mixer_ctx_ptr->change_batches, __ATOMIC_RELAXED);
+  while (!__atomic_compare_exchange_n(&mixer_ctx_ptr->change_batches,
+                                      &batch_ptr->next,
+                                      batch_ptr,
+                                      true,
+                                      __ATOMIC_RELEASE,
+                                      __ATOMIC_RELAXED));
+
+  /* The process thread takes the batch in the next cycle at the latest */
+  pthread_mutex_lock(&mixer_ctx_ptr->mutex);
+  retire(mixer_ctx_ptr, batch_ptr, free);
+  pthread_mutex_unlock(&mixer_ctx_ptr->mutex);
+
+  return 0;
+}
+
+/*
+ * Wait until process cycles which started before the call are over, like
+ * retire() does before freeing memory
+ *
+ * Offline cycles only run in the thread calling offline_process(). The
+ * process thread doesn't run at all once JACK stopped, so don't wait for
+ * more than a second.
+ */
+static void
+wait_for_process_cycles(
+  struct jack_mixer *mixer_ptr)
+{
+  unsigned int cycle;
+  unsigned int waited;
+
+  if (backend_is_offline(mixer_ptr->backend))
+  {
+    return;
+  }
+
+  cycle = __atomic_load_n(&mixer_ptr->cycle, __ATOMIC_ACQUIRE);
+  for (waited = 0; waited < 1000; waited++)
+  {
+    if (__atomic_load_n(&mixer_ptr->cycle, __ATOMIC_ACQUIRE) - cycle >= 2)
+    {
+      return;
+    }
+
+    usleep(1000);
   }
+}
 
-  LOG_DEBUG("JACK client created.");
-  LOG_DEBUG("Sample rate: %u", jack_get_sample_rate(mixer_ptr->jack_client));
+/* Store the volume, balance, mute and solo of a channel in a scene */
+static void
+store_scene_values(
+  struct channel *channel_ptr,
+  struct scene_values *values_ptr)
+{
+  values_ptr->volume = channel_ptr->state->volume_new;
+  values_ptr->balance = channel_ptr->state->balance_new;
+  values_ptr->out_mute = channel_ptr->state->out_mute;
+  values_ptr->solo = __atomic_load_n(&channel_ptr->state->solo, __ATOMIC_RELAXED);
+  values_ptr->stored = true;
+}
 
+int
+store_scene(
+  jack_mixer_t mixer,
+  int scene)
+{
+  struct channel *channel_ptr;
+  struct output_channel *output_channel_ptr;
+  struct scene_routing *routing_ptr;
+  GSList *node_ptr;
 
-#if defined(HAVE_JACK_MIDI)
-  mixer_ptr->port_midi_in = jack_port_register(mixer_ptr->jack_client, "midi in",
-                                               JACK_DEFAULT_MIDI_TYPE, JackPortIsInput, 0);
-  if (mixer_ptr->port_midi_in == NULL)
+  if (scene < 0 || scene >= SCENES_COUNT)
   {
-    _jack_mixer_error = JACK_MIXER_ERROR_JACK_MIDI_IN_CREATE;
-    goto close_jack;
+    _jack_mixer_error = JACK_MIXER_ERROR_INVALID_SCENE;
+    return -1;
   }
 
-  mixer_ptr->port_midi_out = jack_port_register(mixer_ptr->jack_client, "midi out",
-                                                JACK_DEFAULT_MIDI_TYPE, JackPortIsOutput, 0);
-  if (mixer_ptr->port_midi_out == NULL)
+  /* The process thread may be applying the values being overwritten, and
+   * its snapshot of the scene has the old routing */
+  if (__atomic_load_n(&mixer_ctx_ptr->scene_stored[scene], __ATOMIC_ACQUIRE))
   {
-    _jack_mixer_error = JACK_MIXER_ERROR_JACK_MIDI_OUT_CREATE;
-    goto close_jack;
+    __atomic_store_n(&mixer_ctx_ptr->scene_stored[scene], false, __ATOMIC_RELEASE);
+    update_snapshot(mixer_ctx_ptr);
+    wait_for_process_cycles(mixer_ctx_ptr);
   }
 
-#endif
-
-  ret = jack_set_process_callback(mixer_ptr->jack_client, process, mixer_ptr);
-  if (ret != 0)
+  for (node_ptr = mixer_ctx_ptr->input_channels_list; node_ptr; node_ptr = g_slist_next(node_ptr))
   {
-    _jack_mixer_error = JACK_MIXER_ERROR_JACK_SET_PROCESS_CALLBACK;
-    goto close_jack;
+    channel_ptr = node_ptr->data;
+    store_scene_values(channel_ptr, &channel_ptr->scenes[scene]);
   }
 
-  ret = jack_set_buffer_size_callback(mixer_ptr->jack_client, jack_buffer_size_cb, mixer_ptr);
-  if (ret != 0)
+  for (node_ptr = mixer_ctx_ptr->output_channels_list; node_ptr; node_ptr = g_slist_next(node_ptr))
   {
-    _jack_mixer_error = JACK_MIXER_ERROR_JACK_SET_BUFFER_SIZE_CALLBACK;
-    goto close_jack;
+    output_channel_ptr = node_ptr->data;
+    if (output_channel_ptr->system)
+    {
+      continue;
+    }
+
+    store_scene_values(&output_channel_ptr->channel, &output_channel_ptr->channel.scenes[scene]);
+
+    routing_ptr = &output_channel_ptr->scenes[scene];
+    free_scene_routing(routing_ptr);
+    routing_ptr->soloed_channels = g_slist_copy(output_channel_ptr->soloed_channels);
+    routing_ptr->muted_channels = g_slist_copy(output_channel_ptr->muted_channels);
+    routing_ptr->prefader_channels = g_slist_copy(output_channel_ptr->prefader_channels);
+    routing_ptr->prefader = output_channel_ptr->prefader;
   }
 
-  ret = jack_activate(mixer_ptr->jack_client);
-  if (ret != 0)
+  /* The scene can't be recalled via MIDI until its snapshot is published */
+  __atomic_store_n(&mixer_ctx_ptr->scene_stored[scene], true, __ATOMIC_RELEASE);
+  if (update_snapshot(mixer_ctx_ptr) != 0)
   {
-    _jack_mixer_error = JACK_MIXER_ERROR_JACK_ACTIVATE;
-    goto close_jack;
+    __atomic_store_n(&mixer_ctx_ptr->scene_stored[scene], false, __ATOMIC_RELEASE);
+    _jack_mixer_error = JACK_MIXER_ERROR_SCENE_MALLOC;
+    return -1;
   }
 
-  return mixer_ptr;
+  return 0;
+}
 
-close_jack:
-  /* this should clear all other resources we obtained through the client handle */
-  jack_client_close(mixer_ptr->jack_client);
+int
+recall_scene(
+  jack_mixer_t mixer,
+  int scene,
+  double crossfade)
+{
+  unsigned int steps;
 
-exit_destroy_mutex:
-  pthread_mutex_destroy(&mixer_ptr->mutex);
+  if (!is_scene_stored(mixer, scene))
+  {
+    _jack_mixer_error = JACK_MIXER_ERROR_INVALID_SCENE;
+    return -1;
+  }
 
-exit_free:
-  free(mixer_ptr);
+  steps = MAX(crossfade, 0) * backend_get_sample_rate(mixer_ctx_ptr->backend) + 1;
 
-exit:
-  return NULL;
-}
+  /* Published before the recall, so the process thread applies both in the same cycle */
+  apply_scene_routing(mixer_ctx_ptr, scene);
 
-#define mixer_ctx_ptr ((struct jack_mixer *)mixer)
+  __atomic_store_n(&mixer_ctx_ptr->current_scene, scene, __ATOMIC_RELAXED);
+  __atomic_store_n(&mixer_ctx_ptr->scene_recall, ((uint64_t)steps << 32) | (unsigned int)(scene + 1),
+                   __ATOMIC_RELEASE);
+  return 0;
+}
 
-void
-destroy(
-  jack_mixer_t mixer)
+int
+clear_scene(
+  jack_mixer_t mixer,
+  int scene)
 {
-  LOG_DEBUG("Uninitializing JACK.");
-  assert(mixer_ctx_ptr->jack_client != NULL);
-  jack_client_close(mixer_ctx_ptr->jack_client);
-  pthread_mutex_destroy(&mixer_ctx_ptr->mutex);
-  free(mixer_ctx_ptr);
-}
+  struct output_channel *output_channel_ptr;
+  GSList *node_ptr;
 
+  if (scene < 0 || scene >= SCENES_COUNT)
+  {
+    _jack_mixer_error = JACK_MIXER_ERROR_INVALID_SCENE;
+    return -1;
+  }
 
-unsigned int
-get_channels_count(
-  jack_mixer_t mixer)
-{
-  return g_slist_length(mixer_ctx_ptr->input_channels_list);
-}
+  /* The values of channels are overwritten when the scene is stored again */
+  __atomic_store_n(&mixer_ctx_ptr->scene_stored[scene], false, __ATOMIC_RELEASE);
 
-const char*
-get_client_name(
-  jack_mixer_t mixer)
-{
-  return jack_get_client_name(mixer_ctx_ptr->jack_client);
-}
+  for (node_ptr = mixer_ctx_ptr->output_channels_list; node_ptr; node_ptr = g_slist_next(node_ptr))
+  {
+    output_channel_ptr = node_ptr->data;
+    free_scene_routing(&output_channel_ptr->scenes[scene]);
+  }
 
-bool
-get_kmetering(
-  jack_mixer_t mixer)
-{
-  return mixer_ctx_ptr->kmetering;
+  /* Drop the snapshot of the scene */
+  update_snapshot(mixer_ctx_ptr);
+
+  return 0;
 }
 
-void
-set_kmetering(
+bool
+is_scene_stored(
   jack_mixer_t mixer,
-  bool flag)
+  int scene)
 {
-  mixer_ctx_ptr->kmetering = flag;
+  return scene >= 0 && scene < SCENES_COUNT &&
+    __atomic_load_n(&mixer_ctx_ptr->scene_stored[scene], __ATOMIC_ACQUIRE);
 }
 
-int8_t
-get_last_midi_cc(
+int
+get_current_scene(
   jack_mixer_t mixer)
 {
-  return mixer_ctx_ptr->last_midi_cc;
-}
-
-void
-set_last_midi_cc(
-  jack_mixer_t mixer,
-  int8_t new_cc) {
-  mixer_ctx_ptr->last_midi_cc = new_cc;
+  return __atomic_load_n(&mixer_ctx_ptr->current_scene, __ATOMIC_RELAXED);
 }
 
-int
-get_midi_behavior_mode(
+double
+get_scene_crossfade(
   jack_mixer_t mixer)
 {
-  return mixer_ctx_ptr->midi_behavior;
+  unsigned int steps = __atomic_load_n(&mixer_ctx_ptr->scene_crossfade_steps, __ATOMIC_RELAXED);
+
+  return (double)(steps - 1) / backend_get_sample_rate(mixer_ctx_ptr->backend);
 }
 
 void
-set_midi_behavior_mode(
+set_scene_crossfade(
   jack_mixer_t mixer,
-  enum midi_behavior_mode mode)
+  double crossfade)
 {
-  mixer_ctx_ptr->midi_behavior = mode;
+  unsigned int steps = MAX(crossfade, 0) * backend_get_sample_rate(mixer_ctx_ptr->backend) + 1;
+
+  __atomic_store_n(&mixer_ctx_ptr->scene_crossfade_steps, steps, __ATOMIC_RELAXED);
 }
 
 jack_mixer_channel_t
@@ -1980,6 +5357,12 @@ add_channel(
 
   channel_ptr->mixer_ptr = mixer_ctx_ptr;
 
+  if (alloc_channel_slot(mixer_ctx_ptr, channel_ptr) != 0)
+  {
+    _jack_mixer_error = JACK_MIXER_ERROR_CHANNEL_MALLOC;
+    goto fail_free_channel;
+  }
+
   channel_ptr->name = strdup(channel_name);
   if (channel_ptr->name == NULL)
   {
@@ -2003,9 +5386,9 @@ add_channel(
     port_name[channel_name_size+1] = 'L';
     port_name[channel_name_size+2] = 0;
 
-    channel_ptr->port_left = jack_port_register(channel_ptr->mixer_ptr->jack_client, port_name,
-                                                JACK_DEFAULT_AUDIO_TYPE, JackPortIsInput, 0);
-    if (channel_ptr->port_left == NULL)
+    channel_ptr->state->port_left = backend_port_register(channel_ptr->mixer_ptr->backend, port_name,
+                                                   JACK_DEFAULT_AUDIO_TYPE, JackPortIsInput);
+    if (channel_ptr->state->port_left == NULL)
     {
       _jack_mixer_error = JACK_MIXER_ERROR_PORT_REGISTER_LEFT;
       goto fail_free_port_name;
@@ -2013,9 +5396,9 @@ add_channel(
 
     port_name[channel_name_size+1] = 'R';
 
-    channel_ptr->port_right = jack_port_register(channel_ptr->mixer_ptr->jack_client, port_name,
-                                                 JACK_DEFAULT_AUDIO_TYPE, JackPortIsInput, 0);
-    if (channel_ptr->port_right == NULL)
+    channel_ptr->state->port_right = backend_port_register(channel_ptr->mixer_ptr->backend, port_name,
+                                                    JACK_DEFAULT_AUDIO_TYPE, JackPortIsInput);
+    if (channel_ptr->state->port_right == NULL)
     {
       _jack_mixer_error = JACK_MIXER_ERROR_PORT_REGISTER_RIGHT;
       goto fail_unregister_left_channel;
@@ -2023,47 +5406,53 @@ add_channel(
   }
   else
   {
-    channel_ptr->port_left = jack_port_register(channel_ptr->mixer_ptr->jack_client, channel_name,
-                                                JACK_DEFAULT_AUDIO_TYPE, JackPortIsInput, 0);
-    if (channel_ptr->port_left == NULL)
+    channel_ptr->state->port_left = backend_port_register(channel_ptr->mixer_ptr->backend, channel_name,
+                                                   JACK_DEFAULT_AUDIO_TYPE, JackPortIsInput);
+    if (channel_ptr->state->port_left == NULL)
     {
       _jack_mixer_error = JACK_MIXER_ERROR_PORT_REGISTER;
       goto fail_free_channel_name;
     }
   }
 
-  channel_ptr->stereo = stereo;
+  channel_ptr->state->stereo = stereo;
 
-  int sr = jack_get_sample_rate(channel_ptr->mixer_ptr->jack_client);
-  int fsize = jack_get_buffer_size(channel_ptr->mixer_ptr->jack_client);
+  int sr = backend_get_sample_rate(channel_ptr->mixer_ptr->backend);
+  int fsize = backend_get_buffer_size(channel_ptr->mixer_ptr->backend);
 
   channel_ptr->volume_transition_seconds = VOLUME_TRANSITION_SECONDS;
   channel_ptr->num_volume_transition_steps = channel_ptr->volume_transition_seconds * sr + 1;
-  channel_ptr->volume = 0.0;
-  channel_ptr->volume_new = 0.0;
-  channel_ptr->balance = 0.0;
-  channel_ptr->balance_new = 0.0;
-  channel_ptr->meter_left_prefader = channel_ptr->meter_left_postfader = -1.0;
-  channel_ptr->meter_right_prefader = channel_ptr->meter_right_postfader = -1.0;
-  channel_ptr->abspeak_postfader = 0.0;
-  channel_ptr->abspeak_prefader = 0.0;
-  channel_ptr->out_mute = false;
-
-  kmeter_init(&channel_ptr->kmeter_left, fsize, sr);
-  kmeter_init(&channel_ptr->kmeter_right, fsize, sr);
-  kmeter_init(&channel_ptr->kmeter_prefader_left, fsize, sr);
-  kmeter_init(&channel_ptr->kmeter_prefader_right, fsize, sr);
-
-  channel_ptr->peak_left_prefader = channel_ptr->peak_left_postfader = 0.0;
-  channel_ptr->peak_right_prefader = channel_ptr->peak_right_postfader = 0.0;
-  channel_ptr->peak_frames = 0;
-
-  channel_ptr->frames_left = calloc(MAX_BLOCK_SIZE, sizeof(jack_default_audio_sample_t));
-  channel_ptr->frames_right = calloc(MAX_BLOCK_SIZE, sizeof(jack_default_audio_sample_t));
-  channel_ptr->prefader_frames_left = calloc(MAX_BLOCK_SIZE, sizeof(jack_default_audio_sample_t));
-  channel_ptr->prefader_frames_right = calloc(MAX_BLOCK_SIZE, sizeof(jack_default_audio_sample_t));
-
-  channel_ptr->NaN_detected = false;
+  ramp_init(&channel_ptr->state->volume, 0.0);
+  channel_ptr->state->volume_new = 0.0;
+  ramp_init(&channel_ptr->state->balance, 0.0);
+  channel_ptr->state->balance_new = 0.0;
+  channel_ptr->state->meter_left_prefader = channel_ptr->state->meter_left_postfader = -1.0;
+  channel_ptr->state->meter_right_prefader = channel_ptr->state->meter_right_postfader = -1.0;
+  channel_ptr->state->abspeak_postfader = 0.0;
+  channel_ptr->state->abspeak_prefader = 0.0;
+  channel_ptr->state->out_mute = false;
+  channel_ptr->state->solo = false;
+
+  kmeter_init(&channel_ptr->state->kmeter_left, fsize, sr);
+  kmeter_init(&channel_ptr->state->kmeter_right, fsize, sr);
+  kmeter_init(&channel_ptr->state->kmeter_prefader_left, fsize, sr);
+  kmeter_init(&channel_ptr->state->kmeter_prefader_right, fsize, sr);
+
+  channel_ptr->state->peak_left_prefader = channel_ptr->state->peak_left_postfader = 0.0;
+  channel_ptr->state->peak_right_prefader = channel_ptr->state->peak_right_postfader = 0.0;
+  channel_ptr->state->peak_frames = 0;
+
+  /* Scratch buffers are set by the process thread, see bind_scratch() */
+  channel_ptr->state->tmp_mixed_frames_left = NULL;
+  channel_ptr->state->tmp_mixed_frames_right = NULL;
+  channel_ptr->state->frames_left = NULL;
+  channel_ptr->state->frames_right = NULL;
+  channel_ptr->state->prefader_frames_left = NULL;
+  channel_ptr->state->prefader_frames_right = NULL;
+
+  channel_ptr->state->NaN_detected = false;
+  channel_ptr->state->idle = false;
+  channel_ptr->state->zero_frames = 0;
 
   channel_ptr->midi_cc_volume_index = -1;
   channel_ptr->midi_cc_balance_index = -1;
@@ -2074,18 +5463,36 @@ add_channel(
 
   channel_ptr->midi_change_callback = NULL;
   channel_ptr->midi_change_callback_data = NULL;
+  channel_ptr->midi_change_queued = false;
   channel_ptr->midi_out_has_events = 0;
+  channel_ptr->midi_out_next = NULL;
 
   channel_ptr->midi_scale = NULL;
 
+  memset(channel_ptr->scenes, 0, sizeof(channel_ptr->scenes));
+
   channel_ptr->mixer_ptr->input_channels_list = g_slist_prepend(
                   channel_ptr->mixer_ptr->input_channels_list, channel_ptr);
 
+  if (update_snapshot(channel_ptr->mixer_ptr) != 0)
+  {
+    _jack_mixer_error = JACK_MIXER_ERROR_CHANNEL_MALLOC;
+    goto fail_remove_channel;
+  }
+
   free(port_name);
   return channel_ptr;
 
+fail_remove_channel:
+  channel_ptr->mixer_ptr->input_channels_list = g_slist_remove(
+                  channel_ptr->mixer_ptr->input_channels_list, channel_ptr);
+  if (stereo)
+  {
+    backend_port_unregister(channel_ptr->mixer_ptr->backend, channel_ptr->state->port_right);
+  }
+
 fail_unregister_left_channel:
-  jack_port_unregister(channel_ptr->mixer_ptr->jack_client, channel_ptr->port_left);
+  backend_port_unregister(channel_ptr->mixer_ptr->backend, channel_ptr->state->port_left);
 
 fail_free_port_name:
   free(port_name);
@@ -2123,6 +5530,12 @@ create_output_channel(
 
   channel_ptr->mixer_ptr = mixer_ctx_ptr;
 
+  if (alloc_channel_slot(mixer_ctx_ptr, channel_ptr) != 0)
+  {
+    _jack_mixer_error = JACK_MIXER_ERROR_CHANNEL_MALLOC;
+    goto fail_free_channel;
+  }
+
   channel_ptr->name = strdup(channel_name);
   if (channel_ptr->name == NULL)
   {
@@ -2146,9 +5559,9 @@ create_output_channel(
     port_name[channel_name_size+1] = 'L';
     port_name[channel_name_size+2] = 0;
 
-    channel_ptr->port_left = jack_port_register(channel_ptr->mixer_ptr->jack_client, port_name,
-                                                JACK_DEFAULT_AUDIO_TYPE, JackPortIsOutput, 0);
-    if (channel_ptr->port_left == NULL)
+    channel_ptr->state->port_left = backend_port_register(channel_ptr->mixer_ptr->backend, port_name,
+                                                   JACK_DEFAULT_AUDIO_TYPE, JackPortIsOutput);
+    if (channel_ptr->state->port_left == NULL)
     {
       _jack_mixer_error = JACK_MIXER_ERROR_PORT_REGISTER_LEFT;
       goto fail_free_port_name;
@@ -2156,9 +5569,9 @@ create_output_channel(
 
     port_name[channel_name_size+1] = 'R';
 
-    channel_ptr->port_right = jack_port_register(channel_ptr->mixer_ptr->jack_client, port_name,
-                                                 JACK_DEFAULT_AUDIO_TYPE, JackPortIsOutput, 0);
-    if (channel_ptr->port_right == NULL)
+    channel_ptr->state->port_right = backend_port_register(channel_ptr->mixer_ptr->backend, port_name,
+                                                    JACK_DEFAULT_AUDIO_TYPE, JackPortIsOutput);
+    if (channel_ptr->state->port_right == NULL)
     {
       _jack_mixer_error = JACK_MIXER_ERROR_PORT_REGISTER_RIGHT;
       goto fail_unregister_left_channel;
@@ -2166,49 +5579,53 @@ create_output_channel(
   }
   else
   {
-    channel_ptr->port_left = jack_port_register(channel_ptr->mixer_ptr->jack_client, channel_name,
-                                                JACK_DEFAULT_AUDIO_TYPE, JackPortIsOutput, 0);
-    if (channel_ptr->port_left == NULL)
+    channel_ptr->state->port_left = backend_port_register(channel_ptr->mixer_ptr->backend, channel_name,
+                                                   JACK_DEFAULT_AUDIO_TYPE, JackPortIsOutput);
+    if (channel_ptr->state->port_left == NULL)
     {
       _jack_mixer_error = JACK_MIXER_ERROR_PORT_REGISTER;
       goto fail_free_channel_name;
     }
   }
 
-  channel_ptr->stereo = stereo;
-  channel_ptr->out_mute = false;
+  channel_ptr->state->stereo = stereo;
+  channel_ptr->state->out_mute = false;
+  channel_ptr->state->solo = false;
 
-  int sr = jack_get_sample_rate(channel_ptr->mixer_ptr->jack_client);
-  int fsize = jack_get_buffer_size(channel_ptr->mixer_ptr->jack_client);
+  int sr = backend_get_sample_rate(channel_ptr->mixer_ptr->backend);
+  int fsize = backend_get_buffer_size(channel_ptr->mixer_ptr->backend);
 
   channel_ptr->volume_transition_seconds = VOLUME_TRANSITION_SECONDS;
   channel_ptr->num_volume_transition_steps =
     channel_ptr->volume_transition_seconds * sr + 1;
-  channel_ptr->volume = 0.0;
-  channel_ptr->volume_new = 0.0;
-  channel_ptr->balance = 0.0;
-  channel_ptr->balance_new = 0.0;
-  channel_ptr->meter_left_prefader = channel_ptr->meter_left_postfader = -1.0;
-  channel_ptr->meter_right_prefader = channel_ptr->meter_right_postfader = -1.0;
-  channel_ptr->abspeak_postfader = 0.0;
-  channel_ptr->abspeak_prefader = 0.0;
-  kmeter_init(&channel_ptr->kmeter_left, fsize, sr);
-  kmeter_init(&channel_ptr->kmeter_right, fsize, sr);
-  kmeter_init(&channel_ptr->kmeter_prefader_left, fsize, sr);
-  kmeter_init(&channel_ptr->kmeter_prefader_right, fsize, sr);
-
-  channel_ptr->peak_left_prefader = channel_ptr->peak_left_postfader = 0.0;
-  channel_ptr->peak_right_prefader = channel_ptr->peak_right_postfader = 0.0;
-  channel_ptr->peak_frames = 0;
-
-  channel_ptr->tmp_mixed_frames_left = calloc(MAX_BLOCK_SIZE, sizeof(jack_default_audio_sample_t));
-  channel_ptr->tmp_mixed_frames_right = calloc(MAX_BLOCK_SIZE, sizeof(jack_default_audio_sample_t));
-  channel_ptr->frames_left = calloc(MAX_BLOCK_SIZE, sizeof(jack_default_audio_sample_t));
-  channel_ptr->frames_right = calloc(MAX_BLOCK_SIZE, sizeof(jack_default_audio_sample_t));
-  channel_ptr->prefader_frames_left = calloc(MAX_BLOCK_SIZE, sizeof(jack_default_audio_sample_t));
-  channel_ptr->prefader_frames_right = calloc(MAX_BLOCK_SIZE, sizeof(jack_default_audio_sample_t));
-
-  channel_ptr->NaN_detected = false;
+  ramp_init(&channel_ptr->state->volume, 0.0);
+  channel_ptr->state->volume_new = 0.0;
+  ramp_init(&channel_ptr->state->balance, 0.0);
+  channel_ptr->state->balance_new = 0.0;
+  channel_ptr->state->meter_left_prefader = channel_ptr->state->meter_left_postfader = -1.0;
+  channel_ptr->state->meter_right_prefader = channel_ptr->state->meter_right_postfader = -1.0;
+  channel_ptr->state->abspeak_postfader = 0.0;
+  channel_ptr->state->abspeak_prefader = 0.0;
+  kmeter_init(&channel_ptr->state->kmeter_left, fsize, sr);
+  kmeter_init(&channel_ptr->state->kmeter_right, fsize, sr);
+  kmeter_init(&channel_ptr->state->kmeter_prefader_left, fsize, sr);
+  kmeter_init(&channel_ptr->state->kmeter_prefader_right, fsize, sr);
+
+  channel_ptr->state->peak_left_prefader = channel_ptr->state->peak_left_postfader = 0.0;
+  channel_ptr->state->peak_right_prefader = channel_ptr->state->peak_right_postfader = 0.0;
+  channel_ptr->state->peak_frames = 0;
+
+  /* Scratch buffers are set by the process thread, see bind_scratch() */
+  channel_ptr->state->tmp_mixed_frames_left = NULL;
+  channel_ptr->state->tmp_mixed_frames_right = NULL;
+  channel_ptr->state->frames_left = NULL;
+  channel_ptr->state->frames_right = NULL;
+  channel_ptr->state->prefader_frames_left = NULL;
+  channel_ptr->state->prefader_frames_right = NULL;
+
+  channel_ptr->state->NaN_detected = false;
+  channel_ptr->state->idle = false;
+  channel_ptr->state->zero_frames = 0;
 
   channel_ptr->midi_cc_volume_index = -1;
   channel_ptr->midi_cc_balance_index = -1;
@@ -2219,20 +5636,30 @@ create_output_channel(
 
   channel_ptr->midi_change_callback = NULL;
   channel_ptr->midi_change_callback_data = NULL;
+  channel_ptr->midi_change_queued = false;
+  channel_ptr->midi_out_has_events = 0;
+  channel_ptr->midi_out_next = NULL;
 
   channel_ptr->midi_scale = NULL;
 
+  memset(channel_ptr->scenes, 0, sizeof(channel_ptr->scenes));
+
   output_channel_ptr->soloed_channels = NULL;
   output_channel_ptr->muted_channels = NULL;
   output_channel_ptr->prefader_channels = NULL;
+  memset(output_channel_ptr->scenes, 0, sizeof(output_channel_ptr->scenes));
+  output_channel_ptr->mix_minus_source = NULL;
+  output_channel_ptr->mix_minus_channel = NULL;
   output_channel_ptr->system = system;
   output_channel_ptr->prefader = false;
+  output_channel_ptr->mix_time_sum = 0;
+  output_channel_ptr->mix_time = 0;
 
   free(port_name);
   return output_channel_ptr;
 
 fail_unregister_left_channel:
-  jack_port_unregister(channel_ptr->mixer_ptr->jack_client, channel_ptr->port_left);
+  backend_port_unregister(channel_ptr->mixer_ptr->backend, channel_ptr->state->port_left);
 
 fail_free_port_name:
   free(port_name);
@@ -2267,6 +5694,20 @@ add_output_channel(
   ((struct jack_mixer*)mixer)->output_channels_list = g_slist_prepend(
                   ((struct jack_mixer*)mixer)->output_channels_list, channel_ptr);
 
+  if (update_snapshot(mixer) != 0)
+  {
+    _jack_mixer_error = JACK_MIXER_ERROR_CHANNEL_MALLOC;
+    ((struct jack_mixer*)mixer)->output_channels_list = g_slist_remove(
+                    ((struct jack_mixer*)mixer)->output_channels_list, channel_ptr);
+    backend_port_unregister(channel_ptr->mixer_ptr->backend, channel_ptr->state->port_left);
+    if (channel_ptr->state->stereo)
+    {
+      backend_port_unregister(channel_ptr->mixer_ptr->backend, channel_ptr->state->port_right);
+    }
+    free_channel(output_channel_ptr);
+    return NULL;
+  }
+
   return output_channel_ptr;
 }
 
@@ -2274,11 +5715,10 @@ void
 remove_channels(
   jack_mixer_t mixer)
 {
-  GSList *list_ptr;
-  for (list_ptr = mixer_ctx_ptr->input_channels_list; list_ptr; list_ptr = g_slist_next(list_ptr))
+  /* remove_channel() unlinks the channel from the list */
+  while (mixer_ctx_ptr->input_channels_list)
   {
-    struct channel *input_channel_ptr = list_ptr->data;
-    remove_channel((jack_mixer_channel_t)input_channel_ptr);
+    remove_channel((jack_mixer_channel_t)mixer_ctx_ptr->input_channels_list->data);
   }
 }
 
@@ -2294,6 +5734,7 @@ kmeter_init(
   km->_z2 = 0;
   km->_rms = 0;
   km->_dpk = 0;
+  km->_pk = 0;
   km->_cnt = 0;
   km->_flag = false;
 
@@ -2311,11 +5752,6 @@ kmeter_process(
   int i;
   jack_default_audio_sample_t s, t, z1, z2;
 
-  if (km->_flag) {
-    km->_rms = 0;
-    km->_flag = 0;
-  }
-
   z1 = km->_z1;
   z2 = km->_z2;
 
@@ -2333,11 +5769,47 @@ kmeter_process(
   km->_z1 = z1 + 1e-20f;
   km->_z2 = z2 + 1e-20f;
 
-  s = sqrtf(2 * z2);
+  if (t > km->_pk) km->_pk = t;
+}
+
+/*
+ * Same as kmeter_process() on nframes zero samples, using the closed form
+ * of the two filter stages instead of iterating over the samples
+ */
+void
+kmeter_process_silence(
+  jack_mixer_kmeter_t kmeter,
+  jack_nframes_t nframes)
+{
+  float a;
+
+  /* z1 decays by a = 1 - omega every sample, and z2 follows it with
+   * z2[n] = a^n * (z2[0] + n * omega * z1[0]) */
+  a = powf(1.0f - km->_omega, nframes);
+  km->_z2 = a * (km->_z2 + nframes * km->_omega * km->_z1) + 1e-20f;
+  km->_z1 = a * km->_z1 + 1e-20f;
+}
+
+/*
+ * Update the displayed values with the blocks processed in this period,
+ * once per JACK period because peak hold and fallback are sized per period
+ */
+void
+kmeter_end_period(
+  jack_mixer_kmeter_t kmeter)
+{
+  float s;
+
+  if (km->_flag) {
+    km->_rms = 0;
+    km->_flag = 0;
+  }
+
+  s = sqrtf(2 * km->_z2);
   if (s > km->_rms) km->_rms = s;
 
-  if (t > km->_dpk) {
-    km->_dpk = t;
+  if (km->_pk > km->_dpk) {
+    km->_dpk = km->_pk;
     km->_cnt = km->_hold;
   }
   else if (km->_cnt) {
@@ -2347,6 +5819,8 @@ kmeter_process(
     km->_dpk *= km->_fall;
     km->_dpk += 1e-10f;
   }
+
+  km->_pk = 0;
 }
 
 void
@@ -2355,52 +5829,69 @@ remove_output_channel(
 {
   struct output_channel *output_channel_ptr = output_channel;
   struct channel *channel_ptr = output_channel;
+  struct jack_mixer *mixer_ptr = channel_ptr->mixer_ptr;
+  unsigned int scene;
+  GSList *list_ptr;
 
-  channel_ptr->mixer_ptr->output_channels_list = g_slist_remove(
-                  channel_ptr->mixer_ptr->output_channels_list, channel_ptr);
-  free(channel_ptr->name);
+  mixer_ptr->output_channels_list = g_slist_remove(mixer_ptr->output_channels_list, channel_ptr);
 
-  jack_port_unregister(channel_ptr->mixer_ptr->jack_client, channel_ptr->port_left);
-  if (channel_ptr->stereo)
+  /* mix-minus output channels of this one become regular output channels */
+  for (list_ptr = mixer_ptr->output_channels_list; list_ptr; list_ptr = g_slist_next(list_ptr))
   {
-    jack_port_unregister(channel_ptr->mixer_ptr->jack_client, channel_ptr->port_right);
+    struct output_channel *mix_minus_ptr = list_ptr->data;
+    if (mix_minus_ptr->mix_minus_source == output_channel_ptr)
+    {
+      mix_minus_ptr->mix_minus_source = NULL;
+      mix_minus_ptr->mix_minus_channel = NULL;
+    }
+  }
+
+  /* stop the process thread from seeing the channel */
+  update_snapshot(mixer_ptr);
+
+  backend_port_unregister(mixer_ptr->backend, channel_ptr->state->port_left);
+  if (channel_ptr->state->stereo)
+  {
+    backend_port_unregister(mixer_ptr->backend, channel_ptr->state->port_right);
   }
 
   if (channel_ptr->midi_cc_volume_index != -1)
   {
-    assert(channel_ptr->mixer_ptr->midi_cc_map[channel_ptr->midi_cc_volume_index] == channel_ptr);
-    channel_ptr->mixer_ptr->midi_cc_map[channel_ptr->midi_cc_volume_index] = NULL;
+    assert(mixer_ptr->midi_cc_map[channel_ptr->midi_cc_volume_index].channel == channel_ptr);
+    map_midi_cc(mixer_ptr, channel_ptr->midi_cc_volume_index, NULL, MIDI_CC_NONE);
   }
 
   if (channel_ptr->midi_cc_balance_index != -1)
   {
-    assert(channel_ptr->mixer_ptr->midi_cc_map[channel_ptr->midi_cc_balance_index] == channel_ptr);
-    channel_ptr->mixer_ptr->midi_cc_map[channel_ptr->midi_cc_balance_index] = NULL;
+    assert(mixer_ptr->midi_cc_map[channel_ptr->midi_cc_balance_index].channel == channel_ptr);
+    map_midi_cc(mixer_ptr, channel_ptr->midi_cc_balance_index, NULL, MIDI_CC_NONE);
   }
 
   if (channel_ptr->midi_cc_mute_index != -1)
   {
-    assert(channel_ptr->mixer_ptr->midi_cc_map[channel_ptr->midi_cc_mute_index] == channel_ptr);
-    channel_ptr->mixer_ptr->midi_cc_map[channel_ptr->midi_cc_mute_index] = NULL;
+    assert(mixer_ptr->midi_cc_map[channel_ptr->midi_cc_mute_index].channel == channel_ptr);
+    map_midi_cc(mixer_ptr, channel_ptr->midi_cc_mute_index, NULL, MIDI_CC_NONE);
   }
 
   if (channel_ptr->midi_cc_solo_index != -1)
   {
-    assert(channel_ptr->mixer_ptr->midi_cc_map[channel_ptr->midi_cc_solo_index] == channel_ptr);
-    channel_ptr->mixer_ptr->midi_cc_map[channel_ptr->midi_cc_solo_index] = NULL;
+    assert(mixer_ptr->midi_cc_map[channel_ptr->midi_cc_solo_index].channel == channel_ptr);
+    map_midi_cc(mixer_ptr, channel_ptr->midi_cc_solo_index, NULL, MIDI_CC_NONE);
   }
 
   g_slist_free(output_channel_ptr->soloed_channels);
   g_slist_free(output_channel_ptr->muted_channels);
   g_slist_free(output_channel_ptr->prefader_channels);
 
-  free(channel_ptr->tmp_mixed_frames_left);
-  free(channel_ptr->tmp_mixed_frames_right);
-  free(channel_ptr->frames_left);
-  free(channel_ptr->frames_right);
-  free(channel_ptr->prefader_frames_left);
-  free(channel_ptr->prefader_frames_right);
-  free(channel_ptr);
+  for (scene = 0; scene < SCENES_COUNT; scene++)
+  {
+    free_scene_routing(&output_channel_ptr->scenes[scene]);
+  }
+
+  /* the process thread may still be using the channel in the current cycle */
+  pthread_mutex_lock(&mixer_ptr->mutex);
+  retire(mixer_ptr, channel_ptr, free_channel);
+  pthread_mutex_unlock(&mixer_ptr->mutex);
 }
 
 void
@@ -2411,15 +5902,9 @@ output_channel_set_solo(
 {
   struct output_channel *output_channel_ptr = output_channel;
 
-  if (solo_value) {
-    if (g_slist_find(output_channel_ptr->soloed_channels, channel) != NULL)
-      return;
-    output_channel_ptr->soloed_channels = g_slist_prepend(output_channel_ptr->soloed_channels, channel);
-  }
-  else {
-    if (g_slist_find(output_channel_ptr->soloed_channels, channel) == NULL)
-      return;
-    output_channel_ptr->soloed_channels = g_slist_remove(output_channel_ptr->soloed_channels, channel);
+  if (update_routing_list(&output_channel_ptr->soloed_channels, channel, solo_value))
+  {
+    update_snapshot(((struct channel *)output_channel_ptr)->mixer_ptr);
   }
 }
 
@@ -2431,15 +5916,9 @@ output_channel_set_muted(
 {
   struct output_channel *output_channel_ptr = output_channel;
 
-  if (muted_value) {
-    if (g_slist_find(output_channel_ptr->muted_channels, channel) != NULL)
-      return;
-    output_channel_ptr->muted_channels = g_slist_prepend(output_channel_ptr->muted_channels, channel);
-  }
-  else {
-    if (g_slist_find(output_channel_ptr->muted_channels, channel) == NULL)
-      return;
-    output_channel_ptr->muted_channels = g_slist_remove(output_channel_ptr->muted_channels, channel);
+  if (update_routing_list(&output_channel_ptr->muted_channels, channel, muted_value))
+  {
+    update_snapshot(((struct channel *)output_channel_ptr)->mixer_ptr);
   }
 }
 
@@ -2484,6 +5963,14 @@ output_channel_is_prefader(
   return output_channel_ptr->prefader;
 }
 
+double
+output_channel_get_mix_time(
+  jack_mixer_output_channel_t output_channel)
+{
+  struct output_channel *output_channel_ptr = output_channel;
+  return __atomic_load_n(&output_channel_ptr->mix_time, __ATOMIC_RELAXED) / 1000.0;
+}
+
 void
 output_channel_set_in_prefader(
   jack_mixer_output_channel_t output_channel,
@@ -2492,15 +5979,9 @@ output_channel_set_in_prefader(
 {
   struct output_channel *output_channel_ptr = output_channel;
 
-  if (prefader_value) {
-    if (g_slist_find(output_channel_ptr->prefader_channels, channel) != NULL)
-      return;
-    output_channel_ptr->prefader_channels = g_slist_prepend(output_channel_ptr->prefader_channels, channel);
-  }
-  else {
-    if (g_slist_find(output_channel_ptr->prefader_channels, channel) == NULL)
-      return;
-    output_channel_ptr->prefader_channels = g_slist_remove(output_channel_ptr->prefader_channels, channel);
+  if (update_routing_list(&output_channel_ptr->prefader_channels, channel, prefader_value))
+  {
+    update_snapshot(((struct channel *)output_channel_ptr)->mixer_ptr);
   }
 }
 
@@ -2515,3 +5996,74 @@ output_channel_is_in_prefader(
     return true;
   return false;
 }
+
+int
+output_channel_set_mix_minus(
+  jack_mixer_output_channel_t output_channel,
+  jack_mixer_output_channel_t source,
+  jack_mixer_channel_t channel)
+{
+  struct output_channel *output_channel_ptr = output_channel;
+  struct output_channel *source_ptr = source;
+  struct jack_mixer *mixer_ptr = ((struct channel *)output_channel_ptr)->mixer_ptr;
+  struct output_channel *old_source_ptr = output_channel_ptr->mix_minus_source;
+  struct channel *old_channel_ptr = output_channel_ptr->mix_minus_channel;
+  GSList *list_ptr;
+
+  if (source_ptr != NULL)
+  {
+    if (source_ptr == output_channel_ptr || source_ptr->mix_minus_source != NULL)
+    {
+      _jack_mixer_error = JACK_MIXER_ERROR_INVALID_MIX_MINUS;
+      return -1;
+    }
+
+    /* Sources can't be mix-minus output channels */
+    for (list_ptr = mixer_ptr->output_channels_list; list_ptr; list_ptr = g_slist_next(list_ptr))
+    {
+      if (((struct output_channel *)list_ptr->data)->mix_minus_source == output_channel_ptr)
+      {
+        _jack_mixer_error = JACK_MIXER_ERROR_INVALID_MIX_MINUS;
+        return -1;
+      }
+    }
+  }
+  else
+  {
+    channel = NULL;
+  }
+
+  if (source_ptr == old_source_ptr && channel == old_channel_ptr)
+  {
+    return 0;
+  }
+
+  output_channel_ptr->mix_minus_source = source_ptr;
+  output_channel_ptr->mix_minus_channel = channel;
+
+  if (update_snapshot(mixer_ptr) != 0)
+  {
+    output_channel_ptr->mix_minus_source = old_source_ptr;
+    output_channel_ptr->mix_minus_channel = old_channel_ptr;
+    _jack_mixer_error = JACK_MIXER_ERROR_CHANNEL_MALLOC;
+    return -1;
+  }
+
+  return 0;
+}
+
+jack_mixer_output_channel_t
+output_channel_get_mix_minus_source(
+  jack_mixer_output_channel_t output_channel)
+{
+  struct output_channel *output_channel_ptr = output_channel;
+  return output_channel_ptr->mix_minus_source;
+}
+
+jack_mixer_channel_t
+output_channel_get_mix_minus_channel(
+  jack_mixer_output_channel_t output_channel)
+{
+  struct output_channel *output_channel_ptr = output_channel;
+  return output_channel_ptr->mix_minus_channel;
+}
@@ -24,6 +24,7 @@
 #define _JACK_MIXER_H
 
 #include <stdbool.h>
+#include <stddef.h>
 #include <stdint.h>
 #include <jack/jack.h>
 
@@ -47,11 +48,10 @@ typedef void * jack_mixer_threshold_t;
 
 #define PEAK_FRAMES_CHUNK 4800
 
-// we don't know how much to allocate, but we don't want to wait with
-// allocating until we're in the process() callback, so we just take a
-// fairly big chunk: 4 periods per buffer, 4096 samples per period.
-// (not sure if the '*4' is needed)
-#define MAX_BLOCK_SIZE (4 * 4096)
+#define MAX_WORKER_THREADS 64
+
+/* Scenes stored by the engine, one for each MIDI program number */
+#define SCENES_COUNT 128
 
 #define FLOAT_EXISTS(x) (!((x) - (x)))
 
@@ -69,6 +69,78 @@ enum meter_mode {
   Post_Fader
 };
 
+/*
+ * Meter values of one channel as returned by read_meters(), in dBFS
+ *
+ * Index 0 of each pair is the left (or mono) side, index 1 the right
+ * side, which is -inf for mono channels.
+ */
+struct meter_values {
+  float meter_prefader[2];
+  float meter_postfader[2];
+  float kmeter_rms_prefader[2];
+  float kmeter_prefader[2];     /* kmeter digital peak */
+  float kmeter_rms_postfader[2];
+  float kmeter_postfader[2];
+  float abspeak_prefader;       /* NaN if NaN was detected in the channel */
+  float abspeak_postfader;
+};
+
+
+/* Stages of the process cycle timed by the engine */
+enum process_stage {
+  Stage_Midi_In,
+  Stage_Inputs,                 /* Processing of all input channels */
+  Stage_Outputs,                /* Mixing of all output channels */
+  Stage_Midi_Out,
+  Stage_Process,                /* The whole process cycle */
+  Stage_Count
+};
+
+/* Durations of a stage in the statistics window, in µs */
+struct stage_stats {
+  float min;
+  float avg;
+  float p99;                    /* Upper limit, at most 19% above the exact value */
+  float max;
+};
+
+/* Timing of about the last second of process cycles */
+struct process_stats {
+  unsigned int cycles;
+  float period;                 /* Average period duration in µs */
+  float load;                   /* Average share of the period spent processing */
+  struct stage_stats stages[Stage_Count];
+};
+
+/* Channel parameters changed by apply_changes() */
+enum channel_parameter {
+  Parameter_Volume,             /* dB */
+  Parameter_Balance,
+  Parameter_Mute,
+  Parameter_Solo,               /* input channels only */
+  Parameter_Prefader,           /* output channels only */
+  Parameter_Send_Mute,          /* input_channel muted for an output channel */
+  Parameter_Send_Solo,          /* input_channel soloed for an output channel */
+  Parameter_Send_Prefader       /* input_channel pre-fader for an output channel */
+};
+
+/* One change for apply_changes(), boolean parameters are set for non-zero values */
+struct channel_change {
+  jack_mixer_channel_t channel;
+  jack_mixer_channel_t input_channel; /* Parameter_Send_* only */
+  enum channel_parameter parameter;
+  double value;
+};
+
+/* Memory used by the mixer engine in bytes */
+struct memory_usage {
+  size_t scratch;               /* scratch buffers for one period of all channels */
+  size_t topology;              /* published channel lists and routing tables */
+  size_t channels;              /* channel state */
+  size_t meters;                /* published meter values */
+  size_t total;
+};
 
 typedef enum {
   JACK_MIXER_NO_ERROR,
@@ -77,6 +149,7 @@ typedef enum {
   JACK_MIXER_ERROR_JACK_MIDI_OUT_CREATE,
   JACK_MIXER_ERROR_JACK_SET_PROCESS_CALLBACK,
   JACK_MIXER_ERROR_JACK_SET_BUFFER_SIZE_CALLBACK,
+  JACK_MIXER_ERROR_JACK_SET_XRUN_CALLBACK,
   JACK_MIXER_ERROR_JACK_ACTIVATE,
   JACK_MIXER_ERROR_CHANNEL_MALLOC,
   JACK_MIXER_ERROR_CHANNEL_NAME_MALLOC,
@@ -89,6 +162,14 @@ typedef enum {
   JACK_MIXER_ERROR_PORT_NAME_MALLOC,
   JACK_MIXER_ERROR_INVALID_CC,
   JACK_MIXER_ERROR_NO_FREE_CC,
+  JACK_MIXER_ERROR_WORKER_THREADS,
+  JACK_MIXER_ERROR_MIDI_CHANGE_QUEUE,
+  JACK_MIXER_ERROR_OFFLINE_BACKEND_CREATE,
+  JACK_MIXER_ERROR_OFFLINE_PROCESS,
+  JACK_MIXER_ERROR_INVALID_SCENE,
+  JACK_MIXER_ERROR_CHANGES_MALLOC,
+  JACK_MIXER_ERROR_INVALID_MIX_MINUS,
+  JACK_MIXER_ERROR_SCENE_MALLOC,
   JACK_MIXER_ERROR_COUNT
 } jack_mixer_error_t;
 
@@ -103,6 +184,24 @@ create(
   const char * jack_client_name_ptr,
   bool stereo);
 
+/* Create a mixer not connected to JACK, running process cycles of at most
+ * buffer_size frames when offline_process() is called */
+jack_mixer_t
+create_offline(
+  const char * client_name_ptr,
+  unsigned int sample_rate,
+  unsigned int buffer_size);
+
+bool
+is_offline(
+  jack_mixer_t mixer);
+
+/* Run one process cycle of an offline mixer, returns 0 on success */
+int
+offline_process(
+  jack_mixer_t mixer,
+  unsigned int nframes);
+
 void
 destroy(
   jack_mixer_t mixer);
@@ -115,6 +214,15 @@ const char*
 get_client_name(
   jack_mixer_t mixer);
 
+unsigned int
+get_sample_rate(
+  jack_mixer_t mixer);
+
+/* Maximum number of frames of a process cycle */
+unsigned int
+get_buffer_size(
+  jack_mixer_t mixer);
+
 bool
 get_kmetering(
   jack_mixer_t mixer);
@@ -124,6 +232,58 @@ set_kmetering(
   jack_mixer_t mixer,
   bool flag);
 
+/* Block processing uses vectorized kernels for input channels with
+ * constant gain, disabling it falls back to per-sample processing */
+bool
+get_block_processing(
+  jack_mixer_t mixer);
+
+void
+set_block_processing(
+  jack_mixer_t mixer,
+  bool flag);
+
+/* Flush denormal numbers to zero in the JACK process thread and worker
+ * threads (enabled by default), where the CPU supports it */
+bool
+get_flush_denormals(
+  jack_mixer_t mixer);
+
+void
+set_flush_denormals(
+  jack_mixer_t mixer,
+  bool flag);
+
+/* Number of process cycles which computed with denormal numbers */
+unsigned int
+get_denormal_cycles_count(
+  jack_mixer_t mixer);
+
+/* Split process cycles at the time of MIDI events changing channels, so
+ * they take effect at their exact sample, into blocks of at least frames
+ * samples. Events closer to the start of a block take effect at its start.
+ * 0 (the default) applies all events at the start of the cycle. */
+unsigned int
+get_midi_split_frames(
+  jack_mixer_t mixer);
+
+void
+set_midi_split_frames(
+  jack_mixer_t mixer,
+  unsigned int frames);
+
+/* Number of worker threads sharing the processing of input and output
+ * channels with the JACK process thread, 0 (the default) to do all
+ * processing in the JACK process thread */
+unsigned int
+get_worker_threads(
+  jack_mixer_t mixer);
+
+int
+set_worker_threads(
+  jack_mixer_t mixer,
+  unsigned int count);
+
 int8_t
 get_last_midi_cc(
   jack_mixer_t mixer);
@@ -142,6 +302,123 @@ set_midi_behavior_mode(
   jack_mixer_t mixer,
   enum midi_behavior_mode mode);
 
+/* Number of meter slots, all channels have a slot below this */
+unsigned int
+get_meter_slots_count(
+  jack_mixer_t mixer);
+
+/*
+ * Copy the meter values of the first count slots, as published by the
+ * process thread at the end of the last period, into values, and reset
+ * the kmeter RMS values like the channel kmeter read functions do.
+ * Returns the number of slots copied.
+ */
+unsigned int
+read_meters(
+  jack_mixer_t mixer,
+  struct meter_values * values,
+  unsigned int count);
+
+/*
+ * File descriptor which becomes readable when channels were changed via
+ * MIDI in. Poll it from the main loop and call dispatch_midi_changes().
+ */
+int
+get_midi_change_fd(
+  jack_mixer_t mixer);
+
+/* Timing of process cycles, returns false until about one second was processed */
+bool
+get_process_stats(
+  jack_mixer_t mixer,
+  struct process_stats * stats_ptr);
+
+unsigned int
+get_xruns_count(
+  jack_mixer_t mixer);
+
+/* Memory currently used by the mixer engine */
+void
+get_memory_usage(
+  jack_mixer_t mixer,
+  struct memory_usage * usage_ptr);
+
+/*
+ * Call the MIDI change callback of each channel changed via MIDI in since
+ * the last call. Must be called from the thread adding and removing
+ * channels, as the callbacks are run from here, never from the process
+ * thread.
+ */
+void
+dispatch_midi_changes(
+  jack_mixer_t mixer);
+
+/*
+ * Apply count changes at once. Routing changes are published in one
+ * snapshot, the other changes are applied by the process thread at the
+ * start of the next cycle, together with the routing, so no period sees
+ * only part of them. Channel values read back reflect the changes once
+ * they are applied. Must be called from the thread adding and
+ * removing channels. Returns 0 on success, -1 if memory could not be
+ * allocated, in which case no change is applied.
+ */
+int
+apply_changes(
+  jack_mixer_t mixer,
+  const struct channel_change * changes_ptr,
+  unsigned int count);
+
+/*
+ * Store the volume, balance, mute and solo of all channels and the
+ * solo/mute/prefader routing of all output channels, except system ones,
+ * as scene number scene. A MIDI Program Change with the same number
+ * recalls the scene, routing included, in a single period. Overwriting a
+ * stored scene waits for the process thread to finish the current cycle.
+ * Returns 0 on success.
+ */
+int
+store_scene(
+  jack_mixer_t mixer,
+  int scene);
+
+/*
+ * Recall a stored scene, volumes and balances move to the stored values
+ * over crossfade seconds, starting with the next process cycle. Channels
+ * added after the scene was stored are left alone. The MIDI change
+ * callbacks of all channels are run by dispatch_midi_changes() once the
+ * process thread applied the scene. Returns 0 on success.
+ */
+int
+recall_scene(
+  jack_mixer_t mixer,
+  int scene,
+  double crossfade);
+
+int
+clear_scene(
+  jack_mixer_t mixer,
+  int scene);
+
+bool
+is_scene_stored(
+  jack_mixer_t mixer,
+  int scene);
+
+/* Number of the last recalled scene, -1 if none */
+int
+get_current_scene(
+  jack_mixer_t mixer);
+
+/* Crossfade time in seconds of scenes recalled via MIDI Program Change */
+double
+get_scene_crossfade(
+  jack_mixer_t mixer);
+
+void
+set_scene_crossfade(
+  jack_mixer_t mixer,
+  double crossfade);
+
 jack_mixer_channel_t
 add_channel(
   jack_mixer_t mixer,
@@ -162,6 +439,15 @@ kmeter_process(
   int start,
   int end);
 
+void
+kmeter_process_silence(
+  jack_mixer_kmeter_t km,
+  jack_nframes_t nframes);
+
+void
+kmeter_end_period(
+  jack_mixer_kmeter_t km);
+
 const char *
 channel_get_name(
   jack_mixer_channel_t channel);
@@ -211,6 +497,28 @@ bool
 channel_is_stereo(
   jack_mixer_channel_t channel);
 
+/* Index of the channel in the values read by read_meters() */
+unsigned int
+channel_get_meter_slot(
+  jack_mixer_channel_t channel);
+
+/* Number of blocks of input with Inf or NaN samples, after each of which
+ * the channel was silenced for a few periods */
+unsigned int
+channel_get_nan_events_count(
+  jack_mixer_channel_t channel);
+
+/* Set the buffers an offline mixer reads the input of the channel from, or
+ * writes the output of the channel to, for each following process cycle.
+ * They must hold buffer_size samples, right_buffer_ptr is unused for mono
+ * channels. NULL buffers make inputs silent and discard outputs. Returns -1
+ * if the mixer is not offline. */
+int
+channel_set_offline_buffers(
+  jack_mixer_channel_t channel,
+  float * left_buffer_ptr,
+  float * right_buffer_ptr);
+
 void
 channel_set_midi_change_callback(
   jack_mixer_channel_t channel,
@@ -402,6 +710,11 @@ bool
 output_channel_is_prefader(
   jack_mixer_output_channel_t output_channel);
 
+/* Average time spent mixing the channel per process cycle, in µs */
+double
+output_channel_get_mix_time(
+  jack_mixer_output_channel_t output_channel);
+
 void
 output_channel_set_in_prefader(
   jack_mixer_output_channel_t output_channel,
@@ -413,4 +726,34 @@ output_channel_is_in_prefader(
   jack_mixer_output_channel_t output_channel,
   jack_mixer_channel_t channel);
 
+/*
+ * Make an output channel carry the mix of another output channel, without
+ * the signal one input channel sends to it (mix-minus)
+ *
+ * The sum of the source is computed once and shared by all its mix-minus
+ * output channels, each one only subtracts its own input channel. The
+ * output channel still applies its own volume, balance and mute, but its
+ * own routing of input channels is not used. The source can't be a
+ * mix-minus output channel itself. channel may be NULL to carry the mix of
+ * the source as is, and source NULL to turn the output channel back into
+ * a regular one.
+ *
+ * Returns 0 on success, otherwise -1 and sets the error code.
+ */
+int
+output_channel_set_mix_minus(
+  jack_mixer_output_channel_t output_channel,
+  jack_mixer_output_channel_t source,
+  jack_mixer_channel_t channel);
+
+/* Returns the source of a mix-minus output channel, NULL for a regular one */
+jack_mixer_output_channel_t
+output_channel_get_mix_minus_source(
+  jack_mixer_output_channel_t output_channel);
+
+/* Returns the input channel excluded from a mix-minus output channel, or NULL */
+jack_mixer_channel_t
+output_channel_get_mix_minus_channel(
+  jack_mixer_output_channel_t output_channel);
+
 #endif /* #ifndef _JACK_MIXER_H */
@@ -0,0 +1,205 @@
+/* -*- Mode: C ; c-basic-offset: 2 -*- */
+/*****************************************************************************
+ *
+ *   This file is part of jack_mixer
+ *
+ *   This program is free software; you can redistribute it and/or modify
+ *   it under the terms of the GNU General Public License as published by
+ *   the Free Software Foundation; version 2 of the License
+ *
+ *   This program is distributed in the hope that it will be useful,
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ *   GNU General Public License for more details.
+ *
+ *   You should have received a copy of the GNU General Public License
+ *   along with this program; if not, write to the Free Software
+ *   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA.
+ *
+ *****************************************************************************/
+
+#include <stdbool.h>
+#include <stdlib.h>
+#include <errno.h>
+#include <pthread.h>
+#include <semaphore.h>
+
+#include "pool.h"
+#include "log.h"
+
+struct pool {
+  unsigned int threads_count;
+  pthread_t *threads;
+  sem_t start;                  /* posted once per worker to start a job */
+  sem_t done;                   /* posted by each worker when it has finished a job */
+  bool quit;
+
+  /* Current job */
+  pool_job_fn job_fn;
+  void *job_context;
+  unsigned int job_count;
+  unsigned int job_next;        /* next index to be processed */
+};
+
+static void
+pool_wait(
+  sem_t *sem_ptr)
+{
+  while (sem_wait(sem_ptr) != 0 && errno == EINTR);
+}
+
+static void
+work(
+  struct pool *pool_ptr)
+{
+  unsigned int index;
+
+  while ((index = __atomic_fetch_add(&pool_ptr->job_next, 1, __ATOMIC_RELAXED)) < pool_ptr->job_count)
+  {
+    pool_ptr->job_fn(pool_ptr->job_context, index);
+  }
+}
+
+static void *
+worker(
+  void *arg)
+{
+  struct pool *pool_ptr = arg;
+
+  while (true)
+  {
+    pool_wait(&pool_ptr->start);
+
+    if (pool_ptr->quit)
+    {
+      break;
+    }
+
+    work(pool_ptr);
+    sem_post(&pool_ptr->done);
+  }
+
+  return NULL;
+}
+
+struct pool *
+pool_create(
+  struct backend * backend_ptr,
+  unsigned int threads_count)
+{
+  struct pool *pool_ptr;
+  int ret;
+
+  pool_ptr = calloc(1, sizeof(struct pool));
+  if (pool_ptr == NULL)
+  {
+    goto fail;
+  }
+
+  pool_ptr->threads = calloc(threads_count, sizeof(pthread_t));
+  if (pool_ptr->threads == NULL)
+  {
+    goto fail_free;
+  }
+
+  if (sem_init(&pool_ptr->start, 0, 0) != 0)
+  {
+    goto fail_free_threads;
+  }
+
+  if (sem_init(&pool_ptr->done, 0, 0) != 0)
+  {
+    goto fail_destroy_start;
+  }
+
+  for (pool_ptr->threads_count = 0; pool_ptr->threads_count < threads_count; pool_ptr->threads_count++)
+  {
+    ret = backend_create_thread(backend_ptr,
+                                &pool_ptr->threads[pool_ptr->threads_count],
+                                worker,
+                                pool_ptr);
+    if (ret != 0)
+    {
+      LOG_ERROR("Could not create worker thread (error %d).", ret);
+      pool_destroy(pool_ptr);
+      return NULL;
+    }
+  }
+
+  LOG_DEBUG("Started %u worker threads.", threads_count);
+  return pool_ptr;
+
+fail_destroy_start:
+  sem_destroy(&pool_ptr->start);
+
+fail_free_threads:
+  free(pool_ptr->threads);
+
+fail_free:
+  free(pool_ptr);
+
+fail:
+  return NULL;
+}
+
+void
+pool_destroy(
+  void * pool)
+{
+  struct pool *pool_ptr = pool;
+  unsigned int i;
+
+  pool_ptr->quit = true;
+
+  for (i = 0; i < pool_ptr->threads_count; i++)
+  {
+    sem_post(&pool_ptr->start);
+  }
+
+  for (i = 0; i < pool_ptr->threads_count; i++)
+  {
+    pthread_join(pool_ptr->threads[i], NULL);
+  }
+
+  sem_destroy(&pool_ptr->done);
+  sem_destroy(&pool_ptr->start);
+  free(pool_ptr->threads);
+  free(pool_ptr);
+}
+
+unsigned int
+pool_get_threads_count(
+  struct pool * pool_ptr)
+{
+  return pool_ptr->threads_count;
+}
+
+void
+pool_run(
+  struct pool * pool_ptr,
+  pool_job_fn fn,
+  void * context,
+  unsigned int count)
+{
+  unsigned int i;
+
+  pool_ptr->job_fn = fn;
+  pool_ptr->job_context = context;
+  pool_ptr->job_count = count;
+  pool_ptr->job_next = 0;
+
+  /* Semaphores order the job setup before the workers' reads */
+  for (i = 0; i < pool_ptr->threads_count; i++)
+  {
+    sem_post(&pool_ptr->start);
+  }
+
+  work(pool_ptr);
+
+  /* Wait for all workers, so the next job can't be picked up by a worker
+   * still busy with this one */
+  for (i = 0; i < pool_ptr->threads_count; i++)
+  {
+    pool_wait(&pool_ptr->done);
+  }
+}
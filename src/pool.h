@@ -0,0 +1,65 @@
+/* -*- Mode: C ; c-basic-offset: 2 -*- */
+/*****************************************************************************
+ *
+ *   This file is part of jack_mixer
+ *
+ *   This program is free software; you can redistribute it and/or modify
+ *   it under the terms of the GNU General Public License as published by
+ *   the Free Software Foundation; version 2 of the License
+ *
+ *   This program is distributed in the hope that it will be useful,
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ *   GNU General Public License for more details.
+ *
+ *   You should have received a copy of the GNU General Public License
+ *   along with this program; if not, write to the Free Software
+ *   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA.
+ *
+ *****************************************************************************/
+
+/*
+ * Pool of worker threads sharing jobs with the JACK process thread
+ *
+ * Workers are created by the backend, as JACK client threads they run with
+ * real-time priority when the JACK server does. They sleep on a semaphore between
+ * jobs and are woken by pool_run() inside the process cycle.
+ */
+
+#ifndef _POOL_H
+#define _POOL_H
+
+#include "backend.h"
+
+struct pool;
+
+/* Function called for each index of a job */
+typedef void (*pool_job_fn)(void *context, unsigned int index);
+
+struct pool *
+pool_create(
+  struct backend * backend_ptr,
+  unsigned int threads_count);
+
+/* Stop worker threads and free the pool, must not be called while a job is running */
+void
+pool_destroy(
+  void * pool);
+
+unsigned int
+pool_get_threads_count(
+  struct pool * pool_ptr);
+
+/*
+ * Call fn(context, index) for each index from 0 to count - 1, spread over
+ * the worker threads and the calling thread, and return when all calls
+ * have finished. Calls for different indices may run concurrently.
+ */
+void
+pool_run(
+  struct pool * pool_ptr,
+  pool_job_fn fn,
+  void * context,
+  unsigned int count);
+
+#endif /* #ifndef _POOL_H */
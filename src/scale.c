@@ -40,10 +40,39 @@ struct threshold
   double b;
 };
 
+/* Threshold with the coefficients of the segment below it, see struct scale */
+struct segment
+{
+  double db;
+  double scale;
+  double a;
+  double b;
+};
+
+/* Cells of the lookup tables, each of which should hold at most one threshold */
+#define SCALE_TABLE_SIZE 256
+
+/* Number of MIDI CC values */
+#define SCALE_MIDI_VALUES 128
+
+/*
+ * Thresholds are kept in a list while the scale is set up. When the
+ * coefficients are calculated, they are also copied to an array, and
+ * conversions look up the segment of a value in a table which divides the
+ * range of the scale in cells of equal size, instead of walking the list.
+ */
 struct scale
 {
   struct list_head thresholds;
   double max_db;
+
+  struct segment *segments;     /* NULL until the coefficients are calculated */
+  unsigned int segments_count;
+  double db_cell_inv;           /* cells per dB */
+  double scale_cell_inv;        /* cells per scale unit */
+  unsigned int db_table[SCALE_TABLE_SIZE];    /* first segment ending after cell start */
+  unsigned int scale_table[SCALE_TABLE_SIZE]; /* first segment ending at or after cell start */
+  double midi_db[SCALE_MIDI_VALUES];          /* dBFS value for each MIDI CC value */
 };
 
 jack_mixer_scale_t
@@ -59,6 +88,8 @@ scale_create()
 
   INIT_LIST_HEAD(&scale_ptr->thresholds);
   scale_ptr->max_db = -INFINITY;
+  scale_ptr->segments = NULL;
+  scale_ptr->segments_count = 0;
 
   LOG_DEBUG("Scale %p created", scale_ptr);
 
@@ -67,6 +98,16 @@ scale_create()
 
 #define scale_ptr ((struct scale *)scale)
 
+/* Drop the lookup tables, conversions walk the thresholds list until they are built again */
+static void
+scale_free_tables(
+  jack_mixer_scale_t scale)
+{
+  free(scale_ptr->segments);
+  scale_ptr->segments = NULL;
+  scale_ptr->segments_count = 0;
+}
+
 void
 scale_destroy(
   jack_mixer_scale_t scale)
@@ -83,6 +124,8 @@ scale_remove_thresholds(
   struct threshold * threshold_ptr;
   struct threshold * node_ptr;
 
+  scale_free_tables(scale);
+
   list_for_each_entry_safe(threshold_ptr, node_ptr, &scale_ptr->thresholds, scale_siblings)
   {
     list_del(&(threshold_ptr->scale_siblings));
@@ -112,6 +155,8 @@ scale_add_threshold(
   threshold_ptr->db = db;
   threshold_ptr->scale = scale_value;
 
+  scale_free_tables(scale);
+
   list_add_tail(&threshold_ptr->scale_siblings, &scale_ptr->thresholds);
 
   if (db > scale_ptr->max_db)
@@ -124,9 +169,11 @@ scale_add_threshold(
 
 #undef threshold_ptr
 
-void
-scale_calculate_coefficients(
-  jack_mixer_scale_t scale)
+/* Convert dBFS value to number in range 0.0-1.0, walking the thresholds list */
+static double
+scale_db_to_scale_list(
+  jack_mixer_scale_t scale,
+  double db)
 {
   struct threshold * threshold_ptr;
   struct threshold * prev_ptr;
@@ -138,24 +185,28 @@ scale_calculate_coefficients(
   {
     threshold_ptr = list_entry(node_ptr, struct threshold, scale_siblings);
 
-    LOG_DEBUG("Calculating coefficients for threshold %p", threshold_ptr);
-
-    if (prev_ptr != NULL)
+    if (db < threshold_ptr->db)
     {
-      threshold_ptr->a = (prev_ptr->scale - threshold_ptr->scale) / (prev_ptr->db - threshold_ptr->db);
-      threshold_ptr->b = threshold_ptr->scale - threshold_ptr->a * threshold_ptr->db;
-      LOG_DEBUG("%.0f dB - %.0f dB: scale = %f * dB + %f", prev_ptr->db, threshold_ptr->db, threshold_ptr->a, threshold_ptr->b);
+      LOG_DEBUG("Match at %f dB treshold", threshold_ptr->db);
+      if (prev_ptr == NULL)
+      {
+        return 0.0;
+      }
+
+      return threshold_ptr->a * db + threshold_ptr->b;
     }
 
     prev_ptr = threshold_ptr;
   }
+
+  return 1.0;
 }
 
-/* Convert dBFS value to number in range 0.0-1.0 */
-double
-scale_db_to_scale(
+/* Convert number in range 0.0-1.0 to dBFS value, walking the thresholds list */
+static double
+scale_scale_to_db_list(
   jack_mixer_scale_t scale,
-  double db)
+  double scale_value)
 {
   struct threshold * threshold_ptr;
   struct threshold * prev_ptr;
@@ -167,28 +218,107 @@ scale_db_to_scale(
   {
     threshold_ptr = list_entry(node_ptr, struct threshold, scale_siblings);
 
-    if (db < threshold_ptr->db)
+    if (scale_value <= threshold_ptr->scale)
     {
-      LOG_DEBUG("Match at %f dB treshold", threshold_ptr->db);
       if (prev_ptr == NULL)
       {
-        return 0.0;
+        return -INFINITY;
       }
 
-      return threshold_ptr->a * db + threshold_ptr->b;
+      return (scale_value - threshold_ptr->b) / threshold_ptr->a;
     }
 
     prev_ptr = threshold_ptr;
   }
 
-  return 1.0;
+  return scale_ptr->max_db;
 }
 
-/* Convert number in range 0.0-1.0 to dBFS value */
-double
-scale_scale_to_db(
-  jack_mixer_scale_t scale,
-  double scale_value)
+/*
+ * Copy the thresholds to an array and fill the lookup tables
+ *
+ * If memory allocation fails, conversions keep walking the thresholds list.
+ */
+static void
+scale_build_tables(
+  jack_mixer_scale_t scale)
+{
+  struct threshold * threshold_ptr;
+  struct list_head * node_ptr;
+  struct segment * segment_ptr;
+  unsigned int count;
+  unsigned int cell;
+  unsigned int i;
+  double db;
+  double scale_value;
+
+  scale_free_tables(scale);
+
+  count = 0;
+  list_for_each(node_ptr, &scale_ptr->thresholds)
+  {
+    count++;
+  }
+
+  /* Values of a scale without segments are constant */
+  if (count < 2)
+  {
+    return;
+  }
+
+  segment_ptr = malloc(count * sizeof(struct segment));
+  if (segment_ptr == NULL)
+  {
+    return;
+  }
+
+  i = 0;
+  list_for_each(node_ptr, &scale_ptr->thresholds)
+  {
+    threshold_ptr = list_entry(node_ptr, struct threshold, scale_siblings);
+    segment_ptr[i].db = threshold_ptr->db;
+    segment_ptr[i].scale = threshold_ptr->scale;
+    segment_ptr[i].a = threshold_ptr->a;
+    segment_ptr[i].b = threshold_ptr->b;
+    i++;
+  }
+
+  scale_ptr->db_cell_inv = SCALE_TABLE_SIZE / (segment_ptr[count - 1].db - segment_ptr[0].db);
+  scale_ptr->scale_cell_inv = SCALE_TABLE_SIZE / (segment_ptr[count - 1].scale - segment_ptr[0].scale);
+
+  /* Segment 0 is never used, values below the first threshold are clamped */
+  for (cell = 0, i = 1; cell < SCALE_TABLE_SIZE; cell++)
+  {
+    db = segment_ptr[0].db + cell / scale_ptr->db_cell_inv;
+    while (i < count - 1 && !(db < segment_ptr[i].db))
+    {
+      i++;
+    }
+    scale_ptr->db_table[cell] = i;
+  }
+
+  for (cell = 0, i = 1; cell < SCALE_TABLE_SIZE; cell++)
+  {
+    scale_value = segment_ptr[0].scale + cell / scale_ptr->scale_cell_inv;
+    while (i < count - 1 && !(scale_value <= segment_ptr[i].scale))
+    {
+      i++;
+    }
+    scale_ptr->scale_table[cell] = i;
+  }
+
+  scale_ptr->segments = segment_ptr;
+  scale_ptr->segments_count = count;
+
+  for (i = 0; i < SCALE_MIDI_VALUES; i++)
+  {
+    scale_ptr->midi_db[i] = scale_scale_to_db(scale, (double)i / (SCALE_MIDI_VALUES - 1));
+  }
+}
+
+void
+scale_calculate_coefficients(
+  jack_mixer_scale_t scale)
 {
   struct threshold * threshold_ptr;
   struct threshold * prev_ptr;
@@ -200,18 +330,134 @@ scale_scale_to_db(
   {
     threshold_ptr = list_entry(node_ptr, struct threshold, scale_siblings);
 
-    if (scale_value <= threshold_ptr->scale)
-    {
-      if (prev_ptr == NULL)
-      {
-        return -INFINITY;
-      }
+    LOG_DEBUG("Calculating coefficients for threshold %p", threshold_ptr);
 
-      return (scale_value - threshold_ptr->b) / threshold_ptr->a;
+    if (prev_ptr != NULL)
+    {
+      threshold_ptr->a = (prev_ptr->scale - threshold_ptr->scale) / (prev_ptr->db - threshold_ptr->db);
+      threshold_ptr->b = threshold_ptr->scale - threshold_ptr->a * threshold_ptr->db;
+      LOG_DEBUG("%.0f dB - %.0f dB: scale = %f * dB + %f", prev_ptr->db, threshold_ptr->db, threshold_ptr->a, threshold_ptr->b);
     }
 
     prev_ptr = threshold_ptr;
   }
 
-  return scale_ptr->max_db;
+  scale_build_tables(scale);
+}
+
+/* Convert dBFS value to number in range 0.0-1.0 */
+double
+scale_db_to_scale(
+  jack_mixer_scale_t scale,
+  double db)
+{
+  const struct segment * segments = scale_ptr->segments;
+  unsigned int last;
+  unsigned int i;
+  double cell;
+
+  if (segments == NULL)
+  {
+    return scale_db_to_scale_list(scale, db);
+  }
+
+  last = scale_ptr->segments_count - 1;
+
+  if (db < segments[0].db)
+  {
+    return 0.0;
+  }
+
+  /* Also true for NaN */
+  if (!(db < segments[last].db))
+  {
+    return 1.0;
+  }
+
+  /* Rounding may put a value at the border of a cell in the neighbouring one */
+  cell = (db - segments[0].db) * scale_ptr->db_cell_inv;
+  i = scale_ptr->db_table[cell < SCALE_TABLE_SIZE ? (unsigned int)cell : SCALE_TABLE_SIZE - 1];
+  while (!(db < segments[i].db))
+  {
+    i++;
+  }
+  while (i > 1 && db < segments[i - 1].db)
+  {
+    i--;
+  }
+
+  return segments[i].a * db + segments[i].b;
+}
+
+/* Convert number in range 0.0-1.0 to dBFS value */
+double
+scale_scale_to_db(
+  jack_mixer_scale_t scale,
+  double scale_value)
+{
+  const struct segment * segments = scale_ptr->segments;
+  unsigned int last;
+  unsigned int i;
+  double cell;
+
+  if (segments == NULL)
+  {
+    return scale_scale_to_db_list(scale, scale_value);
+  }
+
+  last = scale_ptr->segments_count - 1;
+
+  if (scale_value <= segments[0].scale)
+  {
+    return -INFINITY;
+  }
+
+  /* Also true for NaN */
+  if (!(scale_value <= segments[last].scale))
+  {
+    return scale_ptr->max_db;
+  }
+
+  cell = (scale_value - segments[0].scale) * scale_ptr->scale_cell_inv;
+  i = scale_ptr->scale_table[cell < SCALE_TABLE_SIZE ? (unsigned int)cell : SCALE_TABLE_SIZE - 1];
+  while (!(scale_value <= segments[i].scale))
+  {
+    i++;
+  }
+  while (i > 1 && scale_value <= segments[i - 1].scale)
+  {
+    i--;
+  }
+
+  return (scale_value - segments[i].b) / segments[i].a;
+}
+
+/* Convert MIDI CC value in range 0-127 to dBFS value */
+double
+scale_midi_value_to_db(
+  jack_mixer_scale_t scale,
+  unsigned int value)
+{
+  if (scale_ptr->segments == NULL)
+  {
+    return scale_scale_to_db(scale, (double)value / (SCALE_MIDI_VALUES - 1));
+  }
+
+  return scale_ptr->midi_db[value];
+}
+
+/* Convert count dBFS values to numbers in range 0.0-1.0 */
+void
+scale_db_to_scale_array(
+  jack_mixer_scale_t scale,
+  const float * db_ptr,
+  float * scale_value_ptr,
+  unsigned int count)
+{
+  unsigned int i;
+
+  for (i = 0; i < count; i++)
+  {
+    scale_value_ptr[i] = scale_db_to_scale(scale, db_ptr[i]);
+  }
 }
@@ -52,6 +52,18 @@ scale_scale_to_db(
   jack_mixer_scale_t scale,
   double scale_value);
 
+double
+scale_midi_value_to_db(
+  jack_mixer_scale_t scale,
+  unsigned int value);
+
+void
+scale_db_to_scale_array(
+  jack_mixer_scale_t scale,
+  const float * db_ptr,
+  float * scale_value_ptr,
+  unsigned int count);
+
 void
 scale_destroy(
   jack_mixer_scale_t scale);
@@ -0,0 +1,185 @@
+/* -*- Mode: C ; c-basic-offset: 2 -*- */
+/*****************************************************************************
+ *
+ *   This file is part of jack_mixer
+ *
+ *   This program is free software; you can redistribute it and/or modify
+ *   it under the terms of the GNU General Public License as published by
+ *   the Free Software Foundation; version 2 of the License
+ *
+ *   This program is distributed in the hope that it will be useful,
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ *   GNU General Public License for more details.
+ *
+ *   You should have received a copy of the GNU General Public License
+ *   along with this program; if not, write to the Free Software
+ *   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA.
+ *
+ *****************************************************************************/
+
+#include <string.h>
+#include <sched.h>
+
+#include "timing.h"
+
+static void
+reset_window(
+  struct timing_window * window_ptr)
+{
+  unsigned int i;
+
+  memset(window_ptr, 0, sizeof(struct timing_window));
+  for (i = 0; i < Stage_Count; i++)
+  {
+    window_ptr->stages[i].min = UINT32_MAX;
+  }
+}
+
+/* Buckets 0 to 3 hold 0 to 3 ns, then each octave is split in four buckets */
+static inline unsigned int
+bucket_index(
+  uint32_t duration)
+{
+  unsigned int msb;
+
+  if (duration < 4)
+  {
+    return duration;
+  }
+
+  msb = 31 - __builtin_clz(duration);
+  return msb * 4 + ((duration >> (msb - 2)) & 3);
+}
+
+/* Upper limit of durations in a bucket */
+static double
+bucket_limit(
+  unsigned int index)
+{
+  if (index < 8)
+  {
+    return index + 1;
+  }
+
+  return (double)(5 + index % 4) * (1u << (index / 4 - 2));
+}
+
+void
+timing_init(
+  struct timing * timing_ptr)
+{
+  reset_window(&timing_ptr->current);
+  reset_window(&timing_ptr->published);
+  timing_ptr->seq = 0;
+}
+
+void
+timing_record(
+  struct timing * timing_ptr,
+  enum process_stage stage,
+  uint64_t duration)
+{
+  struct timing_histogram *histogram_ptr = &timing_ptr->current.stages[stage];
+  uint32_t ns = duration > UINT32_MAX ? UINT32_MAX : duration;
+
+  histogram_ptr->sum += ns;
+  histogram_ptr->count++;
+  if (ns < histogram_ptr->min)
+    histogram_ptr->min = ns;
+  if (ns > histogram_ptr->max)
+    histogram_ptr->max = ns;
+  histogram_ptr->buckets[bucket_index(ns)]++;
+}
+
+unsigned int
+timing_end_cycle(
+  struct timing * timing_ptr,
+  jack_nframes_t nframes,
+  jack_nframes_t sample_rate)
+{
+  unsigned int seq = timing_ptr->seq; /* only written by the process thread */
+  unsigned int cycles = ++timing_ptr->current.cycles;
+
+  timing_ptr->current.frames += nframes;
+  if (timing_ptr->current.frames < sample_rate)
+  {
+    return 0;
+  }
+
+  __atomic_store_n(&timing_ptr->seq, seq + 1, __ATOMIC_RELAXED);
+  __atomic_thread_fence(__ATOMIC_RELEASE);
+
+  memcpy(&timing_ptr->published, &timing_ptr->current, sizeof(struct timing_window));
+
+  __atomic_store_n(&timing_ptr->seq, seq + 2, __ATOMIC_RELEASE);
+
+  reset_window(&timing_ptr->current);
+  return cycles;
+}
+
+bool
+timing_read(
+  struct timing * timing_ptr,
+  jack_nframes_t sample_rate,
+  struct process_stats * stats_ptr)
+{
+  struct timing_window window;
+  struct timing_histogram *histogram_ptr;
+  struct stage_stats *stage_ptr;
+  unsigned int seq;
+  unsigned int stage;
+  unsigned int i;
+  uint32_t rank, total;
+
+  do
+  {
+    while ((seq = __atomic_load_n(&timing_ptr->seq, __ATOMIC_ACQUIRE)) & 1)
+    {
+      sched_yield();
+    }
+
+    memcpy(&window, &timing_ptr->published, sizeof(struct timing_window));
+
+    __atomic_thread_fence(__ATOMIC_ACQUIRE);
+  }
+  while (__atomic_load_n(&timing_ptr->seq, __ATOMIC_RELAXED) != seq);
+
+  memset(stats_ptr, 0, sizeof(struct process_stats));
+  if (window.cycles == 0)
+  {
+    return false;
+  }
+
+  stats_ptr->cycles = window.cycles;
+  stats_ptr->period = 1e6 * window.frames / window.cycles / sample_rate;
+
+  for (stage = 0; stage < Stage_Count; stage++)
+  {
+    histogram_ptr = &window.stages[stage];
+    stage_ptr = &stats_ptr->stages[stage];
+    if (histogram_ptr->count == 0)
+    {
+      continue;
+    }
+
+    stage_ptr->min = histogram_ptr->min / 1000.0;
+    stage_ptr->avg = histogram_ptr->sum / 1000.0 / histogram_ptr->count;
+    stage_ptr->max = histogram_ptr->max / 1000.0;
+
+    /* Upper limit of the bucket holding the 99th percentile */
+    rank = histogram_ptr->count - histogram_ptr->count / 100;
+    total = 0;
+    for (i = 0; i < TIMING_BUCKETS; i++)
+    {
+      total += histogram_ptr->buckets[i];
+      if (total >= rank)
+        break;
+    }
+
+    stage_ptr->p99 = (bucket_limit(i) < histogram_ptr->max ? bucket_limit(i) : histogram_ptr->max) / 1000.0;
+  }
+
+  stats_ptr->load = stats_ptr->stages[Stage_Process].avg / stats_ptr->period;
+  return true;
+}
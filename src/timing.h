@@ -0,0 +1,102 @@
+/* -*- Mode: C ; c-basic-offset: 2 -*- */
+/*****************************************************************************
+ *
+ *   This file is part of jack_mixer
+ *
+ *   This program is free software; you can redistribute it and/or modify
+ *   it under the terms of the GNU General Public License as published by
+ *   the Free Software Foundation; version 2 of the License
+ *
+ *   This program is distributed in the hope that it will be useful,
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ *   GNU General Public License for more details.
+ *
+ *   You should have received a copy of the GNU General Public License
+ *   along with this program; if not, write to the Free Software
+ *   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA.
+ *
+ *****************************************************************************/
+
+/*
+ * Timing statistics of the process cycle
+ *
+ * The process thread records the duration of each stage of a cycle in a
+ * histogram with four buckets per octave. After about one second of audio
+ * the histograms are published with a sequence lock and started anew, so
+ * readers on other threads always see the last complete window.
+ */
+
+#ifndef _TIMING_H
+#define _TIMING_H
+
+#include <stdbool.h>
+#include <stdint.h>
+#include <time.h>
+#include <jack/jack.h>
+
+#include "jack_mixer.h"
+
+#define TIMING_BUCKETS 128      /* Covers durations up to 2^32 ns */
+
+struct timing_histogram {
+  uint64_t sum;                 /* ns */
+  uint32_t count;
+  uint32_t min;                 /* ns */
+  uint32_t max;                 /* ns */
+  uint32_t buckets[TIMING_BUCKETS];
+};
+
+struct timing_window {
+  unsigned int cycles;
+  uint64_t frames;
+  struct timing_histogram stages[Stage_Count];
+};
+
+struct timing {
+  struct timing_window current; /* only accessed by the process thread */
+  unsigned int seq;             /* odd while published is written */
+  struct timing_window published;
+};
+
+/* Monotonic time in ns */
+static inline uint64_t
+timing_now(void)
+{
+  struct timespec ts;
+
+  clock_gettime(CLOCK_MONOTONIC, &ts);
+  return (uint64_t)ts.tv_sec * 1000000000 + ts.tv_nsec;
+}
+
+void
+timing_init(
+  struct timing * timing_ptr);
+
+/* Add the duration of a stage in the current cycle, called from the process thread only */
+void
+timing_record(
+  struct timing * timing_ptr,
+  enum process_stage stage,
+  uint64_t duration);
+
+/*
+ * Finish a cycle of nframes frames, called from the process thread only
+ *
+ * Returns the number of cycles in the window if it was published and a
+ * new one started, 0 otherwise.
+ */
+unsigned int
+timing_end_cycle(
+  struct timing * timing_ptr,
+  jack_nframes_t nframes,
+  jack_nframes_t sample_rate);
+
+/* Summarize the last published window, returns false if there is none yet */
+bool
+timing_read(
+  struct timing * timing_ptr,
+  jack_nframes_t sample_rate,
+  struct process_stats * stats_ptr);
+
+#endif /* #ifndef _TIMING_H */
@@ -0,0 +1,441 @@
+/* -*- Mode: C ; c-basic-offset: 2 -*- */
+/*****************************************************************************
+ *
+ *   This file is part of jack_mixer
+ *
+ *   This program is free software; you can redistribute it and/or modify
+ *   it under the terms of the GNU General Public License as published by
+ *   the Free Software Foundation; version 2 of the License
+ *
+ *   This program is distributed in the hope that it will be useful,
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ *   GNU General Public License for more details.
+ *
+ *   You should have received a copy of the GNU General Public License
+ *   along with this program; if not, write to the Free Software
+ *   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA.
+ *
+ *****************************************************************************/
+
+/*
+ * Benchmark of the mixing engine
+ *
+ * Runs the process cycle of an offline mixer with synthetic signals over a
+ * matrix of configurations and prints the timings as JSON, one object per
+ * configuration. Configurations differ in one parameter at a time, so the
+ * cost of a code path (e.g. kmeters or gain ramps) is the difference
+ * between two results.
+ */
+
+#include <stdlib.h>
+#include <stdio.h>
+#include <string.h>
+#include <stdbool.h>
+#include <stdint.h>
+#include <math.h>
+#include <time.h>
+#include <getopt.h>
+#if defined(__x86_64__) || defined(__i386__)
+#include <x86intrin.h>
+#endif
+
+#include "jack_mixer.h"
+#include "dsp.h"
+
+#define SAMPLE_RATE 48000
+#define MAX_VALUES 16
+
+struct value_list {
+  unsigned int count;
+  unsigned int values[MAX_VALUES];
+};
+
+struct config {
+  unsigned int inputs;
+  unsigned int outputs;
+  bool stereo;
+  bool kmetering;
+  bool ramps;                   /* Change volumes every period, so gain ramps are always active */
+  bool mutes;                   /* Each output channel mutes a different half of the input channels */
+  unsigned int period;
+};
+
+struct result {
+  unsigned long periods;
+  double ns_per_sample;         /* Per frame of a period */
+  double mean_period_ns;
+  double max_period_ns;
+  double cycles_per_period;     /* Negative if there is no cycle counter */
+  double dsp_load;              /* Share of the period duration spent processing */
+};
+
+static struct value_list inputs_list = { 3, { 8, 32, 128 } };
+static struct value_list outputs_list = { 3, { 4, 16, 64 } };
+static struct value_list periods_list = { 8, { 32, 64, 128, 256, 512, 1024, 2048, 4096 } };
+static double min_time = 0.1;
+static unsigned int worker_threads = 0;
+
+static inline double
+now_ns(void)
+{
+  struct timespec ts;
+
+  clock_gettime(CLOCK_MONOTONIC, &ts);
+  return ts.tv_sec * 1e9 + ts.tv_nsec;
+}
+
+static inline uint64_t
+cycles(void)
+{
+#if defined(__x86_64__) || defined(__i386__)
+  return __rdtsc();
+#else
+  return 0;
+#endif
+}
+
+static bool
+parse_list(
+  const char * str,
+  struct value_list * list_ptr)
+{
+  char *end;
+
+  list_ptr->count = 0;
+  while (*str != '\0' && list_ptr->count < MAX_VALUES)
+  {
+    list_ptr->values[list_ptr->count] = strtoul(str, &end, 10);
+    if (end == str || list_ptr->values[list_ptr->count] == 0)
+    {
+      return false;
+    }
+
+    list_ptr->count++;
+    str = *end == ',' ? end + 1 : end;
+  }
+
+  return list_ptr->count > 0 && *str == '\0';
+}
+
+static float *
+create_signal(
+  unsigned int length,
+  unsigned int index)
+{
+  float *buffer;
+  unsigned int i;
+
+  buffer = malloc(length * sizeof(float));
+  if (buffer == NULL)
+  {
+    return NULL;
+  }
+
+  /* A different sine for each port, well above the denormal range */
+  for (i = 0; i < length; i++)
+  {
+    buffer[i] = 0.25f * sinf(2.0f * (float)M_PI * (110.0f + 10.0f * index) * i / SAMPLE_RATE);
+  }
+
+  return buffer;
+}
+
+static bool
+run(
+  const struct config * config_ptr,
+  struct result * result_ptr)
+{
+  jack_mixer_t mixer;
+  jack_mixer_channel_t *inputs;
+  jack_mixer_output_channel_t *outputs;
+  jack_mixer_scale_t scale;
+  float **buffers;
+  unsigned int ports_count;
+  unsigned int ports = config_ptr->stereo ? 2 : 1;
+  unsigned int i;
+  unsigned int j;
+  char name[32];
+  double start, end, period_ns, total_ns;
+  uint64_t start_cycles, total_cycles;
+  bool ret = false;
+
+  mixer = create_offline("benchmark", SAMPLE_RATE, config_ptr->period);
+  if (mixer == NULL)
+  {
+    fprintf(stderr, "%s", jack_mixer_error_str());
+    return false;
+  }
+
+  set_kmetering(mixer, config_ptr->kmetering);
+  if (set_worker_threads(mixer, worker_threads) != 0)
+  {
+    fprintf(stderr, "%s", jack_mixer_error_str());
+    goto exit_destroy;
+  }
+
+  scale = scale_create();
+  scale_add_threshold(scale, -70.0, 0.0);
+  scale_add_threshold(scale, 0.0, 1.0);
+  scale_calculate_coefficients(scale);
+
+  ports_count = (config_ptr->inputs + config_ptr->outputs) * ports;
+  inputs = calloc(config_ptr->inputs, sizeof(jack_mixer_channel_t));
+  outputs = calloc(config_ptr->outputs, sizeof(jack_mixer_output_channel_t));
+  buffers = calloc(ports_count, sizeof(float *));
+  if (inputs == NULL || outputs == NULL || buffers == NULL)
+  {
+    goto exit_free;
+  }
+
+  for (i = 0; i < ports_count; i++)
+  {
+    buffers[i] = create_signal(config_ptr->period, i);
+    if (buffers[i] == NULL)
+    {
+      goto exit_free;
+    }
+  }
+
+  for (i = 0; i < config_ptr->inputs; i++)
+  {
+    snprintf(name, sizeof(name), "in %u", i);
+    inputs[i] = add_channel(mixer, name, config_ptr->stereo);
+    if (inputs[i] == NULL)
+    {
+      goto exit_free;
+    }
+
+    channel_set_offline_buffers(inputs[i], buffers[i * ports], buffers[i * ports + ports - 1]);
+    channel_set_midi_scale(inputs[i], scale);
+    if (i < 128)
+    {
+      channel_set_volume_midi_cc(inputs[i], i);
+    }
+    channel_volume_write(inputs[i], -6.0);
+  }
+
+  for (i = 0; i < config_ptr->outputs; i++)
+  {
+    snprintf(name, sizeof(name), "out %u", i);
+    outputs[i] = add_output_channel(mixer, name, config_ptr->stereo, false);
+    if (outputs[i] == NULL)
+    {
+      goto exit_free;
+    }
+
+    channel_set_offline_buffers(outputs[i],
+                                buffers[(config_ptr->inputs + i) * ports],
+                                buffers[(config_ptr->inputs + i) * ports + ports - 1]);
+    channel_volume_write(outputs[i], -3.0);
+  }
+
+  if (config_ptr->mutes)
+  {
+    /* Output channels share only part of their sends, like monitor mixes do */
+    for (i = 0; i < config_ptr->outputs; i++)
+    {
+      for (j = 0; j < config_ptr->inputs; j++)
+      {
+        output_channel_set_muted(outputs[i], inputs[j], ((j * 2654435761u) >> (8 + i % 16)) & 1);
+      }
+    }
+  }
+
+  /* Let initial ramps finish and caches warm up */
+  for (i = 0; i < 64; i++)
+  {
+    offline_process(mixer, config_ptr->period);
+  }
+
+  result_ptr->periods = 0;
+  result_ptr->max_period_ns = 0.0;
+  total_ns = 0.0;
+  total_cycles = 0;
+  while (total_ns < min_time * 1e9 || result_ptr->periods < 16)
+  {
+    if (config_ptr->ramps)
+    {
+      /* Restart the ramp of every input channel, this also queues MIDI
+       * out events for channels with a MIDI CC */
+      for (i = 0; i < config_ptr->inputs; i++)
+      {
+        channel_volume_write(inputs[i], result_ptr->periods % 2 ? -6.0 : -7.0);
+      }
+    }
+
+    start_cycles = cycles();
+    start = now_ns();
+    if (offline_process(mixer, config_ptr->period) != 0)
+    {
+      fprintf(stderr, "%s", jack_mixer_error_str());
+      goto exit_free;
+    }
+    end = now_ns();
+    total_cycles += cycles() - start_cycles;
+
+    period_ns = end - start;
+    total_ns += period_ns;
+    if (period_ns > result_ptr->max_period_ns)
+    {
+      result_ptr->max_period_ns = period_ns;
+    }
+    result_ptr->periods++;
+  }
+
+  result_ptr->cycles_per_period = total_cycles == 0 ? -1.0 : (double)total_cycles / result_ptr->periods;
+  result_ptr->mean_period_ns = total_ns / result_ptr->periods;
+  result_ptr->ns_per_sample = result_ptr->mean_period_ns / config_ptr->period;
+  result_ptr->dsp_load = result_ptr->mean_period_ns / (1e9 * config_ptr->period / SAMPLE_RATE);
+  ret = true;
+
+exit_free:
+  if (!ret)
+  {
+    fprintf(stderr, "Could not set up benchmark.\n");
+  }
+
+  if (buffers != NULL)
+  {
+    for (i = 0; i < ports_count; i++)
+    {
+      free(buffers[i]);
+    }
+  }
+
+  free(buffers);
+  free(outputs);
+  free(inputs);
+  scale_destroy(scale);
+
+exit_destroy:
+  remove_channels(mixer);
+  destroy(mixer);
+  return ret;
+}
+
+static void
+usage(void)
+{
+  fputs(
+"Usage: jack_mixer_benchmark [-i <list>] [-o <list>] [-p <list>] [-t <seconds>] [-w <count>]\n"
+"\n"
+"-h|--help     print this help message\n"
+"-i|--inputs   comma separated numbers of input channels (default 8,32,128)\n"
+"-o|--outputs  comma separated numbers of output channels (default 4,16,64)\n"
+"-p|--periods  comma separated period sizes in frames (default 32 to 4096)\n"
+"-t|--time     minimum time to run each configuration (default 0.1)\n"
+"-w|--threads  number of worker threads for processing (default 0)\n"
+"\n"
+"Each combination of channel counts, mono/stereo channels, kmetering on/off,\n"
+"gain ramps active/idle, identical/partly muted routing and period size is run\n"
+"and the results are printed to standard output as JSON.\n",
+    stdout);
+}
+
+int
+main(
+  int argc,
+  char * argv[])
+{
+  static struct option long_options[] = {
+    {"help", no_argument, 0, 'h'},
+    {"inputs", required_argument, 0, 'i'},
+    {"outputs", required_argument, 0, 'o'},
+    {"periods", required_argument, 0, 'p'},
+    {"time", required_argument, 0, 't'},
+    {"threads", required_argument, 0, 'w'},
+    {0, 0, 0, 0}
+  };
+  struct config config;
+  struct result result;
+  unsigned int i, o, p, variant;
+  bool first = true;
+  int c;
+
+  while ((c = getopt_long(argc, argv, "hi:o:p:t:w:", long_options, NULL)) != -1)
+  {
+    switch (c)
+    {
+    case 'h':
+      usage();
+      return 0;
+    case 'i':
+      if (!parse_list(optarg, &inputs_list))
+        goto invalid;
+      break;
+    case 'o':
+      if (!parse_list(optarg, &outputs_list))
+        goto invalid;
+      break;
+    case 'p':
+      if (!parse_list(optarg, &periods_list))
+        goto invalid;
+      break;
+    case 't':
+      min_time = strtod(optarg, NULL);
+      break;
+    case 'w':
+      worker_threads = strtoul(optarg, NULL, 10);
+      break;
+    default:
+      goto invalid;
+    }
+  }
+
+  /* Select kernels before reporting their name, creating mixers does it too */
+  dsp_init();
+
+  printf("{\n  \"sample_rate\": %u,\n  \"dsp_kernels\": \"%s\",\n  \"worker_threads\": %u,\n"
+         "  \"results\": [",
+         SAMPLE_RATE, dsp_get_kernel_name(), worker_threads);
+
+  for (i = 0; i < inputs_list.count; i++)
+  {
+    for (o = 0; o < outputs_list.count; o++)
+    {
+      for (variant = 0; variant < 16; variant++)
+      {
+        for (p = 0; p < periods_list.count; p++)
+        {
+          config.inputs = inputs_list.values[i];
+          config.outputs = outputs_list.values[o];
+          config.stereo = variant & 1;
+          config.kmetering = variant & 2;
+          config.ramps = variant & 4;
+          config.mutes = variant & 8;
+          config.period = periods_list.values[p];
+
+          if (!run(&config, &result))
+          {
+            return 1;
+          }
+
+          printf("%s\n    {\"inputs\": %u, \"outputs\": %u, \"stereo\": %s, \"kmetering\": %s, "
+                 "\"ramps\": %s, \"mutes\": %s, \"period\": %u, \"periods\": %lu, \"ns_per_sample\": %.3f, "
+                 "\"mean_period_ns\": %.1f, \"max_period_ns\": %.1f, \"cycles_per_period\": %.0f, "
+                 "\"dsp_load\": %.6f}",
+                 first ? "" : ",",
+                 config.inputs, config.outputs,
+                 config.stereo ? "true" : "false",
+                 config.kmetering ? "true" : "false",
+                 config.ramps ? "true" : "false",
+                 config.mutes ? "true" : "false",
+                 config.period, result.periods, result.ns_per_sample,
+                 result.mean_period_ns, result.max_period_ns, result.cycles_per_period,
+                 result.dsp_load);
+          fflush(stdout);
+          first = false;
+        }
+      }
+    }
+  }
+
+  printf("\n  ]\n}\n");
+  return 0;
+
+invalid:
+  fprintf(stderr, "Invalid argument, aborting.\n");
+  usage();
+  return 1;
+}
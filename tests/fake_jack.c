@@ -0,0 +1,543 @@
+/* -*- Mode: C ; c-basic-offset: 2 -*- */
+/*****************************************************************************
+ *
+ *   This file is part of jack_mixer
+ *
+ *   This program is free software; you can redistribute it and/or modify
+ *   it under the terms of the GNU General Public License as published by
+ *   the Free Software Foundation; version 2 of the License
+ *
+ *   This program is distributed in the hope that it will be useful,
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ *   GNU General Public License for more details.
+ *
+ *   You should have received a copy of the GNU General Public License
+ *   along with this program; if not, write to the Free Software
+ *   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA.
+ *
+ *****************************************************************************/
+
+#include <stdlib.h>
+#include <stdbool.h>
+#include <string.h>
+#include <pthread.h>
+#include <jack/jack.h>
+#include <jack/midiport.h>
+#include <jack/ringbuffer.h>
+
+#include "fake_jack.h"
+
+#define MAX_MIDI_EVENTS 64
+#define MAX_MIDI_EVENT_SIZE 4
+
+struct _jack_port {
+  struct _jack_port *next;
+  char *name;
+  unsigned long flags;
+  bool midi;
+  float buffer[FAKE_JACK_BUFFER_SIZE];
+  unsigned int midi_events_count;
+  jack_midi_event_t midi_events[MAX_MIDI_EVENTS];
+  jack_midi_data_t midi_data[MAX_MIDI_EVENTS][MAX_MIDI_EVENT_SIZE];
+};
+
+struct _jack_client {
+  bool open;
+  bool active;
+  char *name;
+  JackProcessCallback process;
+  void *process_arg;
+  struct _jack_port *ports;
+};
+
+static struct _jack_client client;
+
+static void
+free_port(
+  struct _jack_port * port_ptr)
+{
+  free(port_ptr->name);
+  free(port_ptr);
+}
+
+static struct _jack_port *
+find_port(
+  const char * name)
+{
+  struct _jack_port *port_ptr;
+
+  for (port_ptr = client.ports; port_ptr != NULL; port_ptr = port_ptr->next)
+  {
+    if (strcmp(port_ptr->name, name) == 0)
+    {
+      return port_ptr;
+    }
+  }
+
+  return NULL;
+}
+
+int
+fake_jack_process(
+  jack_nframes_t nframes)
+{
+  struct _jack_port *port_ptr;
+  int ret;
+
+  if (!client.active || client.process == NULL || nframes > FAKE_JACK_BUFFER_SIZE)
+  {
+    return -1;
+  }
+
+  ret = client.process(nframes, client.process_arg);
+
+  /* MIDI input events are only delivered in one cycle */
+  port_ptr = find_port("midi in");
+  if (port_ptr != NULL)
+  {
+    port_ptr->midi_events_count = 0;
+  }
+
+  return ret;
+}
+
+float *
+fake_jack_port_buffer(
+  const char * name)
+{
+  struct _jack_port *port_ptr = find_port(name);
+
+  if (port_ptr == NULL || port_ptr->midi)
+  {
+    return NULL;
+  }
+
+  return port_ptr->buffer;
+}
+
+int
+fake_jack_midi_in(
+  jack_nframes_t time,
+  const unsigned char * data,
+  size_t size)
+{
+  struct _jack_port *port_ptr = find_port("midi in");
+  jack_midi_data_t *data_ptr;
+
+  if (port_ptr == NULL)
+  {
+    return -1;
+  }
+
+  data_ptr = jack_midi_event_reserve(port_ptr, time, size);
+  if (data_ptr == NULL)
+  {
+    return -1;
+  }
+
+  memcpy(data_ptr, data, size);
+  return 0;
+}
+
+jack_client_t *
+jack_client_open(
+  const char * client_name,
+  jack_options_t options,
+  jack_status_t * status,
+  ...)
+{
+  (void) options;
+  (void) status;
+
+  if (client.open)
+  {
+    return NULL;
+  }
+
+  client.name = strdup(client_name);
+  if (client.name == NULL)
+  {
+    return NULL;
+  }
+
+  client.open = true;
+  return &client;
+}
+
+int
+jack_client_close(
+  jack_client_t * client_ptr)
+{
+  struct _jack_port *port_ptr;
+
+  while (client_ptr->ports != NULL)
+  {
+    port_ptr = client_ptr->ports;
+    client_ptr->ports = port_ptr->next;
+    free_port(port_ptr);
+  }
+
+  free(client_ptr->name);
+  memset(client_ptr, 0, sizeof(struct _jack_client));
+  return 0;
+}
+
+char *
+jack_get_client_name(
+  jack_client_t * client_ptr)
+{
+  return client_ptr->name;
+}
+
+jack_nframes_t
+jack_get_sample_rate(
+  jack_client_t * client_ptr)
+{
+  (void) client_ptr;
+  return FAKE_JACK_SAMPLE_RATE;
+}
+
+jack_nframes_t
+jack_get_buffer_size(
+  jack_client_t * client_ptr)
+{
+  (void) client_ptr;
+  return FAKE_JACK_BUFFER_SIZE;
+}
+
+int
+jack_set_process_callback(
+  jack_client_t * client_ptr,
+  JackProcessCallback process_callback,
+  void * arg)
+{
+  client_ptr->process = process_callback;
+  client_ptr->process_arg = arg;
+  return 0;
+}
+
+int
+jack_set_buffer_size_callback(
+  jack_client_t * client_ptr,
+  JackBufferSizeCallback bufsize_callback,
+  void * arg)
+{
+  (void) client_ptr;
+  (void) bufsize_callback;
+  (void) arg;
+
+  /* The buffer size never changes */
+  return 0;
+}
+
+int
+jack_set_xrun_callback(
+  jack_client_t * client_ptr,
+  JackXRunCallback xrun_callback,
+  void * arg)
+{
+  (void) client_ptr;
+  (void) xrun_callback;
+  (void) arg;
+  return 0;
+}
+
+int
+jack_activate(
+  jack_client_t * client_ptr)
+{
+  client_ptr->active = true;
+  return 0;
+}
+
+jack_port_t *
+jack_port_register(
+  jack_client_t * client_ptr,
+  const char * port_name,
+  const char * port_type,
+  unsigned long flags,
+  unsigned long buffer_size)
+{
+  struct _jack_port *port_ptr;
+
+  (void) buffer_size;
+
+  port_ptr = calloc(1, sizeof(struct _jack_port));
+  if (port_ptr == NULL)
+  {
+    return NULL;
+  }
+
+  port_ptr->name = strdup(port_name);
+  if (port_ptr->name == NULL)
+  {
+    free(port_ptr);
+    return NULL;
+  }
+
+  port_ptr->flags = flags;
+  port_ptr->midi = strcmp(port_type, JACK_DEFAULT_MIDI_TYPE) == 0;
+  port_ptr->next = client_ptr->ports;
+  client_ptr->ports = port_ptr;
+
+  return port_ptr;
+}
+
+int
+jack_port_unregister(
+  jack_client_t * client_ptr,
+  jack_port_t * port_ptr)
+{
+  struct _jack_port **link_ptr;
+
+  for (link_ptr = &client_ptr->ports; *link_ptr != NULL; link_ptr = &(*link_ptr)->next)
+  {
+    if (*link_ptr == port_ptr)
+    {
+      *link_ptr = port_ptr->next;
+      free_port(port_ptr);
+      return 0;
+    }
+  }
+
+  return -1;
+}
+
+int
+jack_port_rename(
+  jack_client_t * client_ptr,
+  jack_port_t * port_ptr,
+  const char * port_name)
+{
+  char *name_ptr;
+
+  (void) client_ptr;
+
+  name_ptr = strdup(port_name);
+  if (name_ptr == NULL)
+  {
+    return -1;
+  }
+
+  free(port_ptr->name);
+  port_ptr->name = name_ptr;
+  return 0;
+}
+
+void *
+jack_port_get_buffer(
+  jack_port_t * port_ptr,
+  jack_nframes_t nframes)
+{
+  (void) nframes;
+
+  if (port_ptr->midi)
+  {
+    return port_ptr;
+  }
+
+  return port_ptr->buffer;
+}
+
+int
+jack_port_connected(
+  const jack_port_t * port_ptr)
+{
+  (void) port_ptr;
+
+  /* All ports count as connected, so all channels are mixed */
+  return 1;
+}
+
+int
+jack_client_create_thread(
+  jack_client_t * client_ptr,
+  pthread_t * thread_ptr,
+  int priority,
+  int realtime,
+  void *(*start_routine)(void *),
+  void * arg)
+{
+  (void) client_ptr;
+  (void) priority;
+  (void) realtime;
+  return pthread_create(thread_ptr, NULL, start_routine, arg);
+}
+
+int
+jack_client_real_time_priority(
+  jack_client_t * client_ptr)
+{
+  (void) client_ptr;
+  return 0;
+}
+
+int
+jack_is_realtime(
+  jack_client_t * client_ptr)
+{
+  (void) client_ptr;
+  return 0;
+}
+
+/* MIDI port buffers are the ports themselves */
+
+uint32_t
+jack_midi_get_event_count(
+  void * port_buffer)
+{
+  return ((struct _jack_port *)port_buffer)->midi_events_count;
+}
+
+int
+jack_midi_event_get(
+  jack_midi_event_t * event,
+  void * port_buffer,
+  uint32_t event_index)
+{
+  struct _jack_port *port_ptr = port_buffer;
+
+  if (event_index >= port_ptr->midi_events_count)
+  {
+    return -1;
+  }
+
+  *event = port_ptr->midi_events[event_index];
+  return 0;
+}
+
+void
+jack_midi_clear_buffer(
+  void * port_buffer)
+{
+  ((struct _jack_port *)port_buffer)->midi_events_count = 0;
+}
+
+jack_midi_data_t *
+jack_midi_event_reserve(
+  void * port_buffer,
+  jack_nframes_t time,
+  size_t data_size)
+{
+  struct _jack_port *port_ptr = port_buffer;
+  unsigned int index = port_ptr->midi_events_count;
+
+  if (index == MAX_MIDI_EVENTS || data_size > MAX_MIDI_EVENT_SIZE)
+  {
+    return NULL;
+  }
+
+  port_ptr->midi_events[index].time = time;
+  port_ptr->midi_events[index].size = data_size;
+  port_ptr->midi_events[index].buffer = port_ptr->midi_data[index];
+  port_ptr->midi_events_count++;
+
+  return port_ptr->midi_data[index];
+}
+
+/* Single reader and single writer ring buffer, as in JACK */
+
+jack_ringbuffer_t *
+jack_ringbuffer_create(
+  size_t sz)
+{
+  jack_ringbuffer_t *rb;
+  size_t size = 1;
+
+  while (size < sz)
+  {
+    size <<= 1;
+  }
+
+  rb = calloc(1, sizeof(jack_ringbuffer_t));
+  if (rb == NULL)
+  {
+    return NULL;
+  }
+
+  rb->buf = malloc(size);
+  if (rb->buf == NULL)
+  {
+    free(rb);
+    return NULL;
+  }
+
+  rb->size = size;
+  rb->size_mask = size - 1;
+  return rb;
+}
+
+void
+jack_ringbuffer_free(
+  jack_ringbuffer_t * rb)
+{
+  free(rb->buf);
+  free(rb);
+}
+
+size_t
+jack_ringbuffer_read_space(
+  const jack_ringbuffer_t * rb)
+{
+  size_t w = __atomic_load_n(&rb->write_ptr, __ATOMIC_ACQUIRE);
+  size_t r = __atomic_load_n(&rb->read_ptr, __ATOMIC_ACQUIRE);
+
+  return (w - r) & rb->size_mask;
+}
+
+size_t
+jack_ringbuffer_write_space(
+  const jack_ringbuffer_t * rb)
+{
+  size_t w = __atomic_load_n(&rb->write_ptr, __ATOMIC_ACQUIRE);
+  size_t r = __atomic_load_n(&rb->read_ptr, __ATOMIC_ACQUIRE);
+
+  return (r - w - 1) & rb->size_mask;
+}
+
+size_t
+jack_ringbuffer_read(
+  jack_ringbuffer_t * rb,
+  char * dest,
+  size_t cnt)
+{
+  size_t r = rb->read_ptr;
+  size_t i;
+
+  if (cnt > jack_ringbuffer_read_space(rb))
+  {
+    cnt = jack_ringbuffer_read_space(rb);
+  }
+
+  for (i = 0; i < cnt; i++)
+  {
+    dest[i] = rb->buf[(r + i) & rb->size_mask];
+  }
+
+  __atomic_store_n(&rb->read_ptr, (r + cnt) & rb->size_mask, __ATOMIC_RELEASE);
+  return cnt;
+}
+
+size_t
+jack_ringbuffer_write(
+  jack_ringbuffer_t * rb,
+  const char * src,
+  size_t cnt)
+{
+  size_t w = rb->write_ptr;
+  size_t i;
+
+  if (cnt > jack_ringbuffer_write_space(rb))
+  {
+    cnt = jack_ringbuffer_write_space(rb);
+  }
+
+  for (i = 0; i < cnt; i++)
+  {
+    rb->buf[(w + i) & rb->size_mask] = src[i];
+  }
+
+  __atomic_store_n(&rb->write_ptr, (w + cnt) & rb->size_mask, __ATOMIC_RELEASE);
+  return cnt;
+}
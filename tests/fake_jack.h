@@ -0,0 +1,58 @@
+/* -*- Mode: C ; c-basic-offset: 2 -*- */
+/*****************************************************************************
+ *
+ *   This file is part of jack_mixer
+ *
+ *   This program is free software; you can redistribute it and/or modify
+ *   it under the terms of the GNU General Public License as published by
+ *   the Free Software Foundation; version 2 of the License
+ *
+ *   This program is distributed in the hope that it will be useful,
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ *   GNU General Public License for more details.
+ *
+ *   You should have received a copy of the GNU General Public License
+ *   along with this program; if not, write to the Free Software
+ *   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA.
+ *
+ *****************************************************************************/
+
+/*
+ * Stand-in for the JACK library, linked into tests instead of it
+ *
+ * It implements the JACK functions the mixer engine uses for a single
+ * client, without any server. Process cycles run in the thread calling
+ * fake_jack_process(), and MIDI events can be sent to the client, which
+ * the offline backend can't do.
+ */
+
+#ifndef _FAKE_JACK_H
+#define _FAKE_JACK_H
+
+#include <stddef.h>
+#include <jack/jack.h>
+
+#define FAKE_JACK_SAMPLE_RATE 48000
+#define FAKE_JACK_BUFFER_SIZE 256
+
+/* Run one process cycle of nframes frames, returns the process callback
+ * result, or -1 if there is no active client or nframes is too large */
+int
+fake_jack_process(
+  jack_nframes_t nframes);
+
+/* Returns the buffer of the port with the given short name, or NULL */
+float *
+fake_jack_port_buffer(
+  const char * name);
+
+/* Queue a MIDI event for the "midi in" port in the next process cycle,
+ * returns 0 on success */
+int
+fake_jack_midi_in(
+  jack_nframes_t time,
+  const unsigned char * data,
+  size_t size);
+
+#endif /* #ifndef _FAKE_JACK_H */
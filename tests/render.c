@@ -0,0 +1,492 @@
+/* -*- Mode: C ; c-basic-offset: 2 -*- */
+/*****************************************************************************
+ *
+ *   This file is part of jack_mixer
+ *
+ *   This program is free software; you can redistribute it and/or modify
+ *   it under the terms of the GNU General Public License as published by
+ *   the Free Software Foundation; version 2 of the License
+ *
+ *   This program is distributed in the hope that it will be useful,
+ *   but WITHOUT ANY WARRANTY; without even the implied warranty of
+ *   MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+ *   GNU General Public License for more details.
+ *
+ *   You should have received a copy of the GNU General Public License
+ *   along with this program; if not, write to the Free Software
+ *   Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA 02110-1301 USA.
+ *
+ *****************************************************************************/
+
+/*
+ * Regression test of the mixing engine
+ *
+ * Renders known signals through offline mixers and checks the output
+ * against values computed by hand: routing with mute, solo and pre-fader
+ * sends, a volume ramp, a scene recall and mix-minus output channels.
+ *
+ * The offline backend has no MIDI ports, so periods split at MIDI events
+ * are rendered by a mixer on the JACK stand-in of fake_jack.c instead.
+ */
+
+#include <stdlib.h>
+#include <stdio.h>
+#include <stdbool.h>
+#include <string.h>
+#include <math.h>
+
+#include "jack_mixer.h"
+#include "fake_jack.h"
+
+/* Offline mixers run with the sample rate and period of the JACK stand-in */
+#define SAMPLE_RATE FAKE_JACK_SAMPLE_RATE
+#define PERIOD FAKE_JACK_BUFFER_SIZE
+#define SPLIT_FRAMES 32
+
+/* Volume in dB halving the signal */
+#define HALF_DB (20.0 * log10(0.5))
+
+/* Enough periods for volume transitions and routing changes to end */
+#define SETTLE_PERIODS 4
+
+static unsigned int failures;
+
+static void
+check(
+  const char * what,
+  double value,
+  double expected,
+  double tolerance)
+{
+  if (fabs(value - expected) > tolerance)
+  {
+    printf("FAIL %s: %f, expected %f\n", what, value, expected);
+    failures++;
+  }
+}
+
+/* Check that all samples of a buffer have the same value */
+static void
+check_buffer(
+  const char * what,
+  const float * buffer,
+  unsigned int count,
+  double expected)
+{
+  unsigned int i;
+
+  for (i = 0; i < count; i++)
+  {
+    if (fabs(buffer[i] - expected) > 1e-5)
+    {
+      printf("FAIL %s: sample %u is %f, expected %f\n", what, i, buffer[i], expected);
+      failures++;
+      return;
+    }
+  }
+}
+
+static void
+fill(
+  float * buffer,
+  unsigned int count,
+  float value)
+{
+  unsigned int i;
+
+  for (i = 0; i < count; i++)
+  {
+    buffer[i] = value;
+  }
+}
+
+static bool
+process(
+  jack_mixer_t mixer,
+  unsigned int periods)
+{
+  while (periods-- != 0)
+  {
+    if (offline_process(mixer, PERIOD) != 0)
+    {
+      printf("FAIL offline_process()\n");
+      failures++;
+      return false;
+    }
+  }
+
+  return true;
+}
+
+/*
+ * Offline mixer with three mono input channels A, B and C, fed with
+ * constant signals of 0.5, 0.25 and 0.125, and outputs mono output channels
+ */
+struct fixture {
+  jack_mixer_t mixer;
+  jack_mixer_channel_t inputs[3];
+  jack_mixer_output_channel_t outputs[4];
+  float input_buffers[3][PERIOD];
+  float output_buffers[4][PERIOD];
+  unsigned int outputs_count;
+};
+
+static bool
+fixture_init(
+  struct fixture * fixture_ptr,
+  unsigned int outputs_count)
+{
+  static const char * input_names[] = { "A", "B", "C" };
+  static const float input_values[] = { 0.5f, 0.25f, 0.125f };
+  char name[16];
+  unsigned int i;
+
+  memset(fixture_ptr, 0, sizeof(struct fixture));
+
+  fixture_ptr->mixer = create_offline("render", SAMPLE_RATE, PERIOD);
+  if (fixture_ptr->mixer == NULL)
+  {
+    printf("FAIL create_offline(): %s", jack_mixer_error_str());
+    failures++;
+    return false;
+  }
+
+  for (i = 0; i < 3; i++)
+  {
+    fixture_ptr->inputs[i] = add_channel(fixture_ptr->mixer, input_names[i], false);
+    fill(fixture_ptr->input_buffers[i], PERIOD, input_values[i]);
+    channel_set_offline_buffers(fixture_ptr->inputs[i], fixture_ptr->input_buffers[i], NULL);
+    channel_volume_write(fixture_ptr->inputs[i], 0.0);
+  }
+
+  for (i = 0; i < outputs_count; i++)
+  {
+    snprintf(name, sizeof(name), "O%u", i + 1);
+    fixture_ptr->outputs[i] = add_output_channel(fixture_ptr->mixer, name, false, false);
+    channel_set_offline_buffers(fixture_ptr->outputs[i], fixture_ptr->output_buffers[i], NULL);
+    channel_volume_write(fixture_ptr->outputs[i], 0.0);
+  }
+  fixture_ptr->outputs_count = outputs_count;
+
+  return process(fixture_ptr->mixer, SETTLE_PERIODS);
+}
+
+static void
+fixture_destroy(
+  struct fixture * fixture_ptr)
+{
+  unsigned int i;
+
+  for (i = 0; i < fixture_ptr->outputs_count; i++)
+  {
+    remove_output_channel(fixture_ptr->outputs[i]);
+  }
+  remove_channels(fixture_ptr->mixer);
+  destroy(fixture_ptr->mixer);
+}
+
+static void
+test_routing(void)
+{
+  struct fixture fixture;
+  jack_mixer_channel_t *in = fixture.inputs;
+  jack_mixer_output_channel_t *out = fixture.outputs;
+
+  if (!fixture_init(&fixture, 4))
+  {
+    return;
+  }
+
+  /* A is halved by its fader, pre-fader sends bypass it */
+  channel_volume_write(in[0], HALF_DB);
+  output_channel_set_muted(out[0], in[1], true);
+  output_channel_set_solo(out[1], in[2], true);
+  output_channel_set_prefader(out[2], true);
+  output_channel_set_in_prefader(out[3], in[0], true);
+  output_channel_set_muted(out[3], in[2], true);
+  process(fixture.mixer, SETTLE_PERIODS);
+
+  check_buffer("routing mute", fixture.output_buffers[0], PERIOD, 0.25 + 0.125);
+  check_buffer("routing output solo", fixture.output_buffers[1], PERIOD, 0.125);
+  check_buffer("routing pre-fader output", fixture.output_buffers[2], PERIOD, 0.5 + 0.25 + 0.125);
+  check_buffer("routing pre-fader input", fixture.output_buffers[3], PERIOD, 0.5 + 0.25);
+
+  /* A soloed channel is the only one heard, unless muted, and channels
+   * soloed for an output channel are still heard on it */
+  channel_solo(in[1]);
+  process(fixture.mixer, SETTLE_PERIODS);
+
+  check_buffer("solo muted", fixture.output_buffers[0], PERIOD, 0.0);
+  check_buffer("solo with output solo", fixture.output_buffers[1], PERIOD, 0.25 + 0.125);
+  check_buffer("solo pre-fader output", fixture.output_buffers[2], PERIOD, 0.25);
+  check_buffer("solo pre-fader input", fixture.output_buffers[3], PERIOD, 0.25);
+
+  channel_unsolo(in[1]);
+  channel_out_mute(in[0]);
+  process(fixture.mixer, SETTLE_PERIODS);
+
+  check_buffer("unsolo", fixture.output_buffers[0], PERIOD, 0.125);
+  check_buffer("input mute", fixture.output_buffers[2], PERIOD, 0.25 + 0.125);
+
+  fixture_destroy(&fixture);
+}
+
+static void
+test_volume_ramp(void)
+{
+  struct fixture fixture;
+  float ramp[2 * PERIOD];
+  unsigned int steps = VOLUME_TRANSITION_SECONDS * SAMPLE_RATE + 1;
+  unsigned int i;
+
+  if (!fixture_init(&fixture, 1))
+  {
+    return;
+  }
+
+  output_channel_set_solo(fixture.outputs[0], fixture.inputs[0], true);
+  process(fixture.mixer, SETTLE_PERIODS);
+  check_buffer("ramp start", fixture.output_buffers[0], PERIOD, 0.5);
+
+  /* The transition to the new volume is interpolated in dB */
+  channel_volume_write(fixture.inputs[0], HALF_DB);
+  process(fixture.mixer, 1);
+  memcpy(ramp, fixture.output_buffers[0], PERIOD * sizeof(float));
+  process(fixture.mixer, 1);
+  memcpy(ramp + PERIOD, fixture.output_buffers[0], PERIOD * sizeof(float));
+
+  for (i = 1; i < steps; i++)
+  {
+    if (ramp[i] > ramp[i - 1])
+    {
+      printf("FAIL ramp: sample %u rises\n", i);
+      failures++;
+      break;
+    }
+  }
+  check("ramp first sample", ramp[0], 0.5, 0.002);
+  check("ramp middle", ramp[steps / 2], 0.5 * sqrt(0.5), 0.002);
+  check_buffer("ramp end", ramp + steps, 2 * PERIOD - steps, 0.25);
+
+  fixture_destroy(&fixture);
+}
+
+static void
+test_scene(void)
+{
+  struct fixture fixture;
+  jack_mixer_channel_t *in = fixture.inputs;
+  jack_mixer_output_channel_t *out = fixture.outputs;
+
+  if (!fixture_init(&fixture, 2))
+  {
+    return;
+  }
+
+  channel_volume_write(in[0], HALF_DB);
+  output_channel_set_muted(out[0], in[1], true);
+  output_channel_set_prefader(out[1], true);
+  channel_out_mute(in[2]);
+  if (store_scene(fixture.mixer, 3) != 0)
+  {
+    printf("FAIL store_scene()\n");
+    failures++;
+  }
+
+  channel_volume_write(in[0], 0.0);
+  output_channel_set_muted(out[0], in[1], false);
+  output_channel_set_prefader(out[1], false);
+  channel_out_unmute(in[2]);
+  process(fixture.mixer, SETTLE_PERIODS);
+  check_buffer("scene changed", fixture.output_buffers[0], PERIOD, 0.5 + 0.25 + 0.125);
+
+  if (recall_scene(fixture.mixer, 3, 0.0) != 0)
+  {
+    printf("FAIL recall_scene()\n");
+    failures++;
+  }
+  process(fixture.mixer, SETTLE_PERIODS);
+
+  check("scene current", get_current_scene(fixture.mixer), 3, 0);
+  check("scene volume", channel_volume_read(in[0]), HALF_DB, 0.01);
+  check("scene mute", output_channel_is_muted(out[0], in[1]), true, 0);
+  check_buffer("scene recalled", fixture.output_buffers[0], PERIOD, 0.25);
+  check_buffer("scene recalled pre-fader", fixture.output_buffers[1], PERIOD, 0.5 + 0.25);
+
+  fixture_destroy(&fixture);
+}
+
+static void
+test_mix_minus(void)
+{
+  struct fixture fixture;
+  jack_mixer_channel_t *in = fixture.inputs;
+  jack_mixer_output_channel_t *out = fixture.outputs;
+
+  if (!fixture_init(&fixture, 4))
+  {
+    return;
+  }
+
+  output_channel_set_muted(out[0], in[2], true);
+  if (output_channel_set_mix_minus(out[1], out[0], in[0]) != 0 ||
+      output_channel_set_mix_minus(out[2], out[0], in[1]) != 0 ||
+      output_channel_set_mix_minus(out[3], out[0], NULL) != 0)
+  {
+    printf("FAIL output_channel_set_mix_minus()\n");
+    failures++;
+  }
+
+  /* Mix-minus output channels apply their own volume only */
+  channel_volume_write(out[0], HALF_DB);
+  channel_volume_write(out[2], HALF_DB);
+  process(fixture.mixer, SETTLE_PERIODS);
+
+  check_buffer("mix-minus source", fixture.output_buffers[0], PERIOD, 0.5 * (0.5 + 0.25));
+  check_buffer("mix-minus A", fixture.output_buffers[1], PERIOD, 0.25);
+  check_buffer("mix-minus B", fixture.output_buffers[2], PERIOD, 0.5 * 0.5);
+  check_buffer("mix-minus none", fixture.output_buffers[3], PERIOD, 0.5 + 0.25);
+
+  fixture_destroy(&fixture);
+}
+
+#ifdef HAVE_JACK_MIDI
+static void
+send_cc(
+  unsigned int time,
+  unsigned char cc,
+  unsigned char value)
+{
+  unsigned char data[3] = { 0xB0, cc, value };
+
+  if (fake_jack_midi_in(time, data, sizeof(data)) != 0)
+  {
+    printf("FAIL fake_jack_midi_in()\n");
+    failures++;
+  }
+}
+
+/*
+ * Render a sine through a JACK mixer, with a MIDI CC in the middle of every
+ * period when split is set, and check the K-meters and the output
+ */
+static void
+test_midi_split(
+  bool split)
+{
+  const char *what = split ? "split" : "unsplit";
+  char message[64];
+  jack_mixer_t mixer;
+  jack_mixer_channel_t input;
+  jack_mixer_channel_t other;
+  jack_mixer_output_channel_t output;
+  float *input_buffer, *output_buffer;
+  double peak, rms;
+  unsigned int period, i;
+
+  mixer = create("render", false);
+  if (mixer == NULL)
+  {
+    printf("FAIL create(): %s", jack_mixer_error_str());
+    failures++;
+    return;
+  }
+
+  set_kmetering(mixer, true);
+  set_midi_split_frames(mixer, split ? SPLIT_FRAMES : 0);
+  input = add_channel(mixer, "A", false);
+  other = add_channel(mixer, "B", false);
+  output = add_output_channel(mixer, "O", false, false);
+  channel_volume_write(input, 0.0);
+  channel_volume_write(output, 0.0);
+  channel_set_mute_midi_cc(input, 20);
+  channel_set_mute_midi_cc(other, 21);
+  input_buffer = fake_jack_port_buffer("A");
+  output_buffer = fake_jack_port_buffer("O");
+
+  /* A 1 kHz sine of amplitude 0.1 reads -20 dB on both K-meter scales */
+  for (period = 0; period < 300; period++)
+  {
+    for (i = 0; i < PERIOD; i++)
+    {
+      input_buffer[i] = 0.1f * sinf(2.0f * (float)M_PI * ((period * PERIOD + i) % 48) / 48);
+    }
+    send_cc(100, 21, period & 1 ? 127 : 0);
+    fake_jack_process(PERIOD);
+
+    /* Start measuring the RMS value after the filters settled */
+    if (period == 250)
+    {
+      channel_mono_kmeter_read(input, &peak, &rms, Pre_Fader);
+    }
+  }
+
+  channel_mono_kmeter_read(input, &peak, &rms, Pre_Fader);
+  snprintf(message, sizeof(message), "%s K-meter peak", what);
+  check(message, peak, -20.0, 0.01);
+  snprintf(message, sizeof(message), "%s K-meter RMS", what);
+  check(message, rms, -20.0, 0.05);
+
+  /* A peak is held for half a second, then falls by 10.5 dB per second */
+  fill(input_buffer, PERIOD, 0.0f);
+  input_buffer[10] = 0.5f;
+  for (period = 0; period < 100; period++)
+  {
+    send_cc(100, 21, period & 1 ? 127 : 0);
+    fake_jack_process(PERIOD);
+    input_buffer[10] = 0.0f;
+
+    if (period == 90)
+    {
+      channel_mono_kmeter_read(input, &peak, &rms, Pre_Fader);
+      snprintf(message, sizeof(message), "%s K-meter peak hold", what);
+      check(message, peak, 20.0 * log10(0.5), 0.01);
+    }
+  }
+
+  /* Muting by MIDI takes effect at the frame of the event in split
+   * periods, otherwise at the start of the period */
+  fill(input_buffer, PERIOD, 0.5f);
+  fake_jack_process(PERIOD);
+  snprintf(message, sizeof(message), "%s output before mute", what);
+  check_buffer(message, output_buffer, PERIOD, 0.5);
+  send_cc(100, 20, 127);
+  fake_jack_process(PERIOD);
+  snprintf(message, sizeof(message), "%s output muted", what);
+  if (split)
+  {
+    check_buffer(message, output_buffer, 100, 0.5);
+    check_buffer(message, output_buffer + 100, PERIOD - 100, 0.0);
+  }
+  else
+  {
+    check_buffer(message, output_buffer, PERIOD, 0.0);
+  }
+
+  remove_output_channel(output);
+  remove_channels(mixer);
+  destroy(mixer);
+}
+#endif
+
+int
+main(void)
+{
+  test_routing();
+  test_volume_ramp();
+  test_scene();
+  test_mix_minus();
+#ifdef HAVE_JACK_MIDI
+  test_midi_split(false);
+  test_midi_split(true);
+#endif
+
+  if (failures != 0)
+  {
+    printf("%u checks failed\n", failures);
+    return EXIT_FAILURE;
+  }
+
+  printf("All checks passed\n");
+  return EXIT_SUCCESS;
+}